@@ -0,0 +1,219 @@
+import os
+import time
+import asyncio
+import contextlib
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+from aiagent.prompt_encoder import estimate_tokens
+from utils import setup_backend_logger
+
+logger = setup_backend_logger(__name__)
+
+# 評価結果のレーティング (mcp_agentのQualityRatingと同じ値)
+RATING_POOR = 0
+RATING_FAIR = 1
+RATING_GOOD = 2
+RATING_EXCELLENT = 3
+
+EVAL_PROMPT = """以下の依頼に対する回答を評価してください。
+
+【依頼】
+{request}
+
+【回答 (第{round}版)】
+{response}
+
+rating (0:POOR, 1:FAIR, 2:GOOD, 3:EXCELLENT)、feedback、needs_improvement、focus_areas を返してください。"""
+
+REFINE_PROMPT = """評価者のフィードバックを踏まえて回答を改善してください。
+
+【元の依頼】
+{request}
+
+【前回の回答】
+{response}
+
+【評価】{rating}
+【フィードバック】
+{feedback}
+【重点改善項目】{focus_areas}"""
+
+@dataclass
+class OptimizationBudget:
+    """評価-最適化ループの予算
+
+    Attributes:
+        max_wall_time: 最大実行時間(秒)
+        max_tokens: 最大トークン数 (0は無制限、プロンプト+応答の概算値)
+        max_rounds: 最大生成回数 (初回生成を含む)
+        min_rating: 打ち切り品質 (このレーティング以上で終了)
+        plateau_rounds: ベストレーティングが改善しない評価がこの回数続いたら終了
+    """
+    max_wall_time: float = 300.0
+    max_tokens: int = 0
+    max_rounds: int = 3
+    min_rating: int = RATING_GOOD
+    plateau_rounds: int = 2
+
+    @classmethod
+    def from_params(cls, params: Dict) -> "OptimizationBudget":
+        """リクエストパラメータ > 環境変数 > デフォルト値 の順で予算を決定"""
+        def pick(key, env_key, cast, default):
+            value = params.get(key)
+            if value is None:
+                value = os.getenv(env_key)
+            return cast(value) if value is not None else default
+
+        return cls(
+            max_wall_time=pick("max_wall_time", "MCP_MAX_WALL_TIME", float, cls.max_wall_time),
+            max_tokens=pick("max_tokens", "MCP_MAX_TOKENS", int, cls.max_tokens),
+            max_rounds=max(1, pick("max_rounds", "MCP_MAX_ROUNDS", int, cls.max_rounds)),
+            min_rating=pick("min_rating", "MCP_MIN_RATING", int, cls.min_rating),
+            plateau_rounds=max(1, pick("plateau_rounds", "MCP_PLATEAU_ROUNDS", int, cls.plateau_rounds)),
+        )
+
+class BudgetExhausted(Exception):
+    """実行時間の予算切れ"""
+
+class BudgetedEvaluatorOptimizer:
+    """実行時間・トークン・ラウンド数の予算付き評価-最適化ループ
+
+    EvaluatorOptimizerLLMと同じく optimizer が回答を生成し evaluator が評価するが、
+    予算切れやレーティングの頭打ちで早期終了し、その時点のベスト回答を返す。
+    各ラウンドの所要時間・レーティング・トークン数は rounds に記録される。
+
+    Args:
+        optimizer: 回答生成エージェント (async context manager)
+        evaluator: 評価エージェント (async context manager)
+        llm_factory: エージェントからLLMを生成するファクトリ (agent=キーワード引数)
+        evaluation_model: evaluatorの構造化出力モデル (rating, feedback, needs_improvement, focus_areas)
+        budget: 予算
+        clock: 経過時間計測用の時計 (テスト用に差し替え可能)
+    """
+
+    def __init__(self, optimizer, evaluator, llm_factory: Callable,
+                 evaluation_model, budget: Optional[OptimizationBudget] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.optimizer = optimizer
+        self.evaluator = evaluator
+        self.optimizer_llm = llm_factory(agent=optimizer)
+        self.evaluator_llm = llm_factory(agent=evaluator)
+        self.evaluation_model = evaluation_model
+        self.budget = budget or OptimizationBudget()
+        self.clock = clock
+        self.rounds: List[Dict[str, Any]] = []
+        self.stop_reason: Optional[str] = None
+        self.tokens_used = 0
+        self.elapsed_s = 0.0
+        self._deadline = None
+
+    def _remaining(self) -> float:
+        remaining = self._deadline - self.clock()
+        if remaining <= 0:
+            raise BudgetExhausted()
+        return remaining
+
+    async def _call(self, agent, coro_factory: Callable):
+        """エージェントを開いた状態でLLM呼び出しを行い、残り時間で打ち切る"""
+        async def run():
+            async with contextlib.AsyncExitStack() as stack:
+                await stack.enter_async_context(agent)
+                return await coro_factory()
+        # 予算切れならコルーチンを作る前に打ち切る
+        remaining = self._remaining()
+        try:
+            return await asyncio.wait_for(run(), timeout=remaining)
+        except asyncio.TimeoutError:
+            raise BudgetExhausted()
+
+    def _tokens_exhausted(self) -> bool:
+        return self.budget.max_tokens > 0 and self.tokens_used >= self.budget.max_tokens
+
+    def metrics(self) -> Dict[str, Any]:
+        """チューニング用の実行計測値"""
+        return {
+            "mode": "budgeted",
+            "budget": asdict(self.budget),
+            "stop_reason": self.stop_reason,
+            "tokens_used": self.tokens_used,
+            "elapsed_s": self.elapsed_s,
+            "rounds": self.rounds,
+        }
+
+    async def generate_str(self, message: str, request_params=None) -> str:
+        """予算内で回答を生成・改善し、ベスト回答を返す"""
+        budget = self.budget
+        start = self.clock()
+        self._deadline = start + budget.max_wall_time
+        self.rounds = []
+        self.tokens_used = 0
+        best_response, best_rating = None, -1
+        stale_evaluations = 0
+        prompt = message
+
+        for round_no in range(1, budget.max_rounds + 1):
+            round_start = self.clock()
+            record = {"round": round_no}
+            self.rounds.append(record)
+            try:
+                response = await self._call(self.optimizer, lambda: self.optimizer_llm.generate_str(
+                    message=prompt, request_params=request_params))
+                record["generate_s"] = round(self.clock() - round_start, 3)
+                round_tokens = estimate_tokens(prompt) + estimate_tokens(response)
+                if best_response is None:
+                    best_response = response
+
+                eval_prompt = EVAL_PROMPT.format(request=message, round=round_no, response=response)
+                eval_start = self.clock()
+                evaluation = await self._call(self.evaluator, lambda: self.evaluator_llm.generate_structured(
+                    message=eval_prompt, response_model=self.evaluation_model, request_params=request_params))
+                record["evaluate_s"] = round(self.clock() - eval_start, 3)
+                round_tokens += estimate_tokens(eval_prompt) + estimate_tokens(str(evaluation.feedback))
+            except BudgetExhausted:
+                record["elapsed_s"] = round(self.clock() - round_start, 3)
+                self.stop_reason = "wall_time"
+                break
+
+            rating = int(evaluation.rating)
+            self.tokens_used += round_tokens
+            record.update({
+                "rating": rating,
+                "needs_improvement": bool(evaluation.needs_improvement),
+                "tokens": round_tokens,
+                "elapsed_s": round(self.clock() - round_start, 3),
+            })
+
+            if rating > best_rating:
+                best_rating, best_response = rating, response
+                stale_evaluations = 0
+            else:
+                stale_evaluations += 1
+
+            if rating >= budget.min_rating or not evaluation.needs_improvement:
+                self.stop_reason = "quality_reached"
+                break
+            if round_no >= budget.max_rounds:
+                self.stop_reason = "max_rounds"
+                break
+            if stale_evaluations >= budget.plateau_rounds:
+                self.stop_reason = "plateau"
+                break
+            if self._tokens_exhausted():
+                self.stop_reason = "token_budget"
+                break
+
+            prompt = REFINE_PROMPT.format(
+                request=message,
+                response=response,
+                rating=rating,
+                feedback=evaluation.feedback,
+                focus_areas=", ".join(evaluation.focus_areas or []),
+            )
+
+        self.elapsed_s = round(self.clock() - start, 3)
+        logger.info(f"予算付き評価-最適化ループ終了: 理由={self.stop_reason}, "
+                    f"ラウンド={len(self.rounds)}, ベスト評価={best_rating}, "
+                    f"トークン={self.tokens_used}, 経過={self.elapsed_s}秒")
+        if best_response is None:
+            raise TimeoutError("予算内に回答を生成できませんでした")
+        return best_response
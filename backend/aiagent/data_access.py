@@ -1,31 +1,31 @@
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Optional
 from utils import get_db_engine, setup_backend_logger
-from sqlalchemy import select, insert
-from models import RecommendationSession, RecommendationResult, PromptTemplate
+from bar_aggregates import timeframe_config
+from sqlalchemy import insert
+from models import RecommendationSession, RecommendationResult
+from aiagent.prompt_encoder import get_prompt_encoding_settings, encode_prompt_data
+from aiagent.prompt_cache import prompt_template_cache, DEFAULT_COMPILED_TEMPLATE
+from aiagent.raw_response_store import get_raw_response_storage, store_raw_response
 
 logger = setup_backend_logger(__name__)
 
-def fetch_company_infos(symbols: List[str]) -> str:
-    """銘柄情報を文字列形式で取得"""
+def fetch_company_info_frame(symbols: List[str]) -> pd.DataFrame:
+    """銘柄情報をDataFrame形式で取得"""
     if not symbols:
-        return ""
+        return pd.DataFrame()
     
     # シンボルを正規化
     normalized_symbols = [normalize_symbol(s) for s in symbols if s and isinstance(s, str)]
     if not normalized_symbols:
-        return ""
+        return pd.DataFrame()
         
     query = f"""
         SELECT symbol, name, industry_name_33
         FROM stocks
         WHERE symbol IN ({','.join([f"'{s}'" for s in normalized_symbols])})
     """
-    df = pd.read_sql_query(query, get_db_engine())
-    if df.empty:
-        return ""
-    
-    return df.to_string(header=True, index=False)
+    return pd.read_sql_query(query, get_db_engine())
 
 async def fetch_news(symbols: List[str]) -> List[Dict]:
     """symbolsを基に関連ニュースを取得（モック実装）"""
@@ -65,60 +65,58 @@ async def fetch_news(symbols: List[str]) -> List[Dict]:
         "source": "仮想ニュースソース"
     }]
 
-def fetch_technical_indicators(symbols: List[str], limit: int = 100) -> str:
-    """テクニカル指標を文字列形式で取得"""
+def fetch_technical_indicator_frame(symbols: List[str], limit: int = 100, timeframe: str = "daily") -> pd.DataFrame:
+    """最新のテクニカル指標をDataFrame形式で取得 (timeframe: daily / weekly / monthly)"""
     if not symbols:
-        return ""
+        return pd.DataFrame()
     
     # シンボルを正規化
     normalized_symbols = [normalize_symbol(s) for s in symbols if s and isinstance(s, str)]
     if not normalized_symbols:
-        return ""
+        return pd.DataFrame()
         
+    # 銘柄ごとに (symbol, date DESC) の索引から最新1行だけを読む (履歴の長さに依存しない)
     query = f"""
-        SELECT DISTINCT ON (symbol)
-        symbol, to_char(date, 'YYYY/MM/DD') as date, 
-        golden_cross, dead_cross, rsi, macd, signal_line 
-        FROM technical_indicators
-        WHERE symbol IN ({','.join([f"'{s}'" for s in normalized_symbols])})
-        ORDER BY symbol, date DESC
+        SELECT s.symbol, to_char(ti.date, 'YYYY/MM/DD') as date,
+        ti.golden_cross, ti.dead_cross, ti.rsi, ti.macd, ti.signal_line, ti.macd_score
+        FROM (SELECT DISTINCT unnest(ARRAY[{','.join([f"'{s}'" for s in normalized_symbols])}]) AS symbol) s
+        CROSS JOIN LATERAL (
+            SELECT * FROM {timeframe_config(timeframe)["indicators"]}
+            WHERE symbol = s.symbol
+            ORDER BY date DESC
+            LIMIT 1
+        ) ti
+        ORDER BY s.symbol
         LIMIT {limit}
     """
     #logger.debug(query)
     
-    df = pd.read_sql_query(query, get_db_engine())
-    if df.empty:
-        return ""
-    
-    return df.to_string(header=True, index=False)
+    return pd.read_sql_query(query, get_db_engine())
 
-def fetch_price_history(symbols: List[str], limit: int = 90) -> str:
-    """株価履歴を文字列形式で取得（過去3ヶ月分）"""
-    if not symbols:
-        return ""
-    
-    # シンボルを正規化
-    normalized_symbols = [normalize_symbol(s) for s in symbols if s and isinstance(s, str)]
-    if not normalized_symbols:
-        return ""
-        
-    query = f"""
-        SELECT symbol, to_char(date, 'YYYY/MM/DD') as date, open, high, low, close, volume 
-        FROM stock_prices
-        WHERE symbol IN ({','.join([f"'{s}'" for s in normalized_symbols])})
-          AND date >= current_date - interval '1 months'
-        ORDER BY symbol, date DESC
+def fetch_prompt_data(symbols: List[str], params: Dict = None,
+                      include_indicators: bool = True, limit: int = 100) -> Dict:
+    """プロンプトに埋め込む銘柄データをエンコーディング設定に従って取得
+
+    Args:
+        symbols: 銘柄コードリスト
+        params: 推奨パラメータ (prompt_encoding, prompt_token_budget, timeframe)
+        include_indicators: テクニカル指標を含めるか
+        limit: テクニカル指標の最大銘柄数
+
+    Returns:
+        {"company_infos": 文字列, "technical_indicators": 文字列, "stats": 統計}
     """
-    logger.debug(query)
-    
-    df = pd.read_sql_query(query, get_db_engine())
-    if df.empty:
-        return ""
-    
-    return df.to_string(header=True, index=False)
+    settings = get_prompt_encoding_settings(params)
+    company_df = fetch_company_info_frame(symbols)
+    timeframe = (params or {}).get("timeframe") or "daily"
+    indicator_df = fetch_technical_indicator_frame(symbols, limit, timeframe) if include_indicators else None
+    return encode_prompt_data(
+        company_df, indicator_df, settings["mode"], settings["token_budget"],
+        settings["decimals"], settings["separator"]
+    )
 
 def get_prompt_template(prompt_id: int) -> Dict[str, str]:
-    """プロンプトテンプレートをデータベースから取得
+    """プロンプトテンプレートを取得 (プロセス内キャッシュから返す)
     
     Args:
         prompt_id: prompt_templatesテーブルのID
@@ -129,31 +127,14 @@ def get_prompt_template(prompt_id: int) -> Dict[str, str]:
             "user_template": ユーザーテンプレートテキスト,
             "output_format": 出力フォーマット
         }
+        system_role, user_template は読み込み時に解析済みの CompiledTemplate (strのサブクラス)
     """
     try:
-        engine = get_db_engine()
-        with engine.begin() as conn:
-            stmt = select(
-                PromptTemplate.system_role,
-                PromptTemplate.user_template,
-                PromptTemplate.output_format
-            ).where(PromptTemplate.id == prompt_id)
-            
-            result = conn.execute(stmt).fetchone()
-            
-            if result is None:
-                logger.warning(f"指定されたプロンプトテンプレートが見つかりません: prompt_id={prompt_id}")
-                return {
-                    "system_role": "あなたはプロの株式アナリストです。",
-                    "user_template": "以下の銘柄情報を分析して投資推奨を行ってください。\n銘柄情報:\n{company_info}\n\nテクニカル指標:\n{technical_indicators}\n\n価格履歴:\n{price_history}",
-                    "output_format": "JSON形式で推奨銘柄とその理由を返してください"
-                }
-                
-            return {
-                "system_role": result.system_role or "",
-                "user_template": result.user_template,
-                "output_format": result.output_format
-            }
+        template = prompt_template_cache.get(prompt_id)
+        if template is None:
+            logger.warning(f"指定されたプロンプトテンプレートが見つかりません: prompt_id={prompt_id}")
+            return dict(DEFAULT_COMPILED_TEMPLATE)
+        return dict(template)
             
     except Exception as e:
         logger.error(f"プロンプトテンプレートの取得に失敗: {str(e)}")
@@ -165,55 +146,76 @@ def normalize_symbol(symbol: str) -> str:
         return symbol + '.T'
     return symbol
 
-def save_recommendation(result: Dict, params: Dict, ai_raw_response: str = None) -> bool:
+def _existing_prompt_id(prompt_id) -> Optional[int]:
+    """保存するプロンプトテンプレートID (削除済みなど存在しないIDは外部キー違反になるため None)"""
+    if prompt_id is None:
+        return None
+    return prompt_id if prompt_template_cache.get(prompt_id) is not None else None
+
+def persist_recommendation(result: Dict, params: Dict, ai_raw_response: str = None,
+                           execution_metrics: Dict = None) -> int:
+    """推奨結果をデータベースに保存し、セッションIDを返す (失敗時は例外を送出)
+
+    セッションIDは INSERT ... RETURNING で取得し、推奨結果は1回の複数行INSERTで保存する。
+    RAW_RESPONSE_STORAGE=compressed の場合、AI生レスポンスは圧縮して別テーブルに保存する。
+    """
+    logger.debug(
+        f"推奨結果保存開始 - principal: {params['principal']}, "
+        f"戦略: {params['strategy']}, "
+        f"銘柄数: {len(params['selected_symbols'])}, "
+        f"推奨: {result}"
+    )
+    compressed = bool(ai_raw_response) and get_raw_response_storage() == "compressed"
+    engine = get_db_engine()
+    with engine.begin() as conn:
+        # セッション作成
+        session_stmt = insert(RecommendationSession).values(
+            principal=params['principal'],
+            risk_tolerance=params['risk_tolerance'],
+            strategy=params['strategy'],
+            symbols=params['selected_symbols'],
+            technical_filter=params.get('technical_filter'),
+            prompt_id=_existing_prompt_id(params.get('prompt_id')),
+            agent_type=params.get('agent_type'),
+            ai_raw_response=None if compressed else ai_raw_response,
+            total_return_estimate=result.get('total_return_estimate', -1),
+            execution_metrics=execution_metrics,
+            risk_metrics=result.get('risk')
+        ).returning(RecommendationSession.session_id)
+        session_id = conn.execute(session_stmt).scalar_one()
+        if compressed:
+            store_raw_response(conn, session_id, ai_raw_response)
+        
+        # 結果保存
+        rows = [
+            {
+                "session_id": session_id,
+                # シンボルを正規化
+                "symbol": normalize_symbol(rec['symbol']),
+                "name": rec.get('name', ''),
+                "allocation": rec.get('allocation', ''),
+                "confidence": rec.get('confidence') / 100.0 if rec.get('confidence') else None,
+                "reason": rec.get('reason', "")
+            }
+            for rec in result.get('recommendations', [])
+        ]
+        if rows:
+            conn.execute(insert(RecommendationResult).values(rows))
+        return session_id
+
+def save_recommendation(result: Dict, params: Dict, ai_raw_response: str = None,
+                        execution_metrics: Dict = None) -> bool:
     """推奨結果をデータベースに保存
     
     Args:
         result: パース済みの推奨結果
         params: 推奨パラメータ
         ai_raw_response: AIからの生のレスポンス（オプション）
+        execution_metrics: ブランチごとのレイテンシなどの実行計測値（オプション）
     """
     try:
-        logger.debug(
-            f"推奨結果保存開始 - principal: {params['principal']}, "
-            f"戦略: {params['strategy']}, "
-            f"銘柄数: {len(params['selected_symbols'])}, "
-            f"推奨: {result}"
-        )
-        engine = get_db_engine()
-        with engine.begin() as conn:
-            # セッション作成
-            session_stmt = insert(RecommendationSession).values(
-                principal=params['principal'],
-                risk_tolerance=params['risk_tolerance'],
-                strategy=params['strategy'],
-                symbols=params['selected_symbols'],
-                technical_filter=params.get('technical_filter'),
-                ai_raw_response=ai_raw_response,
-                total_return_estimate=result.get('total_return_estimate', -1)
-            )
-            conn.execute(session_stmt)
-            session_id = conn.execute(
-                select(RecommendationSession.session_id)
-                .order_by(RecommendationSession.session_id.desc())
-                .limit(1)
-            ).scalar()
-            
-            # 結果保存
-            if "recommendations" in result:
-                for rec in result.get('recommendations', []):
-                    # シンボルを正規化
-                    normalized_symbol = normalize_symbol(rec['symbol'])
-                    result_stmt = insert(RecommendationResult).values(
-                        session_id=session_id,
-                        symbol=normalized_symbol,
-                        name=rec.get('name', ''),
-                        allocation=rec.get('allocation', ''),
-                        confidence=rec.get('confidence') / 100.0 if rec.get('confidence') else None,
-                        reason=rec.get('reason', "")
-                    )
-                    conn.execute(result_stmt)
-            return True
+        persist_recommendation(result, params, ai_raw_response, execution_metrics)
+        return True
             
     except Exception as e:
         logger.error(f"推奨結果の保存に失敗: {str(e)}")
@@ -1,12 +1,13 @@
 import os
 import json
+import time
 from typing import Dict, List
-from openai import OpenAI
+from openai import AsyncOpenAI
 from aiagent.interface import IStockRecommender
 from utils import setup_backend_logger
+from metrics import LLM_REQUEST_DURATION, LLM_TOKENS
 from aiagent.data_access import (
-    fetch_company_infos,
-    fetch_technical_indicators,
+    fetch_prompt_data,
     get_prompt_template
 )
 from aiagent.prompt_builder import build_recommendation_prompt
@@ -19,7 +20,9 @@ DEEPSEEK_MODEL = "deepseek-reasoner"
 class DeepSeekDirectRecommender(IStockRecommender):
     def __init__(self):
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
-        self.ai_client = OpenAI(api_key=self.api_key, base_url=DEEPSEEK_API_URL)
+        self.api_url = os.getenv("DEEPSEEK_API_URL", DEEPSEEK_API_URL)
+        self.model = os.getenv("DEEPSEEK_MODEL", DEEPSEEK_MODEL)
+        self.ai_client = AsyncOpenAI(api_key=self.api_key, base_url=self.api_url)
     
     async def execute(self, params: Dict) -> Dict:
         """直接DeepSeek APIを呼び出して銘柄推奨を生成"""
@@ -33,8 +36,8 @@ class DeepSeekDirectRecommender(IStockRecommender):
                 return {"status": "error", "message": "選択された銘柄がありません"}
             
             # データ取得
-            data = await self._fetch_data(symbols)
-            logger.info(f"銘柄データ: {data}")
+            data = await self._fetch_data(symbols, params)
+            logger.debug("銘柄データ: %s", data)
             
             # API呼び出し
             return await self._call_deepseek(params, data)
@@ -43,26 +46,36 @@ class DeepSeekDirectRecommender(IStockRecommender):
             logger.exception(f"Recommendation error: {str(e)}")
             return {"status": "error", "message": str(e)}
 
-    async def _fetch_data(self, symbols: List[str]) -> Dict:
-        """必要なデータを取得"""
-        return {
-            "company_infos": fetch_company_infos(symbols),
-            "technical_indicators": fetch_technical_indicators(symbols, limit=50)
-        }
+    async def _fetch_data(self, symbols: List[str], params: Dict = None) -> Dict:
+        """必要なデータを取得 (エンコーディング設定とトークン予算を適用)"""
+        data = fetch_prompt_data(symbols, params, limit=50)
+        logger.info(f"プロンプトデータ統計: {data.pop('stats')}")
+        return data
 
     async def _call_deepseek(self, params: Dict, data: Dict) -> Dict:
         """DeepSeek APIを呼び出し"""
         prompt = self._build_prompt(params, data)
-        logger.info(f"Prompt: {prompt}")
+        logger.debug("Prompt: %s", prompt)
 
-        response = self.ai_client.chat.completions.create(
-            model=DEEPSEEK_MODEL,
-            messages=[
-                {"role": "system", "content": "あなたはプロの株式アナリストです。"},
-                {"role": "user", "content": prompt},
-            ],
-            stream=False
-        )
+        # 非同期クライアントを使い、デッドライン・キャンセル (アンサンブルのブランチ等) でHTTPリクエストも中断させる
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.ai_client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "あなたはプロの株式アナリストです。"},
+                    {"role": "user", "content": prompt},
+                ],
+                stream=False
+            )
+            status = "ok"
+        finally:
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, recommender="direct", status=status)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.inc(usage.prompt_tokens or 0, recommender="direct", type="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens or 0, recommender="direct", type="completion")
 
         # 生のレスポンスを返す（パース済み結果と生データの両方）
         parsed_response = self._parse_response(response)
@@ -0,0 +1,253 @@
+import os
+import re
+import json
+import time
+import asyncio
+from typing import Dict, Any, List, Optional
+from aiagent.interface import IStockRecommender
+from utils import setup_backend_logger
+
+logger = setup_backend_logger(__name__)
+
+DEFAULT_BRANCH_TIMEOUT = 120.0
+
+def parse_percentage(value) -> Optional[float]:
+    """"20%" / "20" / 20 などの表記から数値を取り出す"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"-?\d+(?:\.\d+)?", str(value))
+    return float(match.group()) if match else None
+
+def parse_branches(spec: str) -> List[Dict[str, Any]]:
+    """環境変数形式のブランチ指定を解析 (例: "direct:1,direct:2,mcpagent")"""
+    branches = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        agent_type, _, prompt_id = item.partition(":")
+        branches.append({
+            "agent_type": agent_type.strip(),
+            "prompt_id": int(prompt_id) if prompt_id.strip() else None
+        })
+    return branches
+
+def is_valid_result(parsed: Dict) -> bool:
+    """ブランチ結果が統合可能な推奨結果かを判定"""
+    return (
+        isinstance(parsed, dict)
+        and parsed.get("status") != "error"
+        and isinstance(parsed.get("recommendations"), list)
+        and len(parsed["recommendations"]) > 0
+    )
+
+def merge_recommendations(results: List[Dict]) -> Dict:
+    """複数ブランチの推奨結果を1つのランキングに統合
+
+    配分はブランチ間の平均 (推奨しなかったブランチは0%扱い) を100%に再正規化し、
+    推奨したブランチ数 → 平均配分 → 平均信頼度 の順で並べる。
+    """
+    merged: Dict[str, Dict] = {}
+    for result in results:
+        for rec in result.get("recommendations", []):
+            symbol = str(rec.get("symbol", "")).strip()
+            if not symbol:
+                continue
+            key = symbol[:-2] if symbol.endswith(".T") else symbol
+            entry = merged.setdefault(key, {
+                "symbol": symbol, "name": rec.get("name", ""),
+                "allocations": [], "confidences": [], "reasons": []
+            })
+            allocation = parse_percentage(rec.get("allocation"))
+            confidence = parse_percentage(rec.get("confidence"))
+            if allocation is not None:
+                entry["allocations"].append(allocation)
+            if confidence is not None:
+                entry["confidences"].append(confidence)
+            if rec.get("reason"):
+                entry["reasons"].append((confidence or 0, rec["reason"]))
+            if not entry["name"]:
+                entry["name"] = rec.get("name", "")
+
+    n_results = max(len(results), 1)
+    ranked = []
+    for entry in merged.values():
+        votes = max(len(entry["allocations"]), len(entry["confidences"]), len(entry["reasons"]), 1)
+        ranked.append({
+            "symbol": entry["symbol"],
+            "name": entry["name"],
+            "votes": votes,
+            "allocation": sum(entry["allocations"]) / n_results,
+            "confidence": (sum(entry["confidences"]) / len(entry["confidences"])
+                           if entry["confidences"] else None),
+            # 最も信頼度の高いブランチの理由を採用
+            "reason": max(entry["reasons"], key=lambda r: r[0])[1] if entry["reasons"] else "",
+        })
+    ranked.sort(key=lambda r: (-r["votes"], -r["allocation"], -(r["confidence"] or 0)))
+
+    total_allocation = sum(r["allocation"] for r in ranked)
+    recommendations = []
+    for r in ranked:
+        allocation = r["allocation"] * 100 / total_allocation if total_allocation > 0 else 0
+        recommendations.append({
+            "symbol": r["symbol"],
+            "name": r["name"],
+            "allocation": f"{allocation:.1f}%",
+            "confidence": round(r["confidence"], 1) if r["confidence"] is not None else None,
+            "reason": f"{r['reason']} ({r['votes']}/{len(results)}ブランチが推奨)",
+        })
+
+    estimates = [parse_percentage(r.get("total_return_estimate")) for r in results]
+    estimates = [e for e in estimates if e is not None]
+    merged_result = {"recommendations": recommendations}
+    if estimates:
+        merged_result["total_return_estimate"] = f"{sum(estimates) / len(estimates):.1f}%"
+    return merged_result
+
+class EnsembleRecommender(IStockRecommender):
+    """同一リクエストを複数のエージェント/プロンプトへ並列に投げ、結果を統合する推奨クラス
+
+    各ブランチにはデッドラインを設け、有効な結果がクォーラム数に達した時点で
+    残りのブランチをキャンセルして返す。最も遅いモデルを待たずに済むため
+    テールレイテンシを抑えられる。
+    """
+
+    def __init__(self, recommender_factory=None):
+        self.recommender_factory = recommender_factory
+
+    def _create(self, agent_type: str) -> IStockRecommender:
+        if self.recommender_factory is not None:
+            return self.recommender_factory(agent_type)
+        from aiagent.factory import RecommenderFactory
+        return RecommenderFactory.create(agent_type)
+
+    def _resolve_settings(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        branches = params.get("ensemble_branches") or parse_branches(
+            os.getenv("ENSEMBLE_BRANCHES", "direct"))
+        branches = [b for b in branches if b.get("agent_type", "").lower() != "ensemble"]
+        if not branches:
+            raise ValueError("アンサンブルのブランチが指定されていません")
+        quorum = params.get("ensemble_quorum") or int(os.getenv("ENSEMBLE_QUORUM", 1))
+        timeout = params.get("branch_timeout") or float(
+            os.getenv("ENSEMBLE_BRANCH_TIMEOUT", DEFAULT_BRANCH_TIMEOUT))
+        return {
+            "branches": branches,
+            "quorum": max(1, min(int(quorum), len(branches))),
+            "timeout": float(timeout),
+        }
+
+    async def _run_branch(self, index: int, branch: Dict[str, Any],
+                          params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """1ブランチを実行し、結果と計測値を返す"""
+        branch_params = {
+            **params,
+            "agent_type": branch["agent_type"],
+            "prompt_id": branch.get("prompt_id") or params.get("prompt_id"),
+        }
+        metric = {
+            "branch": index,
+            "agent_type": branch["agent_type"],
+            "prompt_id": branch_params["prompt_id"],
+        }
+        start = time.perf_counter()
+        try:
+            recommender = self._create(branch["agent_type"])
+            result = await asyncio.wait_for(recommender.execute(branch_params), timeout=timeout)
+            parsed, raw = result, None
+            if isinstance(result, dict) and "parsed_result" in result:
+                parsed, raw = result["parsed_result"], result.get("raw_response")
+            metric["status"] = "ok" if is_valid_result(parsed) else "invalid"
+            return {"metric": metric, "parsed": parsed, "raw": raw}
+        except asyncio.TimeoutError:
+            metric["status"] = "timeout"
+            return {"metric": metric, "parsed": None, "raw": None}
+        except Exception as e:
+            logger.exception(f"アンサンブルブランチ{index}でエラー: {str(e)}")
+            metric["status"] = "error"
+            metric["error"] = str(e)
+            return {"metric": metric, "parsed": None, "raw": None}
+        finally:
+            metric["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def execute(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """ブランチを並列実行し、クォーラム到達後に統合結果を返す
+
+        Args:
+            params: 推奨パラメータ
+                - ensemble_branches: [{"agent_type": ..., "prompt_id": ...}, ...]
+                - ensemble_quorum: 統合に必要な有効結果数
+                - branch_timeout: ブランチごとのデッドライン(秒)
+
+        Returns:
+            {"parsed_result": 統合結果, "raw_response": ブランチごとの生データ(JSON),
+             "execution_metrics": {"mode": "ensemble", "branches": [...]}}
+        """
+        try:
+            settings = self._resolve_settings(params)
+        except ValueError as e:
+            logger.error(str(e))
+            return {"status": "error", "message": str(e)}
+
+        logger.info(f"アンサンブル実行: {len(settings['branches'])}ブランチ, "
+                    f"クォーラム={settings['quorum']}, デッドライン={settings['timeout']}秒")
+        start = time.perf_counter()
+        tasks = {
+            asyncio.create_task(self._run_branch(i, branch, params, settings["timeout"])): i
+            for i, branch in enumerate(settings["branches"])
+        }
+        pending = set(tasks)
+        outcomes = []
+        valid = []
+        while pending and len(valid) < settings["quorum"]:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcome = task.result()
+                outcomes.append(outcome)
+                if outcome["metric"]["status"] == "ok":
+                    valid.append(outcome)
+
+        # クォーラム到達後の残りブランチはキャンセル
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        for task in pending:
+            branch = settings["branches"][tasks[task]]
+            outcomes.append({"metric": {
+                "branch": tasks[task],
+                "agent_type": branch["agent_type"],
+                "prompt_id": branch.get("prompt_id") or params.get("prompt_id"),
+                "status": "cancelled",
+                "latency_ms": elapsed_ms,
+            }, "parsed": None, "raw": None})
+
+        metrics = sorted((o["metric"] for o in outcomes), key=lambda m: m["branch"])
+        execution_metrics = {
+            "mode": "ensemble",
+            "quorum": settings["quorum"],
+            "branch_timeout": settings["timeout"],
+            "total_latency_ms": elapsed_ms,
+            "branches": metrics,
+        }
+        logger.info(f"アンサンブル完了: {execution_metrics}")
+
+        raw_response = json.dumps(
+            [{"branch": o["metric"]["branch"], "raw_response": o["raw"]} for o in outcomes if o["raw"]],
+            ensure_ascii=False, default=str
+        )
+        if not valid:
+            return {
+                "parsed_result": {"status": "error", "message": "有効な推奨結果を返したブランチがありません"},
+                "raw_response": raw_response,
+                "execution_metrics": execution_metrics,
+            }
+
+        merged = merge_recommendations([o["parsed"] for o in valid])
+        return {
+            "parsed_result": merged,
+            "raw_response": raw_response,
+            "execution_metrics": execution_metrics,
+        }
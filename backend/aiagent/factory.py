@@ -1,23 +1,56 @@
+import importlib
+import threading
+from typing import Dict, Type
 from aiagent.interface import IStockRecommender
-from aiagent.deepseek_direct import DeepSeekDirectRecommender
-from aiagent.mcp_agent import MCPAgentRecommender
+
+# エージェントタイプ → "モジュール:クラス名"
+# openai や mcp_agent などの重い依存を API 起動時に読み込まないよう、
+# 推奨クラスは初回生成時にインポートする
+RECOMMENDERS: Dict[str, str] = {
+    'direct': 'aiagent.deepseek_direct:DeepSeekDirectRecommender',
+    'mcpagent': 'aiagent.mcp_agent:MCPAgentRecommender',
+    'ensemble': 'aiagent.ensemble:EnsembleRecommender',
+    'quant': 'aiagent.quant_recommender:QuantRecommender',
+}
+
+_loaded: Dict[str, Type[IStockRecommender]] = {}
+_lock = threading.Lock()
+
+def register_recommender(agent_type: str, target: str) -> None:
+    """推奨クラスを登録 (target は "モジュール:クラス名")"""
+    module_name, _, class_name = target.partition(':')
+    if not module_name or not class_name:
+        raise ValueError(f"推奨クラスの指定が不正です: {target}")
+    mode = agent_type.lower()
+    with _lock:
+        RECOMMENDERS[mode] = target
+        _loaded.pop(mode, None)
+
+def load_recommender_class(agent_type: str) -> Type[IStockRecommender]:
+    """エージェントタイプに対応する推奨クラスを返す (初回のみモジュールをインポート)"""
+    mode = agent_type.lower()
+    cls = _loaded.get(mode)
+    if cls is not None:
+        return cls
+    target = RECOMMENDERS.get(mode)
+    if target is None:
+        raise ValueError(f"Unknown recommender mode: {mode}")
+    module_name, _, class_name = target.partition(':')
+    with _lock:
+        cls = getattr(importlib.import_module(module_name), class_name)
+        _loaded[mode] = cls
+    return cls
 
 class RecommenderFactory:
     @staticmethod
     def create(agent_type: str = 'direct') -> IStockRecommender:
         """設定に基づいて推奨クラスのインスタンスを生成
-        
+
         Args:
-            agent_type: 使用するエージェントタイプ ('direct' または 'mcpagent')
-            
+            agent_type: 使用するエージェントタイプ (RECOMMENDERS に登録済みのもの。
+                既定では 'direct', 'mcpagent', 'ensemble' または 'quant')
+
         Returns:
             IStockRecommender: 推奨クラスのインスタンス
         """
-        mode = agent_type.lower()
-        
-        if mode == 'direct':
-            return DeepSeekDirectRecommender()
-        elif mode == 'mcpagent':
-            return MCPAgentRecommender()
-        
-        raise ValueError(f"Unknown recommender mode: {mode}")
+        return load_recommender_class(agent_type)()
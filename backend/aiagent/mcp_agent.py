@@ -1,22 +1,48 @@
+import os
 import json
 import re
+import time
 from aiagent.interface import IStockRecommender
 from typing import Dict, Any
 from aiagent.prompt_builder import build_recommendation_prompt
 from utils import setup_backend_logger
+from metrics import LLM_REQUEST_DURATION, LLM_TOKENS
+from aiagent.prompt_encoder import estimate_tokens
 from mcp_agent.workflows.evaluator_optimizer.evaluator_optimizer import (
     EvaluatorOptimizerLLM,
+    EvaluationResult,
     QualityRating,
 )
 
 from mcp_agent.agents.agent import Agent
 from mcp_agent.workflows.llm.augmented_llm import RequestParams
-from aiagent.data_access import (fetch_company_infos, get_prompt_template)
+from aiagent.data_access import (fetch_prompt_data, get_prompt_template)
 from mcp_agent.workflows.llm.augmented_llm_openai import OpenAIAugmentedLLM
+from aiagent.budgeted_optimizer import BudgetedEvaluatorOptimizer, OptimizationBudget
 
 logger = setup_backend_logger(__name__)
 
+BUDGET_PARAM_KEYS = ("max_wall_time", "max_tokens", "max_rounds")
+
 class MCPAgentRecommender(IStockRecommender):
+    def __init__(self, agent_cls=Agent, llm_factory=OpenAIAugmentedLLM,
+                 evaluation_model=EvaluationResult):
+        """
+        Args:
+            agent_cls: エージェントクラス (テスト時はスタブに差し替え可能)
+            llm_factory: エージェントからLLMを生成するファクトリ
+            evaluation_model: 評価結果の構造化出力モデル
+        """
+        self.agent_cls = agent_cls
+        self.llm_factory = llm_factory
+        self.evaluation_model = evaluation_model
+
+    def _is_budgeted(self, params: Dict[str, Any]) -> bool:
+        """予算付きモードを使用するか (リクエストで予算指定 or 環境変数で有効化)"""
+        if any(params.get(key) is not None for key in BUDGET_PARAM_KEYS):
+            return True
+        return os.getenv("MCP_OPTIMIZER_MODE", "standard").lower() == "budgeted"
+
     async def execute(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """MCPエージェントの実装
         
@@ -28,6 +54,7 @@ class MCPAgentRecommender(IStockRecommender):
                 - principal: プリンシパル
                 - risk_tolerance: リスク許容度
                 - strategy: 戦略
+                - max_wall_time / max_tokens / max_rounds: 予算付きモードの予算（オプション）
             
         Returns:
             推奨結果
@@ -37,9 +64,8 @@ class MCPAgentRecommender(IStockRecommender):
         optimizer_prompt = get_prompt_template(params['optimizer_prompt_id'])
         evaluation_prompt = get_prompt_template(params['evaluation_prompt_id'])
         
-        stock_data = {
-            "company_infos": fetch_company_infos(params['selected_symbols'])
-        }
+        stock_data = fetch_prompt_data(params['selected_symbols'], params, include_indicators=False)
+        logger.info(f"プロンプトデータ統計: {stock_data.pop('stats')}")
         
         # メッセージ構築
         msg4optimizer = build_recommendation_prompt(
@@ -58,36 +84,71 @@ class MCPAgentRecommender(IStockRecommender):
             data=stock_data
         ) + "\n" + "【出力形式】\n" + optimizer_prompt['output_format']
         
-        logger.info(f"optimizer’s instruction={msg4optimizer}")
-        logger.info(f"evaluator's instruction={msg4evaluation}")
-        logger.info(f"generator's message={message}")
+        logger.debug("optimizer’s instruction=%s", msg4optimizer)
+        logger.debug("evaluator's instruction=%s", msg4evaluation)
+        logger.debug("generator's message=%s", message)
         
         # 分析実行
-        optimizer = Agent(
+        optimizer = self.agent_cls(
             name="stock_optimizer",
             instruction=msg4optimizer,
             server_names=["yfinance"]
         )
         
-        evaluator = Agent(
+        evaluator = self.agent_cls(
             name="risk_evaluator",
             instruction=msg4evaluation,
             server_names=["yfinance"]
         )
         
-        evaluator_optimizer = EvaluatorOptimizerLLM(
-            optimizer=optimizer,
-            evaluator=evaluator,
-            llm_factory=OpenAIAugmentedLLM,
-            min_rating=QualityRating.GOOD,
-            max_refinements=10
-        )
+        execution_metrics = None
+        if self._is_budgeted(params):
+            budget = OptimizationBudget.from_params(params)
+            logger.info(f"予算付き評価-最適化ループを使用: {budget}")
+            evaluator_optimizer = BudgetedEvaluatorOptimizer(
+                optimizer=optimizer,
+                evaluator=evaluator,
+                llm_factory=self.llm_factory,
+                evaluation_model=self.evaluation_model,
+                budget=budget
+            )
+        else:
+            evaluator_optimizer = EvaluatorOptimizerLLM(
+                optimizer=optimizer,
+                evaluator=evaluator,
+                llm_factory=self.llm_factory,
+                min_rating=QualityRating.GOOD,
+                max_refinements=10
+            )
         
-        result = await evaluator_optimizer.generate_str(
-            message=message,
-            request_params=RequestParams(model='gpt-4o'),
-        )
-        logger.info(f"MCPAgentRecommender's result={result}")
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = await evaluator_optimizer.generate_str(
+                message=message,
+                request_params=RequestParams(model='gpt-4o'),
+            )
+            status = "ok"
+        except TimeoutError as e:
+            status = "timeout"
+            logger.error(f"評価-最適化ループが予算切れ: {str(e)}")
+            return {
+                "parsed_result": {"status": "error", "message": str(e)},
+                "raw_response": None,
+                "execution_metrics": (evaluator_optimizer.metrics()
+                                      if isinstance(evaluator_optimizer, BudgetedEvaluatorOptimizer) else None)
+            }
+        finally:
+            LLM_REQUEST_DURATION.observe(time.perf_counter() - start, recommender="mcpagent", status=status)
+            if isinstance(evaluator_optimizer, BudgetedEvaluatorOptimizer):
+                execution_metrics = evaluator_optimizer.metrics()
+                logger.info(f"ラウンド計測値: {execution_metrics}")
+                LLM_TOKENS.inc(evaluator_optimizer.tokens_used, recommender="mcpagent", type="total")
+        if not isinstance(evaluator_optimizer, BudgetedEvaluatorOptimizer):
+            # 標準モードはusageを取得できないため、初回の依頼と最終回答から概算する
+            LLM_TOKENS.inc(estimate_tokens(message), recommender="mcpagent", type="prompt")
+            LLM_TOKENS.inc(estimate_tokens(result), recommender="mcpagent", type="completion")
+        logger.debug("MCPAgentRecommender's result=%s", result)
         
         try:
             # JSON部分を抽出してパース
@@ -97,17 +158,20 @@ class MCPAgentRecommender(IStockRecommender):
                 # 生の評価結果を含めて返す
                 return {
                     "parsed_result": parsed_result,
-                    "raw_response": result
+                    "raw_response": result,
+                    "execution_metrics": execution_metrics
                 }
             else:
                 # JSON形式が見つからない場合のフォールバック
                 return {
                     "parsed_result": {"status": "success", "data": result},
-                    "raw_response": result
+                    "raw_response": result,
+                    "execution_metrics": execution_metrics
                 }
         except json.JSONDecodeError as e:
             logger.error(f"JSON解析エラー: {str(e)}")
             return {
                 "parsed_result": {"status": "error", "message": "推奨結果の解析に失敗しました"},
-                "raw_response": result
+                "raw_response": result,
+                "execution_metrics": execution_metrics
             }
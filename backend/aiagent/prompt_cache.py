@@ -0,0 +1,170 @@
+import os
+import time
+import string
+import threading
+from typing import Dict, List, Optional
+from sqlalchemy import select
+from models import PromptTemplate
+from utils import get_db_engine, setup_backend_logger
+from metrics import record_cache_lookup
+from invalidation import PROMPTS_CHANGED, invalidation_bus
+
+logger = setup_backend_logger(__name__)
+
+# build_recommendation_prompt が埋め込むプレースホルダ
+TEMPLATE_PLACEHOLDERS = frozenset({
+    "principal", "risk_tolerance", "strategy", "company_infos", "technical_indicators"
+})
+
+# 書式埋め込みを行うフィールド
+TEMPLATE_FIELDS = ("system_role", "user_template")
+
+DEFAULT_TEMPLATE = {
+    "system_role": "あなたはプロの株式アナリストです。",
+    "user_template": "以下の銘柄情報を分析して投資推奨を行ってください。\n銘柄情報:\n{company_infos}\n\nテクニカル指標:\n{technical_indicators}",
+    "output_format": "JSON形式で推奨銘柄とその理由を返してください"
+}
+
+class CompiledTemplate(str):
+    """読み込み時に解析済みのテンプレート文字列
+
+    str のサブクラスなので従来どおり文字列として扱えるが、format() は
+    読み込み時に変換した %形式のテンプレートで埋め込むため、
+    呼び出しごとの書式解析を行わない。書式指定 ({x:>5} など) を含む場合は
+    分解済みのリテラル/プレースホルダ列を連結する。
+    """
+
+    def __new__(cls, source: Optional[str]):
+        self = super().__new__(cls, source or "")
+        self.segments = []
+        self.placeholders = set()
+        self.errors: List[str] = []
+        try:
+            for literal, field, spec, conversion in string.Formatter().parse(self):
+                if field is None:
+                    self.segments.append((literal, None, None, None))
+                    continue
+                if not field or not field.isidentifier():
+                    # 位置引数・属性参照は事前解析の対象外
+                    self.errors.append(f"未対応のプレースホルダ: {{{field}}}")
+                    continue
+                self.segments.append((literal, field, spec or "", conversion))
+                self.placeholders.add(field)
+        except ValueError as e:
+            self.errors.append(f"テンプレートの書式エラー: {str(e)}")
+        unknown = self.placeholders - TEMPLATE_PLACEHOLDERS
+        if unknown:
+            self.errors.append(f"未定義のプレースホルダ: {sorted(unknown)}")
+
+        self._percent_template = None
+        if not self.errors and all(not spec and not conversion for _, _, spec, conversion in self.segments):
+            self._percent_template = "".join(
+                literal.replace("%", "%%") + (f"%({field})s" if field else "")
+                for literal, field, _, _ in self.segments
+            )
+        return self
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+    def format(self, *args, **kwargs) -> str:
+        if args or self.errors:
+            # 解析できないテンプレートは従来どおりの例外を出させる
+            return str.format(str(self), *args, **kwargs)
+        if self._percent_template is not None:
+            return self._percent_template % kwargs
+        parts = []
+        for literal, field, spec, conversion in self.segments:
+            parts.append(literal)
+            if field is None:
+                continue
+            value = kwargs[field]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "s":
+                value = str(value)
+            elif conversion == "a":
+                value = ascii(value)
+            parts.append(format(value, spec))
+        return "".join(parts)
+
+def compile_template(row: Dict) -> Dict[str, str]:
+    """テンプレート1件のうち、書式埋め込みを行うフィールドを事前解析する
+
+    output_format はJSONの例示を含むため埋め込み対象外としてそのまま保持する。
+    """
+    compiled = {field: CompiledTemplate(row.get(field)) for field in TEMPLATE_FIELDS}
+    compiled["output_format"] = row.get("output_format") or ""
+    return compiled
+
+class PromptTemplateCache:
+    """プロンプトテンプレートのプロセス内キャッシュ
+
+    初回参照時に全テンプレートを読み込み、以降はメモリから返す。
+    /api/prompts の更新時や他ワーカーからの無効化イベント (prompts_changed) で invalidate() され、
+    次の参照時に再読み込みする。通知の取りこぼしは LISTEN の再接続時の破棄で補い、
+    念のため PROMPT_CACHE_TTL 秒 (0で無効) を過ぎたキャッシュも再読み込みする。
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = float(os.getenv("PROMPT_CACHE_TTL", 86400)) if ttl is None else ttl
+        self._templates: Optional[Dict[int, Dict[str, str]]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[int, Dict[str, str]]:
+        engine = get_db_engine()
+        with engine.connect() as conn:
+            rows = conn.execute(select(
+                PromptTemplate.id,
+                PromptTemplate.name,
+                PromptTemplate.system_role,
+                PromptTemplate.user_template,
+                PromptTemplate.output_format
+            )).mappings().all()
+
+        templates = {}
+        for row in rows:
+            compiled = compile_template(row)
+            for field in TEMPLATE_FIELDS:
+                template = compiled[field]
+                if not template.is_valid:
+                    logger.warning(f"プロンプトテンプレートに問題があります: id={row['id']}, "
+                                   f"name={row['name']}, {field}: {template.errors}")
+            templates[row["id"]] = compiled
+        logger.info(f"プロンプトテンプレートを読み込みました: {len(templates)}件")
+        return templates
+
+    def _is_stale(self) -> bool:
+        if self._templates is None:
+            return True
+        return self.ttl > 0 and time.monotonic() - self._loaded_at > self.ttl
+
+    def reload(self):
+        """全テンプレートを読み込み直す"""
+        with self._lock:
+            self._templates = self._load()
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self, *args):
+        """キャッシュを破棄する (無効化イベントのハンドラとしても使えるよう引数は無視)"""
+        with self._lock:
+            self._templates = None
+        logger.debug("プロンプトテンプレートのキャッシュを破棄しました")
+
+    def get(self, prompt_id: int) -> Optional[Dict[str, str]]:
+        """テンプレートを取得 (存在しない場合はNone)"""
+        with self._lock:
+            if self._is_stale():
+                self._templates = self._load()
+                self._loaded_at = time.monotonic()
+                record_cache_lookup("prompt_templates", hit=False)
+            else:
+                record_cache_lookup("prompt_templates", hit=True)
+            return self._templates.get(prompt_id)
+
+prompt_template_cache = PromptTemplateCache()
+invalidation_bus.register(prompt_template_cache.invalidate, PROMPTS_CHANGED)
+
+DEFAULT_COMPILED_TEMPLATE = compile_template(DEFAULT_TEMPLATE)
@@ -0,0 +1,240 @@
+import os
+import math
+from typing import Dict, List, Optional
+import pandas as pd
+from utils import setup_backend_logger
+
+logger = setup_backend_logger(__name__)
+
+# エンコーディングモード
+ENCODING_TABLE = "table"        # 従来の固定幅テーブル (df.to_string)
+ENCODING_COMPACT = "compact"    # 短縮ヘッダ付きCSV/TSV
+ENCODING_SUMMARY = "summary"    # 銘柄ごとの要約行
+ENCODING_MODES = (ENCODING_TABLE, ENCODING_COMPACT, ENCODING_SUMMARY)
+
+# コンパクトモードで使用する短縮ヘッダ
+SHORT_HEADERS = {
+    "symbol": "sym",
+    "name": "name",
+    "industry_name_33": "ind",
+    "date": "dt",
+    "golden_cross": "gc",
+    "dead_cross": "dc",
+    "rsi": "rsi",
+    "macd": "macd",
+    "signal_line": "sig",
+    "macd_score": "ms",
+}
+
+def get_prompt_encoding_settings(params: Optional[Dict] = None) -> Dict:
+    """プロンプトエンコーディング設定を取得 (リクエスト指定 > 環境変数)
+
+    Args:
+        params: 推奨パラメータ (prompt_encoding, prompt_token_budgetを含む可能性あり)
+
+    Returns:
+        dict: {'mode': モード, 'token_budget': トークン予算(0は無制限),
+               'decimals': 小数桁数, 'separator': 区切り文字}
+    """
+    params = params or {}
+    mode = (params.get("prompt_encoding") or os.getenv("PROMPT_ENCODING", ENCODING_TABLE)).lower()
+    if mode not in ENCODING_MODES:
+        logger.warning(f"不明なプロンプトエンコーディング: {mode} (tableを使用)")
+        mode = ENCODING_TABLE
+
+    token_budget = params.get("prompt_token_budget")
+    if token_budget is None:
+        token_budget = int(os.getenv("PROMPT_TOKEN_BUDGET", 0))
+
+    separator = os.getenv("PROMPT_SEPARATOR", "csv").lower()
+    return {
+        "mode": mode,
+        "token_budget": int(token_budget),
+        "decimals": int(os.getenv("PROMPT_DECIMALS", 2)),
+        "separator": "\t" if separator == "tsv" else ",",
+    }
+
+def estimate_tokens(text: str) -> int:
+    """トークン数を概算 (ASCIIは約4文字/トークン、日本語などは約1文字/トークン)"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    ascii_chars = len(text) - non_ascii
+    return non_ascii + math.ceil(ascii_chars / 4)
+
+def _strip_suffix(symbol) -> str:
+    """銘柄コードの.Tサフィックスを除去 (保存時にnormalize_symbolで復元される)"""
+    symbol = str(symbol)
+    return symbol[:-2] if symbol.endswith(".T") else symbol
+
+def _compact_frame(df: pd.DataFrame, decimals: int) -> pd.DataFrame:
+    """数値の丸め・真偽値の0/1化・短縮ヘッダへの変換"""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].astype(int)
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].round(decimals)
+    if "symbol" in df.columns:
+        df["symbol"] = df["symbol"].map(_strip_suffix)
+    return df.rename(columns=SHORT_HEADERS)
+
+def _to_delimited(df: pd.DataFrame, separator: str) -> str:
+    return df.to_csv(index=False, sep=separator, lineterminator="\n").rstrip("\n")
+
+def encode_company_infos(df: pd.DataFrame, mode: str = ENCODING_TABLE,
+                         decimals: int = 2, separator: str = ",") -> str:
+    """銘柄情報DataFrameをプロンプト用文字列に変換
+
+    compact/summaryモードでは業種名が重複する場合に業種コード表へ置き換える
+    """
+    if df is None or df.empty:
+        return ""
+    if mode == ENCODING_TABLE:
+        return df.to_string(header=True, index=False)
+
+    df = df.copy()
+    legend = ""
+    if "industry_name_33" in df.columns and df["industry_name_33"].nunique() < len(df):
+        industries = list(dict.fromkeys(df["industry_name_33"].fillna("")))
+        codes = {name: f"I{i}" for i, name in enumerate(industries, 1)}
+        df["industry_name_33"] = df["industry_name_33"].fillna("").map(codes)
+        legend = "業種: " + ";".join(f"{code}={name}" for name, code in codes.items()) + "\n"
+
+    return legend + _to_delimited(_compact_frame(df, decimals), separator)
+
+def _summarize_indicator_row(row) -> str:
+    """テクニカル指標1行を要約シグナルに変換"""
+    signals = []
+    if row.get("golden_cross"):
+        signals.append("GC")
+    if row.get("dead_cross"):
+        signals.append("DC")
+    rsi = row.get("rsi")
+    if pd.notna(rsi):
+        signals.append(f"RSI{int(round(float(rsi)))}")
+        if rsi < 30:
+            signals.append("売られすぎ")
+        elif rsi > 70:
+            signals.append("買われすぎ")
+    macd, signal_line = row.get("macd"), row.get("signal_line")
+    if pd.notna(macd) and pd.notna(signal_line):
+        signals.append("MACD↑" if macd > signal_line else "MACD↓")
+    score = row.get("macd_score")
+    if pd.notna(score):
+        signals.append(f"S{int(score)}")
+    return " ".join(signals)
+
+def encode_technical_indicators(df: pd.DataFrame, mode: str = ENCODING_TABLE,
+                                decimals: int = 2, separator: str = ",") -> str:
+    """テクニカル指標DataFrameをプロンプト用文字列に変換"""
+    if df is None or df.empty:
+        return ""
+    if mode == ENCODING_TABLE:
+        # 従来形式を維持 (MACDスコアは予算超過時の順位付けにのみ使用)
+        return df.drop(columns=["macd_score"], errors="ignore").to_string(header=True, index=False)
+
+    if mode == ENCODING_SUMMARY:
+        lines = [f"{_strip_suffix(row['symbol'])}:{_summarize_indicator_row(row)}"
+                 for row in df.to_dict("records")]
+        date_note = f"基準日: {df['date'].max()}\n" if "date" in df.columns else ""
+        return date_note + "\n".join(lines)
+
+    # 日付が全銘柄で同一なら列を省略してヘッダに記載
+    date_note = ""
+    if "date" in df.columns and df["date"].nunique() == 1:
+        date_note = f"基準日: {df['date'].iloc[0]}\n"
+        df = df.drop(columns=["date"])
+    return date_note + _to_delimited(_compact_frame(df, decimals), separator)
+
+def rank_symbols(indicator_df: Optional[pd.DataFrame], symbols: List[str]) -> List[str]:
+    """トークン予算超過時に残す銘柄の優先順位を決定
+
+    MACDスコア降順 → ゴールデンクロス優先 → 元の選択順
+    """
+    if indicator_df is None or indicator_df.empty:
+        return list(symbols)
+    ranked = indicator_df.assign(_order=range(len(indicator_df)))
+    sort_cols, ascending = [], []
+    if "macd_score" in ranked.columns:
+        sort_cols.append("macd_score")
+        ascending.append(False)
+    if "golden_cross" in ranked.columns:
+        ranked["_gc"] = ranked["golden_cross"].fillna(False).astype(bool)
+        sort_cols.append("_gc")
+        ascending.append(False)
+    sort_cols.append("_order")
+    ascending.append(True)
+    ordered = ranked.sort_values(sort_cols, ascending=ascending, na_position="last")["symbol"].tolist()
+    # 指標がない銘柄は末尾に回す
+    seen = set(ordered)
+    return ordered + [s for s in symbols if s not in seen]
+
+def encode_prompt_data(company_df: Optional[pd.DataFrame],
+                       indicator_df: Optional[pd.DataFrame],
+                       mode: str = ENCODING_TABLE,
+                       token_budget: int = 0,
+                       decimals: int = 2,
+                       separator: str = ",") -> Dict:
+    """プロンプトに埋め込む銘柄データをエンコードし、トークン予算内に収める
+
+    Args:
+        company_df: 銘柄情報 (symbol, name, industry_name_33)
+        indicator_df: テクニカル指標 (symbol, date, golden_cross, ...)
+        mode: エンコーディングモード (table/compact/summary)
+        token_budget: データ部分のトークン予算 (0以下は無制限)
+        decimals: 数値の丸め桁数
+        separator: compactモードの区切り文字
+
+    Returns:
+        dict: {'company_infos': 文字列, 'technical_indicators': 文字列,
+               'stats': {'symbols': 件数, 'kept_symbols': 採用件数, 'tokens': 概算トークン数}}
+    """
+    def encode(symbols=None):
+        c_df, i_df = company_df, indicator_df
+        if symbols is not None:
+            keep = set(symbols)
+            if c_df is not None and not c_df.empty:
+                c_df = c_df[c_df["symbol"].isin(keep)]
+            if i_df is not None and not i_df.empty:
+                i_df = i_df[i_df["symbol"].isin(keep)]
+        return {
+            "company_infos": encode_company_infos(c_df, mode, decimals, separator),
+            "technical_indicators": encode_technical_indicators(i_df, mode, decimals, separator),
+        }
+
+    def tokens_of(encoded):
+        return estimate_tokens(encoded["company_infos"]) + estimate_tokens(encoded["technical_indicators"])
+
+    all_symbols = []
+    for df in (company_df, indicator_df):
+        if df is not None and not df.empty:
+            all_symbols.extend(s for s in df["symbol"] if s not in all_symbols)
+
+    encoded = encode()
+    tokens = tokens_of(encoded)
+    kept = len(all_symbols)
+
+    if token_budget and token_budget > 0 and tokens > token_budget and all_symbols:
+        ranked = rank_symbols(indicator_df, all_symbols)
+        # 予算内に収まる最大の銘柄数を二分探索
+        low, high, best = 1, len(ranked), None
+        while low <= high:
+            mid = (low + high) // 2
+            candidate = encode(ranked[:mid])
+            if tokens_of(candidate) <= token_budget:
+                best, kept = candidate, mid
+                low = mid + 1
+            else:
+                high = mid - 1
+        if best is None:
+            best, kept = encode(ranked[:1]), 1
+        omitted = len(ranked) - kept
+        if omitted > 0 and indicator_df is not None:
+            # 指標を埋め込むプロンプトのみ (MCPモードは指標の欄が無く、銘柄はエージェントが取得する)
+            best["technical_indicators"] += f"\n# 他{omitted}銘柄はトークン予算のため省略"
+        logger.info(f"トークン予算({token_budget})適用: {len(ranked)}銘柄中{kept}銘柄を採用")
+        encoded, tokens = best, tokens_of(best)
+
+    encoded["stats"] = {"symbols": len(all_symbols), "kept_symbols": kept, "tokens": tokens}
+    return encoded
@@ -0,0 +1,151 @@
+import os
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from aiagent.interface import IStockRecommender
+from aiagent.data_access import fetch_company_info_frame, fetch_technical_indicator_frame, normalize_symbol
+from portfolio_optimizer import METHODS, optimize_allocation, risk_profile, signal_scores
+from portfolio_risk import RiskConfig, covariance_block, latest_bar
+from utils import get_db_engine, setup_backend_logger
+
+logger = setup_backend_logger(__name__)
+
+METHOD_LABELS = {
+    "mean_variance": "平均分散",
+    "risk_parity": "リスクパリティ",
+    "inverse_volatility": "逆ボラティリティ",
+}
+
+def resolve_method(params: Dict[str, Any]) -> str:
+    """配分方法 (params の optimizer_method → QUANT_OPTIMIZER_METHOD → mean_variance)"""
+    method = params.get("optimizer_method") or os.getenv("QUANT_OPTIMIZER_METHOD", "mean_variance")
+    if method not in METHODS:
+        raise ValueError(f"未対応の配分方法: {method} ({' / '.join(METHODS)})")
+    return method
+
+def _indicator_scores(symbols: List[str], timeframe: str) -> Dict[str, np.ndarray]:
+    """銘柄順のシグナルと、表示用の MACDスコア・RSI"""
+    frame = fetch_technical_indicator_frame(symbols, len(symbols), timeframe)
+    frame = frame.set_index("symbol") if not frame.empty else pd.DataFrame(columns=["macd_score", "rsi"])
+    frame = frame.reindex(symbols)
+    macd = pd.to_numeric(frame["macd_score"], errors="coerce").to_numpy(dtype=np.float64)
+    rsi = pd.to_numeric(frame["rsi"], errors="coerce").to_numpy(dtype=np.float64)
+    return {"scores": signal_scores(macd, rsi), "macd_score": macd, "rsi": rsi}
+
+def optimize_selection(params: Dict[str, Any], max_holdings: Optional[int] = None,
+                       use_principal: bool = True, engine=None) -> Dict:
+    """
+    選択銘柄 (selected_symbols) の配分を最適化する
+
+    共分散は portfolio_risk の共分散ブロックを使う (推奨後のリスク分析と同じキャッシュに当たる)。
+
+    Returns:
+        portfolio_optimizer.optimize_allocation の結果に、block (共分散ブロック) と indicators を加えたもの
+    """
+    symbols = sorted({normalize_symbol(s) for s in params.get("selected_symbols") or [] if s})
+    if not symbols:
+        raise ValueError("銘柄が選択されていません")
+    method = resolve_method(params)
+    profile = risk_profile(params.get("risk_tolerance"))
+    engine = engine or get_db_engine()
+    block = covariance_block(symbols, RiskConfig.from_env(), latest_bar(engine, symbols), engine)
+    indicators = _indicator_scores(list(block.symbols), params.get("timeframe") or "daily")
+    principal = float(params["principal"]) if use_principal and params.get("principal") else None
+    allocation = optimize_allocation(block, indicators["scores"], method, profile, principal, max_holdings)
+    allocation["block"] = block
+    allocation["indicators"] = indicators
+    return allocation
+
+def _reason(allocation: Dict, i: int, position: int) -> str:
+    indicators = allocation["indicators"]
+    macd, rsi = indicators["macd_score"][position], indicators["rsi"][position]
+    parts = [
+        f"{METHOD_LABELS[allocation['method']]}による配分",
+        f"年率ボラティリティ {allocation['volatilities'][i] * 100:.1f}%",
+        f"期待リターン {allocation['expected_returns'][i] * 100:.1f}%",
+    ]
+    if np.isfinite(macd):
+        parts.append(f"MACDスコア {macd:.0f}")
+    if np.isfinite(rsi):
+        parts.append(f"RSI {rsi:.0f}")
+    if "shares" in allocation:
+        parts.append(f"{allocation['shares'][i]:,}株 (約{allocation['amounts'][i]:,.0f}円)")
+    return "、".join(parts)
+
+def build_recommendations(allocation: Dict) -> Dict:
+    """最適化の結果を LLM の推奨結果と同じ形式 (recommendations / total_return_estimate) にする"""
+    block, scores = allocation["block"], allocation["indicators"]["scores"]
+    names = fetch_company_info_frame(allocation["symbols"])
+    names = dict(zip(names["symbol"], names["name"])) if not names.empty else {}
+    # 信頼度はユニバース内でのシグナルの順位 (0〜100)
+    ranks = pd.Series(scores).rank(pct=True).to_numpy() * 100
+    order = np.argsort(-allocation["weights"], kind="stable")
+    recommendations = []
+    for i in order:
+        position = block.index[allocation["symbols"][i]]
+        recommendations.append({
+            "symbol": allocation["symbols"][i],
+            "name": names.get(allocation["symbols"][i], ""),
+            "allocation": f"{allocation['weights'][i] * 100:.1f}%",
+            "confidence": round(float(ranks[position]), 1),
+            "reason": _reason(allocation, i, position),
+        })
+    return {
+        "recommendations": recommendations,
+        "total_return_estimate": f"{allocation['expected_return'] * 100:.1f}%",
+    }
+
+def prefilter_symbols(params: Dict[str, Any], top: int) -> List[str]:
+    """
+    LLM に渡す前に候補銘柄を top 銘柄に絞り込む
+
+    元金を考慮せずに最適化した比率の大きい順、比率が0の銘柄はシグナルの高い順に選ぶ。
+    """
+    allocation = optimize_selection(params, max_holdings=top, use_principal=False)
+    block, scores = allocation["block"], allocation["indicators"]["scores"]
+    weights = dict(zip(allocation["symbols"], allocation["weights"]))
+    ranked = sorted(block.symbols, key=lambda s: (-weights.get(s, 0.0), -scores[block.index[s]]))
+    return ranked[:top]
+
+class QuantRecommender(IStockRecommender):
+    """数値最適化で選択銘柄の配分を求める推奨クラス (LLM を使わず、決定的・オフラインで動く)
+
+    配分方法は optimizer_method (mean_variance / risk_parity / inverse_volatility)、
+    リスク許容度は portfolio_optimizer.RISK_PROFILES、元金は単元株の制約に使う。
+    """
+
+    async def execute(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """配分を最適化して推奨結果を返す
+
+        Returns:
+            {"parsed_result": 推奨結果, "raw_response": None,
+             "execution_metrics": {"mode": "quant", "method": ..., "latency_ms": ...}}
+        """
+        start = time.perf_counter()
+        try:
+            allocation = await asyncio.to_thread(optimize_selection, params)
+            parsed = await asyncio.to_thread(build_recommendations, allocation)
+        except ValueError as e:
+            logger.error(f"配分の最適化に失敗しました: {str(e)}")
+            return {"status": "error", "message": str(e)}
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"配分を最適化しました: {allocation['method']}, {len(allocation['symbols'])}銘柄 "
+                    f"(候補 {len(allocation['block'].symbols)}銘柄, {latency_ms}ms)")
+        return {
+            "parsed_result": parsed,
+            "raw_response": None,
+            "execution_metrics": {
+                "mode": "quant",
+                "method": allocation["method"],
+                "universe": len(allocation["block"].symbols),
+                "holdings": len(allocation["symbols"]),
+                "rounds": allocation["rounds"],
+                "expected_return": allocation["expected_return"],
+                "volatility": allocation["volatility"],
+                "latency_ms": latency_ms,
+            },
+        }
@@ -0,0 +1,102 @@
+import os
+import zlib
+from typing import Iterator, Optional, Tuple
+from sqlalchemy import insert, text
+from models import RecommendationRawResponse
+from utils import setup_backend_logger
+
+try:
+    import zstandard
+except ImportError:  # zstdが無い環境ではzlibで圧縮する
+    zstandard = None
+
+logger = setup_backend_logger(__name__)
+
+# ストリーミング応答の1チャンクのバイト数
+RAW_RESPONSE_CHUNK_SIZE = 64 * 1024
+
+def get_raw_response_storage() -> str:
+    """AI生レスポンスの保存先 (inline: recommendation_sessions.ai_raw_response / compressed: 圧縮して別テーブル)"""
+    return os.getenv("RAW_RESPONSE_STORAGE", "inline").lower()
+
+def compress_raw_response(raw: str) -> Tuple[str, bytes]:
+    """生レスポンスを圧縮し (エンコーディング名, 圧縮データ) を返す"""
+    data = raw.encode("utf-8")
+    if zstandard is not None:
+        level = int(os.getenv("RAW_RESPONSE_ZSTD_LEVEL", 10))
+        return "zstd", zstandard.ZstdCompressor(level=level).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+def decompress_raw_response(encoding: str, body: bytes) -> bytes:
+    """圧縮データをUTF-8のバイト列に戻す"""
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd圧縮されたレスポンスの展開には zstandard パッケージが必要です")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if encoding == "zlib":
+        return zlib.decompress(body)
+    return bytes(body)
+
+def store_raw_response(conn, session_id: int, raw: str):
+    """圧縮した生レスポンスを recommendation_raw_responses に保存 (呼び出し元のトランザクション内)"""
+    raw = str(raw)
+    encoding, body = compress_raw_response(raw)
+    conn.execute(insert(RecommendationRawResponse).values(
+        session_id=session_id,
+        encoding=encoding,
+        raw_size=len(raw.encode("utf-8")),
+        body=body
+    ))
+
+def get_raw_response_size(conn, session_id: int) -> Optional[int]:
+    """生レスポンスのバイト数 (未保存ならNone)
+
+    インライン保存分は octet_length を使うため、TOASTされた本文は展開されない。
+    """
+    return conn.execute(text("""
+        SELECT COALESCE(
+            (SELECT raw_size FROM recommendation_raw_responses WHERE session_id = :session_id),
+            (SELECT octet_length(ai_raw_response) FROM recommendation_sessions WHERE session_id = :session_id)
+        )
+    """), {"session_id": session_id}).scalar()
+
+def _read_compressed(conn, session_id: int) -> Optional[bytes]:
+    row = conn.execute(text("""
+        SELECT encoding, body FROM recommendation_raw_responses WHERE session_id = :session_id
+    """), {"session_id": session_id}).first()
+    return decompress_raw_response(row.encoding, row.body) if row is not None else None
+
+def _read_inline(conn, session_id: int, start: int, end: Optional[int]) -> Optional[bytes]:
+    length = None if end is None else max(end - start, 0)
+    return conn.execute(text("""
+        SELECT substring(convert_to(ai_raw_response, 'UTF8') FROM :start
+                         FOR COALESCE(:length, octet_length(ai_raw_response)))
+        FROM recommendation_sessions
+        WHERE session_id = :session_id AND ai_raw_response IS NOT NULL
+    """), {"session_id": session_id, "start": start + 1, "length": length}).scalar()
+
+def read_raw_response(conn, session_id: int, start: int = 0,
+                      end: Optional[int] = None) -> Optional[bytes]:
+    """生レスポンスのバイト範囲 [start, end) をUTF-8バイト列で返す (未保存ならNone)
+
+    インライン保存分はDB側で切り出すため、範囲外の本文は転送されない。
+    """
+    data = _read_compressed(conn, session_id)
+    if data is not None:
+        return data[start:end]
+    data = _read_inline(conn, session_id, start, end)
+    return bytes(data) if data is not None else None
+
+def iter_raw_response(engine, session_id: int, start: int, end: int,
+                      chunk_size: int = RAW_RESPONSE_CHUNK_SIZE) -> Iterator[bytes]:
+    """生レスポンスの範囲をチャンク単位で読み出すジェネレータ (ストリーミング応答用)
+
+    範囲は1回のクエリで読み込んでから分割する (チャンクごとに本文全体を変換し直さない)。
+    """
+    with engine.connect() as conn:
+        data = read_raw_response(conn, session_id, start, end)
+    if not data:
+        return
+    view = memoryview(data)
+    for position in range(0, len(view), chunk_size):
+        yield bytes(view[position:position + chunk_size])
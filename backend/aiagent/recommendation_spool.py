@@ -0,0 +1,170 @@
+import os
+import json
+import uuid
+import time
+import asyncio
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from utils import setup_backend_logger
+from aiagent.data_access import persist_recommendation
+
+logger = setup_backend_logger(__name__)
+
+def get_spool_dir() -> str:
+    """保存待ち推奨結果のスプールディレクトリ"""
+    return os.getenv("RECOMMENDATION_SPOOL_DIR", os.path.join("spool", "recommendations"))
+
+def get_save_mode() -> str:
+    """推奨結果の保存モード (sync: レスポンス前に保存 / async: レスポンス送信後に保存)"""
+    return os.getenv("RECOMMENDATION_SAVE_MODE", "sync").lower()
+
+_replay_lock = threading.Lock()
+
+def spool_recommendation(result: Dict, params: Dict, ai_raw_response: str = None,
+                         execution_metrics: Dict = None) -> str:
+    """保存内容をスプールファイルに書き出す (DB保存が完了するまで残る)
+
+    Returns:
+        str: スプールファイルのパス
+    """
+    spool_dir = get_spool_dir()
+    os.makedirs(spool_dir, exist_ok=True)
+    # ファイル名は時刻順に並ぶようにし、再送時の保存順を維持する
+    name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+    path = os.path.join(spool_dir, name)
+    tmp_path = path + ".tmp"
+    payload = {
+        "result": result,
+        "params": params,
+        "ai_raw_response": ai_raw_response,
+        "execution_metrics": execution_metrics,
+        "attempts": 0,
+    }
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+def _dead_letter(claimed: str):
+    """再試行上限に達したスプールファイルを failed/ に退避"""
+    failed_dir = os.path.join(os.path.dirname(claimed), "failed")
+    os.makedirs(failed_dir, exist_ok=True)
+    os.replace(claimed, os.path.join(failed_dir, os.path.basename(claimed)[:-len(".inflight")] + ".json"))
+
+def _flush(path: str) -> Tuple[Optional[int], Optional[Exception]]:
+    """スプールファイル1件を保存し、(セッションID, 例外) を返す"""
+    claimed = path[:-len(".json")] + ".inflight"
+    try:
+        os.rename(path, claimed)
+        os.utime(claimed)
+    except FileNotFoundError:
+        # 別ワーカーが処理中または保存済み
+        return None, None
+
+    try:
+        with open(claimed, encoding="utf-8") as f:
+            payload = json.load(f)
+    except ValueError as e:
+        # 壊れたファイル (JSONDecodeError / UnicodeDecodeError) は再送しても直らないため .failed に退避
+        failed = claimed[:-len(".inflight")] + ".failed"
+        os.replace(claimed, failed)
+        logger.error(f"スプールファイルを読み込めないため退避しました: {os.path.basename(failed)}: {str(e)}")
+        return None, e
+
+    try:
+        session_id = persist_recommendation(
+            payload["result"], payload["params"],
+            payload.get("ai_raw_response"), payload.get("execution_metrics")
+        )
+    except Exception as e:
+        payload["attempts"] = payload.get("attempts", 0) + 1
+        payload["last_error"] = str(e)
+        with open(claimed, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, default=str)
+        max_attempts = int(os.getenv("RECOMMENDATION_MAX_ATTEMPTS", 20))
+        if payload["attempts"] >= max_attempts:
+            _dead_letter(claimed)
+            logger.error(f"推奨結果の保存を断念しました: {os.path.basename(path)} ({max_attempts}回失敗)")
+        else:
+            os.replace(claimed, path)
+            logger.warning(f"推奨結果の保存に失敗、再送キューに保持: {os.path.basename(path)} "
+                           f"(試行{payload['attempts']}回目): {str(e)}")
+        return None, e
+
+    os.remove(claimed)
+    logger.info(f"推奨結果を保存しました: session_id={session_id}")
+    return session_id, None
+
+def flush_spooled_recommendation(path: str) -> Optional[int]:
+    """スプールファイル1件をDBに保存し、成功したら削除する
+
+    処理中のファイルは .inflight に改名して確保するため、複数ワーカーや
+    再送ループと同時に実行されても二重保存されない。
+
+    Returns:
+        保存されたセッションID (失敗時はNone、ファイルは再送用に残る)
+    """
+    session_id, _ = _flush(path)
+    return session_id
+
+def _release_stale_claims(spool_dir: str, max_age: float = 600):
+    """プロセス異常終了で残った .inflight ファイルを再送対象に戻す"""
+    now = time.time()
+    for name in os.listdir(spool_dir):
+        if not name.endswith(".inflight"):
+            continue
+        claimed = os.path.join(spool_dir, name)
+        try:
+            if now - os.path.getmtime(claimed) > max_age:
+                os.replace(claimed, claimed[:-len(".inflight")] + ".json")
+        except FileNotFoundError:
+            continue
+
+def list_spooled_recommendations() -> List[str]:
+    """再送待ちのスプールファイル一覧 (古い順)"""
+    spool_dir = get_spool_dir()
+    if not os.path.isdir(spool_dir):
+        return []
+    _release_stale_claims(spool_dir)
+    return [os.path.join(spool_dir, name) for name in sorted(os.listdir(spool_dir))
+            if name.endswith(".json")]
+
+def replay_spooled_recommendations() -> int:
+    """再送待ちの推奨結果を古い順に保存する
+
+    DBが利用できない場合は最初の失敗で打ち切り、次回の再送に回す。
+
+    Returns:
+        int: 保存できた件数
+    """
+    if not _replay_lock.acquire(blocking=False):
+        return 0
+    try:
+        saved = 0
+        for path in list_spooled_recommendations():
+            session_id, error = _flush(path)
+            if session_id is not None:
+                saved += 1
+            elif isinstance(error, (OperationalError, InterfaceError)) or \
+                    (isinstance(error, DBAPIError) and error.connection_invalidated):
+                # DB停止中のため残りは次回に回す
+                break
+        return saved
+    finally:
+        _replay_lock.release()
+
+async def run_retry_loop(interval: float = None):
+    """再送キューを定期的に処理するバックグラウンドループ (APIの起動時に開始)"""
+    interval = interval or float(os.getenv("RECOMMENDATION_RETRY_INTERVAL", 30))
+    while True:
+        try:
+            pending = len(list_spooled_recommendations())
+            if pending:
+                saved = await asyncio.to_thread(replay_spooled_recommendations)
+                logger.info(f"推奨結果の再送: {saved}/{pending}件を保存")
+        except Exception as e:
+            logger.exception(f"推奨結果の再送処理でエラー: {str(e)}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,266 @@
+"""
+テクニカル指標のアラート
+
+ユーザーが登録したルール (例: 業種Xで RSI が30を下抜け) を、指標バッチ (technical_indicator_calculator.py) が
+書き込んだ行だけで評価する。発火したアラートは alert_events に保存し、NOTIFY (ALERTS_CHANNEL) で購読者に配信する。
+
+- ルールは指標ごとの索引 (AlertEngine.rules_by_indicator) にまとめ、書き込んだ行の指標ごとに
+  その指標のルールだけを評価する (評価の計算量は書き込んだ行数 × その指標のルール数)。
+- 「下抜け・上抜け」の判定に使う前の足の値は、バッチが計算に使った DataFrame から取り、DBは読まない。
+- 同じルール・銘柄・足のアラートは1回だけ保存する (--days で同じ足を再計算しても重複しない)。
+"""
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from bar_aggregates import TIMEFRAMES
+from pg_listener import notify, payload_chunks
+
+logger = logging.getLogger(__name__)
+
+# 発火したアラートの通知チャネル
+ALERTS_CHANNEL = "alerts_fired"
+
+# 指標ごとの条件 (真偽値の指標は発生した足で発火)
+NUMERIC_INDICATORS = ("rsi", "macd_score")
+BOOLEAN_INDICATORS = ("golden_cross", "dead_cross")
+INDICATORS = NUMERIC_INDICATORS + BOOLEAN_INDICATORS
+
+CONDITIONS = {
+    "above": lambda value, previous, threshold: value > threshold,
+    "below": lambda value, previous, threshold: value < threshold,
+    "crosses_above": lambda value, previous, threshold: (previous <= threshold) & (value > threshold),
+    "crosses_below": lambda value, previous, threshold: (previous >= threshold) & (value < threshold),
+    "occurs": lambda value, previous, threshold: value == 1,
+}
+NUMERIC_CONDITIONS = ("above", "below", "crosses_above", "crosses_below")
+
+RULE_COLUMNS = ("name", "indicator", "condition", "threshold", "timeframe",
+                "symbols", "industry_code", "scale_code", "enabled")
+
+@dataclass
+class AlertRule:
+    """アラートのルール (symbols・industry_code・scale_code は対象の絞り込み、未指定は全銘柄)"""
+    id: int
+    name: str
+    indicator: str
+    condition: str
+    threshold: Optional[float] = None
+    timeframe: str = "daily"
+    symbols: Optional[Tuple[str, ...]] = None
+    industry_code: Optional[str] = None
+    scale_code: Optional[str] = None
+
+def validate_rule(rule: Dict) -> Dict:
+    """
+    ルールの入力を検証して保存する値にする
+
+    Raises:
+        ValueError: 未対応の指標・条件・時間軸、閾値の不足
+    """
+    indicator, condition = rule.get("indicator"), rule.get("condition")
+    if indicator not in INDICATORS:
+        raise ValueError(f"未対応の指標: {indicator} ({' / '.join(INDICATORS)})")
+    allowed = NUMERIC_CONDITIONS if indicator in NUMERIC_INDICATORS else ("occurs",)
+    if condition not in allowed:
+        raise ValueError(f"{indicator} に未対応の条件: {condition} ({' / '.join(allowed)})")
+    threshold = rule.get("threshold")
+    if indicator in NUMERIC_INDICATORS and threshold is None:
+        raise ValueError(f"{indicator} の条件には閾値 (threshold) が必要です")
+    timeframe = (rule.get("timeframe") or "daily").lower()
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"未対応の時間軸: {timeframe} ({' / '.join(TIMEFRAMES)})")
+    return {
+        "name": rule.get("name") or f"{indicator} {condition} {threshold if threshold is not None else ''}".strip(),
+        "indicator": indicator,
+        "condition": condition,
+        "threshold": float(threshold) if indicator in NUMERIC_INDICATORS else None,
+        "timeframe": timeframe,
+        "symbols": sorted(set(rule["symbols"])) if rule.get("symbols") else None,
+        "industry_code": rule.get("industry_code") or None,
+        "scale_code": rule.get("scale_code") or None,
+        "enabled": rule.get("enabled", True),
+    }
+
+class AlertEngine:
+    """有効なルールを指標ごとに索引化して、書き込んだ行を評価する"""
+
+    def __init__(self, rules: Iterable[AlertRule], stocks: Optional[pd.DataFrame] = None):
+        self.rules_by_indicator: Dict[str, List[AlertRule]] = {}
+        for rule in rules:
+            self.rules_by_indicator.setdefault(rule.indicator, []).append(rule)
+        # 業種・規模の絞り込み用 (銘柄 → 業種コード・規模コード)
+        self.stocks = stocks.set_index("symbol") if stocks is not None else pd.DataFrame(
+            columns=["industry_code_33", "scale_code"])
+
+    @classmethod
+    def load(cls, engine, timeframe: str = "daily") -> "AlertEngine":
+        """時間軸の有効なルールと銘柄の業種・規模を読み込む"""
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT id, name, indicator, condition, threshold, timeframe, symbols, industry_code, scale_code
+                FROM alert_rules WHERE enabled AND timeframe = :timeframe
+            """), {"timeframe": timeframe}).mappings().all()
+            rules = [AlertRule(**{**row, "symbols": tuple(row["symbols"]) if row["symbols"] else None})
+                     for row in rows]
+            stocks = None
+            if any(rule.industry_code or rule.scale_code for rule in rules):
+                stocks = pd.DataFrame(conn.execute(text(
+                    "SELECT symbol, industry_code_33, scale_code FROM stocks"
+                )).mappings().all(), columns=["symbol", "industry_code_33", "scale_code"])
+        return cls(rules, stocks)
+
+    @property
+    def rule_count(self) -> int:
+        return sum(len(rules) for rules in self.rules_by_indicator.values())
+
+    def evaluate(self, indicators: pd.DataFrame, days: int) -> pd.DataFrame:
+        """
+        指標を計算した DataFrame の各銘柄の直近 days 本 (バッチが書き込んだ行) を評価する
+
+        指標バッチの DataFrame は銘柄・日付順 (読み込みの ORDER BY symbol, date) なので、
+        書き込んだ行とその前の行の位置だけを求め、指標の値はその位置だけを取り出して評価する。
+
+        Returns:
+            DataFrame: rule_id, symbol, date, value, previous (発火したアラート)
+        """
+        columns = ["rule_id", "symbol", "date", "value", "previous"]
+        if not self.rules_by_indicator or indicators.empty:
+            return pd.DataFrame(columns=columns)
+        if not indicators["symbol"].is_monotonic_increasing:
+            indicators = indicators.sort_values(["symbol", "date"], kind="stable")
+        codes, _ = pd.factorize(indicators["symbol"])
+        n = len(codes)
+        # 銘柄の末尾から days 本以内の行 (days 本先が別の銘柄、または表の末尾)
+        ahead = np.arange(n) + days
+        rows = np.flatnonzero((ahead >= n) | (codes[np.minimum(ahead, n - 1)] != codes))
+        # 前の足 (銘柄の最初の足には無いため、下抜け・上抜けは判定しない)
+        has_previous = (rows > 0) & (codes[rows - 1] == codes[rows])
+        symbols = indicators["symbol"].to_numpy()[rows]
+        dates = indicators["date"].to_numpy()[rows]
+        scope_cache: Dict[Tuple, np.ndarray] = {}
+        events = []
+        for indicator, rules in self.rules_by_indicator.items():
+            column = indicators[indicator].to_numpy()
+            values = pd.Series(column[rows]).astype(np.float64).to_numpy()
+            previous = pd.Series(column[rows - 1]).astype(np.float64).to_numpy()
+            previous[~has_previous] = np.nan
+            for rule in rules:
+                with np.errstate(invalid="ignore"):
+                    fired = CONDITIONS[rule.condition](values, previous, rule.threshold)
+                fired &= self._scope(rule, symbols, scope_cache)
+                if fired.any():
+                    events.append(pd.DataFrame({
+                        "rule_id": rule.id, "symbol": symbols[fired], "date": dates[fired],
+                        "value": values[fired], "previous": previous[fired],
+                    }))
+        return pd.concat(events, ignore_index=True) if events else pd.DataFrame(columns=columns)
+
+    def _scope(self, rule: AlertRule, symbols: np.ndarray, cache: Dict) -> np.ndarray:
+        """ルールの対象銘柄のマスク (同じ絞り込みのルールで使い回す)"""
+        key = (rule.symbols, rule.industry_code, rule.scale_code)
+        if key not in cache:
+            mask = np.ones(len(symbols), dtype=bool)
+            if rule.symbols:
+                mask &= np.isin(symbols, rule.symbols)
+            if rule.industry_code:
+                mask &= self.stocks["industry_code_33"].reindex(symbols).to_numpy() == rule.industry_code
+            if rule.scale_code:
+                mask &= self.stocks["scale_code"].reindex(symbols).to_numpy() == rule.scale_code
+            cache[key] = mask
+        return cache[key]
+
+def _bar_date(dates: pd.Series, timeframe: str) -> pd.Series:
+    """足の日付 (日足の日時は日本時間の日付にする)"""
+    dates = pd.to_datetime(dates)
+    if timeframe == "daily" and dates.dt.tz is not None:
+        dates = dates.dt.tz_convert("Asia/Tokyo")
+    return dates.dt.date
+
+def store_events(engine, events: pd.DataFrame, timeframe: str = "daily") -> List[Dict]:
+    """
+    発火したアラートを保存し、新しく保存したものを ALERTS_CHANNEL に通知する (コミット時に配信される)
+
+    Returns:
+        list: 新しく保存したアラート (保存済みの重複は除く)
+    """
+    if events.empty:
+        return []
+    rows = [
+        {"rule_id": int(e.rule_id), "symbol": e.symbol, "date": d, "timeframe": timeframe,
+         "value": None if pd.isna(e.value) else float(e.value),
+         "previous": None if pd.isna(e.previous) else float(e.previous)}
+        for e, d in zip(events.itertuples(index=False), _bar_date(events["date"], timeframe))
+    ]
+    with engine.begin() as conn:
+        inserted = conn.execute(text("""
+            INSERT INTO alert_events (rule_id, symbol, date, timeframe, value, previous)
+            SELECT * FROM jsonb_to_recordset(CAST(:rows AS JSONB))
+                AS r(rule_id INTEGER, symbol TEXT, date DATE, timeframe VARCHAR(10), value REAL, previous REAL)
+            ON CONFLICT (rule_id, symbol, date, timeframe) DO NOTHING
+            RETURNING id, rule_id, symbol, TO_CHAR(date, 'YYYY-MM-DD') AS date, timeframe, value
+        """), {"rows": json.dumps(rows, default=str)}).mappings().all()
+        inserted = [dict(row) for row in inserted]
+        for chunk in payload_chunks(inserted):
+            notify(conn, ALERTS_CHANNEL, {"events": chunk})
+    return inserted
+
+def list_rules(conn) -> List[Dict]:
+    rows = conn.execute(text(f"""
+        SELECT id, {', '.join(RULE_COLUMNS)}, created_at, updated_at FROM alert_rules ORDER BY id
+    """)).mappings().all()
+    return [dict(row) for row in rows]
+
+def create_rule(conn, rule: Dict) -> Dict:
+    values = validate_rule(rule)
+    row = conn.execute(text(f"""
+        INSERT INTO alert_rules ({', '.join(RULE_COLUMNS)})
+        VALUES ({', '.join(f':{column}' for column in RULE_COLUMNS)})
+        RETURNING id, {', '.join(RULE_COLUMNS)}, created_at, updated_at
+    """), values).mappings().one()
+    return dict(row)
+
+def update_rule(conn, rule_id: int, rule: Dict) -> Optional[Dict]:
+    values = validate_rule(rule)
+    row = conn.execute(text(f"""
+        UPDATE alert_rules SET {', '.join(f'{column} = :{column}' for column in RULE_COLUMNS)},
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = :id
+        RETURNING id, {', '.join(RULE_COLUMNS)}, created_at, updated_at
+    """), {**values, "id": rule_id}).mappings().first()
+    return dict(row) if row else None
+
+def delete_rule(conn, rule_id: int) -> bool:
+    return conn.execute(text("DELETE FROM alert_rules WHERE id = :id"), {"id": rule_id}).rowcount > 0
+
+def list_events(conn, rule_id: Optional[int] = None, symbol: Optional[str] = None,
+                after_id: Optional[int] = None, limit: int = 100) -> List[Dict]:
+    """発火したアラート (新しい順、after_id を指定するとそれより後に発火したもの)"""
+    conditions, params = [], {"limit": limit}
+    if rule_id is not None:
+        conditions.append("e.rule_id = :rule_id")
+        params["rule_id"] = rule_id
+    if symbol:
+        conditions.append("e.symbol = :symbol")
+        params["symbol"] = symbol
+    if after_id is not None:
+        conditions.append("e.id > :after_id")
+        params["after_id"] = after_id
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = conn.execute(text(f"""
+        SELECT e.id, e.rule_id, r.name AS rule_name, r.indicator, r.condition, r.threshold,
+            e.symbol, s.name, TO_CHAR(e.date, 'YYYY-MM-DD') AS date, e.timeframe, e.value, e.previous,
+            e.fired_at
+        FROM alert_events e
+        JOIN alert_rules r ON r.id = e.rule_id
+        LEFT JOIN stocks s ON s.symbol = e.symbol
+        {where}
+        ORDER BY e.id DESC
+        LIMIT :limit
+    """), params).mappings().all()
+    return [dict(row) for row in rows]
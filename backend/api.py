@@ -1,7 +1,10 @@
-from fastapi import FastAPI, HTTPException, Depends
+import os
+import time
+import asyncio
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request
 import datetime
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from sqlalchemy.orm import Session, sessionmaker
 from models import PromptTemplate
 from typing import List, Optional
@@ -12,16 +15,43 @@ from utils import setup_backend_logger, get_db_engine, get_ma_settings
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from technical_indicators import calculate_moving_average, calculate_macd, calculate_rsi
+from bar_aggregates import timeframe_config, DEFAULT_CHART_YEARS
 from stock_recommender import recommend_stocks
+from backtest import BacktestConfig, BacktestLimits, run_from_store
+from recommendation_performance import HORIZONS, performance_summary
+from cross_section import RANK_COLUMNS, rank_filter, sector_averages
+from similarity import similar_stocks
+from alerts import create_rule, delete_rule, list_events, list_rules, update_rule
+from indicator_stream import indicator_stream
+from aiagent.recommendation_spool import run_retry_loop
+from aiagent.prompt_cache import prompt_template_cache
+from aiagent.data_access import normalize_symbol
+from aiagent.raw_response_store import get_raw_response_size, read_raw_response, iter_raw_response
+from pg_listener import PgListener
+from invalidation import (
+    PRICES_UPDATED, STOCKS_UPDATED, CacheConfig, TaggedCache, invalidation_bus, publish_prompts_changed
+)
+from metrics import REGISTRY, HTTP_REQUESTS, HTTP_REQUEST_DURATION, CHART_RENDER_DURATION
+import profiling
 from interfaces import (
     RecommendationRequest,
     SelectedRecommendationRequest,
     PromptTemplateRequest,
     PromptTemplateResponse,
     GetStocksParams,
-    GetStocksResponse
+    GetStocksResponse,
+    ProfilingSettingsRequest,
+    BacktestRequest,
+    AlertRuleRequest
 )
 
+def resolve_timeframe(timeframe: Optional[str]) -> dict:
+    """時間軸の設定を取得 (無効な値は400)"""
+    try:
+        return timeframe_config(timeframe)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 def get_db():
     """データベースセッションを取得"""
     engine = get_db_engine()
@@ -32,6 +62,13 @@ def get_db():
     finally:
         db.close()
 
+# レスポンスキャッシュ (無効化イベントで影響のある銘柄のキーだけを破棄するので、TTL は長くてよい)
+cache_config = CacheConfig.from_env()
+chart_cache = TaggedCache("chart", cache_config.ttl, cache_config.chart_size)
+stock_codes_cache = TaggedCache("stock_codes", cache_config.ttl, 10)
+invalidation_bus.register(chart_cache.invalidate, PRICES_UPDATED, STOCKS_UPDATED)
+invalidation_bus.register(stock_codes_cache.invalidate, STOCKS_UPDATED)
+
 # ロギング設定の初期化（バックエンド全体で共通）
 logger = setup_backend_logger(__name__)
 
@@ -52,6 +89,82 @@ app.add_middleware(
 )
 logger.info("CORSミドルウェアが設定されました: すべてのオリジンを許可")
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """ルート別のリクエスト数と処理時間を記録"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # パスパラメータを含む実パスではなくルート定義でまとめる
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(method=request.method, route=route_path, status=str(status))
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - start,
+                                      method=request.method, route=route_path)
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """X-Profile ヘッダまたはサンプリング率で選ばれたリクエストをプロファイル"""
+    mode = profiling.select_request_mode(request.headers)
+    if mode is None:
+        return await call_next(request)
+    response, path = await profiling.profile_request(
+        mode, f"{request.method}-{request.url.path}", call_next, request)
+    if path:
+        response.headers["X-Profile-Artifact"] = os.path.basename(path)
+    return response
+
+if profiling.API_ENABLED:
+    # 設定の変更は任意のリクエストのプロファイルを許すため、開発・検証環境でのみ登録する
+    @app.get("/api/debug/profiling", response_model=dict)
+    async def get_profiling_settings():
+        """リクエストプロファイリングの現在の設定を取得"""
+        return profiling.config.to_dict()
+
+    @app.put("/api/debug/profiling", response_model=dict)
+    async def update_profiling_settings(request: ProfilingSettingsRequest):
+        """リクエストプロファイリングの設定を変更 (このワーカーのみ、再起動で環境変数の値に戻る)"""
+        try:
+            profiling.config.update(request.model_dump())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        logger.info(f"プロファイリング設定を変更しました: {profiling.config.to_dict()}")
+        return profiling.config.to_dict()
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus形式のメトリクス"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.on_event("startup")
+async def start_recommendation_retry_loop():
+    """未保存の推奨結果（スプール）の再送ループを開始"""
+    app.state.recommendation_retry_task = asyncio.create_task(run_retry_loop())
+
+@app.on_event("startup")
+async def start_prompt_template_cache():
+    """プロンプトテンプレートを先読みし、バッチ・他ワーカーからの無効化イベントとアラートの受信を開始"""
+    listener = PgListener()
+    invalidation_bus.attach(listener)
+    indicator_stream.attach(listener, asyncio.get_running_loop())
+    listener.start()
+    app.state.pg_listener = listener
+    try:
+        await asyncio.to_thread(prompt_template_cache.reload)
+    except Exception as e:
+        logger.warning(f"プロンプトテンプレートの先読みに失敗（初回参照時に再試行）: {str(e)}")
+
+@app.on_event("shutdown")
+async def stop_pg_listener():
+    """変更通知の受信を停止"""
+    listener = getattr(app.state, "pg_listener", None)
+    if listener is not None:
+        await asyncio.to_thread(listener.stop)
+
 @app.get("/api/stocks", response_model=GetStocksResponse)
 async def get_stocks(
     params: GetStocksParams = Depends(),
@@ -67,10 +180,14 @@ async def get_stocks(
     """銘柄一覧を取得するエンドポイント（ページネーション・ソート対応）"""
     try:
         # リクエスト情報をログに出力
-        logger.info(f"受信リクエスト: GET /stocks?page={page}&limit={limit}&search={search}&sort_by={sort_by}&sort_order={sort_order}")
+        logger.info(f"受信リクエスト: GET /stocks?page={page}&limit={limit}&search={search}&sort_by={sort_by}&sort_order={sort_order}&timeframe={params.timeframe}")
+
+        # 指標の時間軸 (daily / weekly / monthly)
+        indicators_table = resolve_timeframe(params.timeframe)["indicators"]
         
         # 有効なソートカラムのリスト
-        valid_columns = ["symbol", "name", "industry", "technical_date", "golden_cross", "dead_cross", "rsi", "macd_score"]
+        valid_columns = ["symbol", "name", "industry", "technical_date", "golden_cross", "dead_cross", "rsi", "macd_score",
+                         "momentum", *RANK_COLUMNS]
         
         # ソートカラムの検証
         if sort_by and sort_by not in valid_columns:
@@ -130,13 +247,21 @@ async def get_stocks(
                 ti.dead_cross,
                 ti.rsi,
                 ti.macd_score,
-                TO_CHAR(ti.date, 'YYYY-MM-DD') as technical_date
+                TO_CHAR(ti.date, 'YYYY-MM-DD') as technical_date,
+                tr.momentum,
+                {", ".join(f"tr.{column}" for column in RANK_COLUMNS)},
+                TO_CHAR(tr.date, 'YYYY-MM-DD') as ranking_date
             FROM stocks s
-            LEFT JOIN (
-                SELECT DISTINCT ON (symbol) *
-                FROM technical_indicators
-                ORDER BY symbol, date DESC
-            ) ti ON s.symbol = ti.symbol
+            LEFT JOIN LATERAL (
+                SELECT *
+                FROM {indicators_table}
+                WHERE symbol = s.symbol
+                ORDER BY date DESC
+                LIMIT 1
+            ) ti ON true
+            -- 順位は日足の最新の営業日の値 (batch/cross_section_calculator.py で計算済み)
+            LEFT JOIN technical_rankings tr
+                ON tr.symbol = s.symbol AND tr.date = (SELECT MAX(date) FROM technical_rankings)
             {search_condition}
             ORDER BY {sort_by} {sort_order} NULLS LAST
             LIMIT :limit OFFSET :offset
@@ -177,11 +302,70 @@ async def get_stocks(
             detail=f"銘柄一覧取得エラー: {str(e)}"
         )
 
+@app.get("/api/stocks/{symbol}/similar", response_model=dict)
+async def get_similar_stocks(symbol: str, window: Optional[int] = None, kind: str = "returns", k: int = 10,
+                             db: Session = Depends(get_db)):
+    """値動きが似ている銘柄を取得 (kind: returns / trajectory、window: 埋め込みの期間(営業日)、k: 件数)
+
+    夜間バッチ (batch/similarity_index_builder.py) が作成したインデックスをプロセス内に読み込んで検索する。
+    """
+    try:
+        symbol = normalize_symbol(symbol.strip().upper())
+        result = await asyncio.to_thread(similar_stocks, db.get_bind(), symbol, window, kind, k)
+        names = db.execute(text("""
+            SELECT symbol, name, industry_name_33 AS industry, scale_name
+            FROM stocks WHERE symbol = ANY(:symbols)
+        """), {"symbols": [item["symbol"] for item in result["similar"]]}).mappings().all()
+        names = {row["symbol"]: row for row in names}
+        for item in result["similar"]:
+            row = names.get(item["symbol"], {})
+            item.update(name=row.get("name"), industry=row.get("industry"), scale_name=row.get("scale_name"))
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SQLAlchemyError as e:
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"データベースエラー: {str(e)}"
+        )
+
+@app.get("/api/sector-indicators", response_model=dict)
+async def get_sector_indicators(
+    db: Session = Depends(get_db),
+    group_type: str = "industry",
+    group_code: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """業種・規模・市場全体の RSI・モメンタム・MACDヒストグラムの平均を取得
+
+    group_code を指定するとそのグループの日次の推移、省略すると最新の営業日の全グループを返す
+    (batch/cross_section_calculator.py が保存した値を返す)。
+    """
+    try:
+        return {
+            "group_type": group_type,
+            "group_code": group_code,
+            "averages": sector_averages(db, group_type, group_code, start_date, end_date)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"データベースエラー: {str(e)}"
+        )
+
 @app.post("/api/prepare-recommendations", response_model=dict)
 async def prepare_recommendations(request: RecommendationRequest, db: Session = Depends(get_db)):
     """推奨銘柄準備エンドポイント"""
     try:
         logger.info(f"フィルタリングリクエスト受信: {request.model_dump()}")
+        indicators_table = resolve_timeframe(request.timeframe)["indicators"]
 
         # 対象銘柄関連の入力がない場合は空のリストを返す
         has_stock_related_input = (
@@ -240,6 +424,15 @@ async def prepare_recommendations(request: RecommendationRequest, db: Session =
                         where_clauses.append("ti.golden_cross = true")
                     elif str(value).lower() == 'true':
                         where_clauses.append("ti.golden_cross = true")
+                elif indicator in RANK_COLUMNS:
+                    # 順位フィルタ (例: {"momentum_industry_rank": [">=", 80]}、不正な条件は400)
+                    if not isinstance(value, (list, tuple)) or len(value) != 2:
+                        raise HTTPException(status_code=400,
+                                            detail=f"順位フィルタは [演算子, 値] で指定してください: {indicator}")
+                    try:
+                        where_clauses.append(rank_filter(indicator, *value))
+                    except ValueError as e:
+                        raise HTTPException(status_code=400, detail=str(e))
 
         where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
 
@@ -251,17 +444,23 @@ async def prepare_recommendations(request: RecommendationRequest, db: Session =
                 s.scale_name as scale_name,
                 ti.rsi,
                 ti.golden_cross,
-                TO_CHAR(ti.date, 'YYYY-MM-DD') as indicator_date
+                TO_CHAR(ti.date, 'YYYY-MM-DD') as indicator_date,
+                tr.momentum,
+                {", ".join(f"tr.{column}" for column in RANK_COLUMNS)}
             FROM stocks s
-            LEFT JOIN (
-                SELECT DISTINCT ON (symbol) *
-                FROM technical_indicators
-                ORDER BY symbol, date DESC
-            ) ti ON s.symbol = ti.symbol
+            LEFT JOIN LATERAL (
+                SELECT *
+                FROM {indicators_table}
+                WHERE symbol = s.symbol
+                ORDER BY date DESC
+                LIMIT 1
+            ) ti ON true
+            LEFT JOIN technical_rankings tr
+                ON tr.symbol = s.symbol AND tr.date = (SELECT MAX(date) FROM technical_rankings)
             {where_sql}
         """
 
-        logger.info(f"テクニカル指標取得SQL：{text(query)}")
+        logger.debug("テクニカル指標取得SQL：%s", query)
         result = db.execute(text(query), search_params)
         stocks = [dict(row._mapping) for row in result]
         logger.info(f"銘柄件数：{len(stocks)}")
@@ -271,12 +470,14 @@ async def prepare_recommendations(request: RecommendationRequest, db: Session =
             "params": request.model_dump()
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(f"フィルタリングエラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"フィルタリングエラー: {str(e)}")
 
 @app.post("/api/recommend", response_model=dict)
-async def recommend(request: SelectedRecommendationRequest):
+async def recommend(request: SelectedRecommendationRequest, background_tasks: BackgroundTasks):
     """選択された銘柄のみで推奨生成"""
     try:
         logger.info(f"推奨リクエスト受信: {request.model_dump()}")
@@ -284,7 +485,7 @@ async def recommend(request: SelectedRecommendationRequest):
         params = request.model_dump()
         params['symbols'] = request.selected_symbols
         params['agent_type'] = request.agent_type
-        result = await recommend_stocks(params)
+        result = await recommend_stocks(params, background_tasks)
 
         if result.get("status") == "error":
             raise HTTPException(
@@ -307,10 +508,15 @@ async def recommend(request: SelectedRecommendationRequest):
 @app.get("/api/industry-codes", response_model=list)
 async def get_industry_codes(db: Session = Depends(get_db)):
     """業種コードと業種名の一覧を取得"""
+    cached = stock_codes_cache.get("industry")
+    if cached is not None:
+        return cached
     try:
         query = "SELECT DISTINCT industry_code_33 as code, industry_name_33 as name FROM stocks ORDER BY code"
         result = db.execute(text(query))
-        return [dict(row._mapping) for row in result]
+        codes = [dict(row._mapping) for row in result]
+        stock_codes_cache.put("industry", codes)
+        return codes
     except Exception as e:
         logger.exception(f"業種コード取得エラー: {str(e)}")
         raise HTTPException(status_code=500, detail="業種コードの取得に失敗しました")
@@ -376,7 +582,10 @@ async def create_prompt(request: PromptTemplateRequest, db: Session = Depends(ge
             updated_at=datetime.datetime.now(datetime.timezone.utc)
         )
         db.add(prompt)
+        db.flush()
+        publish_prompts_changed(db, prompt.id)
         db.commit()
+        prompt_template_cache.invalidate()
         db.refresh(prompt)
         
         prompt = db.query(PromptTemplate).filter_by(name=request.name).first()
@@ -418,9 +627,11 @@ async def update_prompt(id: int, request: PromptTemplateRequest, db: Session = D
         
         # 変更を検証
         db.flush()
+        publish_prompts_changed(db, id)
         
         # コミット
         db.commit()
+        prompt_template_cache.invalidate()
         
         # 最新データを取得
         db.refresh(prompt)
@@ -463,7 +674,9 @@ async def delete_prompt(id: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="プロンプトが見つかりません")
             
         db.delete(prompt)
+        publish_prompts_changed(db, id)
         db.commit()
+        prompt_template_cache.invalidate()
         return {"message": "プロンプトを削除しました"}
     except Exception as e:
         db.rollback()
@@ -473,19 +686,37 @@ async def delete_prompt(id: int, db: Session = Depends(get_db)):
 @app.get("/api/scale-codes", response_model=list)
 async def get_scale_codes(db: Session = Depends(get_db)):
     """規模コードと規模名の一覧を取得"""
+    cached = stock_codes_cache.get("scale")
+    if cached is not None:
+        return cached
     try:
         query = "SELECT DISTINCT scale_code as code, scale_name as name FROM stocks ORDER BY code"
         result = db.execute(text(query))
-        return [dict(row._mapping) for row in result]
+        codes = [dict(row._mapping) for row in result]
+        stock_codes_cache.put("scale", codes)
+        return codes
     except Exception as e:
         logger.exception(f"規模コード取得エラー: {str(e)}")
         raise HTTPException(status_code=500, detail="規模コードの取得に失敗しました")
 
 @app.get("/api/chart/{symbol}", response_model=dict)
-async def get_chart(symbol: str, db: Session = Depends(get_db)):
-    """銘柄のチャート画像をBase64で取得"""
+async def get_chart(symbol: str, timeframe: str = "daily", years: Optional[float] = None,
+                    db: Session = Depends(get_db)):
+    """銘柄のチャート画像をBase64で取得 (timeframe: daily / weekly / monthly、years: 表示期間)"""
     try:
-        logger.info(f"受信リクエスト: GET /chart/{symbol}")
+        logger.info(f"受信リクエスト: GET /chart/{symbol}?timeframe={timeframe}&years={years}")
+        bars_table = resolve_timeframe(timeframe)["bars"]
+        timeframe = timeframe.lower()
+        if years is None:
+            years = DEFAULT_CHART_YEARS[timeframe]
+        if years <= 0:
+            raise HTTPException(status_code=400, detail=f"無効な表示期間: {years}")
+
+        # 表示期間は当日から遡るので日付もキーに含める (株価・銘柄情報の更新時は無効化イベントで破棄)
+        cache_key = (symbol, timeframe, years, datetime.date.today())
+        cached = chart_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # 1. 銘柄情報取得（会社名取得用）
         result = db.execute(text("SELECT name FROM stocks WHERE symbol = :symbol"), {"symbol": symbol})
@@ -496,14 +727,14 @@ async def get_chart(symbol: str, db: Session = Depends(get_db)):
         
         company_name = stock_info['name']
         
-        # 2. チャートデータ取得
-        result = db.execute(text("""
+        # 2. チャートデータ取得 (週足・月足は集計テーブルから読む)
+        result = db.execute(text(f"""
             SELECT date, open, high, low, close, volume
-            FROM stock_prices
+            FROM {bars_table}
             WHERE symbol = :symbol
-              AND date >= CURRENT_DATE - INTERVAL '1 year'
+              AND date >= CURRENT_DATE - make_interval(months => :months)
             ORDER BY date ASC
-        """), {"symbol": symbol})
+        """), {"symbol": symbol, "months": max(1, round(years * 12))})
         chart_data = [dict(row._mapping) for row in result]
     
         # 3. チャート生成
@@ -519,7 +750,8 @@ async def get_chart(symbol: str, db: Session = Depends(get_db)):
         df['rsi'] = calculate_rsi(df)  # RSI計算
         
         # チャート生成
-        output_path = plot_candlestick(df, symbol, company_name)
+        with CHART_RENDER_DURATION.time():
+            output_path = plot_candlestick(df, symbol, company_name, timeframe=timeframe)
         
         # 出力パスがNoneの場合のエラーハンドリング
         if output_path is None:
@@ -534,11 +766,14 @@ async def get_chart(symbol: str, db: Session = Depends(get_db)):
         with open(output_path, "rb") as image_file:
             encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
         
-        return {
+        response = {
             "symbol": symbol,
             "company_name": company_name,
+            "timeframe": timeframe,
             "image": f"data:image/png;base64,{encoded_string}"
         }
+        chart_cache.put(cache_key, response, [symbol])
+        return response
     except SQLAlchemyError as e:
         logger.exception(f"データベースエラー: {str(e)}")
         raise HTTPException(
@@ -560,6 +795,132 @@ async def get_chart(symbol: str, db: Session = Depends(get_db)):
             detail=f"チャート生成エラー: {str(e)}"
         )
 
+@app.post("/api/backtest", response_model=dict)
+async def run_backtest_endpoint(request: BacktestRequest):
+    """売買シグナルのバックテストを実行 (成績の要約・資産推移・上位/下位銘柄を返す)"""
+    logger.info(f"受信リクエスト: POST /backtest strategy={request.strategy} timeframe={request.timeframe} "
+                f"symbols={len(request.symbols) if request.symbols else 'all'}")
+    try:
+        config = BacktestConfig(
+            strategy=request.strategy,
+            cost_bps=request.cost_bps,
+            execution=request.execution,
+            timeframe=(request.timeframe or "daily").lower()
+        ).with_overrides(request.params)
+        start_date, end_date = BacktestLimits.from_env().resolve_period(
+            request.symbols, request.start_date or None, request.end_date or None)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # 配列演算が数秒かかるため、イベントループを塞がないようスレッドで実行
+        result = await asyncio.to_thread(
+            run_from_store, get_db_engine(), config, request.symbols, start_date, end_date
+        )
+        return result.to_report(request.top)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"データベースエラー: {str(e)}"
+        )
+    except Exception as e:
+        logger.exception(f"バックテストエラー: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"バックテストエラー: {str(e)}"
+        )
+
+@app.get("/api/alerts/rules", response_model=list)
+async def get_alert_rules(db: Session = Depends(get_db)):
+    """アラートのルールの一覧を取得"""
+    try:
+        return list_rules(db)
+    except SQLAlchemyError as e:
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"データベースエラー: {str(e)}")
+
+@app.post("/api/alerts/rules", response_model=dict)
+async def create_alert_rule(request: AlertRuleRequest, db: Session = Depends(get_db)):
+    """アラートのルールを作成 (次回の指標バッチから、書き込んだ足で評価する)"""
+    try:
+        rule = create_rule(db, request.model_dump())
+        db.commit()
+        return rule
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"データベースエラー: {str(e)}")
+
+@app.put("/api/alerts/rules/{id}", response_model=dict)
+async def update_alert_rule(id: int, request: AlertRuleRequest, db: Session = Depends(get_db)):
+    """アラートのルールを更新"""
+    try:
+        rule = update_rule(db, id, request.model_dump())
+        if rule is None:
+            raise HTTPException(status_code=404, detail="アラートのルールが見つかりません")
+        db.commit()
+        return rule
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"データベースエラー: {str(e)}")
+
+@app.delete("/api/alerts/rules/{id}")
+async def delete_alert_rule(id: int, db: Session = Depends(get_db)):
+    """アラートのルールを削除 (発火したアラートも削除される)"""
+    try:
+        if not delete_rule(db, id):
+            raise HTTPException(status_code=404, detail="アラートのルールが見つかりません")
+        db.commit()
+        return {"message": "アラートのルールを削除しました"}
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"データベースエラー: {str(e)}")
+
+@app.get("/api/alerts/events", response_model=list)
+async def get_alert_events(rule_id: Optional[int] = None, symbol: Optional[str] = None,
+                           after_id: Optional[int] = None, limit: int = 100,
+                           db: Session = Depends(get_db)):
+    """発火したアラートを新しい順に取得 (after_id: 取得済みの最後のIDより後のものだけを返す)"""
+    if limit <= 0 or limit > 1000:
+        raise HTTPException(status_code=400, detail=f"無効な件数: {limit}")
+    try:
+        return list_events(db, rule_id, symbol, after_id, limit)
+    except SQLAlchemyError as e:
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"データベースエラー: {str(e)}")
+
+@app.get("/api/stream/indicators")
+async def stream_indicators(symbols: Optional[str] = None, timeframe: Optional[str] = None):
+    """
+    指標の更新と発火したアラートを Server-Sent Events で配信
+
+    symbols: 購読する銘柄コード (カンマ区切り、省略時は全銘柄)
+    timeframe: 購読する時間軸 (カンマ区切り、省略時は daily)
+
+    イベント: ready (購読開始) / update (変わった最新の指標の行とアラート) /
+    resync (取りこぼしの可能性、一覧を取得し直す) / dropped (受信が追いつかず切断)
+    """
+    try:
+        subscription = indicator_stream.subscribe(
+            [s.strip() for s in symbols.split(",") if s.strip()] if symbols else None,
+            [t.strip().lower() for t in timeframe.split(",") if t.strip()] if timeframe else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        indicator_stream.iterate(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/recommendations/history", response_model=dict)
 async def get_recommendation_history(
     db: Session = Depends(get_db),
@@ -619,15 +980,20 @@ async def get_recommendation_history(
         offset = (page - 1) * limit
         query = f"""
             SELECT 
-                session_id,
+                rs.session_id,
                 TO_CHAR(generated_at, 'YYYY-MM-DD"T"HH24:MI:SS"Z"') as generated_at,
                 principal,
                 risk_tolerance,
                 strategy,
                 technical_filter,
                 (SELECT COUNT(*) FROM recommendation_results rr 
-                 WHERE rr.session_id = rs.session_id) as symbol_count
+                 WHERE rr.session_id = rs.session_id) as symbol_count,
+                sp.return_1d,
+                sp.return_5d,
+                sp.return_20d,
+                sp.return_60d
             FROM recommendation_sessions rs
+            LEFT JOIN recommendation_session_performance sp ON sp.session_id = rs.session_id
             {where_sql}
             ORDER BY {sort_field} {sort_order}
             LIMIT :limit OFFSET :offset
@@ -654,9 +1020,46 @@ async def get_recommendation_history(
             }
         )
 
+@app.get("/api/recommendations/performance", response_model=dict)
+async def get_recommendation_performance(
+    db: Session = Depends(get_db),
+    group_by: str = "prompt",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """推奨の実績 (1/5/20/60営業日後の平均騰落率・的中率) をプロンプトテンプレート・エージェントタイプなどの単位で取得
+
+    recommendation_evaluator.py が保存した評価結果を集計して返す (株価の再計算は行わない)。
+    """
+    try:
+        groups = performance_summary(db, group_by, start_date, end_date)
+        evaluated_at = db.execute(text(
+            "SELECT TO_CHAR(MAX(evaluated_at), 'YYYY-MM-DD\"T\"HH24:MI:SS\"Z\"') FROM recommendation_session_performance"
+        )).scalar()
+        return {
+            "group_by": group_by,
+            "horizons": list(HORIZONS),
+            "evaluated_at": evaluated_at,
+            "groups": groups
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        logger.exception(f"データベースエラー: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"データベースエラー: {str(e)}"
+        )
+
 @app.get("/api/recommendations/{session_id}", response_model=dict)
-async def get_recommendation_detail(session_id: str, db: Session = Depends(get_db)):
-    """特定セッションの推奨詳細を取得"""
+async def get_recommendation_detail(session_id: str, include_raw: bool = False,
+                                    db: Session = Depends(get_db)):
+    """特定セッションの推奨詳細を取得
+
+    AI生レスポンスは大きいため既定では返さず、サイズのみを返す。
+    本文は /api/recommendations/{session_id}/raw で取得する
+    (include_raw=true で従来どおり詳細に含める)。
+    """
     try:
         # セッション基本情報取得
         session_query = """
@@ -667,8 +1070,8 @@ async def get_recommendation_detail(session_id: str, db: Session = Depends(get_d
                 risk_tolerance,
                 strategy,
                 technical_filter,
-                ai_raw_response,
-                total_return_estimate
+                total_return_estimate,
+                risk_metrics
             FROM recommendation_sessions
             WHERE session_id = :session_id
         """
@@ -678,6 +1081,14 @@ async def get_recommendation_detail(session_id: str, db: Session = Depends(get_d
         if not session_info:
             raise HTTPException(status_code=404, detail="セッションが見つかりません")
 
+        session = dict(session_info)
+        raw_size = get_raw_response_size(db, session["session_id"])
+        session["raw_response_size"] = raw_size
+        session["has_raw_response"] = bool(raw_size)
+        if include_raw:
+            raw = read_raw_response(db, session["session_id"])
+            session["ai_raw_response"] = raw.decode("utf-8") if raw is not None else None
+
         # 推奨結果取得
         results_query = """
             SELECT 
@@ -694,14 +1105,79 @@ async def get_recommendation_detail(session_id: str, db: Session = Depends(get_d
         recommendations = [dict(row._mapping) for row in results]
 
         return {
-            "session": dict(session_info),
+            "session": session,
             "recommendations": recommendations
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(f"推奨詳細取得エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=f"推奨詳細取得エラー: {str(e)}")
 
+def parse_byte_range(range_header: Optional[str], size: int):
+    """Rangeヘッダ (bytes=start-end / bytes=start- / bytes=-suffix) を [start, end) に変換
+
+    Returns:
+        (start, end) または Rangeヘッダが無い場合は None
+
+    Raises:
+        ValueError: 解釈できない、または範囲外の指定
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError(f"未対応のRange指定: {range_header}")
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    else:
+        # 末尾からのバイト数指定
+        start = max(size - int(last), 0)
+        end = size
+    if start >= size or start >= end:
+        raise ValueError(f"範囲外のRange指定: {range_header}")
+    return start, end
+
+@app.get("/api/recommendations/{session_id}/raw")
+async def get_recommendation_raw_response(session_id: int, request: Request,
+                                          db: Session = Depends(get_db)):
+    """AI生レスポンスの本文を取得 (Rangeヘッダによる部分取得、チャンク単位のストリーミング)"""
+    try:
+        size = get_raw_response_size(db, session_id)
+        if size is None:
+            raise HTTPException(status_code=404, detail="AI生レスポンスが見つかりません")
+
+        headers = {"Accept-Ranges": "bytes"}
+        try:
+            byte_range = parse_byte_range(request.headers.get("range"), size)
+        except ValueError as e:
+            logger.warning(str(e))
+            raise HTTPException(status_code=416, detail=str(e),
+                                headers={"Content-Range": f"bytes */{size}"})
+
+        status_code = 200
+        start, end = 0, size
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+
+        return StreamingResponse(
+            iter_raw_response(get_db_engine(), session_id, start, end),
+            status_code=status_code,
+            media_type="text/plain; charset=utf-8",
+            headers=headers
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"AI生レスポンス取得エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"AI生レスポンス取得エラー: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     from utils import initialize_environment
@@ -0,0 +1,397 @@
+"""
+ベクトル化したバックテスト
+
+technical_indicators と同じシグナル (ゴールデン/デッドクロス、MACDスコア、RSI) を売買ルールとして、
+全銘柄のポジションと損益を 銘柄×日付 の配列演算でまとめて計算する (足ごとの Python ループは使わない)。
+
+戦略:
+  golden_cross  ゴールデンクロスで買い、デッドクロスで売り
+  macd_score    MACDスコアが macd_score_threshold 以上の間だけ保有
+  rsi           RSI(単純平均) が rsi_lower を下回ったら買い、rsi_upper を上回ったら売り
+
+約定はシグナルが出た足の次の足の始値 (execution="next_open") または同じ足の終値 (execution="close")。
+取引コストは片道 cost_bps (bps) をポジションの変化量に応じて差し引く。
+ポートフォリオは全銘柄への等金額配分 (データのある銘柄で毎日リバランス)。
+"""
+import io
+import os
+from dataclasses import asdict, dataclass, field, fields, replace
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from indicator_library import IndicatorConfig, PricePanel, crosses, macd, rsi, sma
+from bar_aggregates import timeframe_config, lookback_days
+
+STRATEGIES = ("golden_cross", "macd_score", "rsi")
+EXECUTIONS = ("next_open", "close")
+
+# 年率換算の1年あたりの足の数
+PERIODS_PER_YEAR = {"daily": 245, "weekly": 52, "monthly": 12}
+
+# 指標の助走期間として読む暦日の倍率 (日足は1年で約245本のため、休場日を見込んで2倍)
+WARMUP_CALENDAR_FACTOR = 2.0
+
+@dataclass(frozen=True)
+class BacktestConfig:
+    """バックテストの設定
+
+    Attributes:
+        strategy: golden_cross / macd_score / rsi
+        cost_bps: 片道の取引コスト (bps、売買代金に対する割合)
+        execution: next_open (次の足の始値で約定) / close (シグナルの足の終値で約定)
+        macd_score_threshold: macd_score 戦略で保有するスコアの下限
+        rsi_lower / rsi_upper: rsi 戦略の買い・売りの閾値
+        timeframe: daily / weekly / monthly (年率換算に使う)
+        indicators: 指標の期間
+    """
+    strategy: str = "golden_cross"
+    cost_bps: float = 10.0
+    execution: str = "next_open"
+    macd_score_threshold: int = 4
+    rsi_lower: float = 30.0
+    rsi_upper: float = 70.0
+    timeframe: str = "daily"
+    indicators: IndicatorConfig = field(default_factory=IndicatorConfig.from_env)
+
+    def __post_init__(self):
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"未対応の戦略: {self.strategy} ({' / '.join(STRATEGIES)})")
+        if self.execution not in EXECUTIONS:
+            raise ValueError(f"未対応の約定方法: {self.execution} ({' / '.join(EXECUTIONS)})")
+        timeframe_config(self.timeframe)
+
+    def with_overrides(self, overrides: Optional[Dict]) -> "BacktestConfig":
+        """
+        項目を上書きした設定 (IndicatorConfig の項目名も指定できる)
+
+        Raises:
+            ValueError: 未知の項目
+        """
+        if not overrides:
+            return self
+        own = {f.name for f in fields(self)} - {"indicators"}
+        indicator_fields = {f.name for f in fields(IndicatorConfig)}
+        top, nested = {}, {}
+        for key, value in overrides.items():
+            if key in own:
+                top[key] = _cast(value, getattr(self, key))
+            elif key in indicator_fields:
+                nested[key] = _cast(value, getattr(self.indicators, key))
+            else:
+                raise ValueError(f"未知のパラメータ: {key}")
+        return replace(self, indicators=replace(self.indicators, **nested), **top)
+
+def _cast(value, current):
+    """上書き値を既定値と同じ型に変換"""
+    return type(current)(value) if not isinstance(current, str) else str(value)
+
+@dataclass
+class BacktestResult:
+    """バックテストの結果
+
+    Attributes:
+        symbols / dates: 配列の行・列
+        position: 各足の保有ポジション (0/1、約定の遅れを反映済み)
+        returns: 銘柄ごとのコスト控除後の日次リターン
+        portfolio_returns: 等金額ポートフォリオのリターン
+        benchmark_returns: 全銘柄の等金額買い持ちのリターン
+        trade_returns: 取引ごとのリターン
+        trade_symbols: 各取引の銘柄 (symbols の添字)
+    """
+    config: BacktestConfig
+    symbols: np.ndarray
+    dates: np.ndarray
+    position: np.ndarray
+    returns: np.ndarray
+    portfolio_returns: np.ndarray
+    benchmark_returns: np.ndarray
+    trade_returns: np.ndarray
+    trade_symbols: np.ndarray
+
+    def summary(self) -> Dict:
+        """ポートフォリオと買い持ちの成績"""
+        periods = PERIODS_PER_YEAR[self.config.timeframe]
+        stats = performance_stats(self.portfolio_returns, periods)
+        stats.update({
+            "trades": int(len(self.trade_returns)),
+            "win_rate": float(np.mean(self.trade_returns > 0)) if len(self.trade_returns) else None,
+            "avg_trade_return": float(np.mean(self.trade_returns)) if len(self.trade_returns) else None,
+            "exposure": float(np.nanmean(self.position)),
+        })
+        return {
+            "strategy": self.config.strategy,
+            "period": [str(pd.Timestamp(self.dates[0]).date()), str(pd.Timestamp(self.dates[-1]).date())],
+            "symbols": int(len(self.symbols)),
+            "portfolio": stats,
+            "buy_and_hold": performance_stats(self.benchmark_returns, periods),
+        }
+
+    def symbol_stats(self) -> pd.DataFrame:
+        """銘柄ごとの成績 (total_return, sharpe, max_drawdown, trades, win_rate, exposure)"""
+        periods = PERIODS_PER_YEAR[self.config.timeframe]
+        log_growth = np.log1p(self.returns)
+        equity = np.exp(np.cumsum(log_growth, axis=1))
+        running_max = np.maximum.accumulate(equity, axis=1)
+        volatility = self.returns.std(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.where(volatility > 0, self.returns.mean(axis=1) / volatility * np.sqrt(periods), np.nan)
+        n_symbols = len(self.symbols)
+        trades = np.bincount(self.trade_symbols, minlength=n_symbols)
+        wins = np.bincount(self.trade_symbols, weights=self.trade_returns > 0, minlength=n_symbols)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            win_rate = np.where(trades > 0, wins / trades, np.nan)
+        return pd.DataFrame({
+            "symbol": self.symbols,
+            "total_return": np.expm1(log_growth.sum(axis=1)),
+            "sharpe": sharpe,
+            "max_drawdown": (equity / running_max - 1).min(axis=1),
+            "trades": trades,
+            "win_rate": win_rate,
+            "exposure": self.position.mean(axis=1),
+        })
+
+    def equity_curve(self) -> pd.DataFrame:
+        """ポートフォリオと買い持ちの資産推移 (初期値1)"""
+        return pd.DataFrame({
+            "date": self.dates,
+            "portfolio": np.cumprod(1 + self.portfolio_returns),
+            "buy_and_hold": np.cumprod(1 + self.benchmark_returns),
+        })
+
+    def to_report(self, top: int = 20) -> Dict:
+        """
+        JSONで返せる形の結果 (API・CLIの --output 用)
+
+        Returns:
+            dict: summary, parameters, equity_curve, best_symbols / worst_symbols (総リターンの上位・下位 top 銘柄)
+        """
+        symbol_stats = self.symbol_stats().sort_values("total_return", ascending=False)
+        curve = self.equity_curve()
+        curve["date"] = pd.to_datetime(curve["date"]).dt.strftime("%Y-%m-%d")
+
+        def records(frame):
+            return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+        return {
+            "summary": self.summary(),
+            "parameters": asdict(self.config),
+            "equity_curve": records(curve),
+            "best_symbols": records(symbol_stats.head(top)),
+            "worst_symbols": records(symbol_stats.tail(top).iloc[::-1]),
+        }
+
+def performance_stats(returns: np.ndarray, periods_per_year: int) -> Dict:
+    """リターン系列の成績 (total_return, cagr, volatility, sharpe, max_drawdown)"""
+    equity = np.cumprod(1 + returns)
+    years = len(returns) / periods_per_year
+    volatility = float(np.std(returns) * np.sqrt(periods_per_year))
+    total = float(equity[-1] - 1) if len(equity) else 0.0
+    return {
+        "total_return": total,
+        "cagr": float((1 + total) ** (1 / years) - 1) if years > 0 and total > -1 else None,
+        "volatility": volatility,
+        "sharpe": float(np.mean(returns) * periods_per_year / volatility) if volatility > 0 else None,
+        "max_drawdown": float((equity / np.maximum.accumulate(equity) - 1).min()) if len(equity) else 0.0,
+    }
+
+def _forward_fill(values: np.ndarray) -> np.ndarray:
+    """日付方向の前方補完 (先頭の NaN はそのまま)"""
+    index = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(index, axis=1, out=index)
+    return values[np.arange(values.shape[0])[:, None], index]
+
+def _hold_between(enter: np.ndarray, exit_: np.ndarray) -> np.ndarray:
+    """買いシグナルから売りシグナルまで保有するポジション (0/1)"""
+    events = np.where(enter, 1.0, np.where(exit_, 0.0, np.nan))
+    return np.nan_to_num(_forward_fill(events), nan=0.0)
+
+def signal_positions(panel: PricePanel, config: BacktestConfig) -> np.ndarray:
+    """各足の終値時点で取るべきポジション (0/1)"""
+    close, params = panel.close, config.indicators
+    if config.strategy == "golden_cross":
+        short_ma, long_ma = sma(close, [params.cross_short, params.cross_long])
+        signals = crosses(short_ma, long_ma)
+        position = _hold_between(signals["golden_cross"], signals["dead_cross"])
+    elif config.strategy == "macd_score":
+        short_ma, long_ma = sma(close, [params.cross_short, params.cross_long])
+        golden = crosses(short_ma, long_ma)["golden_cross"]
+        histogram = macd(close, params.macd_fast, params.macd_slow, params.macd_signal)["histogram"]
+        score = macd_scores(golden, histogram)
+        position = (score >= config.macd_score_threshold).astype(float)
+    else:
+        values = rsi(close, params.rsi_window, method="sma")
+        position = _hold_between(values < config.rsi_lower, values > config.rsi_upper)
+    # 株価の無い日はシグナルを出さない (前日のポジションを引き継ぐ)
+    return np.where(np.isnan(close), np.nan, position)
+
+def macd_scores(golden_cross: np.ndarray, histogram: np.ndarray) -> np.ndarray:
+    """technical_indicators.calculate_macd_score と同じMACDスコア (0〜6点) を配列で計算"""
+    prev = np.full(histogram.shape, np.nan)
+    prev[:, 1:] = histogram[:, :-1]
+    positive = histogram > 0
+    trend = np.where(np.isnan(prev), positive, (histogram > prev) * 2)
+    return golden_cross * 3 + trend + positive
+
+def run_backtest(panel: PricePanel, config: Optional[BacktestConfig] = None) -> BacktestResult:
+    """全銘柄のバックテストを実行"""
+    config = config or BacktestConfig()
+    close = _forward_fill(panel.close)
+    open_ = np.where(np.isnan(panel.open), close, panel.open)
+    listed = ~np.isnan(close)
+
+    # シグナルは足の終値で判定し、次の足から保有する
+    target = np.nan_to_num(_forward_fill(signal_positions(panel, config)), nan=0.0)
+    held = np.zeros_like(target)
+    held[:, 1:] = target[:, :-1]
+    prev_held = np.zeros_like(held)
+    prev_held[:, 1:] = held[:, :-1]
+    prev_close = np.full(close.shape, np.nan)
+    prev_close[:, 1:] = close[:, :-1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        close_to_close = np.nan_to_num(close / prev_close - 1)
+        if config.execution == "next_open":
+            # 新規は始値→終値、決済は前日終値→始値、継続は前日終値→終値
+            gross = np.where(held > prev_held, close / open_ - 1,
+                             np.where(held < prev_held, open_ / prev_close - 1, close_to_close * held))
+        else:
+            gross = close_to_close * held
+    gross = np.nan_to_num(gross)
+    net = gross - np.abs(held - prev_held) * config.cost_bps / 10000.0
+
+    # 等金額ポートフォリオ (その日に株価のある銘柄で平均)
+    active = listed.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        portfolio = np.where(active > 0, np.where(listed, net, 0).sum(axis=0) / active, 0.0)
+        benchmark = np.where(active > 0, np.where(listed, close_to_close, 0).sum(axis=0) / active, 0.0)
+
+    trade_returns, trade_symbols = _trade_returns(held, prev_held, net)
+    return BacktestResult(config=config, symbols=panel.symbols, dates=panel.dates, position=held,
+                          returns=net, portfolio_returns=portfolio, benchmark_returns=benchmark,
+                          trade_returns=trade_returns, trade_symbols=trade_symbols)
+
+def _trade_returns(held: np.ndarray, prev_held: np.ndarray, net: np.ndarray):
+    """取引 (買いから売りまで、期末に保有中のものを含む) ごとのリターンと銘柄"""
+    entries = (held > prev_held)
+    trade_number = np.cumsum(entries, axis=1)
+    # 決済日のリターンもその取引に含める (期間の開始前から保有していた分は含めない)
+    in_trade = ((held > 0) | (prev_held > 0)) & (trade_number > 0)
+    offsets = np.concatenate([[0], np.cumsum(entries.sum(axis=1))[:-1]])
+    trade_ids = np.where(in_trade, trade_number + offsets[:, None], 0)
+    n_trades = int(entries.sum())
+    log_returns = np.bincount(trade_ids.ravel(), weights=np.log1p(net).ravel(), minlength=n_trades + 1)[1:]
+    symbols = np.repeat(np.arange(held.shape[0]), entries.sum(axis=1))
+    return np.expm1(log_returns), symbols
+
+def load_price_panel(engine, symbols: Optional[Iterable[str]] = None, start=None, end=None,
+                     timeframe: str = "daily") -> PricePanel:
+    """
+    株価を読み込んで PricePanel にする
+
+    COPY で CSV として受け取る (数百万行を read_sql で読むより速い)。日足の日付は日本時間の日付にする。
+
+    Args:
+        engine: SQLAlchemy のエンジン
+        symbols: 対象銘柄 (None なら全銘柄)
+        start, end: 期間 (日付、None なら制限なし)
+        timeframe: daily / weekly / monthly
+    """
+    table = timeframe_config(timeframe)["bars"]
+    date_column = "(date AT TIME ZONE 'Asia/Tokyo')::date" if timeframe == "daily" else "date"
+    conditions, params = [], []
+    if symbols is not None:
+        conditions.append("symbol = ANY(%s)")
+        params.append(list(symbols))
+    if start is not None:
+        conditions.append("date >= %s")
+        params.append(pd.Timestamp(start).tz_localize("Asia/Tokyo").to_pydatetime()
+                      if timeframe == "daily" else pd.Timestamp(start).date())
+    if end is not None:
+        conditions.append("date < %s")
+        params.append((pd.Timestamp(end) + pd.Timedelta(days=1)).tz_localize("Asia/Tokyo").to_pydatetime()
+                      if timeframe == "daily" else (pd.Timestamp(end) + pd.Timedelta(days=1)).date())
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        query = cursor.mogrify(f"""
+            SELECT symbol, {date_column} AS date, open, high, low, close, volume
+            FROM {table} {where}
+        """, params).decode()
+        buffer = io.StringIO()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+    finally:
+        raw.close()
+    buffer.seek(0)
+    df = pd.read_csv(buffer, parse_dates=["date"])
+    if df.empty:
+        raise ValueError("対象期間の株価がありません")
+    return PricePanel.from_frame(df)
+
+@dataclass
+class BacktestLimits:
+    """APIから実行するバックテストの上限 (環境変数)
+
+    Attributes:
+        max_symbols: 指定できる銘柄数 (未指定の全銘柄には適用しない)
+        max_years: 期間の年数 (start 未指定なら end の max_years 年前から)
+    """
+    max_symbols: int = 1000
+    max_years: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "BacktestLimits":
+        return cls(
+            max_symbols=int(os.getenv("BACKTEST_MAX_SYMBOLS", "1000")),
+            max_years=float(os.getenv("BACKTEST_MAX_YEARS", "10")),
+        )
+
+    def resolve_period(self, symbols: Optional[List[str]], start=None,
+                       end=None) -> Tuple[pd.Timestamp, Optional[pd.Timestamp]]:
+        """
+        上限を確認し、バックテストの期間 (start, end) を返す
+
+        Raises:
+            ValueError: 銘柄数・期間が上限を超える、または start が end より後
+        """
+        if symbols is not None and len(symbols) > self.max_symbols:
+            raise ValueError(f"バックテストの銘柄は{self.max_symbols}件までです: {len(symbols)}件")
+        end = pd.Timestamp(end) if end is not None else None
+        max_span = pd.Timedelta(days=int(self.max_years * 365.25))
+        if start is None:
+            return (end or pd.Timestamp.now().normalize()) - max_span, end
+        start = pd.Timestamp(start)
+        if end is not None and start > end:
+            raise ValueError(f"開始日が終了日より後です: {start.date()} > {end.date()}")
+        if (end or pd.Timestamp.now().normalize()) - start > max_span:
+            raise ValueError(f"バックテストの期間は{self.max_years:g}年までです")
+        return start, end
+
+def run_from_store(engine, config: BacktestConfig, symbols: Optional[List[str]] = None,
+                   start=None, end=None) -> BacktestResult:
+    """株価ストアから読み込んでバックテストを実行 (指標の助走期間分は start より前から読む)"""
+    if start is None:
+        return run_backtest(load_price_panel(engine, symbols, None, end, config.timeframe), config)
+    params = config.indicators
+    warmup_bars = max(params.cross_long, params.macd_slow + params.macd_signal, params.rsi_window) + 1
+    warmup_days = int(lookback_days(config.timeframe, warmup_bars) * WARMUP_CALENDAR_FACTOR)
+    panel = load_price_panel(engine, symbols, pd.Timestamp(start) - pd.Timedelta(days=warmup_days),
+                             end, config.timeframe)
+    return _slice_dates(run_backtest(panel, config), panel.dates >= np.datetime64(pd.Timestamp(start)))
+
+def _slice_dates(result: BacktestResult, keep: np.ndarray) -> BacktestResult:
+    """助走期間を除いた結果 (取引は期間内に始まったもの)"""
+    first = int(np.argmax(keep)) if keep.any() else len(keep)
+    trimmed = BacktestResult(
+        config=result.config, symbols=result.symbols, dates=result.dates[first:],
+        position=result.position[:, first:], returns=result.returns[:, first:],
+        portfolio_returns=result.portfolio_returns[first:], benchmark_returns=result.benchmark_returns[first:],
+        trade_returns=np.array([]), trade_symbols=np.array([], dtype=int))
+    prev_held = np.zeros_like(trimmed.position)
+    prev_held[:, 1:] = trimmed.position[:, :-1]
+    if first > 0:
+        prev_held[:, 0] = result.position[:, first - 1]
+    trimmed.trade_returns, trimmed.trade_symbols = _trade_returns(trimmed.position, prev_held, trimmed.returns)
+    return trimmed
@@ -0,0 +1,91 @@
+"""
+週足・月足の集計
+
+stock_prices_weekly / stock_prices_monthly は stock_prices を日本時間の週 (月曜始まり)・月で集計したテーブル
+(db/migrations/004_add_bar_aggregates.sql)。集計は DB 関数 refresh_bar_aggregates() が行い、
+株価の取り込み時に取り込んだ銘柄・期間を含む週・月だけを集計し直す。
+ここでは時間軸ごとのテーブル名、集計の呼び出し、日足からの再集計 (集計テーブルが無い場合の比較用) を提供する。
+"""
+import logging
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+from partitions import _as_date
+
+logger = logging.getLogger(__name__)
+
+# 時間軸ごとの足・指標テーブルと、1本あたりのおおよその日数
+TIMEFRAMES = {
+    "daily": {"bars": "stock_prices", "indicators": "technical_indicators", "unit": None, "days": 1},
+    "weekly": {"bars": "stock_prices_weekly", "indicators": "technical_indicators_weekly", "unit": "week", "days": 7},
+    "monthly": {"bars": "stock_prices_monthly", "indicators": "technical_indicators_monthly", "unit": "month", "days": 31},
+}
+
+# チャートの既定表示期間(年)
+DEFAULT_CHART_YEARS = {"daily": 1, "weekly": 5, "monthly": 10}
+
+# pandas で日足から集計する場合の期間 (週は月曜始まり)
+_RESAMPLE_RULES = {"weekly": "W-MON", "monthly": "MS"}
+
+def timeframe_config(timeframe: Optional[str]) -> Dict:
+    """
+    時間軸の設定 (bars / indicators テーブル名など) を取得
+
+    Raises:
+        ValueError: 未対応の時間軸
+    """
+    config = TIMEFRAMES.get((timeframe or "daily").lower())
+    if config is None:
+        raise ValueError(f"無効な時間軸: {timeframe} (daily / weekly / monthly のいずれか)")
+    return config
+
+def lookback_days(timeframe: Optional[str], bars: int) -> int:
+    """指定本数の足を読むのに必要な日数"""
+    return bars * timeframe_config(timeframe)["days"]
+
+def refresh_aggregates(cursor, symbols: Optional[Iterable[str]] = None, start=None, end=None) -> Dict[str, int]:
+    """
+    start〜end の日付を含む週・月の週足・月足を集計し直す
+
+    Args:
+        cursor: psycopg2 のカーソル (コミットは呼び出し元で行う)
+        symbols: 対象銘柄 (None なら全銘柄)
+        start, end: 日付・日時 (None なら全期間、タイムゾーン無しの日時は日本時間とみなす)
+
+    Returns:
+        dict: 時間軸ごとの更新行数
+    """
+    symbols = list(symbols) if symbols is not None else None
+    start = _as_date(start) if start is not None else None
+    end = _as_date(end) if end is not None else None
+    updated = {}
+    for timeframe, config in TIMEFRAMES.items():
+        if config["unit"] is None:
+            continue
+        cursor.execute("SELECT refresh_bar_aggregates(%s, %s, %s, %s)",
+                       (config["unit"], symbols, start, end))
+        updated[timeframe] = cursor.fetchone()[0]
+    logger.debug("週足・月足を集計しました: %s (%s〜%s)", updated, start, end)
+    return updated
+
+def resample_bars(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """
+    日足 (date, open, high, low, close, volume) を週足・月足に集計する
+
+    集計テーブルと同じく、期間の開始日 (日本時間) を date とする。1銘柄分の DataFrame を想定。
+    """
+    if timeframe == "daily" or df.empty:
+        return df
+    rule = _RESAMPLE_RULES[timeframe]
+    dates = pd.to_datetime(df["date"])
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert("Asia/Tokyo").dt.tz_localize(None)
+    resampled = (
+        df.assign(date=dates)
+        .set_index("date")
+        .resample(rule, label="left", closed="left")
+        .agg({"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+        .dropna(subset=["close"])
+    )
+    return resampled.reset_index()
@@ -0,0 +1,104 @@
+import sys
+import json
+import time
+import argparse
+
+# プロジェクトルートをsys.pathに追加
+from utils import get_db_engine, initialize_environment, setup_backend_logger
+from bar_aggregates import TIMEFRAMES
+from backtest import STRATEGIES, EXECUTIONS, BacktestConfig, run_from_store
+
+logger = setup_backend_logger(__name__)
+
+def parse_overrides(values):
+    """--set key=value を辞書にする"""
+    overrides = {}
+    for value in values or []:
+        key, sep, raw = value.partition('=')
+        if not sep:
+            raise ValueError(f"--set は key=value の形式で指定してください: {value}")
+        overrides[key.strip()] = raw.strip()
+    return overrides
+
+def _pct(value):
+    return f"{value * 100:8.2f}%" if value is not None else f"{'-':>9}"
+
+def _num(value):
+    return f"{value:9.2f}" if value is not None else f"{'-':>9}"
+
+def print_report(report, elapsed: float):
+    """成績の表を表示"""
+    summary = report['summary']
+    print(f"\n戦略: {summary['strategy']}  期間: {summary['period'][0]} 〜 {summary['period'][1]}  "
+          f"銘柄数: {summary['symbols']:,}  ({elapsed:.2f}秒)")
+    print(f"  {'':<14} {'総リターン':>9} {'年率':>9} {'ボラ':>9} {'シャープ':>9} {'最大DD':>9}")
+    for label, key in (('戦略', 'portfolio'), ('買い持ち', 'buy_and_hold')):
+        stats = summary[key]
+        print(f"  {label:<14} {_pct(stats['total_return'])} {_pct(stats['cagr'])} {_pct(stats['volatility'])} "
+              f"{_num(stats['sharpe'])} {_pct(stats['max_drawdown'])}")
+    portfolio = summary['portfolio']
+    print(f"  取引数: {portfolio['trades']:,}  勝率: {_pct(portfolio['win_rate']).strip()}  "
+          f"平均リターン: {_pct(portfolio['avg_trade_return']).strip()}  保有率: {_pct(portfolio['exposure']).strip()}")
+    for title, key in (('上位銘柄', 'best_symbols'), ('下位銘柄', 'worst_symbols')):
+        if not report[key]:
+            continue
+        print(f"\n{title}")
+        print(f"  {'銘柄':<10} {'総リターン':>9} {'シャープ':>9} {'最大DD':>9} {'取引数':>6} {'勝率':>9}")
+        for row in report[key]:
+            print(f"  {row['symbol']:<10} {_pct(row['total_return'])} {_num(row['sharpe'])} "
+                  f"{_pct(row['max_drawdown'])} {row['trades']:>6} {_pct(row['win_rate'])}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='売買シグナルのバックテストツール',
+        epilog="""
+【使い方】
+全銘柄でゴールデンクロス戦略を検証:
+  python backtest_runner.py --strategy golden_cross --start 2015-01-01
+
+銘柄と指標の期間を指定して MACDスコア戦略を検証:
+  python backtest_runner.py --strategy macd_score --symbol 7203.T --symbol 6758.T --set cross_short=5 --set macd_score_threshold=5
+
+結果をJSONで書き出す:
+  python backtest_runner.py --strategy rsi --timeframe weekly --output result.json
+""")
+    parser.add_argument('--strategy', choices=STRATEGIES, default='golden_cross', help='戦略（既定: golden_cross）')
+    parser.add_argument('--symbol', action='append', default=None, help='対象銘柄（複数指定可、既定: 全銘柄）')
+    parser.add_argument('--start', default=None, help='開始日 (YYYY-MM-DD)')
+    parser.add_argument('--end', default=None, help='終了日 (YYYY-MM-DD)')
+    parser.add_argument('--timeframe', choices=list(TIMEFRAMES), default='daily', help='時間軸（既定: daily）')
+    parser.add_argument('--cost-bps', type=float, default=10.0, help='片道の取引コスト(bps)（既定: 10）')
+    parser.add_argument('--execution', choices=EXECUTIONS, default='next_open',
+                        help='約定価格（next_open: 次の足の始値、close: シグナルの足の終値、既定: next_open）')
+    parser.add_argument('--set', dest='overrides', action='append', metavar='KEY=VALUE',
+                        help='戦略・指標のパラメータ（例: cross_short=5、rsi_lower=25、複数指定可）')
+    parser.add_argument('--top', type=int, default=10, help='表示する上位・下位銘柄の数（既定: 10）')
+    parser.add_argument('--output', default=None, help='結果JSONの出力先')
+    args = parser.parse_args()
+
+    initialize_environment()
+    try:
+        config = BacktestConfig(strategy=args.strategy, cost_bps=args.cost_bps, execution=args.execution,
+                                timeframe=args.timeframe).with_overrides(parse_overrides(args.overrides))
+    except (TypeError, ValueError) as e:
+        parser.error(str(e))
+
+    engine = get_db_engine()
+    try:
+        start = time.perf_counter()
+        result = run_from_store(engine, config, args.symbol, args.start, args.end)
+        report = result.to_report(args.top)
+        print_report(report, time.perf_counter() - start)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n結果を保存しました: {args.output}")
+    except Exception as e:
+        logger.exception(f"バックテストでエラー: {str(e)}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
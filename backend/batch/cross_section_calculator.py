@@ -0,0 +1,79 @@
+import sys
+import time
+import argparse
+from datetime import date
+
+from sqlalchemy import text
+
+# プロジェクトルートをsys.pathに追加
+from utils import get_db_engine, initialize_environment, setup_backend_logger
+from cross_section import recent_trading_days, update_rankings
+from partitions import _as_date
+
+logger = setup_backend_logger(__name__)
+
+def _date_range(engine):
+    """technical_indicators の最初と最後の営業日 (日本時間)"""
+    with engine.connect() as conn:
+        first, last = conn.execute(text("SELECT MIN(date), MAX(date) FROM technical_indicators")).one()
+    return (_as_date(first), _as_date(last)) if first is not None else (None, None)
+
+def _yearly_chunks(start: date, end: date):
+    """全期間の再計算はメモリを抑えるため1年ずつ行う"""
+    for year in range(start.year, end.year + 1):
+        yield max(start, date(year, 1, 1)), min(end, date(year, 12, 31))
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='日次の横断的な順位・業種別平均の計算ツール',
+        epilog="""
+【使い方】
+直近の営業日を計算 (テクニカル指標の計算後に定期実行):
+  python cross_section_calculator.py
+
+直近7営業日を計算し直す:
+  python cross_section_calculator.py --days 7
+
+期間を指定して計算:
+  python cross_section_calculator.py --start 2024-01-01 --end 2024-12-31
+
+全期間を計算し直す (1年ずつ):
+  python cross_section_calculator.py --full
+""")
+    parser.add_argument('--days', type=int, default=1, help='計算する直近の営業日数（既定: 1）')
+    parser.add_argument('--start', type=date.fromisoformat, default=None, help='開始日（YYYY-MM-DD）')
+    parser.add_argument('--end', type=date.fromisoformat, default=None, help='終了日（YYYY-MM-DD、既定: 最新の営業日）')
+    parser.add_argument('--full', action='store_true', help='全期間を計算し直す')
+    args = parser.parse_args()
+
+    initialize_environment()
+    engine = get_db_engine()
+    try:
+        started = time.perf_counter()
+        if args.full or args.start:
+            first, last = _date_range(engine)
+            if first is None:
+                print("テクニカル指標がありません")
+                return
+            ranges = list(_yearly_chunks(args.start or first, args.end or last))
+        else:
+            days = recent_trading_days(engine, args.days, args.end)
+            ranges = [(days[0], days[-1])] if days else []
+
+        total = {"dates": 0, "rows": 0, "groups": 0}
+        for start, end in ranges:
+            result = update_rankings(engine, start, end)
+            for key in total:
+                total[key] += result[key]
+            print(f"{start}〜{end}: {result['dates']:,}営業日 / {result['rows']:,}行 / 平均 {result['groups']:,}行")
+        print(f"計算した営業日: {total['dates']:,} (順位 {total['rows']:,}行、平均 {total['groups']:,}行)  "
+              f"({time.perf_counter() - started:.2f}秒)")
+    except Exception as e:
+        logger.exception(f"横断的な順位の計算でエラー: {str(e)}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
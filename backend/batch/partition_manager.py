@@ -0,0 +1,129 @@
+import os
+import sys
+import argparse
+from datetime import date, datetime
+
+import pandas as pd
+
+# プロジェクトルートをsys.pathに追加
+from utils import get_db_engine, initialize_environment, setup_backend_logger
+from partitions import (
+    PARTITIONED_TABLES, partition_interval, ensure_partitions, list_partitions,
+    archive_partition, restore_archive
+)
+
+logger = setup_backend_logger(__name__)
+
+def show_status(engine, tables):
+    """パーティションの一覧 (範囲・推定行数・サイズ) を表示"""
+    with engine.connect() as conn:
+        for table in tables:
+            partitions = list_partitions(conn, table)
+            print(f"\n{table}: {len(partitions)}パーティション")
+            print(f"  {'パーティション':<36} {'範囲 (日本時間)':<25} {'推定行数':>12} {'サイズ(MiB)':>12}")
+            for p in partitions:
+                lower = p['lower'].tz_convert('Asia/Tokyo').strftime('%Y-%m-%d')
+                upper = p['upper'].tz_convert('Asia/Tokyo').strftime('%Y-%m-%d')
+                print(f"  {p['name']:<36} {lower} 〜 {upper:<12} {p['rows']:>12,} {p['bytes'] / 1024 / 1024:>12.1f}")
+
+def ensure_ahead(engine, tables, months_ahead: int):
+    """今月から months_ahead か月先までのパーティションを作成"""
+    end = (pd.Timestamp(date.today()) + pd.DateOffset(months=months_ahead)).date()
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for table in tables:
+            created = ensure_partitions(cursor, table, date.today(), end)
+            print(f"{table}: {created}パーティションを作成 (〜{end}, {partition_interval()}単位)")
+        raw.commit()
+    finally:
+        raw.close()
+
+def archive_before(engine, tables, before: date, archive_dir: str, keep_table: bool, dry_run: bool):
+    """範囲の上限が before 以前のパーティションを切り離してアーカイブ"""
+    cutoff = pd.Timestamp(before).tz_localize('Asia/Tokyo')
+    with engine.connect() as conn:
+        targets = [(table, p) for table in tables for p in list_partitions(conn, table) if p['upper'] <= cutoff]
+    if not targets:
+        print(f"{before} より前に終わるパーティションはありません")
+        return
+    for table, p in targets:
+        print(f"{'[dry-run] ' if dry_run else ''}{table}: {p['name']} (推定 {p['rows']:,}行) をアーカイブ")
+    if dry_run:
+        return
+    raw = engine.raw_connection()
+    try:
+        for table, p in targets:
+            path = archive_partition(raw.driver_connection, table, p['name'], archive_dir, keep_table)
+            print(f"  → {path}{' (テーブルは残します)' if keep_table else ''}")
+    finally:
+        raw.close()
+
+def restore(engine, table: str, paths):
+    """アーカイブしたCSVを親テーブルに戻す"""
+    raw = engine.raw_connection()
+    try:
+        for path in paths:
+            inserted = restore_archive(raw.driver_connection, table, path)
+            print(f"{path}: {inserted:,}行を {table} に復元")
+    finally:
+        raw.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='株価・テクニカル指標の日付範囲パーティション管理ツール',
+        epilog="""
+【使い方】
+パーティション一覧:
+  python partition_manager.py status
+
+3か月先までのパーティションを作成 (定期実行用):
+  python partition_manager.py ensure --months-ahead 3
+
+2016年より前のパーティションを切り離して archive/ に書き出す (確認のみ):
+  python partition_manager.py archive --before 2016-01-01 --dry-run
+
+アーカイブを戻す:
+  python partition_manager.py restore --table stock_prices archive/stock_prices_p2015_12.csv.gz
+""")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--table', choices=PARTITIONED_TABLES, action='append',
+                        help='対象テーブル（複数指定可、既定: 両方）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', parents=[common], help='パーティション一覧を表示')
+    ensure_parser = subparsers.add_parser('ensure', parents=[common], help='先の期間のパーティションを作成')
+    ensure_parser.add_argument('--months-ahead', type=int, default=3, help='何か月先まで作成するか（既定: 3）')
+    archive_parser = subparsers.add_parser('archive', parents=[common], help='古いパーティションを切り離してCSV(gzip)に書き出す')
+    archive_parser.add_argument('--before', required=True, help='この日付 (YYYY-MM-DD) 以前に終わるパーティションが対象')
+    archive_parser.add_argument('--dir', default=None, help='出力先（既定: PARTITION_ARCHIVE_DIR または archive）')
+    archive_parser.add_argument('--keep-table', action='store_true', help='書き出し後も切り離したテーブルを残す')
+    archive_parser.add_argument('--dry-run', action='store_true', help='対象の表示のみ')
+    restore_parser = subparsers.add_parser('restore', parents=[common], help='アーカイブしたCSVを戻す')
+    restore_parser.add_argument('files', nargs='+', help='archive で書き出したファイル')
+    args = parser.parse_args()
+
+    initialize_environment()
+    engine = get_db_engine()
+    tables = args.table or list(PARTITIONED_TABLES)
+    try:
+        if args.command == 'status':
+            show_status(engine, tables)
+        elif args.command == 'ensure':
+            ensure_ahead(engine, tables, args.months_ahead)
+        elif args.command == 'archive':
+            before = datetime.strptime(args.before, '%Y-%m-%d').date()
+            archive_dir = args.dir or os.getenv('PARTITION_ARCHIVE_DIR', 'archive')
+            archive_before(engine, tables, before, archive_dir, args.keep_table, args.dry_run)
+        elif args.command == 'restore':
+            if len(tables) != 1:
+                parser.error('restore では --table を1つ指定してください')
+            restore(engine, tables[0], args.files)
+    except Exception as e:
+        logger.exception(f"パーティション管理でエラー: {str(e)}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import sys
+import time
+import argparse
+
+# プロジェクトルートをsys.pathに追加
+from utils import get_db_engine, initialize_environment, setup_backend_logger
+from recommendation_performance import HORIZONS, SUMMARY_GROUPS, evaluate_sessions, performance_summary
+
+logger = setup_backend_logger(__name__)
+
+def _pct(value):
+    return f"{value * 100:7.2f}%" if value is not None else f"{'-':>8}"
+
+def print_summary(engine, group_by: str):
+    """集計単位ごとの平均騰落率・的中率を表示"""
+    with engine.connect() as conn:
+        rows = performance_summary(conn, group_by)
+    if not rows:
+        return
+    header = " ".join(f"{f'{h}日後':>8} {'的中率':>6}" for h in HORIZONS)
+    print(f"\n{'集計単位':<24} {'件数':>6} {header}")
+    for row in rows:
+        label = str(row['label'] if row['label'] is not None else row['key'])
+        values = " ".join(f"{_pct(row[f'avg_return_{h}d'])} {_pct(row[f'hit_rate_{h}d'])}" for h in HORIZONS)
+        print(f"{label[:24]:<24} {row['sessions']:>6} {values}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='推奨の実績評価ツール',
+        epilog="""
+【使い方】
+未評価・評価途中のセッションを評価 (株価の取り込み後に定期実行):
+  python recommendation_evaluator.py
+
+特定のセッションを評価し直す:
+  python recommendation_evaluator.py --session 120 --session 121 --full
+
+エージェントタイプ別の集計を表示:
+  python recommendation_evaluator.py --summary agent_type
+""")
+    parser.add_argument('--session', type=int, action='append', default=None, help='対象セッションID（複数指定可）')
+    parser.add_argument('--full', action='store_true', help='評価済みのセッションも評価し直す')
+    parser.add_argument('--summary', choices=list(SUMMARY_GROUPS), default='prompt',
+                        help='評価後に表示する集計単位（既定: prompt）')
+    args = parser.parse_args()
+
+    initialize_environment()
+    engine = get_db_engine()
+    try:
+        start = time.perf_counter()
+        result = evaluate_sessions(engine, args.session, args.full)
+        print(f"評価したセッション: {result['sessions']:,} (銘柄 {result['picks']:,}、"
+              f"60営業日後まで確定 {result['completed']:,})  最新の株価: {result['latest_bar']}  "
+              f"({time.perf_counter() - start:.2f}秒)")
+        print_summary(engine, args.summary)
+    except Exception as e:
+        logger.exception(f"推奨の実績評価でエラー: {str(e)}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -12,5 +12,8 @@ REM バッチスクリプトの実行
 python batch/stock_symbol_importer.py
 python batch/stock_data_importer.py
 python batch/technical_indicator_calculator.py --days 7
+python batch/cross_section_calculator.py --days 7
+python batch/similarity_index_builder.py
+python batch/recommendation_evaluator.py
 
 pause
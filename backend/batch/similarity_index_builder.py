@@ -0,0 +1,55 @@
+import sys
+import time
+import argparse
+
+# プロジェクトルートをsys.pathに追加
+from utils import get_db_engine, initialize_environment, setup_backend_logger
+from similarity import KINDS, SimilarityConfig, build_indexes
+
+logger = setup_backend_logger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='類似銘柄検索のインデックス作成ツール',
+        epilog="""
+【使い方】
+設定 (SIMILARITY_WINDOWS / SIMILARITY_DIMENSIONS) の全期間のインデックスを作成 (株価の取り込み後に夜間実行):
+  python similarity_index_builder.py
+
+期間・次元数を指定して作成:
+  python similarity_index_builder.py --window 60 --window 120 --dimensions 32
+
+リターンの相関のインデックスだけを作成:
+  python similarity_index_builder.py --kind returns
+""")
+    parser.add_argument('--window', type=int, action='append', default=None,
+                        help='埋め込みの期間（営業日、複数指定可、既定: SIMILARITY_WINDOWS）')
+    parser.add_argument('--dimensions', type=int, default=None,
+                        help='PCA で削減する次元数（0は削減しない、既定: SIMILARITY_DIMENSIONS）')
+    parser.add_argument('--kind', choices=list(KINDS), action='append', default=None,
+                        help='類似度の種類（複数指定可、既定: すべて）')
+    args = parser.parse_args()
+
+    initialize_environment()
+    config = SimilarityConfig.from_env()
+    if args.window:
+        config.windows = tuple(args.window)
+    if args.dimensions is not None:
+        config.dimensions = args.dimensions
+    engine = get_db_engine()
+    try:
+        start = time.perf_counter()
+        indexes = build_indexes(engine, config, args.kind or KINDS)
+        for index in indexes:
+            print(f"{index.kind:<11} {index.window:>4}営業日: {len(index.symbols):,}銘柄 × {index.dimensions}次元 "
+                  f"(最終日 {index.end_date}、分散の保持率 {index.explained_variance:.3f})")
+        print(f"インデックスを作成しました ({time.perf_counter() - start:.2f}秒)")
+    except Exception as e:
+        logger.exception(f"類似銘柄のインデックス作成でエラー: {str(e)}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
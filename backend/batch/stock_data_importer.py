@@ -7,8 +7,8 @@ import traceback
 from datetime import datetime, timedelta, timezone
 import os
 import time
+import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from psycopg2.extras import execute_values
 from psycopg2.pool import ThreadedConnectionPool
 import logging
 import random
@@ -17,6 +17,17 @@ import jpholiday
 
 # プロジェクトルートをsys.pathに追加
 from utils import initialize_environment, setup_backend_logger
+from metrics import BatchMetrics
+from profiling import StageProfiler
+from stock_prices import store_price_history
+
+# 引数解析
+parser = argparse.ArgumentParser(description='株価データ取得ツール')
+parser.add_argument('--profile', nargs='?', const='cprofile', choices=['cprofile', 'sampling'], default=None,
+                    help='ステージ別プロファイルとtracemallocの上位アロケーションを出力（既定: cprofile）')
+parser.add_argument('--profile-dir', type=str, default=None,
+                    help='プロファイルの出力先（既定: PROFILE_DIR または profiles）')
+args = parser.parse_args()
 
 # 環境初期化
 initialize_environment()
@@ -29,6 +40,13 @@ MAX_WORKERS = int(os.getenv('MAX_WORKERS', 2))  # デフォルト値を5→2に
 REQUEST_INTERVAL = float(os.getenv('REQUEST_INTERVAL', 0.5))  # リクエスト間隔(秒)
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))  # 最大リトライ回数
 
+# ステージ別処理時間・スループット (METRICS_TEXTFILE_DIR 設定時に textfile collector 形式で出力)
+batch_metrics = BatchMetrics("stock_data_importer")
+
+# ステージ別プロファイル (--profile 指定時のみ)
+stage_profiler = StageProfiler("stock_data_importer", args.profile_dir, args.profile or "cprofile",
+                               enabled=args.profile is not None)
+
 print(f"DB接続情報 (DB_NAME: {os.getenv('DB_NAME')}, DB_USER: {os.getenv('DB_USER')}, DB_PASSWORD: {os.getenv('DB_PASSWORD')})")
 
 # 接続プール初期化
@@ -63,6 +81,8 @@ def process_ticker(ticker, pool):
     """個別銘柄のデータ取得・保存処理"""
     conn = pool.getconn()
     conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+    check_start = time.perf_counter()
+    stage_profiler.begin("check")
     try:
         cursor = conn.cursor()
         
@@ -82,6 +102,7 @@ def process_ticker(ticker, pool):
             # 最終取得日が当日の場合
             if last_fetched_date == today:
                 logger.info(f"{ticker} - 本日分のデータを既に取得済みのためスキップ")
+                batch_metrics.symbol_result("skipped")
                 return True
                 
             # 最終取得日以降に営業日があるかチェック
@@ -98,9 +119,13 @@ def process_ticker(ticker, pool):
             
             if not has_trading_day:
                 logger.info(f"{ticker} - 最終取得日({last_fetched_date})以降に営業日がないためスキップ")
+                batch_metrics.symbol_result("skipped")
                 return True
+        batch_metrics.observe_stage("check", time.perf_counter() - check_start)
 
         # データ取得（レートリミット＆リトライ付き）
+        fetch_start = time.perf_counter()
+        stage_profiler.begin("fetch")
         retries = 0
         hist = None
         while retries <= MAX_RETRIES:
@@ -128,42 +153,21 @@ def process_ticker(ticker, pool):
                     logger.error(f"{ticker} - データ取得エラー: {str(e)}")
                     raise
 
+        batch_metrics.observe_stage("fetch", time.perf_counter() - fetch_start)
         if hist is None or hist.empty:
+            batch_metrics.symbol_result("empty")
             return False
 
-        # バルクインサート用データ準備
-        data = []
-        current_fetch_date = None
-        for index, row in hist.iterrows():
-            current_fetch_date = index.to_pydatetime().replace(tzinfo=None)
-            data.append((
-                ticker,
-                current_fetch_date,
-                float(row['Open']),
-                float(row['High']),
-                float(row['Low']),
-                float(row['Close']),
-                int(row['Volume'])
-            ))
-
-        # バルクインサート実行
-        execute_values(cursor,
-            """INSERT INTO stock_prices 
-               (symbol, date, open, high, low, close, volume)
-               VALUES %s
-               ON CONFLICT (symbol, date) DO NOTHING""",
-            data
-        )
-
-        # 最終取得日時を更新
-        cursor.execute("""
-            UPDATE stocks 
-            SET last_fetched = %s 
-            WHERE symbol = %s
-        """, (current_fetch_date, ticker))
+        store_start = time.perf_counter()
+        # バルクインサート・最終取得日時の更新
+        stage_profiler.begin("store")
+        rows = store_price_history(cursor, ticker, hist)
 
         # 変更をコミット
         conn.commit()
+        batch_metrics.observe_stage("store", time.perf_counter() - store_start)
+        batch_metrics.rows_written("stock_prices", rows)
+        batch_metrics.symbol_result("ok")
         return True
 
     except Exception as e:
@@ -175,8 +179,10 @@ def process_ticker(ticker, pool):
         logger.error(f"エラー発生時の最終取得日時: {last_fetched}")
         logger.error(f"リトライ回数: {retries}/{MAX_RETRIES}")
         
+        batch_metrics.symbol_result("error")
         return False
     finally:
+        stage_profiler.end()
         cursor.close()
         pool.putconn(conn)
 
@@ -197,6 +203,7 @@ def signal_handler(sig, frame):
 signal.signal(signal.SIGINT, signal_handler)
 
 # 並列処理実行
+stage_profiler.start()
 try:
     with tqdm(total=len(tickers), desc="銘柄処理中") as pbar:
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
@@ -221,10 +228,12 @@ try:
 
         # 結果確認
         success_count = 0
-        for future in as_completed(futures):
+        for done, future in enumerate(as_completed(futures), 1):
             if future.result():
                 success_count += 1
             pbar.update(1)
+            if done % progress_interval == 0:
+                batch_metrics.write()
 
     total_time = time.time() - start_time
     logger.info(
@@ -232,6 +241,7 @@ try:
         f"(総処理時間: {timedelta(seconds=int(total_time))}, "
         f"平均: {total_time/len(tickers):.2f}秒/銘柄)"
     )
+    batch_metrics.write(success=True)
 
 except KeyboardInterrupt:
     print("\n中断リクエストを受信しました。処理を安全に終了します...")
@@ -245,4 +255,6 @@ except Exception as e:
     pool.closeall()
     sys.exit(1)
 finally:
+    stage_profiler.stop()
+    batch_metrics.write()
     pool.closeall()
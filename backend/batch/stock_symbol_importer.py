@@ -6,6 +6,7 @@ from io import BytesIO
 
 # プロジェクトルートをsys.pathに追加
 from utils import initialize_environment
+from invalidation import publish_stocks_updated
 
 # 環境初期化
 initialize_environment()
@@ -127,6 +128,9 @@ for i in range(0, total_rows, batch_size):
             except Exception as e2:
                 print(f"    {row['ticker']} の保存中にエラー: {str(e2)}")
 
+# APIのキャッシュ (業種・規模の一覧、チャートの会社名) を破棄させる (コミット時に配信)
+publish_stocks_updated(cursor, jpx_df['ticker'].tolist())
+
 # 変更をコミット
 conn.commit()
 print("銘柄情報の保存完了")
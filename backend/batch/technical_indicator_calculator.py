@@ -1,11 +1,17 @@
 import pandas as pd
 import asyncio
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import text
 
 # プロジェクトルートをsys.pathに追加
 from utils import get_db_engine, initialize_environment, process_in_symbol_groups
 from technical_indicators import calculate_indicators, batch_store_indicators
+from metrics import BatchMetrics
+from profiling import StageProfiler
+from partitions import ensure_partitions, latest_date
+from bar_aggregates import TIMEFRAMES, lookback_days
+from alerts import AlertEngine, store_events
 
 def format_timedelta(td):
     """経過時間を分:秒形式にフォーマット"""
@@ -22,6 +28,9 @@ def show_usage_examples():
 特定銘柄の最新5日分を計算:
   python technical_indicator_calculator.py --symbol=7203 --days=5
 
+週足の指標を全銘柄の最新2週分計算 (月足は --timeframe monthly):
+  python technical_indicator_calculator.py --timeframe weekly --days=2
+
 ヘルプ表示:
   python technical_indicator_calculator.py -h
 """)
@@ -35,13 +44,27 @@ async def main():
                        help='計算対象の日数（デフォルト:1）')
     parser.add_argument('--symbol', type=str, default=None,
                        help='対象銘柄コード（例: 7203）')
+    parser.add_argument('--timeframe', choices=list(TIMEFRAMES), default='daily',
+                       help='時間軸（daily / weekly / monthly、週足・月足では --days は足の本数、デフォルト:daily）')
+    parser.add_argument('--metrics-file', type=str, default=None,
+                       help='メトリクスの出力先（textfile collector形式、既定: METRICS_TEXTFILE_DIR/technical_indicator_calculator.prom）')
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=['cprofile', 'sampling'], default=None,
+                       help='ステージ別プロファイルとtracemallocの上位アロケーションを出力（既定: cprofile）')
+    parser.add_argument('--profile-dir', type=str, default=None,
+                       help='プロファイルの出力先（既定: PROFILE_DIR または profiles）')
     args = parser.parse_args()
 
     # 使用例表示
-    if not args.symbol and args.days == 1:
+    if not args.symbol and args.days == 1 and args.timeframe == 'daily':
         show_usage_examples()
         return
+    timeframe = TIMEFRAMES[args.timeframe]
     
+    batch_metrics = BatchMetrics("technical_indicator_calculator", args.metrics_file)
+    stage_profiler = StageProfiler("technical_indicator_calculator", args.profile_dir,
+                                   args.profile or "cprofile", enabled=args.profile is not None)
+    stage_profiler.start()
+    success = False
     try:
         # 開始時刻記録
         start_time = datetime.now()
@@ -53,26 +76,50 @@ async def main():
         # データベースエンジン取得
         engine = get_db_engine()
         
-        # 株価データ取得クエリ
-        base_query = """
+        # アラートのルール (書き込んだ足だけで評価する。テーブルが無い場合などはアラートを評価しない)
+        try:
+            alert_engine = AlertEngine.load(engine, args.timeframe)
+        except Exception as e:
+            alert_engine = None
+            print(f"アラートのルールを読み込めませんでした: {str(e)}")
+        fired_alerts = 0
+
+        # 株価データ取得クエリ (週足・月足は集計テーブルから読む)
+        # 最終日は新しいパーティションから順に求め、日付の定数条件で対象パーティションを絞り込む
+        with engine.connect() as conn:
+            latest = latest_date(conn, timeframe["bars"])
+        base_query = f"""
             SELECT symbol, date, open, high, low, close, volume
-            FROM stock_prices
-            WHERE date >= (
-                SELECT MAX(date) - INTERVAL '{} days' 
-                FROM stock_prices
-            )
-        """.format(args.days + 75)
+            FROM {timeframe["bars"]}
+            WHERE date >= :start
+        """
+        params = {"start": latest - timedelta(days=lookback_days(args.timeframe, args.days + 75))
+                  if latest is not None else None}
 
         if args.symbol:
-            base_query += f" AND symbol = '{args.symbol}'"
+            base_query += " AND symbol = :symbol"
+            params["symbol"] = args.symbol
         
         base_query += " ORDER BY symbol, date"
         
-        df = pd.read_sql_query(base_query, engine, parse_dates=['date'])
-        
-        # 日付処理
-        df['date'] = pd.to_datetime(df['date'])
+        load_start = datetime.now()
+        with stage_profiler.stage("load"):
+            df = pd.read_sql_query(text(base_query), engine, params=params, parse_dates=['date'])
+            
+            # 日付処理
+            df['date'] = pd.to_datetime(df['date'])
+        batch_metrics.observe_stage("load", (datetime.now() - load_start).total_seconds(),
+                                    df['symbol'].nunique())
         
+        # 保存先のパーティションを用意 (パーティション化しているのは日足のみ)
+        if not df.empty and args.timeframe == 'daily':
+            raw = engine.raw_connection()
+            try:
+                ensure_partitions(raw.cursor(), "technical_indicators", df['date'].min(), df['date'].max())
+                raw.commit()
+            finally:
+                raw.close()
+
         # グループサイズ設定
         group_size = 1 if args.symbol else 100
         symbols = df['symbol'].unique()
@@ -94,22 +141,37 @@ async def main():
                 print(f"\nグループ {i}/{total_groups} 処理中 ({len(group_symbols)}銘柄) [経過: {elapsed}]")
                 
                 # 指標計算
-                indicators_df = calculate_indicators(group_df)
+                with batch_metrics.stage("calculate", len(group_symbols)), stage_profiler.stage("calculate"):
+                    indicators_df = calculate_indicators(group_df)
                 
                 # 直近の指定日数分のみ抽出して保存
                 recent_indicators_df = indicators_df.groupby('symbol').tail(args.days)
                 
                 # バッチ保存
-                if batch_store_indicators(recent_indicators_df, engine):
+                with batch_metrics.stage("store", len(group_symbols)), stage_profiler.stage("store"):
+                    stored = batch_store_indicators(recent_indicators_df, engine, timeframe["indicators"])
+                if stored:
                     # 処理済み銘柄を記録
                     processed_symbols.update(indicators_df['symbol'].unique())
+                    batch_metrics.symbol_result("ok", len(group_symbols))
+                    batch_metrics.rows_written(timeframe["indicators"], len(recent_indicators_df))
                     print(f"  {len(group_symbols)}銘柄処理済み、{len(recent_indicators_df)}件指標が格納された。")
+                    # 書き込んだ足でアラートを評価 (前の足の値は計算に使った indicators_df から取る)
+                    if alert_engine is not None and alert_engine.rule_count:
+                        with batch_metrics.stage("alerts", len(group_symbols)), stage_profiler.stage("alerts"):
+                            fired = store_events(engine, alert_engine.evaluate(indicators_df, args.days),
+                                                 args.timeframe)
+                        fired_alerts += len(fired)
                 else:
+                    batch_metrics.symbol_result("error", len(group_symbols))
                     print(f" グループ{i}の保存に失敗")
             
             except Exception as e:
+                batch_metrics.symbol_result("error", len(group_df['symbol'].unique()))
                 print(f" グループ{i}処理中にエラー: {str(e)}")
                 continue
+            finally:
+                batch_metrics.write()
         
         end_time = datetime.now()
         elapsed = format_timedelta(end_time - start_time)
@@ -119,13 +181,18 @@ async def main():
         else:
             print(f"\n処理完了: {len(processed_symbols)}銘柄のデータを更新")
         
+        if alert_engine is not None and alert_engine.rule_count:
+            print(f"アラート: {alert_engine.rule_count}件のルールで {fired_alerts}件発火")
         print(f"開始時刻: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"終了時刻: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"総処理時間: {elapsed}")
+        success = True
     
     except Exception as e:
         print(f"致命的エラー: {str(e)}")
     finally:
+        stage_profiler.stop()
+        batch_metrics.write(success=success)
         # エンジン破棄
         if 'engine' in locals():
             engine.dispose()
@@ -0,0 +1,114 @@
+import sys
+import json
+import time
+import argparse
+
+# プロジェクトルートをsys.pathに追加
+from utils import get_db_engine, initialize_environment, setup_backend_logger
+from bar_aggregates import TIMEFRAMES
+from backtest import STRATEGIES, EXECUTIONS, PERIODS_PER_YEAR, BacktestConfig, load_price_panel
+from walk_forward import DEFAULT_GRIDS, OBJECTIVES, default_cache_dir, optimize, parse_grid
+
+logger = setup_backend_logger(__name__)
+
+def _fmt(value, pct=True):
+    if value is None:
+        return f"{'-':>9}"
+    return f"{value * 100:8.2f}%" if pct else f"{value:9.2f}"
+
+def print_report(report, elapsed: float):
+    """分割ごとの選択と検証期間の成績、推奨値を表示"""
+    print(f"\n戦略: {report['strategy']}  評価指標: {report['objective']}  銘柄数: {report['symbols']:,}  "
+          f"セル数: {report['cells']}  ({elapsed:.1f}秒)")
+    print(f"  {'検証期間':<25} {'学習の評価値':>12} {'検証リターン':>10} {'検証シャープ':>10}  パラメータ")
+    for row in report['splits']:
+        test = row['test']
+        period = f"{row['test_period'][0]} 〜 {row['test_period'][1]}"
+        print(f"  {period:<25} {_fmt(row['train_score'], pct=False):>12} {_fmt(test['total_return']):>10} "
+              f"{_fmt(test['sharpe'], pct=False):>10}  {row['params']}")
+    oos = report['out_of_sample']
+    if oos:
+        print(f"\n検証期間をつないだ成績: リターン {_fmt(oos['total_return']).strip()}  年率 {_fmt(oos['cagr']).strip()}  "
+              f"シャープ {_fmt(oos['sharpe'], pct=False).strip()}  最大DD {_fmt(oos['max_drawdown']).strip()}")
+    recommended = report['recommended']
+    print(f"\n推奨値 (直近 {report['train_bars']}本で最良): {recommended['params']}")
+    for name, value in recommended['env'].items():
+        print(f"  {name}={value}")
+    if recommended['strategy_params']:
+        print(f"  (戦略のパラメータ: {recommended['strategy_params']})")
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description='指標パラメータのウォークフォワード最適化ツール',
+        epilog="""
+【使い方】
+ゴールデンクロスの移動平均期間を既定のグリッドで最適化 (学習2年・検証半年):
+  python walk_forward_optimizer.py --strategy golden_cross
+
+MACDの期間を範囲指定で探索し、推奨値を .env 形式で書き出す:
+  python walk_forward_optimizer.py --strategy macd_score --grid macd_fast=6:14:2 --grid macd_slow=20,26,32 --grid macd_signal=5,9 --env-output best.env
+
+中断した場合は同じ引数で再実行すると、計算済みのセルはキャッシュから読み込みます (--fresh で計算し直す)。
+""")
+    parser.add_argument('--strategy', choices=STRATEGIES, default='golden_cross', help='戦略（既定: golden_cross）')
+    parser.add_argument('--grid', action='append', metavar='KEY=VALUES',
+                        help='探索するパラメータ（key=値1,値2 または key=開始:終了:刻み、複数指定可、既定: 戦略ごとのグリッド）')
+    parser.add_argument('--symbol', action='append', default=None, help='対象銘柄（複数指定可、既定: 全銘柄）')
+    parser.add_argument('--start', default=None, help='開始日 (YYYY-MM-DD)')
+    parser.add_argument('--end', default=None, help='終了日 (YYYY-MM-DD)')
+    parser.add_argument('--timeframe', choices=list(TIMEFRAMES), default='daily', help='時間軸（既定: daily）')
+    parser.add_argument('--cost-bps', type=float, default=10.0, help='片道の取引コスト(bps)（既定: 10）')
+    parser.add_argument('--execution', choices=EXECUTIONS, default='next_open', help='約定価格（既定: next_open）')
+    parser.add_argument('--objective', choices=OBJECTIVES, default='sharpe', help='学習期間の評価指標（既定: sharpe）')
+    parser.add_argument('--train-bars', type=int, default=None, help='学習期間の足の数（既定: 2年分）')
+    parser.add_argument('--test-bars', type=int, default=None, help='検証期間の足の数（既定: 半年分）')
+    parser.add_argument('--step', type=int, default=None, help='分割のずらし幅（既定: 検証期間と同じ）')
+    parser.add_argument('--workers', type=int, default=None, help='プロセス数（既定: WALK_FORWARD_WORKERS またはCPU数）')
+    parser.add_argument('--cache-dir', default=None, help='途中結果のキャッシュ（既定: WALK_FORWARD_CACHE_DIR または cache/walk_forward）')
+    parser.add_argument('--fresh', action='store_true', help='キャッシュを使わずに計算し直す')
+    parser.add_argument('--output', default=None, help='結果JSONの出力先')
+    parser.add_argument('--env-output', default=None, help='推奨値を .env 形式で書き出す先')
+    args = parser.parse_args()
+
+    initialize_environment()
+    periods = PERIODS_PER_YEAR[args.timeframe]
+    train_bars = args.train_bars or periods * 2
+    test_bars = args.test_bars or max(1, periods // 2)
+    try:
+        base = BacktestConfig(strategy=args.strategy, cost_bps=args.cost_bps, execution=args.execution,
+                              timeframe=args.timeframe)
+        grid = parse_grid(args.grid) if args.grid else DEFAULT_GRIDS[args.strategy]
+    except ValueError as e:
+        parser.error(str(e))
+
+    engine = get_db_engine()
+    try:
+        start = time.perf_counter()
+        panel = load_price_panel(engine, args.symbol, args.start, args.end, args.timeframe)
+        logger.info(f"株価を読み込みました: {len(panel.symbols)}銘柄 × {len(panel.dates)}本")
+        report = optimize(panel, base, grid, train_bars, test_bars, args.step, args.objective,
+                          args.workers, args.cache_dir or default_cache_dir(), resume=not args.fresh)
+        print_report(report, time.perf_counter() - start)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n結果を保存しました: {args.output}")
+        if args.env_output:
+            with open(args.env_output, 'w', encoding='utf-8') as f:
+                f.write(f"# walk_forward_optimizer.py --strategy {args.strategy} ({report['objective']}, "
+                        f"直近 {train_bars}本で最良)\n")
+                for name, value in report['recommended']['env'].items():
+                    f.write(f"{name}={value}\n")
+            print(f"推奨値を書き出しました: {args.env_output}")
+    except KeyboardInterrupt:
+        print("\n中断しました (同じ引数で再実行すると続きから計算します)")
+        sys.exit(130)
+    except Exception as e:
+        logger.exception(f"ウォークフォワード最適化でエラー: {str(e)}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
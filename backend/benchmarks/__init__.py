@@ -0,0 +1,4 @@
+"""
+ベンチマーク・負荷試験用パッケージ
+バックエンドディレクトリをPYTHONPATHに含めて実行してください
+"""
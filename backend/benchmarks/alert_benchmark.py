@@ -0,0 +1,94 @@
+"""
+アラートの評価 (alerts.AlertEngine) のベンチマーク
+
+合成データ (DB不要) で、指標バッチが計算する DataFrame (銘柄 × 直近の足) と同じ形の全銘柄分に対して、
+ルール数ごとに書き込んだ足だけを評価する時間を計測する。
+
+  incremental  各銘柄の直近 --days 本 (バッチが書き込んだ行) だけを評価
+  full         各銘柄の全期間の足を評価する場合 (比較用、スクリーニングを毎回やり直すのに相当)
+
+ルールは指標 (rsi / macd_score / golden_cross / dead_cross)・条件・業種をばらつかせて生成する。
+
+使い方:
+  python benchmarks/alert_benchmark.py
+  python benchmarks/alert_benchmark.py --symbols 4000 --rules 10 --rules 100 --rules 1000 --days 1
+"""
+import sys
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import measure, collect_environment, save_results
+from benchmarks.synthetic_market import generate_ohlcv, generate_stocks
+from alerts import AlertEngine, AlertRule, NUMERIC_CONDITIONS, NUMERIC_INDICATORS, BOOLEAN_INDICATORS
+from technical_indicators import calculate_crosses, calculate_macd, calculate_rsi
+from indicator_library import IndicatorConfig
+
+def synthetic_indicators(n_symbols: int, bars: int, seed: int) -> pd.DataFrame:
+    """合成株価から指標を計算した縦持ちの DataFrame (指標バッチの indicators_df と同じ列)"""
+    prices = generate_ohlcv(n_symbols, (bars + 100) / 245, seed)
+    config = IndicatorConfig.from_env()
+    wide = prices.pivot(index="date", columns="symbol", values="close")
+    golden_cross, dead_cross = calculate_crosses({"close": wide}, config)
+    _, _, histogram = calculate_macd({"close": wide}, config)
+    columns = {
+        "golden_cross": golden_cross, "dead_cross": dead_cross, "rsi": calculate_rsi({"close": wide}, config),
+        "macd_score": golden_cross * 3 + (histogram > histogram.shift(1)) * 2 + (histogram > 0) * 1,
+    }
+    frame = pd.DataFrame({name: values.iloc[-bars:].stack(future_stack=True) for name, values in columns.items()})
+    # 指標バッチと同じ銘柄・日付順
+    return frame.reset_index()[["symbol", "date", *columns]].sort_values(["symbol", "date"], ignore_index=True)
+
+def synthetic_rules(n_rules: int, industries, seed: int):
+    rng = np.random.default_rng(seed)
+    rules = []
+    for i in range(n_rules):
+        indicator = rng.choice(NUMERIC_INDICATORS + BOOLEAN_INDICATORS)
+        numeric = indicator in NUMERIC_INDICATORS
+        rules.append(AlertRule(
+            id=i + 1, name=f"rule{i}", indicator=str(indicator),
+            condition=str(rng.choice(NUMERIC_CONDITIONS)) if numeric else "occurs",
+            threshold=float(rng.uniform(20, 80) if indicator == "rsi" else rng.integers(1, 6)) if numeric else None,
+            industry_code=str(rng.choice(industries)) if rng.random() < 0.5 else None,
+        ))
+    return rules
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="アラートの評価のベンチマーク")
+    parser.add_argument("--symbols", type=int, default=4000, help="銘柄数")
+    parser.add_argument("--bars", type=int, default=80, help="銘柄ごとの足の本数 (指標バッチの読み込み期間)")
+    parser.add_argument("--days", type=int, default=1, help="書き込んだ足の本数 (指標バッチの --days)")
+    parser.add_argument("--rules", type=int, action="append", default=None,
+                        help="ルール数（複数指定可、既定: 10, 100, 1000）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    indicators = synthetic_indicators(args.symbols, args.bars, args.seed)
+    stocks = generate_stocks(args.symbols, args.seed)[["symbol", "industry_code_33", "scale_code"]]
+    industries = stocks["industry_code_33"].unique()
+    results = {
+        "environment": collect_environment(),
+        "parameters": {"symbols": args.symbols, "bars": args.bars, "days": args.days, "rows": len(indicators)},
+        "benchmarks": {},
+    }
+
+    print(f"{'ルール数':>8} {'ケース':<12} {'中央値(ms)':>12} {'発火':>8}")
+    for n_rules in args.rules or [10, 100, 1000]:
+        engine = AlertEngine(synthetic_rules(n_rules, industries, args.seed), stocks)
+        for name, days in (("incremental", args.days), ("full", args.bars)):
+            stats = measure(lambda: engine.evaluate(indicators, days), args.repeat, args.warmup)
+            stats["events"] = len(engine.evaluate(indicators, days))
+            results["benchmarks"][f"{name}[{n_rules}]"] = stats
+            print(f"{n_rules:>8} {name:<12} {stats['median'] * 1000:>12.1f} {stats['events']:>8,}")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='alert-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+ベクトル化したバックテスト (backtest) のベンチマーク
+
+合成データ (DB不要、既定 4000銘柄×10年) で、戦略×約定方法ごとに全銘柄のバックテストを計測する。
+比較対象として、technical_indicators の関数でシグナルを出し足ごとに Python でポジションと損益を追う
+従来型のループを --loop-symbols 銘柄で計測し (全銘柄分は銘柄数で按分した推定値)、結果が一致することも確認する。
+--db-name を指定すると、ベンチマーク用DBの株価を読み込む時間 (load_price_panel) も計測する。
+
+使い方:
+  python benchmarks/backtest_benchmark.py
+  python benchmarks/backtest_benchmark.py --symbols 1000 --years 5 --loop-symbols 50
+  python benchmarks/backtest_benchmark.py --db-name stock_analyzer_bench   # 投入済みのベンチマーク用DBから読む
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import measure, collect_environment, save_results
+from benchmarks.synthetic_market import generate_ohlcv
+from backtest import STRATEGIES, EXECUTIONS, BacktestConfig, load_price_panel, run_backtest
+from indicator_library import PricePanel
+from technical_indicators import calculate_crosses, calculate_macd, calculate_macd_score, calculate_rsi
+
+def loop_signals(frame, config):
+    """1銘柄の各足の終値時点の目標ポジション (従来の関数でシグナルを出す)"""
+    params = config.indicators
+    target, holding = [], 0
+    if config.strategy == "golden_cross":
+        golden, dead = calculate_crosses(frame, params)
+        for g, d in zip(golden, dead):
+            holding = 1 if g else (0 if d else holding)
+            target.append(holding)
+    elif config.strategy == "macd_score":
+        golden, _ = calculate_crosses(frame, params)
+        histogram = calculate_macd(frame, params)[2].to_numpy()
+        prev = None
+        for g, h in zip(golden, histogram):
+            target.append(1 if calculate_macd_score(g, h, prev) >= config.macd_score_threshold else 0)
+            prev = h if not np.isnan(h) else None
+    else:
+        for value in calculate_rsi(frame, params):
+            holding = 1 if value < config.rsi_lower else (0 if value > config.rsi_upper else holding)
+            target.append(holding)
+    return target
+
+def loop_backtest(groups, config):
+    """銘柄ごと・足ごとのループでコスト控除後のリターンを計算"""
+    cost = config.cost_bps / 10000.0
+    results = {}
+    for symbol, frame in groups:
+        target = loop_signals(frame, config)
+        opens, closes = frame["open"].to_numpy(), frame["close"].to_numpy()
+        returns, held = [0.0], 0
+        for t in range(1, len(frame)):
+            prev_held, held = held, target[t - 1]
+            if config.execution == "next_open" and held > prev_held:
+                gross = closes[t] / opens[t] - 1
+            elif config.execution == "next_open" and held < prev_held:
+                gross = opens[t] / closes[t - 1] - 1
+            else:
+                gross = (closes[t] / closes[t - 1] - 1) * held
+            returns.append(gross - abs(held - prev_held) * cost)
+        results[symbol] = np.array(returns)
+    return results
+
+def check_loop(loop_result, result):
+    """
+    ループ版との比較
+
+    Returns:
+        tuple: (リターンが異なる足の割合, 差の最大値)
+            指標の計算順序が異なるため、移動平均やRSIが閾値と誤差の範囲で等しい足はシグナルが分かれうる
+    """
+    index = {symbol: i for i, symbol in enumerate(result.symbols)}
+    diffs = np.concatenate([np.abs(returns - result.returns[index[symbol]]) for symbol, returns in loop_result.items()])
+    return float(np.mean(diffs > 1e-9)), float(diffs.max())
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ベクトル化したバックテストのベンチマーク")
+    parser.add_argument("--symbols", type=int, default=4000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=10.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--loop-symbols", type=int, default=100, help="ループ版を計測する銘柄数")
+    parser.add_argument("--db-name", default=None, help="株価を読み込むベンチマーク用DB (指定時のみ)")
+    parser.add_argument("--repeat", type=int, default=3, help="ベクトル化版の計測回数")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    results = {"benchmarks": {}, "checks": {}}
+    if args.db_name:
+        from utils import initialize_environment, get_db_engine
+
+        initialize_environment()
+        os.environ["DB_NAME"] = args.db_name
+        engine = get_db_engine()
+        results["benchmarks"]["load_price_panel"] = measure(lambda: load_price_panel(engine), args.repeat, args.warmup)
+        panel = load_price_panel(engine)
+        results["environment"] = collect_environment(engine)
+        results["dataset"] = {"db_name": args.db_name}
+        print(f"株価の読み込み: {results['benchmarks']['load_price_panel']['median']:.2f}秒")
+    else:
+        start = time.perf_counter()
+        prices = generate_ohlcv(args.symbols, args.years, args.seed)
+        panel = PricePanel.from_frame(prices)
+        del prices
+        results["environment"] = collect_environment()
+        results["dataset"] = {"symbols": args.symbols, "years": args.years, "seed": args.seed}
+        print(f"合成データ: ({time.perf_counter() - start:.1f}秒)")
+    n_symbols, n_dates = panel.close.shape
+    results["dataset"].update({"panel_symbols": n_symbols, "panel_dates": n_dates})
+    print(f"パネル: {n_symbols}銘柄 × {n_dates}日")
+
+    # ループ版は先頭 --loop-symbols 銘柄 (欠損の無い銘柄) で計測する
+    loop_rows = [i for i in range(n_symbols) if not np.isnan(panel.close[i]).any()][:args.loop_symbols]
+    groups = [(panel.symbols[i], pd.DataFrame({"open": panel.open[i], "close": panel.close[i]}))
+              for i in loop_rows]
+
+    print(f"{'ケース':<24} {'ループ推定(s)':>14} {'ベクトル化(s)':>14} {'倍率':>8} {'不一致の割合':>12}")
+    for strategy in STRATEGIES:
+        for execution in EXECUTIONS:
+            name = f"{strategy}[{execution}]"
+            config = BacktestConfig(strategy=strategy, execution=execution)
+            vector_stats = measure(lambda: run_backtest(panel, config), args.repeat, args.warmup, items=n_symbols)
+            results["benchmarks"][f"{name}[vector]"] = vector_stats
+            loop_result = {}
+            loop_stats = measure(lambda: loop_result.update(loop_backtest(groups, config)), 1, 0, items=len(groups))
+            results["benchmarks"][f"{name}[loop]"] = loop_stats
+            mismatch_rate, max_diff = check_loop(loop_result, run_backtest(panel, config))
+            results["checks"][name] = {"mismatch_rate": mismatch_rate, "max_diff": max_diff}
+            estimated = loop_stats["median"] / len(groups) * n_symbols
+            print(f"{name:<24} {estimated:>14.1f} {vector_stats['median']:>14.2f} "
+                  f"{estimated / vector_stats['median']:>7.0f}x {mismatch_rate:>12.2e}")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='backtest-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+日次の横断的な順位 (cross_section) のベンチマーク
+
+ベンチマーク用DBの合成データセットで、次を計測する。
+
+  load        対象期間の指標・モメンタム・業種規模の読み込み (load_features)
+  vectorized  全営業日をまとめた順位・平均の計算 (compute_rankings)
+  per_day     営業日ごとにループして順位を計算する場合 (比較用)
+  update      読み込み + 計算 + 保存 (update_rankings、バッチ1回分)
+  stored      保存済みのモメンタムの業種内順位で銘柄一覧をソート (/api/stocks と同じ結合)
+  on_the_fly  直近21営業日の終値からモメンタムと percent_rank() の業種内順位を求めてソート (リクエスト時に計算する場合)
+
+使い方:
+  python benchmarks/cross_section_benchmark.py
+  python benchmarks/cross_section_benchmark.py --days 20 --repeat 10
+"""
+import os
+import sys
+import logging
+import argparse
+
+import pandas as pd
+from sqlalchemy import text
+
+from benchmarks.harness import (
+    measure, collect_environment, ensure_database, load_dataset, save_results
+)
+
+STORED_QUERY = """
+    SELECT s.symbol, tr.momentum, tr.momentum_industry_rank
+    FROM stocks s
+    LEFT JOIN technical_rankings tr
+        ON tr.symbol = s.symbol AND tr.date = (SELECT MAX(date) FROM technical_rankings)
+    ORDER BY tr.momentum_industry_rank DESC NULLS LAST
+    LIMIT 50
+"""
+
+ON_THE_FLY_QUERY = """
+    SELECT symbol, momentum, momentum_industry_rank
+    FROM (
+        SELECT s.symbol, p.momentum,
+            CASE WHEN p.momentum IS NOT NULL THEN
+                ROUND(100 * PERCENT_RANK() OVER (
+                    PARTITION BY s.industry_code_33, p.momentum IS NULL ORDER BY p.momentum))
+            END AS momentum_industry_rank
+        FROM stocks s
+        LEFT JOIN LATERAL (
+            SELECT (ARRAY_AGG(close ORDER BY date DESC))[1] / NULLIF((ARRAY_AGG(close ORDER BY date DESC))[21], 0) - 1
+                AS momentum
+            FROM (SELECT date, close FROM stock_prices WHERE symbol = s.symbol ORDER BY date DESC LIMIT 21) recent
+        ) p ON true
+    ) ranked
+    ORDER BY momentum_industry_rank DESC NULLS LAST
+    LIMIT 50
+"""
+
+def per_day_rankings(frame: pd.DataFrame):
+    """比較用: 営業日ごとに順位を計算する"""
+    from cross_section import compute_rankings
+    return [compute_rankings(day) for _, day in frame.groupby("date")]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="日次の横断的な順位のベンチマーク")
+    parser.add_argument("--db-name", default=os.getenv("BENCHMARK_DB_NAME", "stock_analyzer_bench"))
+    parser.add_argument("--symbols", type=int, default=1000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=10.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=60, help="順位を計算する営業日数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    from utils import initialize_environment, get_db_engine
+
+    initialize_environment()
+    os.environ["DB_NAME"] = args.db_name
+    ensure_database(args.db_name)
+    engine = get_db_engine()
+    dataset = load_dataset(engine, args.symbols, args.years, args.seed, indicator_days=max(args.days, 60))
+
+    from cross_section import compute_rankings, load_features, recent_trading_days, update_rankings
+
+    days = recent_trading_days(engine, args.days)
+    start, end = days[0], days[-1]
+    frame = load_features(engine, start, end)
+    results = {
+        "environment": collect_environment(engine),
+        "dataset": dataset,
+        "parameters": {"days": len(days), "start": start.isoformat(), "end": end.isoformat(), "rows": len(frame)},
+        "benchmarks": {},
+    }
+    cases = {
+        "load": lambda: load_features(engine, start, end),
+        "vectorized": lambda: compute_rankings(frame),
+        "per_day": lambda: per_day_rankings(frame),
+        "update": lambda: update_rankings(engine, start, end),
+    }
+    with engine.connect() as conn:
+        cases["stored"] = lambda: conn.execute(text(STORED_QUERY)).all()
+        cases["on_the_fly"] = lambda: conn.execute(text(ON_THE_FLY_QUERY)).all()
+
+        print(f"{len(days)}営業日 × {args.symbols}銘柄 ({len(frame):,}行)")
+        print(f"{'ケース':<12} {'中央値(ms)':>12} {'p95(ms)':>10}")
+        for name, func in cases.items():
+            stats = measure(func, args.repeat, args.warmup)
+            results["benchmarks"][name] = stats
+            print(f"{name:<12} {stats['median'] * 1000:>12.1f} {stats['p95'] * 1000:>10.1f}")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='cross-section-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""
+ベンチマークの共通処理
+
+- 計測: ウォームアップ後に repeat 回実行し、中央値・最小・p95などを集計する
+- ベンチマーク用DB: 専用データベースを作成し、合成データセットを COPY で投入する
+- 結果: 実行環境・データセットと合わせてJSONに保存し、ベースラインとの比較で劣化を検出する
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import text
+
+from partitions import PARTITIONED_TABLES, ensure_partitions
+from bar_aggregates import refresh_aggregates
+from benchmarks.synthetic_market import (
+    generate_stocks, generate_ohlcv, last_trading_day, dataset_fingerprint
+)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema.sql")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# ベースライン比較で劣化とみなす中央値の増加率
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+def measure(func: Callable, repeat: int = 5, warmup: int = 1,
+            setup: Optional[Callable] = None, items: Optional[int] = None) -> Dict:
+    """
+    関数の実行時間を計測する
+
+    Args:
+        func: 計測対象。setup を指定した場合はその戻り値を引数に受け取る
+        repeat: 計測回数
+        warmup: 計測前の空実行回数
+        setup: 各実行の前に呼ぶ準備処理 (計測時間に含めない)
+        items: 1回の実行で処理する件数 (スループットの算出用)
+
+    Returns:
+        dict: 秒単位の統計値と各回の計測値
+    """
+    def run_once():
+        state = setup() if setup else None
+        start = time.perf_counter()
+        func(state) if setup else func()
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        run_once()
+    samples = [run_once() for _ in range(repeat)]
+    median = statistics.median(samples)
+    result = {
+        "unit": "s",
+        "repeat": repeat,
+        "min": min(samples),
+        "median": median,
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "p95": float(np.percentile(samples, 95)),
+        "samples": samples,
+    }
+    if items:
+        result["items"] = items
+        result["items_per_sec"] = items / median if median > 0 else None
+    return result
+
+def _git_revision() -> Dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                               capture_output=True, text=True, timeout=30).stdout.strip() != ""
+        return {"commit": commit or None, "dirty": dirty}
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "dirty": None}
+
+def collect_environment(engine=None) -> Dict:
+    """結果の比較可能性を判断するための実行環境情報"""
+    import sqlalchemy
+    import matplotlib
+    environment = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "packages": {
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sqlalchemy": sqlalchemy.__version__,
+            "psycopg2": psycopg2.__version__.split()[0],
+            "matplotlib": matplotlib.__version__,
+        },
+        "git": _git_revision(),
+    }
+    if engine is not None:
+        with engine.connect() as conn:
+            environment["postgres"] = conn.execute(text("SHOW server_version")).scalar()
+    return environment
+
+def _connect_args(db_name: str) -> Dict:
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "dbname": db_name,
+        "connect_timeout": 10,
+    }
+
+def ensure_database(db_name: str):
+    """ベンチマーク用データベースが無ければ作成する (CREATEDB権限が必要)"""
+    try:
+        psycopg2.connect(**_connect_args(db_name)).close()
+        return
+    except psycopg2.OperationalError as e:
+        if "does not exist" not in str(e):
+            raise
+    conn = psycopg2.connect(**_connect_args(os.getenv("BENCHMARK_ADMIN_DB", "postgres")))
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE DATABASE \"{db_name}\" ENCODING 'UTF8' TEMPLATE template0")
+        print(f"ベンチマーク用データベースを作成しました: {db_name}")
+    finally:
+        conn.close()
+
+def _copy_frame(cursor, table: str, frame: pd.DataFrame):
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def seed_indicators(prices: pd.DataFrame, days: int) -> pd.DataFrame:
+    """
+    直近 days 営業日分の technical_indicators を一括計算する (投入用)
+
+    バッチと同じ式・同じ環境変数の期間を、銘柄を列にした横持ちの表で列ごとに計算する。
+    """
+    from technical_indicators import calculate_rsi, calculate_macd
+    from indicator_library import IndicatorConfig
+
+    config = IndicatorConfig.from_env()
+    wide = prices.pivot(index="date", columns="symbol", values="close")
+    short_ma = wide.rolling(config.cross_short).mean()
+    long_ma = wide.rolling(config.cross_long).mean()
+    golden_cross = (short_ma > long_ma) & (short_ma.shift(1) <= long_ma.shift(1))
+    dead_cross = (short_ma < long_ma) & (short_ma.shift(1) >= long_ma.shift(1))
+    rsi = calculate_rsi({"close": wide}, config)
+    macd, signal_line, histogram = calculate_macd({"close": wide}, config)
+    macd_score = golden_cross * 3 + (histogram > histogram.shift(1)) * 2 + (histogram > 0) * 1
+
+    columns = {
+        "golden_cross": golden_cross, "dead_cross": dead_cross, "rsi": rsi.round(4),
+        "macd": macd.round(4), "signal_line": signal_line.round(4),
+        "histogram": histogram.round(4), "macd_score": macd_score,
+    }
+    recent = {name: frame.iloc[-days:].stack(future_stack=True) for name, frame in columns.items()}
+    indicators = pd.DataFrame(recent).reset_index()
+    return indicators[["symbol", "date", *columns]].sort_values(["symbol", "date"])
+
+def load_dataset(engine, n_symbols: int, years: float, seed: int,
+                 end: Optional[date] = None, indicator_days: int = 60,
+                 force: bool = False) -> Dict:
+    """
+    合成データセットをベンチマーク用DBに投入する (同じデータセットが投入済みなら何もしない)
+
+    Returns:
+        dict: データセットのパラメータ (fingerprint, 行数を含む)
+    """
+    end = last_trading_day(end)
+    fingerprint = dataset_fingerprint(n_symbols, years, seed, end)
+    parameters = {"symbols": n_symbols, "years": float(years), "seed": seed,
+                  "end": end.isoformat(), "indicator_days": indicator_days}
+
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        schema = f.read()
+    with engine.begin() as conn:
+        # 関数定義に % を含むため、パラメータ展開をしないカーソルで直接実行する
+        conn.connection.cursor().execute(schema)
+        loaded = conn.execute(text("SELECT parameters FROM benchmark_dataset WHERE fingerprint = :fingerprint"),
+                              {"fingerprint": fingerprint}).scalar()
+    if loaded is not None and loaded == parameters and not force:
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT COUNT(*) FROM stock_prices")).scalar()
+        print(f"合成データセット {fingerprint} は投入済みです ({rows:,}行)")
+        return {"fingerprint": fingerprint, "rows": rows, **parameters}
+
+    start = time.perf_counter()
+    stocks = generate_stocks(n_symbols, seed)
+    prices = generate_ohlcv(n_symbols, years, seed, end)
+    indicators = seed_indicators(prices, indicator_days)
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("TRUNCATE benchmark_dataset, technical_indicators, stock_prices, stocks, "
+                       "stock_prices_weekly, stock_prices_monthly, "
+                       "technical_indicators_weekly, technical_indicators_monthly, "
+                       "recommendation_sessions, recommendation_results, recommendation_raw_responses, "
+                       "recommendation_pick_performance, recommendation_session_performance, "
+                       "technical_rankings, sector_indicator_averages, similarity_indexes, alert_events")
+        _copy_frame(cursor, "stocks", stocks)
+        for table in PARTITIONED_TABLES:
+            ensure_partitions(cursor, table, prices["date"].min(), prices["date"].max())
+        chunk = 500 * int(years * 245)
+        for offset in range(0, len(prices), chunk):
+            _copy_frame(cursor, "stock_prices", prices.iloc[offset:offset + chunk])
+        _copy_frame(cursor, "technical_indicators", indicators)
+        refresh_aggregates(cursor)
+        cursor.execute("INSERT INTO benchmark_dataset (fingerprint, parameters) VALUES (%s, %s)",
+                       (fingerprint, json.dumps(parameters)))
+        raw.commit()
+        cursor.execute("ANALYZE stocks; ANALYZE stock_prices; ANALYZE technical_indicators; "
+                       "ANALYZE stock_prices_weekly; ANALYZE stock_prices_monthly")
+        raw.commit()
+    finally:
+        raw.close()
+    print(f"合成データセット {fingerprint} を投入しました: {len(prices):,}行 "
+          f"(指標 {len(indicators):,}行) {time.perf_counter() - start:.1f}秒")
+    return {"fingerprint": fingerprint, "rows": len(prices), **parameters}
+
+def seed_recommendation_history(engine, n_sessions: int = 1000, seed: int = 42) -> int:
+    """
+    推奨履歴 (セッション・結果・AI生レスポンス) を投入する (既に n_sessions 件以上あれば何もしない)
+
+    Returns:
+        int: 投入後のセッション数
+    """
+    from psycopg2.extras import execute_values
+    from aiagent.prompt_cache import DEFAULT_TEMPLATE
+    from benchmarks.mock_llm_server import build_mock_content
+
+    with engine.connect() as conn:
+        existing = conn.execute(text("SELECT COUNT(*) FROM recommendation_sessions")).scalar()
+        symbols = conn.execute(text("SELECT symbol FROM stocks ORDER BY symbol")).scalars().all()
+    if existing >= n_sessions or not symbols:
+        return existing
+
+    rng = np.random.default_rng(seed)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("""
+            INSERT INTO prompt_templates (name, system_role, user_template, output_format)
+            VALUES ('ベンチマーク', %s, %s, %s)
+            ON CONFLICT (name) DO UPDATE SET updated_at = CURRENT_TIMESTAMP
+            RETURNING id
+        """, (DEFAULT_TEMPLATE["system_role"], DEFAULT_TEMPLATE["user_template"], DEFAULT_TEMPLATE["output_format"]))
+        prompt_id = cursor.fetchone()[0]
+
+        sessions = []
+        picks = []
+        for i in range(n_sessions - existing):
+            picked = list(rng.choice(symbols, 3, replace=False))
+            # 推論過程を含む応答を模して数十KBにする
+            raw_response = "推論過程: " + "銘柄の値動きを比較検討する。" * int(rng.integers(200, 2000)) \
+                + build_mock_content(" ".join(picked))
+            sessions.append((
+                datetime.now() - pd.Timedelta(hours=int(rng.integers(0, 24 * 365))),
+                int(rng.integers(10, 100)) * 100000, ["低", "中", "高"][i % 3],
+                ["成長株", "配当株", "バランス"][i % 3], picked, "{}", prompt_id, raw_response, "5%"))
+            picks.append(picked)
+        session_ids = execute_values(cursor, """
+            INSERT INTO recommendation_sessions
+                (generated_at, principal, risk_tolerance, strategy, symbols, technical_filter,
+                 prompt_id, ai_raw_response, total_return_estimate)
+            VALUES %s RETURNING session_id
+        """, sessions, fetch=True)
+        results = [(session_id, symbol, f"合成銘柄{symbol[:4]}株式会社", "33%", 0.7, "ベンチマーク用の推奨")
+                   for (session_id,), picked in zip(session_ids, picks) for symbol in picked]
+        execute_values(cursor, """
+            INSERT INTO recommendation_results (session_id, symbol, name, allocation, confidence, reason)
+            VALUES %s
+        """, results)
+        raw.commit()
+    finally:
+        raw.close()
+    print(f"推奨履歴を投入しました: {n_sessions - existing}セッション")
+    return n_sessions
+
+def save_results(results: Dict, path: Optional[str] = None, prefix: str = "") -> str:
+    """結果をJSONで保存 (既定: benchmarks/results/<接頭辞><日時>-<コミット>.json)"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = results.get("environment", {}).get("git", {}).get("commit") or "unknown"
+        path = os.path.join(RESULTS_DIR, f"{prefix}{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+    return path
+
+def load_results(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def compare_results(baseline: Dict, current: Dict,
+                    threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> List[Dict]:
+    """
+    ベンチマークごとに中央値を比較する
+
+    中央値が baseline の (1 + threshold) 倍を超え、かつ今回の最小値も
+    baseline の中央値を上回る場合に劣化 (regression) と判定する (ばらつきによる誤検出を抑える)。
+    """
+    rows = []
+    for name, result in current.get("benchmarks", {}).items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None:
+            rows.append({"name": name, "status": "new", "current": result["median"]})
+            continue
+        ratio = result["median"] / base["median"] if base["median"] > 0 else float("inf")
+        if ratio > 1 + threshold and result["min"] > base["median"]:
+            status = "regression"
+        elif ratio < 1 - threshold:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append({"name": name, "status": status, "baseline": base["median"],
+                     "current": result["median"], "ratio": ratio})
+    return rows
+
+def print_comparison(rows: List[Dict], baseline: Dict, current: Dict):
+    if baseline.get("dataset", {}).get("fingerprint") != current.get("dataset", {}).get("fingerprint"):
+        print("警告: データセットが異なるため比較結果は参考値です")
+    print(f"{'ベンチマーク':<32} {'baseline':>10} {'current':>10} {'比率':>7}  判定")
+    for row in rows:
+        baseline_value = f"{row['baseline']:.4f}" if "baseline" in row else "-"
+        ratio = f"{row['ratio']:.2f}x" if "ratio" in row else "-"
+        print(f"{row['name']:<32} {baseline_value:>10} {row['current']:>10.4f} {ratio:>7}  {row['status']}")
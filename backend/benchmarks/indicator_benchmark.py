@@ -0,0 +1,137 @@
+"""
+ベクトル化した指標ライブラリ (indicator_library) のベンチマーク
+
+全銘柄の合成データ (DB不要、既定 4000銘柄×3年) で、technical_indicators の関数を銘柄ごと・
+期間ごとにループで呼ぶ従来の方法と、銘柄×日付の配列でまとめて計算する方法を比較する。
+
+  standard   ゴールデン/デッドクロス・RSI(単純平均)・MACD (バッチと同じ指標、結果が一致することも確認)
+  ma_sweep   移動平均 --min-window〜--max-window 日の全期間
+  full_set   indicator_library の全指標 (ボリンジャーバンド・ATR・ストキャスティクス・OBV・VWMA・ワイルダーRSIを含む、比較対象なし)
+
+使い方:
+  python benchmarks/indicator_benchmark.py
+  python benchmarks/indicator_benchmark.py --symbols 500 --years 1 --loop-repeat 3
+"""
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from benchmarks.harness import measure, collect_environment, save_results
+from benchmarks.synthetic_market import generate_ohlcv
+from indicator_library import (
+    IndicatorConfig, PricePanel, compute_indicators, crosses, macd, rsi, sma, sweep
+)
+from technical_indicators import (
+    calculate_crosses, calculate_macd, calculate_moving_average, calculate_rsi
+)
+
+def loop_standard(groups, config):
+    """従来の関数を銘柄ごとに呼ぶ"""
+    results = {}
+    for symbol, frame in groups:
+        golden, dead = calculate_crosses(frame, config)
+        line, signal_line, histogram = calculate_macd(frame, config)
+        results[symbol] = (golden.to_numpy(), dead.to_numpy(), calculate_rsi(frame, config).to_numpy(),
+                           line.to_numpy(), signal_line.to_numpy(), histogram.to_numpy())
+    return results
+
+def vector_standard(prices, config):
+    """同じ指標を配列でまとめて計算 (RSIは従来と同じ単純平均)"""
+    panel = PricePanel.from_frame(prices)
+    short_ma, long_ma = sma(panel.close, [config.cross_short, config.cross_long])
+    result = crosses(short_ma, long_ma)
+    result["rsi"] = rsi(panel.close, config.rsi_window, method="sma")
+    result.update(macd(panel.close, config.macd_fast, config.macd_slow, config.macd_signal))
+    return panel, result
+
+def loop_sweep(groups, windows):
+    for _, frame in groups:
+        for window in windows:
+            calculate_moving_average(frame["close"], window).to_numpy()
+
+def vector_sweep(prices, windows, chunk_size):
+    panel = PricePanel.from_frame(prices)
+    for chunk in panel.chunks(chunk_size):
+        sweep(chunk, "sma", windows)
+
+def check_standard(loop_result, panel, vector_result):
+    """
+    従来の関数の結果との比較
+
+    Returns:
+        tuple: (数値指標の差の最大値, クロス判定の不一致件数)
+            移動平均の計算順序が異なるため、短期・長期の移動平均が誤差の範囲で等しい日はクロス判定が分かれうる
+    """
+    worst, mismatches = 0.0, 0
+    names = ("golden_cross", "dead_cross", "rsi", "macd", "signal_line", "histogram")
+    for i, symbol in enumerate(panel.symbols):
+        for name, expected in zip(names, loop_result[symbol]):
+            actual = vector_result[name][i]
+            if expected.dtype == bool:
+                mismatches += int(np.sum(actual != expected))
+            else:
+                # 片方だけ NaN の位置も不一致として扱う
+                diff = np.where(np.isnan(actual) != np.isnan(expected), np.inf, np.abs(actual - expected))
+                worst = max(worst, float(np.nanmax(diff, initial=0.0)))
+    return worst, mismatches
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ベクトル化した指標ライブラリのベンチマーク")
+    parser.add_argument("--symbols", type=int, default=4000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=3.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-window", type=int, default=5, help="移動平均スイープの最短期間")
+    parser.add_argument("--max-window", type=int, default=200, help="移動平均スイープの最長期間")
+    parser.add_argument("--chunk-size", type=int, default=250, help="スイープで一度に計算する銘柄数")
+    parser.add_argument("--repeat", type=int, default=5, help="ベクトル化版の計測回数")
+    parser.add_argument("--loop-repeat", type=int, default=1, help="ループ版の計測回数")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    start = time.perf_counter()
+    prices = generate_ohlcv(args.symbols, args.years, args.seed)
+    groups = [(symbol, frame.reset_index(drop=True)) for symbol, frame in prices.groupby("symbol", sort=True)]
+    print(f"合成データ: {args.symbols}銘柄 × {prices['date'].nunique()}日 = {len(prices):,}行 "
+          f"({time.perf_counter() - start:.1f}秒)")
+    config = IndicatorConfig.from_env()
+    windows = list(range(args.min_window, args.max_window + 1))
+
+    panel, vector_result = vector_standard(prices, config)
+    max_diff, cross_mismatches = check_standard(loop_standard(groups, config), panel, vector_result)
+
+    cases = {
+        "standard": (lambda: loop_standard(groups, config), lambda: vector_standard(prices, config)),
+        "ma_sweep": (lambda: loop_sweep(groups, windows), lambda: vector_sweep(prices, windows, args.chunk_size)),
+        "full_set": (None, lambda: compute_indicators(PricePanel.from_frame(prices), config)),
+    }
+    results = {
+        "environment": collect_environment(),
+        "dataset": {"symbols": args.symbols, "years": args.years, "seed": args.seed, "rows": len(prices)},
+        "parameters": {"windows": [args.min_window, args.max_window], "chunk_size": args.chunk_size,
+                       "config": vars(config)},
+        "standard_check": {"max_diff": max_diff, "cross_mismatches": cross_mismatches},
+        "benchmarks": {},
+    }
+    print(f"standard の従来関数との比較: 差の最大値 {max_diff:.3g}、クロス判定の不一致 {cross_mismatches}件")
+    print(f"{'ケース':<12} {'ループ(s)':>10} {'ベクトル化(s)':>14} {'倍率':>8}")
+    for name, (loop, vector) in cases.items():
+        vector_stats = measure(vector, args.repeat, args.warmup)
+        results["benchmarks"][f"{name}[vector]"] = vector_stats
+        if loop is None:
+            print(f"{name:<12} {'-':>10} {vector_stats['median']:>14.3f} {'-':>8}")
+            continue
+        loop_stats = measure(loop, args.loop_repeat, 0)
+        results["benchmarks"][f"{name}[loop]"] = loop_stats
+        print(f"{name:<12} {loop_stats['median']:>10.3f} {vector_stats['median']:>14.3f} "
+              f"{loop_stats['median'] / vector_stats['median']:>7.1f}x")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='indicators-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
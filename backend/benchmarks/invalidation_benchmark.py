@@ -0,0 +1,84 @@
+"""
+キャッシュの無効化 (invalidation.TaggedCache) のベンチマーク
+
+合成データ (DB不要) で、銘柄タグ付きのキャッシュ (--entries 件、1件あたり --tags 銘柄に依存) に対して、
+株価の取り込みが1銘柄ごとに発行する prices_updated の処理時間を計測する。
+
+  indexed   銘柄 → キーの索引で、関係するキーだけを破棄 (TaggedCache.invalidate)
+  scan      全キーのタグを調べて破棄する場合 (比較用)
+  hit       キャッシュの参照1回
+
+使い方:
+  python benchmarks/invalidation_benchmark.py
+  python benchmarks/invalidation_benchmark.py --entries 1000 --entries 100000 --tags 20
+"""
+import sys
+import logging
+import argparse
+import itertools
+
+import numpy as np
+
+from benchmarks.harness import measure, collect_environment, save_results
+from invalidation import PRICES_UPDATED, InvalidationEvent, TaggedCache
+
+def fill(cache: TaggedCache, symbols, entries: int, tags: int, rng):
+    for key in range(entries):
+        cache.put(key, key, rng.choice(symbols, size=tags, replace=False))
+
+def scan_invalidate(cache: TaggedCache, event: InvalidationEvent) -> int:
+    """比較用: 全キーのタグを調べて破棄する"""
+    with cache._lock:
+        stale = [key for key, (_, tags, _) in cache._entries.items() if tags is None or event.affects(tags)]
+    for key in stale:
+        with cache._lock:
+            cache._evict(key)
+    return len(stale)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="キャッシュの無効化のベンチマーク")
+    parser.add_argument("--symbols", type=int, default=4000, help="銘柄数")
+    parser.add_argument("--entries", type=int, action="append", default=None,
+                        help="キャッシュの件数（複数指定可、既定: 1000, 10000, 100000）")
+    parser.add_argument("--tags", type=int, default=1, help="1件あたりの依存する銘柄数 (チャートは1)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    rng = np.random.default_rng(args.seed)
+    symbols = np.array([f"{1000 + i}.T" for i in range(args.symbols)])
+    results = {
+        "environment": collect_environment(),
+        "parameters": {"symbols": args.symbols, "tags": args.tags},
+        "benchmarks": {},
+    }
+
+    print(f"{'件数':>8} {'ケース':<10} {'中央値(us)':>12} {'破棄':>6}")
+    for entries in args.entries or [1000, 10000, 100000]:
+        cache = TaggedCache("benchmark", ttl=0, size=entries)
+        targets = itertools.cycle(rng.choice(symbols, size=min(100, args.symbols), replace=False))
+        cases = {
+            "indexed": cache.invalidate,
+            "scan": lambda event: scan_invalidate(cache, event),
+        }
+        for name, invalidate in cases.items():
+            fill(cache, symbols, entries, args.tags, rng)
+            evicted = []
+            stats = measure(lambda: evicted.append(invalidate(
+                InvalidationEvent(PRICES_UPDATED, frozenset([str(next(targets))])))), args.repeat, args.warmup)
+            stats["evicted"] = float(np.mean(evicted))
+            results["benchmarks"][f"{name}[{entries}]"] = stats
+            print(f"{entries:>8} {name:<10} {stats['median'] * 1e6:>12.1f} {stats['evicted']:>6.1f}")
+        keys = itertools.cycle(range(entries))
+        stats = measure(lambda: cache.get(next(keys)), args.repeat, args.warmup)
+        results["benchmarks"][f"hit[{entries}]"] = stats
+        print(f"{entries:>8} {'hit':<10} {stats['median'] * 1e6:>12.1f}")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='invalidation-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,408 @@
+"""
+HTTP負荷試験
+
+ベンチマーク用DB (合成データセット + 推奨履歴) とモックLLMサーバーを用意してAPIを起動し、
+トラフィックプロファイル (benchmarks/traffic_profiles/*.json) の比率でリクエストを送り続ける。
+ルートごとのスループット・レイテンシ (p50/p95/p99)・エラー率を表示し、JSONに保存する。
+
+負荷のかけ方:
+  --concurrency N  同時N利用者がレスポンスを待ってから次を送る (クローズドループ)
+  --rate R         到着率 R req/s のポアソン到着 (オープンループ)。レイテンシは予定送信時刻から
+                   計測するため、サーバーが詰まった際の待ち時間も含まれる
+
+トラフィックプロファイルの記録:
+  稼働中のAPIの /metrics (http_requests_total) からルート別のリクエスト数を読み、
+  既存プロファイルの重みを実トラフィックの比率に置き換えたプロファイルを出力する。
+  python benchmarks/load_test.py --record-from http://prod-host:8000/metrics --record-to recorded.json
+
+使い方:
+  python benchmarks/load_test.py --symbols 4000 --duration 60 --concurrency 20 --workers 2
+  python benchmarks/load_test.py --rate 30 --llm-latency 2.0 --profile recorded.json
+  python benchmarks/load_test.py --url http://localhost:8000 --duration 30   # 起動済みのAPIに対して実行
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import signal
+import logging
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+from sqlalchemy import text
+
+from benchmarks.harness import (
+    RESULTS_DIR, collect_environment, ensure_database, load_dataset,
+    seed_recommendation_history, save_results
+)
+from benchmarks.mock_llm_server import start_mock_server
+
+PROFILES_DIR = os.path.join(os.path.dirname(__file__), "traffic_profiles")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+def load_profile(name_or_path: str) -> Dict:
+    """プロファイル名 (traffic_profiles/<名前>.json) またはパスから読み込む"""
+    path = name_or_path
+    if not os.path.exists(path):
+        path = os.path.join(PROFILES_DIR, f"{name_or_path}.json")
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+    for route in profile["routes"]:
+        if route.get("weight", 0) < 0:
+            raise ValueError(f"重みが負です: {route['name']}")
+    return profile
+
+def record_profile(metrics_text: str, base_profile: Dict) -> Dict:
+    """/metrics のルート別リクエスト数で base_profile の重みを置き換える
+
+    同じルートに複数のエントリ (例: 一覧のページングと検索) がある場合は、
+    元の重みの比率でリクエスト数を按分する。
+    """
+    pattern = re.compile(r'^http_requests_total\{([^}]*)\}\s+([0-9.eE+]+)$')
+    counts: Dict[tuple, float] = {}
+    for line in metrics_text.splitlines():
+        match = pattern.match(line.strip())
+        if not match:
+            continue
+        labels = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(1)))
+        key = (labels.get("method"), labels.get("route"))
+        counts[key] = counts.get(key, 0) + float(match.group(2))
+
+    routes = []
+    unmatched = dict(counts)
+    for route in base_profile["routes"]:
+        key = (route["method"], route["route"])
+        siblings = [r for r in base_profile["routes"] if (r["method"], r["route"]) == key]
+        share = route["weight"] / (sum(r["weight"] for r in siblings) or 1)
+        unmatched.pop(key, None)
+        routes.append({**route, "weight": round(counts.get(key, 0) * share, 2)})
+    recorded = {
+        "description": f"{datetime.now():%Y-%m-%d %H:%M} に /metrics から記録 (元: {base_profile.get('description', '')})",
+        "routes": [route for route in routes if route["weight"] > 0],
+    }
+    if unmatched:
+        ignored = ", ".join(f"{method} {route}" for method, route in unmatched if route != "unmatched")
+        if ignored:
+            recorded["ignored_routes"] = ignored
+    return recorded
+
+class TrafficGenerator:
+    """プロファイルの重みでリクエストを選び、プレースホルダを埋めたリクエストを生成する"""
+
+    def __init__(self, profile: Dict, variables: Dict[str, list], seed: int = 42):
+        self.routes = [route for route in profile["routes"] if route.get("weight", 0) > 0]
+        self.weights = [route["weight"] for route in self.routes]
+        self.variables = variables
+        self.random = random.Random(seed)
+
+    def _value(self, name: str):
+        if name == "page":
+            return self.random.randint(1, max(1, len(self.variables["symbol"]) // 20))
+        if name == "history_page":
+            return self.random.randint(1, max(1, len(self.variables["session_id"]) // 10))
+        if name == "symbols":
+            return self.random.sample(self.variables["symbol"], min(3, len(self.variables["symbol"])))
+        values = self.variables.get(name)
+        if not values:
+            raise KeyError(f"プレースホルダ {{{name}}} の値がありません")
+        return self.random.choice(values)
+
+    def _render(self, value):
+        if isinstance(value, str):
+            whole = PLACEHOLDER.fullmatch(value)
+            if whole:
+                # 値全体がプレースホルダなら型 (数値・リスト) を保つ
+                return self._value(whole.group(1))
+            return PLACEHOLDER.sub(lambda m: str(self._value(m.group(1))), value)
+        if isinstance(value, list):
+            return [self._render(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._render(item) for key, item in value.items()}
+        return value
+
+    def next_request(self) -> Dict:
+        route = self.random.choices(self.routes, self.weights)[0]
+        return {
+            "name": route["name"],
+            "method": route["method"],
+            "path": self._render(route["path"]),
+            "params": self._render(route.get("params")),
+            "json": self._render(route.get("json")),
+        }
+
+def load_variables(engine) -> Dict[str, list]:
+    """プレースホルダに使う値をDBから読み込む"""
+    with engine.connect() as conn:
+        symbols = conn.execute(text("SELECT symbol FROM stocks ORDER BY symbol")).scalars().all()
+        industries = conn.execute(text(
+            "SELECT DISTINCT industry_code_33 FROM stocks WHERE industry_code_33 IS NOT NULL")).scalars().all()
+        session_ids = conn.execute(text(
+            "SELECT session_id FROM recommendation_sessions ORDER BY session_id")).scalars().all()
+    return {
+        "symbol": list(symbols),
+        "industry": sorted(industries),
+        "search": sorted({symbol[:2] for symbol in symbols} | {"合成"}),
+        "sort_by": ["symbol", "name", "rsi", "macd_score", "technical_date"],
+        "sort_order": ["asc", "desc"],
+        "session_id": list(session_ids),
+    }
+
+class LatencyRecorder:
+    """ルートごとのレイテンシ・ステータスの記録 (ウォームアップ中は記録しない)"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+        self.recording = False
+        self.started_at = None
+        self.stopped_at = None
+
+    def start(self):
+        self.recording = True
+        self.started_at = time.perf_counter()
+
+    def stop(self):
+        self.recording = False
+        self.stopped_at = time.perf_counter()
+
+    def record(self, name: str, latency: float, error: Optional[str]):
+        if not self.recording:
+            return
+        self.samples.setdefault(name, []).append(latency)
+        if error is not None:
+            errors = self.errors.setdefault(name, {})
+            errors[error] = errors.get(error, 0) + 1
+
+    def summary(self) -> Dict:
+        elapsed = (self.stopped_at or time.perf_counter()) - self.started_at
+        routes = {}
+        all_samples = []
+        for name, samples in sorted(self.samples.items()):
+            all_samples.extend(samples)
+            routes[name] = self._stats(samples, sum(self.errors.get(name, {}).values()), elapsed)
+            routes[name]["error_types"] = self.errors.get(name, {})
+        total_errors = sum(sum(errors.values()) for errors in self.errors.values())
+        return {"elapsed": elapsed, "routes": routes,
+                "total": self._stats(all_samples, total_errors, elapsed) if all_samples else {}}
+
+    @staticmethod
+    def _stats(samples: List[float], errors: int, elapsed: float) -> Dict:
+        values = np.asarray(samples)
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            "requests": len(samples),
+            "throughput": len(samples) / elapsed if elapsed > 0 else None,
+            "errors": errors,
+            "error_rate": errors / len(samples),
+            "mean": float(values.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(values.max()),
+        }
+
+async def send(client: httpx.AsyncClient, request: Dict, recorder: LatencyRecorder,
+               scheduled_at: Optional[float] = None):
+    """1リクエストを送信して記録 (scheduled_at 指定時は予定時刻からのレイテンシ)"""
+    start = scheduled_at if scheduled_at is not None else time.perf_counter()
+    error = None
+    try:
+        response = await client.request(request["method"], request["path"],
+                                        params=request["params"], json=request["json"])
+        await response.aread()
+        if response.status_code >= 400:
+            error = str(response.status_code)
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    recorder.record(request["name"], time.perf_counter() - start, error)
+
+async def closed_loop(client, generator: TrafficGenerator, recorder: LatencyRecorder,
+                      concurrency: int, deadline: float, think_time: float):
+    async def user():
+        while time.perf_counter() < deadline:
+            await send(client, generator.next_request(), recorder)
+            if think_time > 0:
+                await asyncio.sleep(generator.random.expovariate(1 / think_time))
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+
+async def open_loop(client, generator: TrafficGenerator, recorder: LatencyRecorder,
+                    rate: float, deadline: float, max_in_flight: int):
+    in_flight = set()
+    next_at = time.perf_counter()
+    while next_at < deadline:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            # 上限超過分は送信せずエラーとして数える (送信側の詰まりで到着率が下がるのを防ぐ)
+            recorder.record(generator.next_request()["name"], 0.0, "dropped")
+        else:
+            task = asyncio.create_task(send(client, generator.next_request(), recorder, scheduled_at=next_at))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        next_at += generator.random.expovariate(rate)
+    if in_flight:
+        await asyncio.wait(in_flight)
+
+async def run_load(base_url: str, generator: TrafficGenerator, args) -> Dict:
+    recorder = LatencyRecorder()
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.max_in_flight),
+                          max_keepalive_connections=max(args.concurrency, args.max_in_flight))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        loop.call_later(args.warmup, recorder.start)
+        deadline = start + args.warmup + args.duration
+        if args.rate:
+            await open_loop(client, generator, recorder, args.rate, deadline, args.max_in_flight)
+        else:
+            await closed_loop(client, generator, recorder, args.concurrency, deadline, args.think_time)
+        recorder.stop()
+    return recorder.summary()
+
+def start_api(args, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    """uvicornでAPIを起動し、/metrics が応答するまで待つ"""
+    command = [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1",
+               "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"]
+    log = open(log_path, "w", encoding="utf-8")
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"APIの起動に失敗しました (ログ: {log_path})")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/metrics", timeout=2).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    stop_api(process)
+    raise RuntimeError(f"APIが60秒以内に起動しませんでした (ログ: {log_path})")
+
+def stop_api(process: subprocess.Popen):
+    if process.poll() is None:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(15)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+def print_summary(summary: Dict):
+    print(f"\n{'ルート':<26} {'件数':>7} {'req/s':>8} {'エラー率':>8} {'p50(ms)':>9} {'p95(ms)':>9} "
+          f"{'p99(ms)':>9} {'max(ms)':>9}")
+    rows = list(summary["routes"].items()) + ([("(全体)", summary["total"])] if summary["total"] else [])
+    for name, stats in rows:
+        print(f"{name:<26} {stats['requests']:>7} {stats['throughput']:>8.1f} {stats['error_rate']:>8.1%} "
+              f"{stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f} "
+              f"{stats['max'] * 1000:>9.1f}")
+    for name, stats in summary["routes"].items():
+        if stats["error_types"]:
+            print(f"  {name} のエラー内訳: {stats['error_types']}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="HTTP負荷試験")
+    parser.add_argument("--profile", default="default", help="トラフィックプロファイル (名前またはJSONのパス)")
+    parser.add_argument("--url", default=None, help="起動済みのAPIのURL (指定時はAPI・モックLLMを起動しない)")
+    parser.add_argument("--db-name", default=os.getenv("BENCHMARK_DB_NAME", "stock_analyzer_bench"))
+    parser.add_argument("--symbols", type=int, default=4000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=3.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--history-sessions", type=int, default=1000, help="投入する推奨履歴のセッション数")
+    parser.add_argument("--port", type=int, default=8765, help="起動するAPIのポート")
+    parser.add_argument("--workers", type=int, default=1, help="uvicornのワーカー数")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="モックLLMの基本レイテンシ(秒)")
+    parser.add_argument("--llm-per-token-latency", type=float, default=0.0,
+                        help="モックLLMのプロンプト1トークン当たりの追加レイテンシ(秒)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="モックLLMが500を返す割合")
+    parser.add_argument("--duration", type=float, default=60, help="計測時間(秒)")
+    parser.add_argument("--warmup", type=float, default=5, help="計測前のウォームアップ時間(秒)")
+    parser.add_argument("--concurrency", type=int, default=10, help="クローズドループの同時利用者数")
+    parser.add_argument("--think-time", type=float, default=0.0, help="利用者ごとのリクエスト間隔の平均(秒)")
+    parser.add_argument("--rate", type=float, default=None, help="オープンループの到着率(req/s)")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="オープンループの同時送信数の上限")
+    parser.add_argument("--timeout", type=float, default=60, help="リクエストのタイムアウト(秒)")
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--record-from", default=None, metavar="METRICS_URL",
+                        help="稼働中のAPIの /metrics からプロファイルを記録する")
+    parser.add_argument("--record-to", default=None, help="記録したプロファイルの出力先")
+    parser.add_argument("--log-level", default="WARNING", help="負荷生成側のログレベル")
+    args = parser.parse_args()
+
+    # 負荷生成側のログ出力を抑える (インポート済みのバックエンドのロガー設定を上書き)
+    logging.basicConfig(level=args.log_level.upper())
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    profile = load_profile(args.profile)
+    if args.record_from:
+        recorded = record_profile(httpx.get(args.record_from, timeout=30).text, profile)
+        output = json.dumps(recorded, ensure_ascii=False, indent=2)
+        if args.record_to:
+            with open(args.record_to, "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+            print(f"プロファイルを保存しました: {args.record_to}")
+        else:
+            print(output)
+        return 0
+
+    from utils import initialize_environment, get_db_engine
+    initialize_environment()
+    os.environ["DB_NAME"] = args.db_name
+    engine = get_db_engine()
+    dataset = None
+    mock_server = None
+    api_process = None
+    if args.url is None:
+        ensure_database(args.db_name)
+        dataset = load_dataset(engine, args.symbols, args.years, args.seed)
+        seed_recommendation_history(engine, args.history_sessions, args.seed)
+    generator = TrafficGenerator(profile, load_variables(engine), args.seed)
+
+    base_url = args.url
+    try:
+        if base_url is None:
+            mock_server, llm_url = start_mock_server(0, args.llm_latency, args.llm_per_token_latency,
+                                                     args.llm_error_rate)
+            env = {**os.environ, "DB_NAME": args.db_name, "DEEPSEEK_API_URL": llm_url,
+                   "DEEPSEEK_API_KEY": os.getenv("DEEPSEEK_API_KEY") or "mock"}
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            log_path = os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}-api.log")
+            api_process = start_api(args, env, log_path)
+            base_url = f"http://127.0.0.1:{args.port}"
+            print(f"API起動: {base_url} (workers={args.workers}, ログ: {log_path}), モックLLM: {llm_url}")
+
+        mode = f"rate={args.rate}req/s" if args.rate else f"concurrency={args.concurrency}"
+        print(f"負荷試験開始: {mode}, 計測{args.duration:.0f}秒 (ウォームアップ{args.warmup:.0f}秒)")
+        summary = asyncio.run(run_load(base_url, generator, args))
+    finally:
+        if api_process is not None:
+            stop_api(api_process)
+        if mock_server is not None:
+            mock_server.shutdown()
+
+    print_summary(summary)
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": collect_environment(engine),
+        "dataset": dataset,
+        "profile": profile,
+        "parameters": {key: getattr(args, key) for key in
+                       ("url", "workers", "llm_latency", "llm_per_token_latency", "llm_error_rate",
+                        "duration", "warmup", "concurrency", "think_time", "rate", "max_in_flight")},
+        "summary": summary,
+    }
+    path = save_results(results, args.output, prefix="load-")
+    print(f"結果を保存しました: {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
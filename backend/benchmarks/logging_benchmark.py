@@ -0,0 +1,119 @@
+"""
+ロギングがリクエストレイテンシに与える影響のベンチマーク
+
+ロギング設定 (LOG_* 環境変数) ごとに別プロセスを起動し、次の処理のレイテンシを比較する。
+  - prepare_recommendations: /api/prepare-recommendations (SQLのログを含む。ベンチマーク用DBを使用)
+  - payload_log: 推奨処理と同じ大きさの銘柄データ・プロンプトのログ出力
+標準エラーへのログは親プロセスがパイプで受け取る (コンテナのログ収集と同じ条件)。
+
+モード:
+  sync       同期ハンドラ・切り詰め無し (従来の設定に相当)
+  async      キュー経由の非同期ハンドラ + LOG_MAX_MESSAGE_CHARS による切り詰め
+  async_json 上記 + JSON形式
+  async_info 上記 + LOG_LEVEL=INFO (ペイロードのDEBUGログは文字列化もされない)
+
+使い方:
+  python benchmarks/logging_benchmark.py --repeat 200
+  python benchmarks/logging_benchmark.py --no-db   # DBを使わない payload_log のみ
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "sync": {"LOG_ASYNC": "false", "LOG_MAX_MESSAGE_CHARS": "0"},
+    "async": {"LOG_ASYNC": "true"},
+    "async_json": {"LOG_ASYNC": "true", "LOG_FORMAT": "json"},
+    "async_info": {"LOG_ASYNC": "true", "LOG_LEVEL": "INFO"},
+}
+
+PREPARE_REQUEST = {
+    "principal": 1000000, "risk_tolerance": "中", "strategy": "成長株",
+    "technical_filters": {"rsi": ["<", 40]},
+}
+
+def run_worker(args):
+    """子プロセス: 現在の LOG_* 設定でケースを計測し、結果をJSONで標準出力に書く"""
+    from benchmarks.harness import measure
+    from benchmarks.prompt_encoding_benchmark import make_synthetic_frames
+    from utils import setup_backend_logger
+    from log_pipeline import shutdown_logging
+
+    logger = setup_backend_logger("aiagent.deepseek_direct")
+    company_df, indicator_df = make_synthetic_frames(args.payload_symbols)
+    payload = {"company_infos": company_df, "technical_indicators": indicator_df}
+    prompt = f"以下の銘柄情報を分析し、投資推奨を生成してください:\n{company_df.to_string()}\n{indicator_df.to_string()}"
+
+    def payload_log():
+        logger.info("Generating recommendations with params: %s", PREPARE_REQUEST)
+        logger.debug("銘柄データ: %s", payload)
+        logger.debug("Prompt: %s", prompt)
+
+    results = {"payload_log": measure(payload_log, repeat=args.repeat, warmup=args.warmup)}
+    if not args.no_db:
+        from fastapi.testclient import TestClient
+        import api
+        client = TestClient(api.app)
+
+        def prepare():
+            response = client.post("/api/prepare-recommendations", json=PREPARE_REQUEST)
+            response.raise_for_status()
+
+        results["prepare_recommendations"] = measure(prepare, repeat=args.repeat, warmup=args.warmup)
+    shutdown_logging()
+    for result in results.values():
+        result.pop("samples")
+    results["log_file_bytes"] = os.path.getsize(os.environ["LOG_FILE"])
+    print(json.dumps(results))
+
+def run_mode(mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, **MODES[mode], "PYTHONPATH": BACKEND_DIR,
+               "LOG_FILE": os.path.join(workdir, "bench.log"),
+               "DB_NAME": args.db_name}
+        command = [sys.executable, os.path.abspath(__file__), "--worker",
+                   "--repeat", str(args.repeat), "--warmup", str(args.warmup),
+                   "--payload-symbols", str(args.payload_symbols)] + (["--no-db"] if args.no_db else [])
+        proc = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=False)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{mode} の計測に失敗しました:\n{proc.stderr[-2000:]}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result["stderr_bytes"] = len(proc.stderr.encode("utf-8"))
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description="ロギングのレイテンシへの影響のベンチマーク")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--repeat", type=int, default=200, help="ケースごとの計測回数")
+    parser.add_argument("--warmup", type=int, default=5, help="計測前の空実行回数")
+    parser.add_argument("--payload-symbols", type=int, default=50, help="payload_log の銘柄数 (推奨処理の上限と同じ)")
+    parser.add_argument("--db-name", default=os.getenv("BENCHMARK_DB_NAME", "stock_analyzer_bench"))
+    parser.add_argument("--no-db", action="store_true", help="DBを使うケースを省略")
+    parser.add_argument("--output", type=str, default=None, help="結果JSONの出力先")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    from benchmarks.harness import collect_environment, save_results
+    results = {"environment": collect_environment(), "benchmarks": {}, "log_bytes": {}}
+    print(f"{'ケース':<26} {'モード':<11} {'中央値(ms)':>10} {'p95(ms)':>9} {'ログ(KiB)':>10}")
+    for mode in args.modes:
+        result = run_mode(mode, args)
+        log_kib = (result.pop("log_file_bytes") + result.pop("stderr_bytes")) / 1024
+        results["log_bytes"][mode] = log_kib * 1024
+        for case, stats in result.items():
+            results["benchmarks"][f"{case}[{mode}]"] = stats
+            print(f"{case:<26} {mode:<11} {stats['median'] * 1000:>10.3f} {stats['p95'] * 1000:>9.3f} {log_kib:>10.0f}")
+    if args.output:
+        print(f"結果を保存しました: {save_results(results, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+OpenAI互換のモックLLMサーバー
+
+DeepSeek APIの代わりに起動し、DEEPSEEK_API_URLをこのサーバーへ向けることで
+外部APIを呼ばずに推奨フロー全体のレイテンシを計測できる。
+応答時間は「基本レイテンシ + プロンプトトークン数 × トークン当たりレイテンシ」で模擬する。
+
+使い方:
+  python benchmarks/mock_llm_server.py --port 8089 --base-latency 0.5 --per-token-latency 0.0005
+"""
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aiagent.prompt_encoder import estimate_tokens
+
+SYMBOL_PATTERN = re.compile(r"\b(\d{4})(?:\.T)?\b")
+
+def build_mock_content(prompt: str, max_picks: int = 3) -> str:
+    """プロンプト中の銘柄コードから推奨JSONを生成"""
+    symbols = list(dict.fromkeys(SYMBOL_PATTERN.findall(prompt)))[:max_picks] or ["7203"]
+    allocation = round(100 / len(symbols))
+    recommendations = [
+        {
+            "symbol": symbol,
+            "name": f"銘柄{symbol}",
+            "confidence": 70,
+            "allocation": f"{allocation}%",
+            "reason": "モックLLMによる推奨"
+        }
+        for symbol in symbols
+    ]
+    body = json.dumps({"recommendations": recommendations, "total_return_estimate": "5%"}, ensure_ascii=False)
+    return f"```json\n{body}\n```"
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    base_latency = 0.5
+    per_token_latency = 0.0
+    error_rate = 0.0
+    _lock = threading.Lock()
+    _request_count = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        prompt = "\n".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        prompt_tokens = estimate_tokens(prompt)
+
+        with self._lock:
+            MockLLMHandler._request_count += 1
+            count = MockLLMHandler._request_count
+
+        time.sleep(self.base_latency + prompt_tokens * self.per_token_latency)
+
+        if self.error_rate and (count % max(1, int(1 / self.error_rate))) == 0:
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        content = build_mock_content(prompt)
+        completion_tokens = estimate_tokens(content)
+        response = {
+            "id": f"mock-{count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+        body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_mock_server(port: int = 0, base_latency: float = 0.5,
+                      per_token_latency: float = 0.0, error_rate: float = 0.0):
+    """モックサーバーをバックグラウンドスレッドで起動
+
+    Returns:
+        (ThreadingHTTPServer, base_url): サーバーとOpenAIクライアント用のベースURL
+    """
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {
+        "base_latency": base_latency,
+        "per_token_latency": per_token_latency,
+        "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI互換モックLLMサーバー')
+    parser.add_argument('--port', type=int, default=8089, help='待受ポート（デフォルト:8089）')
+    parser.add_argument('--base-latency', type=float, default=0.5, help='基本レイテンシ(秒)')
+    parser.add_argument('--per-token-latency', type=float, default=0.0,
+                        help='プロンプト1トークン当たりの追加レイテンシ(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='500エラーを返す割合(0-1)')
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.port, args.base_latency,
+                                         args.per_token_latency, args.error_rate)
+    print(f"モックLLMサーバー起動: {base_url} (DEEPSEEK_API_URL={base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+パーティション化の効果のベンチマーク
+
+ベンチマーク用DBに長期間 (既定10年) の合成データセットを投入し、パーティション化したテーブル
+(stock_prices / technical_indicators) と、同じデータを従来どおり1つのヒープに入れた
+heap_stock_prices / heap_technical_indicators で次のクエリを比較する。
+
+  batch_window_subquery  指標バッチの旧クエリ (MAX(date) のサブクエリで直近 N 日を絞り込む)
+  batch_window           指標バッチの現クエリ (最終日を先に求め、日付の定数条件で絞り込む)
+  latest_all_distinct    APIの旧クエリ (DISTINCT ON で全銘柄の最新指標)
+  latest_all_lateral     APIの現クエリ (LATERAL で銘柄ごとに最新1行を索引から取得)
+  latest_selected        推奨用の選択銘柄 (50銘柄) の最新指標
+
+使い方:
+  python benchmarks/partition_benchmark.py --symbols 1000 --years 10
+  PARTITION_INTERVAL=year python benchmarks/partition_benchmark.py --reload   # 年単位のパーティション
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import timedelta
+
+from sqlalchemy import text
+
+from benchmarks.harness import (
+    measure, collect_environment, ensure_database, load_dataset, save_results
+)
+from benchmarks.synthetic_market import make_symbols
+from partitions import latest_date, partition_interval
+
+LAYOUTS = {
+    "partitioned": {"prices": "stock_prices", "indicators": "technical_indicators"},
+    "heap": {"prices": "heap_stock_prices", "indicators": "heap_technical_indicators"},
+}
+
+def build_heap_tables(engine):
+    """パーティション化前と同じ構成 (1つのヒープ + (symbol, date) の一意索引) のコピーを作る"""
+    with engine.connect() as conn:
+        expected = conn.execute(text("SELECT COUNT(*) FROM stock_prices")).scalar()
+        exists = conn.execute(text("SELECT to_regclass('heap_stock_prices') IS NOT NULL")).scalar()
+        if exists and conn.execute(text("SELECT COUNT(*) FROM heap_stock_prices")).scalar() == expected:
+            return
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for source, target in (("stock_prices", "heap_stock_prices"),
+                               ("technical_indicators", "heap_technical_indicators")):
+            conn.execute(text(f"DROP TABLE IF EXISTS {target}"))
+            conn.execute(text(f"CREATE TABLE {target} AS SELECT * FROM {source} ORDER BY symbol, date"))
+            conn.execute(text(f"CREATE UNIQUE INDEX {target}_symbol_date_key ON {target} (symbol, date)"))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE heap_stock_prices"))
+        conn.execute(text("ANALYZE heap_technical_indicators"))
+    print(f"比較用のヒープテーブルを作成しました ({time.perf_counter() - start:.1f}秒)")
+
+def make_cases(engine, tables, args):
+    prices, indicators = tables["prices"], tables["indicators"]
+    selected = make_symbols(args.symbols)[::max(1, args.symbols // 50)][:50]
+
+    def fetch(query, params=None):
+        def run():
+            with engine.connect() as conn:
+                return conn.execute(text(query), params or {}).fetchall()
+        return run
+
+    def batch_window():
+        with engine.connect() as conn:
+            start = latest_date(conn, prices) - timedelta(days=args.window)
+            return conn.execute(text(f"""
+                SELECT symbol, date, open, high, low, close, volume
+                FROM {prices}
+                WHERE date >= :start
+                ORDER BY symbol, date
+            """), {"start": start}).fetchall()
+
+    lateral = f"""
+        SELECT s.symbol, ti.date, ti.rsi, ti.golden_cross, ti.macd_score
+        FROM stocks s
+        LEFT JOIN LATERAL (
+            SELECT * FROM {indicators}
+            WHERE symbol = s.symbol
+            ORDER BY date DESC
+            LIMIT 1
+        ) ti ON true
+    """
+    return {
+        "batch_window_subquery": fetch(f"""
+            SELECT symbol, date, open, high, low, close, volume
+            FROM {prices}
+            WHERE date >= (SELECT MAX(date) - make_interval(days => :days) FROM {prices})
+            ORDER BY symbol, date
+        """, {"days": args.window}),
+        "batch_window": batch_window,
+        "latest_all_distinct": fetch(f"""
+            SELECT s.symbol, ti.date, ti.rsi, ti.golden_cross, ti.macd_score
+            FROM stocks s
+            LEFT JOIN (
+                SELECT DISTINCT ON (symbol) *
+                FROM {indicators}
+                ORDER BY symbol, date DESC
+            ) ti ON s.symbol = ti.symbol
+        """),
+        "latest_all_lateral": fetch(lateral),
+        "latest_selected": fetch(lateral + " WHERE s.symbol = ANY(:symbols)", {"symbols": selected}),
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="パーティション化の効果のベンチマーク")
+    parser.add_argument("--db-name", default=os.getenv("BENCHMARK_DB_NAME", "stock_analyzer_bench"))
+    parser.add_argument("--symbols", type=int, default=1000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=10.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--window", type=int, default=80, help="バッチの読み込み日数 (--days + 75)")
+    parser.add_argument("--reload", action="store_true", help="投入済みでもデータセットを作り直す")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    from utils import initialize_environment, get_db_engine
+
+    initialize_environment()
+    os.environ["DB_NAME"] = args.db_name
+    ensure_database(args.db_name)
+    engine = get_db_engine()
+    # 指標は全期間分を投入する (最新行の検索が長い履歴の影響を受けるかを見るため)
+    dataset = load_dataset(engine, args.symbols, args.years, args.seed,
+                           indicator_days=int(args.years * 245) - 75, force=args.reload)
+    build_heap_tables(engine)
+
+    results = {
+        "environment": collect_environment(engine),
+        "dataset": {**dataset, "partition_interval": partition_interval()},
+        "benchmarks": {},
+    }
+    print(f"{'ケース':<24} {'heap(ms)':>10} {'partitioned(ms)':>16} {'比率':>7}")
+    for name in make_cases(engine, LAYOUTS["heap"], args):
+        row = {}
+        for layout, tables in LAYOUTS.items():
+            result = measure(make_cases(engine, tables, args)[name], args.repeat, args.warmup)
+            results["benchmarks"][f"{name}[{layout}]"] = result
+            row[layout] = result["median"] * 1000
+        print(f"{name:<24} {row['heap']:>10.1f} {row['partitioned']:>16.1f} "
+              f"{row['partitioned'] / row['heap']:>6.2f}x")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='partition-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+配分最適化 (portfolio_optimizer) のベンチマーク
+
+合成データ (DB不要) で、候補銘柄数ごとに共分散の推定と配分方法ごとの最適化の時間を計測する
+(agent_type=quant の推奨から株価・指標の読み込みを除いた部分)。
+元金は既定 1000万円で、単元株を買えない銘柄を除いて最適化し直す回数 (rounds) も記録する。
+
+使い方:
+  python benchmarks/portfolio_optimizer_benchmark.py
+  python benchmarks/portfolio_optimizer_benchmark.py --universe 100 --universe 500 --universe 2000 --risk 高
+"""
+import sys
+import logging
+import argparse
+
+import numpy as np
+
+from benchmarks.harness import measure, collect_environment, save_results
+from benchmarks.synthetic_market import generate_ohlcv
+from indicator_library import PricePanel
+from portfolio_optimizer import METHODS, RISK_PROFILES, optimize_allocation
+from portfolio_risk import build_block
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="配分最適化のベンチマーク")
+    parser.add_argument("--universe", type=int, action="append", default=None,
+                        help="候補銘柄数（複数指定可、既定: 100, 500, 1000）")
+    parser.add_argument("--window", type=int, default=250, help="共分散を求める営業日数")
+    parser.add_argument("--risk", choices=list(RISK_PROFILES), default="中", help="リスク許容度")
+    parser.add_argument("--principal", type=float, default=10_000_000, help="元金 (0なら単元株を考慮しない)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    sizes = args.universe or [100, 500, 1000]
+    profile = RISK_PROFILES[args.risk]
+    principal = args.principal or None
+    years = (args.window + 30) / 245
+    panel = PricePanel.from_frame(generate_ohlcv(max(sizes), years, args.seed))
+    rng = np.random.default_rng(args.seed)
+    results = {
+        "environment": collect_environment(),
+        "parameters": {"window": args.window, "risk_tolerance": args.risk, "principal": principal},
+        "benchmarks": {},
+    }
+
+    print(f"{'候補銘柄数':>10} {'ケース':<20} {'中央値(ms)':>12} {'保有':>5} {'rounds':>7}")
+    for size in sizes:
+        rows = np.arange(size)
+        closes = panel.close[rows]
+        symbols = [panel.symbols[i] for i in rows]
+        scores = rng.standard_normal(size)
+        stats = measure(lambda: build_block(closes, symbols, panel.dates, args.window), args.repeat, args.warmup)
+        results["benchmarks"][f"estimate[{size}]"] = stats
+        print(f"{size:>10} {'estimate':<20} {stats['median'] * 1000:>12.1f}")
+        block = build_block(closes, symbols, panel.dates, args.window)
+        for method in METHODS:
+            stats = measure(lambda: optimize_allocation(block, scores, method, profile, principal),
+                            args.repeat, args.warmup)
+            allocation = optimize_allocation(block, scores, method, profile, principal)
+            stats.update(holdings=len(allocation["symbols"]), rounds=allocation["rounds"],
+                         volatility=allocation["volatility"])
+            results["benchmarks"][f"{method}[{size}]"] = stats
+            print(f"{size:>10} {method:<20} {stats['median'] * 1000:>12.1f} "
+                  f"{len(allocation['symbols']):>5} {allocation['rounds']:>7}")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='portfolio-optimizer-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
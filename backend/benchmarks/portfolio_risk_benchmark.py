@@ -0,0 +1,104 @@
+"""
+推奨ポートフォリオのリスク分析 (portfolio_risk) のベンチマーク
+
+ベンチマーク用DBの合成データセットで、候補銘柄 (ユニバース) の銘柄数ごとに推奨1件のリスク分析のレイテンシを計測する。
+
+  load      ユニバースの直近 window 営業日の株価の読み込み (load_price_panel)
+  estimate  対数リターンと Ledoit-Wolf 縮小推定の共分散 (build_block)
+  cold      キャッシュが無い状態での analyze_recommendation (読み込み + 推定 + リスク指標)
+  warm      同じユニバースでの analyze_recommendation (共分散ブロックのキャッシュに当たる)
+  subset    キャッシュ済みのユニバースに含まれる別の候補銘柄での analyze_recommendation
+
+使い方:
+  python benchmarks/portfolio_risk_benchmark.py
+  python benchmarks/portfolio_risk_benchmark.py --universe 100 --universe 500 --universe 1000 --picks 10
+"""
+import os
+import sys
+import logging
+import argparse
+from datetime import timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from benchmarks.harness import (
+    measure, collect_environment, ensure_database, load_dataset, save_results
+)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ポートフォリオのリスク分析のベンチマーク")
+    parser.add_argument("--db-name", default=os.getenv("BENCHMARK_DB_NAME", "stock_analyzer_bench"))
+    parser.add_argument("--symbols", type=int, default=1000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=10.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--universe", type=int, action="append", default=None,
+                        help="候補銘柄数（複数指定可、既定: 500）")
+    parser.add_argument("--picks", type=int, default=10, help="推奨銘柄数")
+    parser.add_argument("--window", type=int, default=250, help="共分散を求める営業日数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    from utils import initialize_environment, get_db_engine
+
+    initialize_environment()
+    os.environ["DB_NAME"] = args.db_name
+    ensure_database(args.db_name)
+    engine = get_db_engine()
+    dataset = load_dataset(engine, args.symbols, args.years, args.seed)
+
+    from backtest import load_price_panel
+    from partitions import _as_date, latest_date
+    from portfolio_risk import RiskConfig, CovarianceCache, analyze_recommendation, build_block
+    import portfolio_risk
+
+    with engine.connect() as conn:
+        symbols = [row[0] for row in conn.execute(text("SELECT symbol FROM stocks ORDER BY symbol"))]
+        end = _as_date(latest_date(conn, "stock_prices"))
+    config = RiskConfig(window=args.window)
+    rng = np.random.default_rng(args.seed)
+    results = {
+        "environment": collect_environment(engine),
+        "dataset": dataset,
+        "parameters": {"picks": args.picks, "window": args.window},
+        "benchmarks": {},
+    }
+
+    print(f"{'候補銘柄数':>10} {'ケース':<10} {'中央値(ms)':>12}")
+    for size in args.universe or [500]:
+        universe = list(rng.choice(symbols, size=min(size, len(symbols)), replace=False))
+        picks = universe[:args.picks]
+        result = {"recommendations": [{"symbol": s, "allocation": f"{100 / len(picks):.1f}%"} for s in picks]}
+        params = {"selected_symbols": universe}
+        subset_params = {"selected_symbols": universe[len(universe) // 2:] + picks}
+        start = end - timedelta(days=int(args.window * 1.6) + 14)
+        panel = load_price_panel(engine, universe, start, end)
+
+        def cold():
+            portfolio_risk.covariance_cache = CovarianceCache(config.cache_size)
+            analyze_recommendation(result, params, config, engine)
+
+        cases = {
+            "load": lambda: load_price_panel(engine, universe, start, end),
+            "estimate": lambda: build_block(panel.close, panel.symbols, panel.dates, args.window),
+            "cold": cold,
+            "warm": lambda: analyze_recommendation(result, params, config, engine),
+            "subset": lambda: analyze_recommendation(result, subset_params, config, engine),
+        }
+        for name, func in cases.items():
+            if name == "warm":
+                cold()
+            stats = measure(func, args.repeat, args.warmup)
+            results["benchmarks"][f"{name}[{size}]"] = stats
+            print(f"{size:>10} {name:<10} {stats['median'] * 1000:>12.1f}")
+        block = build_block(panel.close, panel.symbols, panel.dates, args.window)
+        results["benchmarks"][f"estimate[{size}]"]["shrinkage"] = block.shrinkage
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='portfolio-risk-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+プロンプトエンコーディングのベンチマーク
+
+合成した銘柄情報・テクニカル指標を各エンコーディングモード (table/compact/summary) で
+プロンプト化し、トークン数とモックLLMサーバーに対するエンドツーエンドのレイテンシを比較する。
+DBには接続しない。
+
+使い方:
+  python benchmarks/prompt_encoding_benchmark.py --sizes 10 50 200 --per-token-latency 0.0005
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+
+from aiagent.prompt_encoder import ENCODING_MODES, encode_prompt_data, estimate_tokens
+from aiagent.prompt_builder import build_recommendation_prompt
+from benchmarks.mock_llm_server import start_mock_server
+
+INDUSTRIES = ["電気機器", "輸送用機器", "情報・通信業", "銀行業", "小売業", "化学", "医薬品", "機械"]
+
+BENCHMARK_TEMPLATE = """以下の銘柄情報を分析し、投資推奨を生成してください:
+
+銘柄情報:
+{company_infos}
+
+テクニカル指標:
+{technical_indicators}
+
+投資条件:
+元金: {principal}円
+リスク許容度: {risk_tolerance}
+戦略: {strategy}"""
+
+def make_synthetic_frames(n_symbols: int, seed: int = 42):
+    """銘柄情報とテクニカル指標の合成DataFrameを生成"""
+    rng = np.random.default_rng(seed)
+    symbols = [f"{1300 + i}.T" for i in range(n_symbols)]
+    company_df = pd.DataFrame({
+        "symbol": symbols,
+        "name": [f"サンプル工業{i}株式会社" for i in range(n_symbols)],
+        "industry_name_33": rng.choice(INDUSTRIES, n_symbols),
+    })
+    macd = rng.normal(0, 5, n_symbols)
+    indicator_df = pd.DataFrame({
+        "symbol": symbols,
+        "date": "2025/08/29",
+        "golden_cross": rng.random(n_symbols) < 0.05,
+        "dead_cross": rng.random(n_symbols) < 0.05,
+        "rsi": rng.uniform(10, 90, n_symbols),
+        "macd": macd,
+        "signal_line": macd + rng.normal(0, 1, n_symbols),
+        "macd_score": rng.integers(0, 7, n_symbols),
+    })
+    return company_df, indicator_df
+
+def count_tokens(text: str) -> int:
+    """tiktokenが利用可能なら実トークン数、なければ概算値を返す"""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except ImportError:
+        return estimate_tokens(text)
+
+async def measure_end_to_end(base_url: str, prompt_data: dict, params: dict, repeat: int) -> float:
+    """モックLLMサーバーに対するプロンプト構築〜応答解析までの平均レイテンシ(秒)"""
+    from aiagent.deepseek_direct import DeepSeekDirectRecommender
+
+    class BenchmarkRecommender(DeepSeekDirectRecommender):
+        def _build_prompt(self, params, data):
+            return build_recommendation_prompt(BENCHMARK_TEMPLATE, params, data)
+
+    os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+    os.environ["DEEPSEEK_API_URL"] = base_url
+    recommender = BenchmarkRecommender()
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await recommender._call_deepseek(params, prompt_data)
+        elapsed.append(time.perf_counter() - start)
+        assert result["parsed_result"].get("status") != "error", result
+    return sum(elapsed) / len(elapsed)
+
+async def run(args):
+    server, base_url = start_mock_server(base_latency=args.base_latency,
+                                         per_token_latency=args.per_token_latency)
+    params = {"principal": 1000000, "risk_tolerance": "中", "strategy": "成長株重視"}
+    results = []
+    try:
+        for n_symbols in args.sizes:
+            company_df, indicator_df = make_synthetic_frames(n_symbols)
+            for mode in ENCODING_MODES:
+                start = time.perf_counter()
+                encoded = encode_prompt_data(company_df, indicator_df, mode, args.token_budget)
+                encode_ms = (time.perf_counter() - start) * 1000
+                stats = encoded.pop("stats")
+                prompt = build_recommendation_prompt(BENCHMARK_TEMPLATE, params, encoded)
+                latency = await measure_end_to_end(base_url, encoded, params, args.repeat) if not args.no_llm else None
+                results.append({
+                    "symbols": n_symbols,
+                    "mode": mode,
+                    "kept_symbols": stats["kept_symbols"],
+                    "prompt_chars": len(prompt),
+                    "prompt_tokens": count_tokens(prompt),
+                    "encode_ms": round(encode_ms, 2),
+                    "e2e_latency_s": round(latency, 4) if latency is not None else None,
+                })
+                print(f"{n_symbols:>5}銘柄 {mode:<8} 採用{stats['kept_symbols']:>5} "
+                      f"tokens={results[-1]['prompt_tokens']:>7} chars={len(prompt):>8} "
+                      f"encode={encode_ms:8.2f}ms e2e={results[-1]['e2e_latency_s']}s")
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.output}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='プロンプトエンコーディングのベンチマーク')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 200, 1000],
+                        help='銘柄数のリスト')
+    parser.add_argument('--token-budget', type=int, default=0, help='トークン予算（0は無制限）')
+    parser.add_argument('--base-latency', type=float, default=0.05, help='モックLLMの基本レイテンシ(秒)')
+    parser.add_argument('--per-token-latency', type=float, default=0.0002,
+                        help='モックLLMのトークン当たりレイテンシ(秒)')
+    parser.add_argument('--repeat', type=int, default=3, help='レイテンシ計測の繰り返し回数')
+    parser.add_argument('--no-llm', action='store_true', help='モックLLMへの送信を省略')
+    parser.add_argument('--output', type=str, default=None, help='結果JSONの出力先')
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
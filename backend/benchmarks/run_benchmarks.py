@@ -0,0 +1,345 @@
+"""
+ベンチマークスイート
+
+専用のベンチマーク用DB (BENCHMARK_DB_NAME、既定: stock_analyzer_bench) に合成データセットを
+投入し、指標計算・DB書き込み・APIエンドポイント・チャート描画の処理時間を計測する。
+結果は実行環境・データセットと合わせてJSONに保存し、--compare でベースラインと比較して
+劣化があれば終了コード1で終了する。
+
+使い方:
+  python benchmarks/run_benchmarks.py                           # 4000銘柄×3年で全ベンチマーク
+  python benchmarks/run_benchmarks.py --symbols 500 --years 1 --only "api_*"
+  python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json
+  python benchmarks/run_benchmarks.py --compare-only base.json new.json
+"""
+import os
+import sys
+import time
+import fnmatch
+import logging
+import argparse
+import tempfile
+import warnings
+import contextlib
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+import pandas as pd
+from sqlalchemy import text
+
+from benchmarks.harness import (
+    DEFAULT_REGRESSION_THRESHOLD, measure, collect_environment, ensure_database, load_dataset,
+    save_results, load_results, compare_results, print_comparison
+)
+from benchmarks.synthetic_market import make_symbols, to_yfinance_history
+from partitions import latest_date
+from bar_aggregates import resample_bars
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+def benchmark(name: str):
+    """ベンチマーク関数を登録するデコレータ (関数は (engine, args) を受け取り measure() の結果を返す)"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+def _load_prices(engine, symbols, days: int = None, local_dates: bool = False) -> pd.DataFrame:
+    """バッチと同じ形で株価を読み込む
+
+    Args:
+        days: 指定時は最終日から days 暦日分 (バッチの --days + 75 と同じ絞り込み)
+        local_dates: 日時をセッションのタイムゾーンの壁時計時刻 (タイムゾーン無し) で返す
+    """
+    date_column = "date::timestamp AS date" if local_dates else "date"
+    query = f"""
+        SELECT symbol, {date_column}, open, high, low, close, volume
+        FROM stock_prices
+        WHERE symbol = ANY(:symbols)
+    """
+    params = {"symbols": list(symbols)}
+    with engine.connect() as conn:
+        if days is not None:
+            query += " AND date >= :start"
+            params["start"] = latest_date(conn, "stock_prices") - timedelta(days=days)
+        df = pd.read_sql_query(text(query + " ORDER BY symbol, date"), conn, params=params,
+                               parse_dates=["date"])
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+@benchmark("calculate_indicators")
+def bench_calculate_indicators(engine, args):
+    """バッチの1グループ分 (group_size銘柄 × days+75日) の指標計算"""
+    from technical_indicators import calculate_indicators
+    group_df = _load_prices(engine, make_symbols(args.group_size), args.calc_days + 75)
+    return measure(lambda: calculate_indicators(group_df), args.repeat, args.warmup,
+                   items=len(group_df))
+
+@benchmark("batch_store_indicators")
+def bench_batch_store_indicators(engine, args):
+    """1グループ分の直近 store_days 日の指標をUPSERT"""
+    from technical_indicators import calculate_indicators, batch_store_indicators
+    group_df = _load_prices(engine, make_symbols(args.group_size), args.calc_days + 75)
+    indicators = calculate_indicators(group_df).groupby("symbol").tail(args.store_days)
+    def store():
+        if not batch_store_indicators(indicators, engine):
+            raise RuntimeError("batch_store_indicators が失敗しました")
+    return measure(store, args.repeat, args.warmup, items=len(indicators))
+
+def _importer_write(engine, args, n_symbols: int, days: int):
+    """インポーターの書き込み経路 (銘柄ごとに store_price_history + コミット)
+
+    各実行の前に対象の行を削除し、計測中に同じ行を挿入し直すためデータセットは変わらない。
+    """
+    from stock_prices import store_price_history
+    symbols = make_symbols(n_symbols)
+    # インポーターは取得日時をタイムゾーン無しで挿入するため、同じ壁時計時刻で挿入し直す
+    prices = _load_prices(engine, symbols, local_dates=True)
+    recent = prices.groupby("symbol").tail(days)
+    histories = {symbol: to_yfinance_history(frame) for symbol, frame in recent.groupby("symbol")}
+    cutoff = recent["date"].min()
+
+    raw = engine.raw_connection()
+    cursor = raw.cursor()
+    def setup():
+        cursor.execute("DELETE FROM stock_prices WHERE symbol = ANY(%s) AND date >= %s",
+                       (symbols, cutoff.to_pydatetime()))
+        raw.commit()
+    def write(_):
+        for symbol, hist in histories.items():
+            store_price_history(cursor, symbol, hist)
+            raw.commit()
+    try:
+        return measure(write, args.repeat, args.warmup, setup=setup, items=len(recent))
+    finally:
+        cursor.close()
+        raw.close()
+
+@benchmark("importer_store_daily")
+def bench_importer_store_daily(engine, args):
+    """日次の差分取り込み (import_symbols銘柄 × import_days日)"""
+    return _importer_write(engine, args, args.import_symbols, args.import_days)
+
+@benchmark("importer_store_initial")
+def bench_importer_store_initial(engine, args):
+    """初回取り込み (5銘柄 × 全期間)"""
+    return _importer_write(engine, args, 5, 10 ** 6)
+
+@contextlib.contextmanager
+def _api_client():
+    from fastapi.testclient import TestClient
+    import api
+    # startup イベント (LISTEN・再送ループ) は起動しない
+    yield TestClient(api.app)
+
+def _api_benchmark(args, path: str, params: Dict = None):
+    with _api_client() as client:
+        def request():
+            response = client.get(path, params=params)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path}: HTTP {response.status_code} {response.text[:200]}")
+        return measure(request, args.repeat, args.warmup)
+
+@benchmark("api_stocks")
+def bench_api_stocks(engine, args):
+    """銘柄一覧 (既定のシンボル順)"""
+    return _api_benchmark(args, "/api/stocks", {"page": 1, "limit": 20})
+
+@benchmark("api_stocks_sort_rsi")
+def bench_api_stocks_sort_rsi(engine, args):
+    """銘柄一覧 (RSI降順、後半のページ)"""
+    return _api_benchmark(args, "/api/stocks", {"page": 50, "limit": 20, "sort_by": "rsi", "sort_order": "desc"})
+
+@benchmark("api_stocks_sort_rank")
+def bench_api_stocks_sort_rank(engine, args):
+    """銘柄一覧 (モメンタムの業種内順位の降順、保存済みの順位を結合)"""
+    return _api_benchmark(args, "/api/stocks", {"page": 1, "limit": 20, "sort_by": "momentum_industry_rank",
+                                                "sort_order": "desc"})
+
+@benchmark("api_stocks_filtered")
+def bench_api_stocks_filtered(engine, args):
+    """銘柄一覧 (検索語 + 業種フィルタ)"""
+    with engine.connect() as conn:
+        industry_code = conn.execute(text("SELECT industry_code_33 FROM stocks ORDER BY symbol LIMIT 1")).scalar()
+    return _api_benchmark(args, "/api/stocks", {"search": "1", "industry_code": industry_code,
+                                                "sort_by": "macd_score", "sort_order": "desc"})
+
+@benchmark("api_chart")
+def bench_api_chart(engine, args):
+    """チャート画像 (1年分の読み込み・指標計算・描画・Base64化)"""
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+        return _api_benchmark(args, f"/api/chart/{make_symbols(1)[0]}")
+
+def _weekly_window(engine, args):
+    """週足チャートの比較用: 1銘柄の最終日から --chart-years 年分の開始日"""
+    with engine.connect() as conn:
+        return latest_date(conn, "stock_prices") - timedelta(days=round(args.chart_years * 365))
+
+@benchmark("weekly_bars_aggregate")
+def bench_weekly_bars_aggregate(engine, args):
+    """週足 (--chart-years 年分) を集計テーブルから読む"""
+    symbol, start = make_symbols(1)[0], _weekly_window(engine, args)
+    def read():
+        with engine.connect() as conn:
+            return pd.read_sql_query(text("""
+                SELECT date, open, high, low, close, volume
+                FROM stock_prices_weekly
+                WHERE symbol = :symbol AND date >= :start
+                ORDER BY date
+            """), conn, params={"symbol": symbol, "start": start})
+    return measure(read, args.repeat, args.warmup)
+
+@benchmark("weekly_bars_resample")
+def bench_weekly_bars_resample(engine, args):
+    """週足 (--chart-years 年分) を日足から pandas で集計"""
+    symbol, start = make_symbols(1)[0], _weekly_window(engine, args)
+    def read():
+        with engine.connect() as conn:
+            df = pd.read_sql_query(text("""
+                SELECT date, open, high, low, close, volume
+                FROM stock_prices
+                WHERE symbol = :symbol AND date >= :start
+                ORDER BY date
+            """), conn, params={"symbol": symbol, "start": start})
+        return resample_bars(df, "weekly")
+    return measure(read, args.repeat, args.warmup)
+
+@benchmark("weekly_bars_sql_group")
+def bench_weekly_bars_sql_group(engine, args):
+    """週足 (--chart-years 年分) を日足からクエリ内で集計"""
+    symbol, start = make_symbols(1)[0], _weekly_window(engine, args)
+    def read():
+        with engine.connect() as conn:
+            return pd.read_sql_query(text("""
+                SELECT date_trunc('week', date AT TIME ZONE 'Asia/Tokyo')::date AS date,
+                       (array_agg(open ORDER BY date))[1] AS open, MAX(high) AS high, MIN(low) AS low,
+                       (array_agg(close ORDER BY date DESC))[1] AS close, SUM(volume) AS volume
+                FROM stock_prices
+                WHERE symbol = :symbol AND date >= :start
+                GROUP BY 1
+                ORDER BY 1
+            """), conn, params={"symbol": symbol, "start": start})
+    return measure(read, args.repeat, args.warmup)
+
+@benchmark("api_chart_weekly")
+def bench_api_chart_weekly(engine, args):
+    """週足チャート画像 (--chart-years 年分)"""
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+        return _api_benchmark(args, f"/api/chart/{make_symbols(1)[0]}",
+                              {"timeframe": "weekly", "years": args.chart_years})
+
+@benchmark("plot_candlestick")
+def bench_plot_candlestick(engine, args):
+    """ローソク足チャートの描画のみ (/api/chart と同じ入力)"""
+    from chart_plotter import plot_candlestick
+    from technical_indicators import calculate_moving_average, calculate_macd, calculate_rsi
+    from utils import get_ma_settings
+
+    symbol = make_symbols(1)[0]
+    df = _load_prices(engine, [symbol], 365).set_index("date")
+    ma_settings = get_ma_settings()
+    df[f'MA{ma_settings["short"]}'] = calculate_moving_average(df['close'], window=ma_settings["short"])
+    df[f'MA{ma_settings["long"]}'] = calculate_moving_average(df['close'], window=ma_settings["long"])
+    df['macd'], df['signal_line'], df['histogram'] = calculate_macd(df)
+    df['rsi'] = calculate_rsi(df)
+    with tempfile.TemporaryDirectory() as output_dir:
+        def plot():
+            if plot_candlestick(df, symbol, "ベンチマーク", output_dir) is None:
+                raise RuntimeError("plot_candlestick が失敗しました")
+        return measure(plot, args.repeat, args.warmup, items=len(df))
+
+def run(args) -> int:
+    from utils import initialize_environment, get_db_engine
+
+    initialize_environment()
+    os.environ["DB_NAME"] = args.db_name
+    ensure_database(args.db_name)
+    engine = get_db_engine()
+    end = datetime.strptime(args.end_date, "%Y-%m-%d").date() if args.end_date else None
+    dataset = load_dataset(engine, args.symbols, args.years, args.seed, end,
+                           indicator_days=args.indicator_days, force=args.reload)
+
+    selected = [name for name in BENCHMARKS if any(fnmatch.fnmatch(name, p) for p in args.only)]
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": collect_environment(engine),
+        "dataset": dataset,
+        "parameters": {key: getattr(args, key) for key in
+                       ("repeat", "warmup", "group_size", "calc_days", "store_days",
+                        "import_symbols", "import_days", "chart_years")},
+        "benchmarks": {},
+        "errors": {},
+    }
+    for name in selected:
+        start = time.perf_counter()
+        try:
+            result = BENCHMARKS[name](engine, args)
+        except Exception as e:
+            logging.getLogger(__name__).exception(f"ベンチマーク {name} でエラー")
+            results["errors"][name] = str(e)
+            print(f"{name:<32} エラー: {e}")
+            continue
+        results["benchmarks"][name] = result
+        throughput = f"  {result['items_per_sec']:,.0f} 件/秒" if result.get("items_per_sec") else ""
+        print(f"{name:<32} 中央値 {result['median']:.4f}s  最小 {result['min']:.4f}s  "
+              f"p95 {result['p95']:.4f}s{throughput}  (計 {time.perf_counter() - start:.1f}秒)")
+
+    path = save_results(results, args.output)
+    print(f"結果を保存しました: {path}")
+
+    exit_code = 1 if results["errors"] else 0
+    if args.compare:
+        baseline = load_results(args.compare)
+        rows = compare_results(baseline, results, args.threshold)
+        print_comparison(rows, baseline, results)
+        if any(row["status"] == "regression" for row in rows):
+            exit_code = 1
+    return exit_code
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ベンチマークスイート")
+    parser.add_argument("--db-name", default=os.getenv("BENCHMARK_DB_NAME", "stock_analyzer_bench"),
+                        help="ベンチマーク用データベース (存在しなければ作成、既存データは置き換える)")
+    parser.add_argument("--symbols", type=int, default=4000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=3.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", default=None, help="合成データの最終日 (YYYY-MM-DD、既定: 直近営業日)")
+    parser.add_argument("--indicator-days", type=int, default=60, help="投入する technical_indicators の日数")
+    parser.add_argument("--reload", action="store_true", help="投入済みでもデータセットを作り直す")
+    parser.add_argument("--only", nargs="+", default=["*"], help="実行するベンチマーク (ワイルドカード可)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--group-size", type=int, default=100, help="指標計算の1グループの銘柄数")
+    parser.add_argument("--calc-days", type=int, default=5, help="指標計算の対象日数 (バッチの --days)")
+    parser.add_argument("--store-days", type=int, default=5, help="指標保存の日数")
+    parser.add_argument("--import-symbols", type=int, default=100, help="差分取り込みの銘柄数")
+    parser.add_argument("--import-days", type=int, default=1, help="差分取り込みの日数")
+    parser.add_argument("--chart-years", type=float, default=10.0, help="週足チャートの比較の期間(年)")
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--compare", default=None, help="比較するベースラインの結果JSON")
+    parser.add_argument("--compare-only", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="計測せずに2つの結果JSONを比較する")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="劣化とみなす中央値の増加率")
+    parser.add_argument("--list", action="store_true", help="ベンチマーク一覧を表示")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, func in BENCHMARKS.items():
+            print(f"{name:<32} {func.__doc__.strip().splitlines()[0]}")
+        return 0
+    if args.compare_only:
+        baseline, current = (load_results(path) for path in args.compare_only)
+        rows = compare_results(baseline, current, args.threshold)
+        print_comparison(rows, baseline, current)
+        return 1 if any(row["status"] == "regression" for row in rows) else 0
+
+    # バックエンドのロガー設定より先に設定し、計測中のログ出力を抑える
+    logging.basicConfig(level=args.log_level.upper())
+    # 日本語フォントの無い環境でのグリフ欠落警告 (描画時間には影響しない)
+    warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+    return run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+推奨結果保存の並行実行チェック
+
+ローカルのPostgreSQLに対して save_recommendation / 非同期スプール保存を並列に発行し、
+セッションIDの重複や推奨結果の取り違えがないこと、保存スループットを確認する。
+(.envのDB設定を使用。検証用に作成したセッションは --cleanup で削除)
+
+使い方:
+  python benchmarks/save_concurrency_check.py --workers 16 --saves 200 --cleanup
+"""
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+
+from utils import initialize_environment, get_db_engine
+from aiagent.data_access import persist_recommendation
+from aiagent.recommendation_spool import spool_recommendation, flush_spooled_recommendation
+
+STRATEGY_MARKER = "concurrency-check"
+
+def make_payload(i: int, n_recs: int):
+    symbols = [f"{1300 + (i + j) % 4000}.T" for j in range(n_recs)]
+    result = {
+        "recommendations": [
+            {"symbol": s, "name": f"check-{i}", "allocation": f"{100 // n_recs}%",
+             "confidence": 50, "reason": f"save-{i}"}
+            for s in symbols
+        ],
+        "total_return_estimate": f"{i}%"
+    }
+    params = {
+        "principal": 1000000 + i,
+        "risk_tolerance": "中",
+        "strategy": STRATEGY_MARKER,
+        "selected_symbols": symbols,
+    }
+    return result, params
+
+def save_one(i: int, n_recs: int, via_spool: bool):
+    result, params = make_payload(i, n_recs)
+    if via_spool:
+        return i, flush_spooled_recommendation(spool_recommendation(result, params, f"raw-{i}"))
+    return i, persist_recommendation(result, params, f"raw-{i}")
+
+def main():
+    parser = argparse.ArgumentParser(description='推奨結果保存の並行実行チェック')
+    parser.add_argument('--workers', type=int, default=16, help='並列数')
+    parser.add_argument('--saves', type=int, default=200, help='保存回数')
+    parser.add_argument('--recs', type=int, default=5, help='1セッション当たりの推奨件数')
+    parser.add_argument('--spool', action='store_true', help='スプール経由で保存')
+    parser.add_argument('--cleanup', action='store_true', help='検証データを削除')
+    args = parser.parse_args()
+
+    initialize_environment()
+    engine = get_db_engine()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        outcomes = list(executor.map(lambda i: save_one(i, args.recs, args.spool), range(args.saves)))
+    elapsed = time.perf_counter() - start
+
+    session_ids = [sid for _, sid in outcomes]
+    failures = [i for i, sid in outcomes if sid is None]
+    duplicates = len(session_ids) - len(set(session_ids))
+
+    # 各セッションに自分の推奨結果だけが保存されているか確認
+    mismatched = []
+    with engine.connect() as conn:
+        for i, session_id in outcomes:
+            if session_id is None:
+                continue
+            rows = conn.execute(text("""
+                SELECT rs.principal, rr.reason
+                FROM recommendation_sessions rs
+                JOIN recommendation_results rr ON rr.session_id = rs.session_id
+                WHERE rs.session_id = :sid
+            """), {"sid": session_id}).fetchall()
+            if len(rows) != args.recs or any(r.reason != f"save-{i}" or int(r.principal) != 1000000 + i for r in rows):
+                mismatched.append(i)
+
+    print(f"保存: {args.saves}件 / 並列数 {args.workers} / {elapsed:.2f}秒 "
+          f"({args.saves / elapsed:.1f}件/秒)")
+    print(f"失敗: {len(failures)}件, セッションID重複: {duplicates}件, 内容不一致: {len(mismatched)}件")
+
+    if args.cleanup:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                DELETE FROM recommendation_results WHERE session_id IN (
+                    SELECT session_id FROM recommendation_sessions WHERE strategy = :marker)
+            """), {"marker": STRATEGY_MARKER})
+            conn.execute(text("DELETE FROM recommendation_sessions WHERE strategy = :marker"),
+                         {"marker": STRATEGY_MARKER})
+        print("検証データを削除しました")
+
+    if failures or duplicates or mismatched:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
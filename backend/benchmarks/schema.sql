@@ -0,0 +1,378 @@
+-- ベンチマーク用データベースのスキーマ
+-- db/init-db.sql のうちベンチマーク対象が参照するテーブルのみ (本番スキーマの変更時は合わせて更新する)
+
+CREATE TABLE IF NOT EXISTS stocks (
+    id SERIAL PRIMARY KEY,
+    symbol TEXT NOT NULL UNIQUE,
+    code TEXT NOT NULL,
+    name TEXT NOT NULL,
+    market_category TEXT,
+    industry_code_33 TEXT,
+    industry_name_33 TEXT,
+    industry_code_17 TEXT,
+    industry_name_17 TEXT,
+    scale_code TEXT,
+    scale_name TEXT,
+    last_fetched TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- パーティション化前のスキーマで作成された株価・指標テーブルは作り直す (ベンチマーク用データは再投入する)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname IN ('stock_prices', 'technical_indicators')
+               AND relkind = 'r' AND relnamespace = 'public'::regnamespace) THEN
+        DROP TABLE IF EXISTS stock_prices, technical_indicators;
+        IF to_regclass('benchmark_dataset') IS NOT NULL THEN
+            TRUNCATE benchmark_dataset;
+        END IF;
+    END IF;
+END
+$$;
+
+-- 週足・月足のテーブルが無いときに投入したデータセットは再投入する (集計テーブルを埋めるため)
+DO $$
+BEGIN
+    IF to_regclass('stock_prices_weekly') IS NULL AND to_regclass('benchmark_dataset') IS NOT NULL THEN
+        TRUNCATE benchmark_dataset;
+    END IF;
+END
+$$;
+
+-- 日付範囲パーティションの作成関数 (db/migrations/003_partition_price_tables.sql と同じ)
+CREATE OR REPLACE FUNCTION ensure_date_partitions(parent TEXT, from_date DATE, to_date DATE,
+                                                  step TEXT DEFAULT 'month')
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    bound DATE;
+    next_bound DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    IF step NOT IN ('month', 'year') THEN
+        RAISE EXCEPTION 'step は month または year を指定してください: %', step;
+    END IF;
+    bound := date_trunc(step, from_date)::date;
+    WHILE bound <= to_date LOOP
+        next_bound := (bound + ('1 ' || step)::interval)::date;
+        partition_name := parent || '_p' || to_char(bound, CASE step WHEN 'year' THEN 'YYYY' ELSE 'YYYY_MM' END);
+        IF to_regclass(partition_name) IS NULL THEN
+            BEGIN
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent,
+                               bound::timestamp AT TIME ZONE 'Asia/Tokyo',
+                               next_bound::timestamp AT TIME ZONE 'Asia/Tokyo');
+                EXECUTE format('CREATE INDEX %I ON %I USING brin (date)', partition_name || '_date_brin', partition_name);
+                created := created + 1;
+            EXCEPTION
+                -- 別の粒度のパーティションが範囲を含んでいる / 同時実行で先に作成された
+                WHEN invalid_object_definition OR duplicate_table THEN NULL;
+            END;
+        END IF;
+        bound := next_bound;
+    END LOOP;
+    RETURN created;
+END
+$$;
+
+COMMENT ON FUNCTION ensure_date_partitions(TEXT, DATE, DATE, TEXT) IS
+    'from_date〜to_date を含む日付範囲パーティション (日本時間の月/年単位) を作成し、作成数を返す';
+
+CREATE TABLE IF NOT EXISTS stock_prices (
+    id SERIAL,
+    symbol TEXT NOT NULL,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_stock_prices_stocks FOREIGN KEY (symbol) REFERENCES stocks(symbol) ON DELETE CASCADE
+) PARTITION BY RANGE (date);
+CREATE UNIQUE INDEX IF NOT EXISTS stock_prices_symbol_date_key ON stock_prices (symbol, date DESC);
+
+CREATE TABLE IF NOT EXISTS technical_indicators (
+    symbol TEXT NOT NULL,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    golden_cross BOOLEAN,
+    dead_cross BOOLEAN,
+    rsi DECIMAL(20,4),
+    macd DECIMAL(20,4),
+    signal_line DECIMAL(20,4),
+    histogram DECIMAL(20,4),
+    macd_score INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (symbol) REFERENCES stocks(symbol)
+) PARTITION BY RANGE (date);
+CREATE UNIQUE INDEX IF NOT EXISTS technical_indicators_symbol_date_key ON technical_indicators (symbol, date DESC);
+
+-- 週足・月足と時間軸別の指標 (db/migrations/004_add_bar_aggregates.sql と同じ)
+CREATE TABLE IF NOT EXISTS stock_prices_weekly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume BIGINT,
+    trading_days SMALLINT NOT NULL,
+    last_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS stock_prices_monthly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume BIGINT,
+    trading_days SMALLINT NOT NULL,
+    last_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS technical_indicators_weekly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol),
+    date DATE NOT NULL,
+    golden_cross BOOLEAN,
+    dead_cross BOOLEAN,
+    rsi DECIMAL(20,4),
+    macd DECIMAL(20,4),
+    signal_line DECIMAL(20,4),
+    histogram DECIMAL(20,4),
+    macd_score INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS technical_indicators_monthly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol),
+    date DATE NOT NULL,
+    golden_cross BOOLEAN,
+    dead_cross BOOLEAN,
+    rsi DECIMAL(20,4),
+    macd DECIMAL(20,4),
+    signal_line DECIMAL(20,4),
+    histogram DECIMAL(20,4),
+    macd_score INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS technical_rankings (
+    date DATE NOT NULL,
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    momentum REAL,
+    rsi_rank SMALLINT,
+    momentum_rank SMALLINT,
+    histogram_rank SMALLINT,
+    rsi_industry_rank SMALLINT,
+    momentum_industry_rank SMALLINT,
+    histogram_industry_rank SMALLINT,
+    rsi_scale_rank SMALLINT,
+    momentum_scale_rank SMALLINT,
+    histogram_scale_rank SMALLINT,
+    PRIMARY KEY (date, symbol)
+);
+
+CREATE TABLE IF NOT EXISTS sector_indicator_averages (
+    group_type VARCHAR(10) NOT NULL,
+    group_code TEXT NOT NULL,
+    date DATE NOT NULL,
+    members INTEGER NOT NULL,
+    rsi REAL,
+    momentum REAL,
+    histogram REAL,
+    PRIMARY KEY (group_type, group_code, date)
+);
+CREATE INDEX IF NOT EXISTS idx_sector_indicator_averages_date ON sector_indicator_averages (date);
+
+CREATE TABLE IF NOT EXISTS similarity_indexes (
+    kind VARCHAR(20) NOT NULL,
+    window_days SMALLINT NOT NULL,
+    end_date DATE NOT NULL,
+    dimensions SMALLINT NOT NULL,
+    explained_variance REAL,
+    symbols TEXT[] NOT NULL,
+    vectors BYTEA NOT NULL,
+    built_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (kind, window_days)
+);
+
+CREATE TABLE IF NOT EXISTS alert_rules (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    indicator VARCHAR(20) NOT NULL,
+    condition VARCHAR(20) NOT NULL,
+    threshold REAL,
+    timeframe VARCHAR(10) NOT NULL DEFAULT 'daily',
+    symbols TEXT[],
+    industry_code TEXT,
+    scale_code TEXT,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS alert_events (
+    id BIGSERIAL PRIMARY KEY,
+    rule_id INTEGER NOT NULL REFERENCES alert_rules(id) ON DELETE CASCADE,
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    value REAL,
+    previous REAL,
+    fired_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    UNIQUE (rule_id, symbol, date, timeframe)
+);
+CREATE INDEX IF NOT EXISTS idx_alert_events_symbol ON alert_events (symbol, id);
+
+CREATE OR REPLACE FUNCTION refresh_bar_aggregates(unit TEXT, symbols TEXT[] DEFAULT NULL,
+                                                  from_date DATE DEFAULT NULL, to_date DATE DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    target TEXT;
+    lower_bound TIMESTAMP WITH TIME ZONE := '-infinity';
+    upper_bound TIMESTAMP WITH TIME ZONE := 'infinity';
+    affected INTEGER;
+BEGIN
+    target := CASE unit WHEN 'week' THEN 'stock_prices_weekly' WHEN 'month' THEN 'stock_prices_monthly' END;
+    IF target IS NULL THEN
+        RAISE EXCEPTION 'unit は week または month を指定してください: %', unit;
+    END IF;
+    -- 指定日を含む期間の全体を集計し直す
+    IF from_date IS NOT NULL THEN
+        lower_bound := date_trunc(unit, from_date::timestamp) AT TIME ZONE 'Asia/Tokyo';
+    END IF;
+    IF to_date IS NOT NULL THEN
+        upper_bound := (date_trunc(unit, to_date::timestamp) + ('1 ' || unit)::interval) AT TIME ZONE 'Asia/Tokyo';
+    END IF;
+    EXECUTE format($sql$
+        INSERT INTO %I (symbol, date, open, high, low, close, volume, trading_days, last_date)
+        SELECT symbol,
+               date_trunc(%L, date AT TIME ZONE 'Asia/Tokyo')::date,
+               (array_agg(open ORDER BY date))[1],
+               MAX(high),
+               MIN(low),
+               (array_agg(close ORDER BY date DESC))[1],
+               SUM(volume),
+               COUNT(*),
+               MAX(date)
+        FROM stock_prices
+        WHERE date >= $1 AND date < $2 AND ($3 IS NULL OR symbol = ANY($3))
+        GROUP BY 1, 2
+        ON CONFLICT (symbol, date) DO UPDATE SET
+            open = EXCLUDED.open,
+            high = EXCLUDED.high,
+            low = EXCLUDED.low,
+            close = EXCLUDED.close,
+            volume = EXCLUDED.volume,
+            trading_days = EXCLUDED.trading_days,
+            last_date = EXCLUDED.last_date,
+            updated_at = CURRENT_TIMESTAMP
+    $sql$, target, unit) USING lower_bound, upper_bound, symbols;
+    GET DIAGNOSTICS affected = ROW_COUNT;
+    RETURN affected;
+END
+$$;
+
+COMMENT ON FUNCTION refresh_bar_aggregates(TEXT, TEXT[], DATE, DATE) IS
+    '週足 (week) / 月足 (month) を stock_prices から集計し直す (symbols・期間を省略すると全体)';
+
+CREATE TABLE IF NOT EXISTS prompt_templates (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(50) NOT NULL UNIQUE,
+    agent_type VARCHAR(20) NOT NULL DEFAULT 'direct',
+    system_role TEXT,
+    user_template TEXT NOT NULL,
+    output_format TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS recommendation_sessions (
+    session_id SERIAL PRIMARY KEY,
+    generated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    principal DECIMAL(20,4) NOT NULL,
+    risk_tolerance VARCHAR(20) NOT NULL,
+    strategy VARCHAR(50) NOT NULL,
+    symbols TEXT[] NOT NULL,
+    technical_filter TEXT,
+    prompt_id INTEGER REFERENCES prompt_templates(id),
+    ai_raw_response TEXT,
+    total_return_estimate VARCHAR(20),
+    execution_metrics JSONB,
+    agent_type VARCHAR(20),
+    risk_metrics JSONB
+);
+ALTER TABLE recommendation_sessions ADD COLUMN IF NOT EXISTS agent_type VARCHAR(20);
+ALTER TABLE recommendation_sessions ADD COLUMN IF NOT EXISTS risk_metrics JSONB;
+
+CREATE TABLE IF NOT EXISTS recommendation_raw_responses (
+    session_id INTEGER PRIMARY KEY REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    encoding VARCHAR(10) NOT NULL,
+    raw_size INTEGER NOT NULL,
+    body BYTEA NOT NULL
+);
+ALTER TABLE recommendation_raw_responses ALTER COLUMN body SET STORAGE EXTERNAL;
+
+CREATE TABLE IF NOT EXISTS recommendation_results (
+    id SERIAL PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES recommendation_sessions(session_id),
+    symbol TEXT NOT NULL,
+    name TEXT NOT NULL,
+    allocation TEXT NOT NULL,
+    confidence DECIMAL(5,4),
+    reason TEXT
+);
+
+-- 推奨の実績評価 (db/migrations/005_add_recommendation_performance.sql)
+CREATE TABLE IF NOT EXISTS recommendation_pick_performance (
+    result_id INTEGER PRIMARY KEY REFERENCES recommendation_results(id) ON DELETE CASCADE,
+    session_id INTEGER NOT NULL REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    symbol TEXT NOT NULL,
+    weight REAL,
+    entry_date DATE,
+    entry_price REAL,
+    return_1d REAL,
+    return_5d REAL,
+    return_20d REAL,
+    return_60d REAL,
+    evaluated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recommendation_pick_performance_session
+    ON recommendation_pick_performance (session_id);
+
+CREATE TABLE IF NOT EXISTS recommendation_session_performance (
+    session_id INTEGER PRIMARY KEY REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    entry_date DATE,
+    picks SMALLINT NOT NULL,
+    priced SMALLINT NOT NULL,
+    return_1d REAL,
+    return_5d REAL,
+    return_20d REAL,
+    return_60d REAL,
+    hits_1d SMALLINT,
+    hits_5d SMALLINT,
+    hits_20d SMALLINT,
+    hits_60d SMALLINT,
+    last_bar_date DATE,
+    complete BOOLEAN NOT NULL DEFAULT FALSE,
+    evaluated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recommendation_session_performance_incomplete
+    ON recommendation_session_performance (session_id) WHERE NOT complete;
+
+-- 投入済みの合成データセット (fingerprint が一致すれば再投入しない)
+CREATE TABLE IF NOT EXISTS benchmark_dataset (
+    fingerprint TEXT PRIMARY KEY,
+    parameters JSONB NOT NULL,
+    loaded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
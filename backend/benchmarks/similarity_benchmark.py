@@ -0,0 +1,91 @@
+"""
+類似銘柄検索 (similarity) のベンチマーク
+
+合成データ (DB不要) で、銘柄数ごとに次を計測する。
+
+  build       全銘柄の埋め込みの作成 (build_index、夜間バッチの計算部分)
+  build_pca   埋め込み + PCA による次元削減 (--dimensions)
+  query       厳密な検索1回 (全銘柄との内積、BLAS の行列ベクトル積)
+  query_pca   次元削減したインデックスでの検索1回
+  per_request リクエスト時にリターンの相関を求める場合 (pandas の corrwith、比較用)
+
+次元削減したインデックスは、厳密な検索の上位 k 銘柄をどれだけ含むか (recall) も記録する。
+
+使い方:
+  python benchmarks/similarity_benchmark.py
+  python benchmarks/similarity_benchmark.py --symbols 1000 --symbols 4000 --window 250 --dimensions 32
+"""
+import sys
+import logging
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import measure, collect_environment, save_results
+from benchmarks.synthetic_market import generate_ohlcv
+from indicator_library import PricePanel
+from similarity import KINDS, build_index
+
+def recall(exact, approximate, symbols, k: int) -> float:
+    """次元削減したインデックスの上位 k 銘柄に、厳密な上位 k 銘柄が含まれる割合の平均"""
+    hits = [len({s for s, _ in exact.query(symbol, k)} & {s for s, _ in approximate.query(symbol, k)}) / k
+            for symbol in symbols]
+    return float(np.mean(hits))
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="類似銘柄検索のベンチマーク")
+    parser.add_argument("--symbols", type=int, action="append", default=None,
+                        help="銘柄数（複数指定可、既定: 4000）")
+    parser.add_argument("--window", type=int, default=120, help="埋め込みの期間（営業日）")
+    parser.add_argument("--kind", choices=list(KINDS), default="returns")
+    parser.add_argument("--dimensions", type=int, default=32, help="PCA で削減する次元数")
+    parser.add_argument("--k", type=int, default=10, help="検索する銘柄数")
+    parser.add_argument("--queries", type=int, default=100, help="recall を求める検索の回数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    sizes = args.symbols or [4000]
+    years = (args.window + 30) / 245
+    panel = PricePanel.from_frame(generate_ohlcv(max(sizes), years, args.seed))
+    rng = np.random.default_rng(args.seed)
+    results = {
+        "environment": collect_environment(),
+        "parameters": {"window": args.window, "kind": args.kind, "dimensions": args.dimensions, "k": args.k},
+        "benchmarks": {},
+    }
+
+    print(f"{'銘柄数':>8} {'ケース':<12} {'中央値(ms)':>12}")
+    for size in sizes:
+        closes, symbols = panel.close[:size], list(panel.symbols[:size])
+        cases = {
+            "build": lambda: build_index(closes, symbols, panel.dates, args.window, args.kind),
+            "build_pca": lambda: build_index(closes, symbols, panel.dates, args.window, args.kind, args.dimensions),
+        }
+        exact = cases["build"]()
+        reduced = cases["build_pca"]()
+        targets = itertools.cycle(rng.choice(symbols, size=min(args.queries, size), replace=False))
+        returns = pd.DataFrame(np.diff(np.log(closes[:, -(args.window + 1):]), axis=1).T, columns=symbols)
+        cases["query"] = lambda: exact.query(next(targets), args.k)
+        cases["query_pca"] = lambda: reduced.query(next(targets), args.k)
+        cases["per_request"] = lambda: returns.corrwith(returns[next(targets)]).nlargest(args.k + 1)
+        for name, func in cases.items():
+            stats = measure(func, args.repeat, args.warmup)
+            results["benchmarks"][f"{name}[{size}]"] = stats
+            print(f"{size:>8} {name:<12} {stats['median'] * 1000:>12.3f}")
+        sample = rng.choice(symbols, size=min(args.queries, size), replace=False)
+        results["benchmarks"][f"query_pca[{size}]"].update(
+            recall=recall(exact, reduced, sample, args.k), explained_variance=reduced.explained_variance)
+        print(f"{size:>8} {'recall':<12} {results['benchmarks'][f'query_pca[{size}]']['recall']:>12.3f} "
+              f"(分散の保持率 {reduced.explained_variance:.3f})")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='similarity-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+API起動時間 (インポート時間) のベンチマーク
+
+`python -X importtime -c "import api"` を別プロセスで繰り返し実行し、api モジュールの
+累積インポート時間と、時間のかかっているモジュールを集計する。中央値が予算を超えた場合や、
+起動時に読み込まれるべきでない重い依存 (openai, mcp_agent, matplotlib など) が
+読み込まれていた場合は終了コード1を返す (CIでの回帰検知用)。
+
+使い方:
+  python benchmarks/startup_benchmark.py --repeat 5 --budget 1.5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+from benchmarks.harness import collect_environment, save_results
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 起動時 (import api) には読み込まず、初回利用時にインポートするモジュール
+LAZY_MODULES = ["openai", "mcp_agent", "matplotlib", "mpl_finance", "aiagent.deepseek_direct",
+                "aiagent.mcp_agent", "aiagent.ensemble"]
+
+DEFAULT_BUDGET = float(os.getenv("STARTUP_IMPORT_BUDGET", 1.5))
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """-X importtime の出力を解析 (時間はマイクロ秒)"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self": int(self_us) / 1e6,
+            "cumulative": int(cumulative_us) / 1e6,
+        })
+    return entries
+
+def measure_import(module: str = "api") -> Dict:
+    """別プロセスで module をインポートし、累積時間と読み込まれたモジュールを返す"""
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=BACKEND_DIR,
+                          env=env, capture_output=True, text=True, check=False)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module} のインポートに失敗しました:\n{proc.stderr[-2000:]}")
+    entries = parse_importtime(proc.stderr)
+    total = next(e["cumulative"] for e in reversed(entries) if e["module"] == module)
+    return {"total": total, "entries": entries,
+            "modules": json.loads(proc.stdout.strip().splitlines()[-1])}
+
+def summarize(samples: List[float]) -> Dict:
+    ordered = sorted(samples)
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.mean(ordered),
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "samples": samples,
+    }
+
+def top_modules(entries: List[Dict], top: int) -> List[Dict]:
+    """api直下 (深さ1) のうち累積時間の大きいモジュール"""
+    direct = [e for e in entries if e["depth"] == 1]
+    return sorted(direct, key=lambda e: e["cumulative"], reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="API起動時間 (インポート時間) のベンチマーク")
+    parser.add_argument("--module", default="api", help="計測するモジュール")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    parser.add_argument("--warmup", type=int, default=1, help="計測前の空実行回数 (.pyc生成・ページキャッシュ用)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help="インポート時間の予算(秒)。中央値が超えたら終了コード1 (既定: STARTUP_IMPORT_BUDGET)")
+    parser.add_argument("--top", type=int, default=10, help="表示する上位モジュール数")
+    parser.add_argument("--output", type=str, default=None, help="結果JSONの出力先")
+    parser.add_argument("--save", action="store_true", help="benchmarks/results に結果を保存")
+    args = parser.parse_args()
+
+    for _ in range(args.warmup):
+        measure_import(args.module)
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    stats = summarize([run["total"] for run in runs])
+    # 上位モジュールは中央値に最も近い回のものを表示する
+    representative = min(runs, key=lambda run: abs(run["total"] - stats["median"]))
+    eager = [name for name in LAZY_MODULES if name in representative["modules"]]
+
+    print(f"import {args.module}: 中央値 {stats['median']:.3f}秒 "
+          f"(最小 {stats['min']:.3f}秒, {args.repeat}回) / 予算 {args.budget:.3f}秒")
+    print(f"{'モジュール':<40} {'累積(秒)':>9} {'自身(秒)':>9}")
+    for entry in top_modules(representative["entries"], args.top):
+        print(f"{entry['module']:<40} {entry['cumulative']:>9.3f} {entry['self']:>9.3f}")
+
+    results = {
+        "environment": collect_environment(),
+        "budget": args.budget,
+        "eager_modules": eager,
+        "top_modules": top_modules(representative["entries"], args.top),
+        "benchmarks": {f"import_{args.module}": stats},
+    }
+    if args.output or args.save:
+        print(f"結果を保存しました: {save_results(results, args.output, prefix='startup-')}")
+
+    failed = False
+    if eager:
+        print(f"NG: 起動時に遅延読み込み対象のモジュールが読み込まれています: {', '.join(eager)}")
+        failed = True
+    if stats["median"] > args.budget:
+        print(f"NG: インポート時間が予算を超えています ({stats['median']:.3f}秒 > {args.budget:.3f}秒)")
+        failed = True
+    if not failed:
+        print("OK: 予算内です")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
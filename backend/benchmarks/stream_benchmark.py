@@ -0,0 +1,96 @@
+"""
+指標の更新のサーバープッシュ配信 (indicator_stream) のベンチマーク
+
+ベンチマーク用DBの合成データセットで、指標バッチ1回分 (全銘柄を100銘柄ずつ保存・通知) の配信にかかる時間を
+購読クライアント数ごとに計測する。クライアントは銘柄一覧の1ページ分 (--page 銘柄) を購読する。
+
+  coalesced   通知をまとめて1回で配信 (最新行の読み込み1回 + 振り分け)
+  per_notify  通知ごとに配信する場合 (比較用、まとめない場合に相当)
+
+使い方:
+  python benchmarks/stream_benchmark.py
+  python benchmarks/stream_benchmark.py --clients 10 --clients 1000 --page 20
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+
+import numpy as np
+from sqlalchemy import text
+
+from benchmarks.harness import (
+    measure, collect_environment, ensure_database, load_dataset, save_results
+)
+
+def deliver(stream, batches):
+    """batches ごとに通知を受けたものとして配信し、送信待ちを空にする"""
+    async def run():
+        stream._sent.clear()
+        for batch in batches:
+            stream._pending = {"daily": set(batch)}
+            await stream._flush()
+        messages = 0
+        for subscription in list(stream._subscriptions):
+            messages += subscription.queue.qsize()
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+        return messages
+    return asyncio.run(run())
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="指標の更新のサーバープッシュ配信のベンチマーク")
+    parser.add_argument("--db-name", default=os.getenv("BENCHMARK_DB_NAME", "stock_analyzer_bench"))
+    parser.add_argument("--symbols", type=int, default=1000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=10.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--clients", type=int, action="append", default=None,
+                        help="購読クライアント数（複数指定可、既定: 10, 100, 1000）")
+    parser.add_argument("--page", type=int, default=20, help="クライアントが購読する銘柄数")
+    parser.add_argument("--group-size", type=int, default=100, help="指標バッチが1回に保存・通知する銘柄数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    from utils import initialize_environment, get_db_engine
+
+    initialize_environment()
+    os.environ["DB_NAME"] = args.db_name
+    ensure_database(args.db_name)
+    engine = get_db_engine()
+    dataset = load_dataset(engine, args.symbols, args.years, args.seed)
+
+    from indicator_stream import IndicatorStream, StreamConfig
+
+    with engine.connect() as conn:
+        symbols = conn.execute(text("SELECT DISTINCT symbol FROM technical_indicators ORDER BY symbol")).scalars().all()
+    notifications = [symbols[i:i + args.group_size] for i in range(0, len(symbols), args.group_size)]
+    rng = np.random.default_rng(args.seed)
+    results = {
+        "environment": collect_environment(engine),
+        "dataset": dataset,
+        "parameters": {"symbols": len(symbols), "page": args.page, "notifications": len(notifications)},
+        "benchmarks": {},
+    }
+
+    print(f"{len(symbols)}銘柄 ({len(notifications)}回の通知)、クライアントごとに{args.page}銘柄を購読")
+    print(f"{'クライアント':>12} {'ケース':<12} {'中央値(ms)':>12} {'メッセージ':>10}")
+    for n_clients in args.clients or [10, 100, 1000]:
+        stream = IndicatorStream(StreamConfig(buffer_size=len(notifications) + 1), engine)
+        for _ in range(n_clients):
+            start = int(rng.integers(0, max(len(symbols) - args.page, 1)))
+            stream.subscribe(symbols[start:start + args.page])
+        for name, batches in (("coalesced", [symbols]), ("per_notify", notifications)):
+            stats = measure(lambda: deliver(stream, batches), args.repeat, args.warmup)
+            stats["messages"] = deliver(stream, batches)
+            results["benchmarks"][f"{name}[{n_clients}]"] = stats
+            print(f"{n_clients:>12} {name:<12} {stats['median'] * 1000:>12.1f} {stats['messages']:>10,}")
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='stream-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+合成マーケットデータ生成
+
+幾何ブラウン運動 (GBM) で銘柄ごとの終値系列を生成し、始値・高値・安値・出来高を
+付けたOHLCVパネルを作る。営業日は土日・祝日 (jpholiday)・年末年始 (12/31〜1/3) を
+除いたJPXの営業日カレンダーに従う。同じ引数と seed からは常に同じデータが得られる。
+
+使い方 (単体で件数・所要時間を確認):
+  python benchmarks/synthetic_market.py --symbols 4000 --years 3
+"""
+import time
+import hashlib
+import argparse
+from datetime import date, timedelta
+from typing import Optional
+import numpy as np
+import pandas as pd
+import jpholiday
+
+TRADING_DAYS_PER_YEAR = 245
+
+# 東証33業種コード (業種名は合成データ用の仮名)
+INDUSTRY_CODES_33 = [f"{code:04d}" for code in range(50, 3300 + 1, 100)]
+SCALE_CODES = {"1": "TOPIX Core30", "2": "TOPIX Large70", "4": "TOPIX Mid400",
+               "6": "TOPIX Small 1", "7": "TOPIX Small 2", "-": "-"}
+
+def is_jpx_holiday(day: date) -> bool:
+    """JPXの休業日 (土日・祝日・年末年始) か"""
+    if day.weekday() >= 5 or jpholiday.is_holiday(day):
+        return True
+    return (day.month == 12 and day.day == 31) or (day.month == 1 and day.day <= 3)
+
+def jpx_trading_days(start: date, end: date) -> pd.DatetimeIndex:
+    """start〜end (両端含む) のJPX営業日"""
+    days = []
+    day = start
+    while day <= end:
+        if not is_jpx_holiday(day):
+            days.append(day)
+        day += timedelta(days=1)
+    return pd.DatetimeIndex(days)
+
+def last_trading_day(on_or_before: Optional[date] = None) -> date:
+    """指定日 (既定は今日) 以前の直近営業日"""
+    day = on_or_before or date.today()
+    while is_jpx_holiday(day):
+        day -= timedelta(days=1)
+    return day
+
+def make_symbols(n_symbols: int):
+    """4桁コード + .T の銘柄シンボル"""
+    if n_symbols > 9000:
+        raise ValueError("合成できる銘柄数は9000までです")
+    return [f"{1000 + i}.T" for i in range(n_symbols)]
+
+def generate_stocks(n_symbols: int, seed: int = 42) -> pd.DataFrame:
+    """stocks テーブル相当の銘柄マスタを生成"""
+    rng = np.random.default_rng(seed)
+    symbols = make_symbols(n_symbols)
+    industry = rng.choice(INDUSTRY_CODES_33, n_symbols)
+    scale = rng.choice(list(SCALE_CODES), n_symbols, p=[0.01, 0.02, 0.1, 0.2, 0.47, 0.2])
+    return pd.DataFrame({
+        "symbol": symbols,
+        "code": [symbol[:4] for symbol in symbols],
+        "name": [f"合成銘柄{symbol[:4]}株式会社" for symbol in symbols],
+        "market_category": "プライム（内国株式）",
+        "industry_code_33": industry,
+        "industry_name_33": [f"業種{code}" for code in industry],
+        "industry_code_17": [f"{int(code) // 200 + 1}" for code in industry],
+        "industry_name_17": [f"業種17-{int(code) // 200 + 1}" for code in industry],
+        "scale_code": scale,
+        "scale_name": [SCALE_CODES[code] for code in scale],
+    })
+
+def generate_ohlcv(n_symbols: int, years: float = 3, seed: int = 42,
+                   end: Optional[date] = None) -> pd.DataFrame:
+    """
+    GBMによる日足OHLCVパネルを生成
+
+    Args:
+        n_symbols: 銘柄数
+        years: 期間 (年)。営業日数は years × 245 日
+        seed: 乱数シード
+        end: 最終営業日 (既定は今日以前の直近営業日)
+
+    Returns:
+        pd.DataFrame: symbol, date, open, high, low, close, volume (symbol, date順)
+    """
+    rng = np.random.default_rng(seed)
+    end = last_trading_day(end)
+    n_days = int(years * TRADING_DAYS_PER_YEAR)
+    # 営業日数が足りるよう暦日を多めに取り、末尾から n_days 日を使う
+    calendar = jpx_trading_days(end - timedelta(days=int(n_days * 1.6) + 30), end)[-n_days:]
+
+    dt = 1 / TRADING_DAYS_PER_YEAR
+    mu = rng.normal(0.05, 0.10, n_symbols)
+    sigma = rng.uniform(0.15, 0.60, n_symbols)
+    initial = np.exp(rng.uniform(np.log(200), np.log(20000), n_symbols))
+
+    shocks = rng.standard_normal((n_symbols, n_days))
+    log_returns = (mu - 0.5 * sigma ** 2)[:, None] * dt + (sigma * np.sqrt(dt))[:, None] * shocks
+    close = initial[:, None] * np.exp(np.cumsum(log_returns, axis=1))
+
+    # 始値は前日終値からのギャップ、高値・安値は実体の外側に日中変動幅を付ける
+    daily_sigma = (sigma * np.sqrt(dt))[:, None]
+    prev_close = np.concatenate([initial[:, None], close[:, :-1]], axis=1)
+    open_ = prev_close * np.exp(rng.normal(0, 0.3, (n_symbols, n_days)) * daily_sigma)
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.5, (n_symbols, n_days))) * daily_sigma)
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.5, (n_symbols, n_days))) * daily_sigma)
+
+    # 出来高は売買代金が概ね一定になるよう株価に反比例させ、約1%の日は出来高0とする
+    turnover = np.exp(rng.normal(np.log(2e8), 1.0, n_symbols))[:, None]
+    volume = turnover / close * np.exp(rng.normal(0, 0.5, (n_symbols, n_days)))
+    volume = np.round(volume / 100) * 100
+    volume[rng.random((n_symbols, n_days)) < 0.01] = 0
+
+    symbols = make_symbols(n_symbols)
+    return pd.DataFrame({
+        "symbol": np.repeat(symbols, n_days),
+        "date": np.tile(calendar.values, n_symbols),
+        "open": np.round(open_, 1).ravel(),
+        "high": np.round(high, 1).ravel(),
+        "low": np.round(low, 1).ravel(),
+        "close": np.round(close, 1).ravel(),
+        "volume": np.minimum(volume, np.iinfo(np.int32).max).astype(np.int64).ravel(),
+    })
+
+def to_yfinance_history(symbol_df: pd.DataFrame) -> pd.DataFrame:
+    """1銘柄分のOHLCV (日時はタイムゾーン無し) を yfinance の Ticker.history() と同じ形
+    (JSTの日付インデックス) に変換"""
+    hist = symbol_df.set_index(pd.DatetimeIndex(symbol_df["date"]).tz_localize("Asia/Tokyo"))
+    hist = hist[["open", "high", "low", "close", "volume"]]
+    hist.columns = ["Open", "High", "Low", "Close", "Volume"]
+    return hist
+
+def dataset_fingerprint(n_symbols: int, years: float, seed: int, end: date) -> str:
+    """データセットを識別するハッシュ (同じ値なら同じデータ)"""
+    key = f"v1:{n_symbols}:{float(years)}:{seed}:{end.isoformat()}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合成OHLCVパネルの生成")
+    parser.add_argument("--symbols", type=int, default=4000)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    prices = generate_ohlcv(args.symbols, args.years, args.seed)
+    elapsed = time.perf_counter() - start
+    print(prices.head())
+    print(f"{len(prices):,}行 ({args.symbols}銘柄 × {prices['date'].nunique()}営業日, "
+          f"{prices['date'].min():%Y-%m-%d}〜{prices['date'].max():%Y-%m-%d}) {elapsed:.2f}秒, "
+          f"{prices.memory_usage(deep=True).sum() / 1024 / 1024:.0f} MiB")
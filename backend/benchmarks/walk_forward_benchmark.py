@@ -0,0 +1,91 @@
+"""
+ウォークフォワード最適化 (walk_forward) のベンチマーク
+
+合成データ (DB不要、既定 1000銘柄×10年) で、グリッドの全セルを計算する時間を次の方法で比較する。
+
+  serial   1プロセスで順に計算
+  pickle   プロセスプールに株価の PricePanel をタスクごとに pickle して渡す (従来型の並列化)
+  memmap   walk_forward.compute_cells (株価はメモリマップで共有し、結果は共有の配列に書き込む)
+  resume   memmap の計算済みキャッシュからの再実行
+
+使い方:
+  python benchmarks/walk_forward_benchmark.py
+  python benchmarks/walk_forward_benchmark.py --symbols 4000 --workers 4
+"""
+import os
+import sys
+import time
+import pickle
+import shutil
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.harness import measure, collect_environment, save_results
+from benchmarks.synthetic_market import generate_ohlcv
+from backtest import BacktestConfig, run_backtest
+from indicator_library import PricePanel
+from walk_forward import DEFAULT_GRIDS, compute_cells, grid_cells
+
+def _pickled_cell(panel, config):
+    return run_backtest(panel, config).portfolio_returns
+
+def run_serial(panel, configs):
+    return [run_backtest(panel, config).portfolio_returns for config in configs]
+
+def run_pickle(panel, configs, workers):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_pickled_cell, [panel] * len(configs), configs))
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ウォークフォワード最適化のベンチマーク")
+    parser.add_argument("--symbols", type=int, default=1000, help="合成データの銘柄数")
+    parser.add_argument("--years", type=float, default=10.0, help="合成データの期間(年)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--strategy", choices=list(DEFAULT_GRIDS), default="golden_cross")
+    parser.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1), help="プロセス数")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", default=None, help="結果JSONの出力先")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    panel = PricePanel.from_frame(generate_ohlcv(args.symbols, args.years, args.seed))
+    base = BacktestConfig(strategy=args.strategy)
+    cells = grid_cells(base, DEFAULT_GRIDS[args.strategy])
+    configs = [base.with_overrides(cell) for cell in cells]
+    payload = len(pickle.dumps(panel, protocol=pickle.HIGHEST_PROTOCOL))
+    print(f"パネル: {len(panel.symbols)}銘柄 × {len(panel.dates)}日  セル数: {len(cells)}  "
+          f"プロセス数: {args.workers}  (pickle時のタスクあたりの転送量 {payload / 1024 / 1024:.1f}MiB)")
+
+    cache_dir = tempfile.mkdtemp(prefix="walk_forward_bench_")
+    try:
+        def run_memmap():
+            compute_cells(panel, base, cells, args.workers, cache_dir, resume=False)
+
+        cases = {
+            "serial": lambda: run_serial(panel, configs),
+            "pickle": lambda: run_pickle(panel, configs, args.workers),
+            "memmap": run_memmap,
+            "resume": lambda: compute_cells(panel, base, cells, args.workers, cache_dir),
+        }
+        results = {
+            "environment": collect_environment(),
+            "dataset": {"symbols": args.symbols, "years": args.years, "seed": args.seed},
+            "parameters": {"strategy": args.strategy, "cells": len(cells), "workers": args.workers,
+                           "pickle_bytes_per_task": payload},
+            "benchmarks": {},
+        }
+        print(f"{'ケース':<10} {'合計(s)':>10} {'セルあたり(s)':>14}")
+        for name, func in cases.items():
+            stats = measure(func, args.repeat, 0, items=len(cells))
+            results["benchmarks"][name] = stats
+            print(f"{name:<10} {stats['median']:>10.2f} {stats['median'] / len(cells):>14.3f}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print(f"結果を保存しました: {save_results(results, args.output, prefix='walk-forward-')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
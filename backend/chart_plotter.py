@@ -1,15 +1,19 @@
 import os
 import logging
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from mpl_finance import candlestick_ohlc
 from utils import get_font_config, get_ma_settings
 
 # ロギング設定（バックエンド全体の設定を使用）
 logger = logging.getLogger(__name__)
 
-def plot_candlestick(symbol_df, symbol, company_name, output_dir='reports'):
+# 時間軸ごとの足の幅(日)と表示名
+_TIMEFRAME_STYLES = {
+    'daily': {'width': 0.6, 'unit': '日', 'label': ''},
+    'weekly': {'width': 4.2, 'unit': '週', 'label': '週足 '},
+    'monthly': {'width': 18.0, 'unit': 'か月', 'label': '月足 '},
+}
+
+def plot_candlestick(symbol_df, symbol, company_name, output_dir='reports', timeframe='daily'):
     """
     ローソク足チャートを描画してファイルに保存
     
@@ -18,13 +22,20 @@ def plot_candlestick(symbol_df, symbol, company_name, output_dir='reports'):
         symbol (str): 銘柄シンボル
         company_name (str): 企業名
         output_dir (str): 出力ディレクトリ
+        timeframe (str): 時間軸 (daily / weekly / monthly)
     
     Returns:
         str: 保存された画像ファイルパス
     """
+    # matplotlib / mpl_finance は読み込みが重いため、API起動時ではなく初回描画時にインポートする
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from mpl_finance import candlestick_ohlc
+
     try:
         # 出力ディレクトリ作成
         os.makedirs(output_dir, exist_ok=True)
+        style = _TIMEFRAME_STYLES[timeframe]
         
         # フォント設定取得
         font_prop, title_font = get_font_config()
@@ -45,18 +56,18 @@ def plot_candlestick(symbol_df, symbol, company_name, output_dir='reports'):
                              plot_df['Low'], 
                              plot_df['Close']))
         
-        candlestick_ohlc(ax1, ohlc_data, width=0.6, colorup='r', colordown='g', alpha=1.0)
+        candlestick_ohlc(ax1, ohlc_data, width=style['width'], colorup='r', colordown='g', alpha=1.0)
         
         # 移動平均プロット（NaNは自動スキップ）
         ma_settings = get_ma_settings()
         ax1.plot(dates, symbol_df[f'MA{ma_settings["short"]}'], 
-                label=f'{ma_settings["short"]}日移動平均', color='blue')
+                label=f'{ma_settings["short"]}{style["unit"]}移動平均', color='blue')
         ax1.plot(dates, symbol_df[f'MA{ma_settings["long"]}'], 
-                label=f'{ma_settings["long"]}日移動平均', color='orange')
+                label=f'{ma_settings["long"]}{style["unit"]}移動平均', color='orange')
         logger.debug(f"移動平均をプロット: {ma_settings}")
         
         # タイトルとラベル設定
-        ax1.set_title(f'{company_name} ({symbol}) ローソク足チャート', fontproperties=title_font)
+        ax1.set_title(f'{company_name} ({symbol}) {style["label"]}ローソク足チャート', fontproperties=title_font)
         ax1.set_ylabel('価格', fontproperties=font_prop)
         ax1.legend(prop=font_prop)
         
@@ -76,7 +87,7 @@ def plot_candlestick(symbol_df, symbol, company_name, output_dir='reports'):
         
         # MACDヒストグラムプロット
         colors = ['g' if val >= 0 else 'r' for val in macd_hist]
-        ax3.bar(dates, macd_hist, color=colors, width=0.6, alpha=0.3, label='MACDヒストグラム')
+        ax3.bar(dates, macd_hist, color=colors, width=style['width'], alpha=0.3, label='MACDヒストグラム')
         ax3.axhline(0, color='k', linestyle='-', alpha=0.3)
         ax3.set_ylabel('MACD指標', fontproperties=font_prop)
         ax3.legend(prop=font_prop)
@@ -92,7 +103,7 @@ def plot_candlestick(symbol_df, symbol, company_name, output_dir='reports'):
         volume_mask = plot_df['Volume'] > 0
         non_zero_volumes = plot_df[volume_mask]
         non_zero_dates = dates[volume_mask]  # 直接booleanマスクを使用
-        ax4.bar(non_zero_dates, non_zero_volumes['Volume'], color='gray')
+        ax4.bar(non_zero_dates, non_zero_volumes['Volume'], color='gray', width=style['width'])
         ax4.set_xlabel('日付', fontproperties=font_prop)
         ax4.set_ylabel('出来高', fontproperties=font_prop)
         
@@ -113,7 +124,7 @@ def plot_candlestick(symbol_df, symbol, company_name, output_dir='reports'):
         
         # ファイル保存（キャッシュ回避のためタイムスタンプ付与）
         timestamp = pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')
-        output_path = os.path.abspath(os.path.join(output_dir, f'{symbol}_candle_chart_{timestamp}.png'))
+        output_path = os.path.abspath(os.path.join(output_dir, f'{symbol}_candle_chart_{timeframe}_{timestamp}.png'))
         plt.savefig(output_path)
         plt.close()
         
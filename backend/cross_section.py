@@ -0,0 +1,265 @@
+"""
+日次の横断的な順位 (パーセンタイル) と業種・規模別の平均
+
+営業日ごとに RSI・モメンタム (MOMENTUM_DAYS 営業日の騰落率)・MACDヒストグラムの
+パーセンタイル順位 (0〜100、大きいほど上位) を、市場全体・業種 (industry_code_33)・規模 (scale_code) の中で求め、
+technical_rankings に保存する。業種・規模・市場全体の平均は sector_indicator_averages に保存する。
+
+- 日足の指標バッチ (technical_indicator_calculator.py) の後に batch/cross_section_calculator.py で計算する。
+  対象期間の全銘柄・全営業日を1つの DataFrame にして、(日付, グループ) ごとの順位をまとめて求める (日付ごとのループは使わない)。
+- 順位は SMALLINT (0〜100) で保存し、スクリーニング (/api/prepare-recommendations) と
+  /api/stocks のソートはリクエスト時に計算せず保存済みの値を使う。
+"""
+import io
+import math
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from backtest import _forward_fill, load_price_panel
+from partitions import _as_date, latest_date
+
+logger = logging.getLogger(__name__)
+
+# 順位を求める指標
+RANK_FEATURES = ("rsi", "momentum", "histogram")
+
+# 順位のグループ (列名の接尾辞 → stocks の列、None は市場全体)
+RANK_GROUPS = {"": None, "industry": "industry_code_33", "scale": "scale_code"}
+
+# technical_rankings の順位の列 (rsi_rank, rsi_industry_rank, rsi_scale_rank, ...)
+RANK_COLUMNS = tuple(
+    f"{feature}_{group}_rank" if group else f"{feature}_rank"
+    for group in RANK_GROUPS for feature in RANK_FEATURES
+)
+
+# 平均のグループ (sector_indicator_averages.group_type → stocks の列)
+AVERAGE_GROUPS = {"market": None, "industry": "industry_code_33", "scale": "scale_code"}
+
+# モメンタムの期間 (営業日)
+MOMENTUM_DAYS = 20
+
+def _copy_out(engine, query: str, params: List) -> pd.DataFrame:
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        buffer = io.StringIO()
+        cursor.copy_expert(f"COPY ({cursor.mogrify(query, params).decode()}) TO STDOUT WITH (FORMAT csv, HEADER)",
+                           buffer)
+    finally:
+        raw.close()
+    buffer.seek(0)
+    return pd.read_csv(buffer)
+
+def _tokyo_bound(value: date):
+    return pd.Timestamp(value).tz_localize("Asia/Tokyo").to_pydatetime()
+
+def load_features(engine, start: date, end: date) -> pd.DataFrame:
+    """
+    start〜end の営業日ごとの指標 (rsi, histogram)、モメンタムと、銘柄の業種・規模
+
+    Returns:
+        DataFrame: date, symbol, rsi, momentum, histogram, industry_code_33, scale_code
+    """
+    indicators = _copy_out(engine, """
+        SELECT symbol, (date AT TIME ZONE 'Asia/Tokyo')::date AS date, rsi, histogram
+        FROM technical_indicators WHERE date >= %s AND date < %s
+    """, [_tokyo_bound(start), _tokyo_bound(end + timedelta(days=1))])
+    indicators["date"] = pd.to_datetime(indicators["date"])
+    indicators[["rsi", "histogram"]] = indicators[["rsi", "histogram"]].astype(np.float64)
+
+    # モメンタムは MOMENTUM_DAYS 営業日前の終値が要るため、祝日を見込んで暦日で多めに読む
+    try:
+        panel = load_price_panel(engine, None, start - timedelta(days=MOMENTUM_DAYS * 2 + 14), end)
+        closes = _forward_fill(panel.close)
+        momentum = np.full(closes.shape, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            momentum[:, MOMENTUM_DAYS:] = closes[:, MOMENTUM_DAYS:] / closes[:, :-MOMENTUM_DAYS] - 1
+        dates = pd.DatetimeIndex(panel.dates)
+        in_range = (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+        momentum = pd.DataFrame({
+            "symbol": np.repeat(np.asarray(panel.symbols), in_range.sum()),
+            "date": np.tile(dates[in_range], len(panel.symbols)),
+            "momentum": momentum[:, in_range].ravel(),
+        })
+    except ValueError:
+        momentum = pd.DataFrame(columns=["symbol", "date", "momentum"])
+
+    momentum["momentum"] = momentum["momentum"].astype(np.float64)
+    frame = indicators.merge(momentum, on=["symbol", "date"], how="outer")
+    frame = frame[frame[list(RANK_FEATURES)].notna().any(axis=1)]
+    with engine.connect() as conn:
+        stocks = pd.DataFrame(conn.execute(text(
+            "SELECT symbol, industry_code_33, scale_code FROM stocks"
+        )).mappings().all(), columns=["symbol", "industry_code_33", "scale_code"])
+    # stocks に無い銘柄 (上場廃止で削除済みなど) は保存できないため除く
+    return frame.merge(stocks, on="symbol", how="inner")
+
+def percentile_ranks(frame: pd.DataFrame, keys: List[str], columns: List[str]) -> pd.DataFrame:
+    """
+    keys のグループ内のパーセンタイル順位 (0〜100、最小が0・最大が100、同値は平均順位)
+
+    値の無い銘柄とグループの列が空の銘柄は NULL。グループに1銘柄だけの場合は 50。
+    """
+    grouped = frame.groupby(keys, sort=False)[columns]
+    rank = grouped.rank(method="average")
+    count = grouped.transform("count")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = (rank - 1) / (count - 1) * 100
+    pct = pct.where((count != 1) | rank.isna(), 50.0).to_numpy()
+    missing = np.isnan(pct)
+    values = np.where(missing, 0, np.round(pct)).astype(np.int16)
+    return pd.DataFrame({column: pd.arrays.IntegerArray(values[:, i], missing[:, i])
+                         for i, column in enumerate(columns)}, index=frame.index)
+
+def compute_rankings(frame: pd.DataFrame):
+    """
+    全銘柄・全営業日の順位と平均をまとめて計算
+
+    Returns:
+        (ranks: date, symbol, momentum, RANK_COLUMNS,
+         averages: date, group_type, group_code, members, rsi, momentum, histogram)
+    """
+    features = list(RANK_FEATURES)
+    ranks = frame[["date", "symbol", "momentum"]].copy()
+    for group, column in RANK_GROUPS.items():
+        keys = ["date"] if column is None else ["date", column]
+        group_ranks = percentile_ranks(frame, keys, features)
+        for feature in features:
+            ranks[f"{feature}_{group}_rank" if group else f"{feature}_rank"] = group_ranks[feature]
+
+    averages = []
+    for group_type, column in AVERAGE_GROUPS.items():
+        keys = ["date"] if column is None else ["date", column]
+        grouped = frame.groupby(keys)
+        summary = grouped[features].mean()
+        summary["members"] = grouped.size()
+        summary = summary.reset_index()
+        summary["group_type"] = group_type
+        summary["group_code"] = "all" if column is None else summary.pop(column)
+        averages.append(summary)
+    averages = pd.concat(averages, ignore_index=True)
+    return ranks, averages[["date", "group_type", "group_code", "members"] + features]
+
+def _copy_in(cursor, table: str, frame: pd.DataFrame):
+    buffer = io.StringIO()
+    # REAL (単精度) で保存するため7桁で書き出す (float64 の全桁の文字列化は遅い)
+    frame.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d", float_format="%.7g")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def store_rankings(cursor, ranks: pd.DataFrame, averages: pd.DataFrame, start: date, end: date):
+    """start〜end の順位・平均を入れ替える (コミットは呼び出し元で行う)"""
+    cursor.execute("DELETE FROM technical_rankings WHERE date BETWEEN %s AND %s", (start, end))
+    cursor.execute("DELETE FROM sector_indicator_averages WHERE date BETWEEN %s AND %s", (start, end))
+    _copy_in(cursor, "technical_rankings", ranks)
+    _copy_in(cursor, "sector_indicator_averages", averages)
+
+def update_rankings(engine, start, end) -> Dict:
+    """
+    start〜end (日本時間の日付) の順位・平均を計算して保存する
+
+    Returns:
+        dict: dates (営業日数), rows (順位の行数), groups (平均の行数)
+    """
+    start, end = _as_date(start), _as_date(end)
+    frame = load_features(engine, start, end)
+    if frame.empty:
+        logger.info(f"{start}〜{end} の指標が無いため順位を計算しません")
+        return {"dates": 0, "rows": 0, "groups": 0}
+    ranks, averages = compute_rankings(frame)
+    raw = engine.raw_connection()
+    try:
+        store_rankings(raw.cursor(), ranks, averages, start, end)
+        raw.commit()
+    finally:
+        raw.close()
+    summary = {"dates": int(ranks["date"].nunique()), "rows": len(ranks), "groups": len(averages)}
+    logger.info(f"順位を保存しました ({start}〜{end}): {summary}")
+    return summary
+
+def recent_trading_days(engine, days: int, end=None) -> List[date]:
+    """technical_indicators の直近 days 営業日 (end 以前、日本時間の日付)"""
+    with engine.connect() as conn:
+        if end is None:
+            end = latest_date(conn, "technical_indicators")
+            if end is None:
+                return []
+        end = _as_date(end)
+        rows = conn.execute(text("""
+            SELECT DISTINCT (date AT TIME ZONE 'Asia/Tokyo')::date AS day
+            FROM technical_indicators
+            WHERE date >= :start AND date < :end
+            ORDER BY day DESC
+            LIMIT :days
+        """), {"start": _tokyo_bound(end - timedelta(days=days * 2 + 10)),
+               "end": _tokyo_bound(end + timedelta(days=1)), "days": days}).all()
+    return sorted(row[0] for row in rows)
+
+# グループ名の取得元 (stocks の列)
+GROUP_NAMES = {"industry": "industry_name_33", "scale": "scale_name"}
+
+def sector_averages(conn, group_type: str = "industry", group_code: Optional[str] = None,
+                    start_date=None, end_date=None) -> List[Dict]:
+    """
+    保存済みの業種・規模・市場全体の平均を取得する
+
+    Args:
+        group_type: market / industry / scale
+        group_code: 指定するとそのグループの日次の推移、省略すると最新の営業日の全グループ
+        start_date, end_date: 推移の期間 (group_code を指定した場合)
+
+    Raises:
+        ValueError: 未対応のグループ
+    """
+    if group_type not in AVERAGE_GROUPS:
+        raise ValueError(f"未対応のグループ: {group_type} ({' / '.join(AVERAGE_GROUPS)})")
+    conditions, params = ["a.group_type = :group_type"], {"group_type": group_type}
+    if group_code is None:
+        conditions.append("a.date = (SELECT MAX(date) FROM sector_indicator_averages)")
+    else:
+        conditions.append("a.group_code = :group_code")
+        params["group_code"] = group_code
+        if start_date:
+            conditions.append("a.date >= :start_date")
+            params["start_date"] = start_date
+        if end_date:
+            conditions.append("a.date <= :end_date")
+            params["end_date"] = end_date
+    name_column = GROUP_NAMES.get(group_type)
+    name = (f"(SELECT MAX({name_column}) FROM stocks WHERE {AVERAGE_GROUPS[group_type]} = a.group_code)"
+            if name_column else "NULL")
+    rows = conn.execute(text(f"""
+        SELECT TO_CHAR(a.date, 'YYYY-MM-DD') AS date, a.group_code, {name} AS group_name,
+            a.members, a.rsi, a.momentum, a.histogram
+        FROM sector_indicator_averages a
+        WHERE {' AND '.join(conditions)}
+        ORDER BY a.date, a.group_code
+    """), params).mappings().all()
+    return [dict(row) for row in rows]
+
+# 順位フィルタの演算子
+RANK_FILTER_OPS = ("<", "<=", ">", ">=", "=")
+
+def rank_filter(column: str, op: str, value) -> str:
+    """
+    スクリーニング条件 (例: rsi_rank >= 80) の SQL
+
+    Raises:
+        ValueError: 未対応の列・演算子、または値が有限の数値でない
+    """
+    if column not in RANK_COLUMNS:
+        raise ValueError(f"未対応の順位フィルタ: {column} ({' / '.join(RANK_COLUMNS)})")
+    if op not in RANK_FILTER_OPS:
+        raise ValueError(f"順位フィルタの演算子が不正です: {column} {op} ({' '.join(RANK_FILTER_OPS)})")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = math.nan
+    if not math.isfinite(number):
+        raise ValueError(f"順位フィルタの値が不正です: {column} {op} {value}")
+    return f"tr.{column} {op} {number:g}"
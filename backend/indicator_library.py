@@ -0,0 +1,392 @@
+"""
+ベクトル化したテクニカル指標ライブラリ
+
+株価を 銘柄×日付 の2次元配列 (PricePanel) にまとめ、全銘柄分を1回の配列演算で計算する。
+期間を複数指定すると (期間数, 銘柄数, 日付数) の3次元配列を返し、累積和や状態の更新を
+1回走査するだけで全期間分を計算する (例: 移動平均 5〜200日のパラメータスイープ)。
+
+対応する指標:
+  sma / ema / vwma          単純・指数・出来高加重移動平均
+  rsi                       RSI (wilder: ワイルダーの平滑化、sma: 単純平均 = technical_indicators.calculate_rsi)
+  macd                      MACD・シグナル・ヒストグラム
+  bollinger                 ボリンジャーバンド (中心・上限・下限・%b・バンド幅)
+  atr                       ATR (ワイルダーの平滑化)
+  stochastic                ストキャスティクス (%K・%D)
+  obv                       OBV
+  crosses                   ゴールデンクロス・デッドクロス
+
+欠損値 (上場前・売買の無い日) を含む期間の値は NaN になる (pandas の rolling(min_periods=期間) と同じ)。
+指数平滑は欠損値の日を飛ばして前日の状態を引き継ぐ。
+パラメータは環境変数を毎回読む代わりに IndicatorConfig で明示的に渡す。
+"""
+import os
+from dataclasses import dataclass, fields
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+Windows = Union[int, Sequence[int]]
+
+# IndicatorConfig の項目と環境変数名
+ENV_VARS = {
+    "ma_short": "SHORT_MA_WINDOW",
+    "ma_long": "LONG_MA_WINDOW",
+    "cross_short": "GOLDEN_DEAD_SHORT_WINDOW",
+    "cross_long": "GOLDEN_DEAD_LONG_WINDOW",
+    "rsi_window": "RSI_WINDOW",
+    "macd_fast": "MACD_FAST",
+    "macd_slow": "MACD_SLOW",
+    "macd_signal": "MACD_SIGNAL",
+    "bollinger_window": "BOLLINGER_WINDOW",
+    "bollinger_k": "BOLLINGER_K",
+    "atr_window": "ATR_WINDOW",
+    "stochastic_k": "STOCHASTIC_K_WINDOW",
+    "stochastic_d": "STOCHASTIC_D_WINDOW",
+    "vwma_window": "VWMA_WINDOW",
+}
+
+@dataclass(frozen=True)
+class IndicatorConfig:
+    """指標のパラメータ
+
+    Attributes:
+        ma_short / ma_long: チャートの移動平均期間
+        cross_short / cross_long: ゴールデンクロス・デッドクロス判定の移動平均期間
+        rsi_window: RSI期間
+        macd_fast / macd_slow / macd_signal: MACDの短期・長期・シグナルのEMA期間
+        bollinger_window / bollinger_k: ボリンジャーバンドの期間と標準偏差の倍率
+        atr_window: ATR期間
+        stochastic_k / stochastic_d: ストキャスティクスの %K 期間と %D の平滑化期間
+        vwma_window: 出来高加重移動平均の期間
+    """
+    ma_short: int = 25
+    ma_long: int = 75
+    cross_short: int = 25
+    cross_long: int = 75
+    rsi_window: int = 14
+    macd_fast: int = 12
+    macd_slow: int = 26
+    macd_signal: int = 9
+    bollinger_window: int = 20
+    bollinger_k: float = 2.0
+    atr_window: int = 14
+    stochastic_k: int = 14
+    stochastic_d: int = 3
+    vwma_window: int = 20
+
+    @classmethod
+    def from_env(cls) -> "IndicatorConfig":
+        """環境変数 (未設定の項目は既定値) から作成"""
+        values = {}
+        for f in fields(cls):
+            raw = os.getenv(ENV_VARS[f.name])
+            values[f.name] = type(f.default)(raw) if raw is not None else f.default
+        return cls(**values)
+
+    def to_env(self, names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """
+        .env にそのまま書ける 環境変数名 → 値 (from_env の逆)
+
+        Args:
+            names: 出力する項目 (None なら全項目)
+        """
+        names = [f.name for f in fields(self)] if names is None else list(names)
+        return {ENV_VARS[name]: str(getattr(self, name)) for name in names}
+
+@dataclass
+class PricePanel:
+    """銘柄×日付の株価配列 (各配列は (銘柄数, 日付数)、データの無い日は NaN)"""
+    symbols: np.ndarray
+    dates: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "PricePanel":
+        """symbol, date, open, high, low, close, volume 列の縦持ちDataFrameから作成"""
+        symbol_codes, symbols = pd.factorize(df["symbol"], sort=True)
+        date_codes, dates = pd.factorize(df["date"], sort=True)
+        shape = (len(symbols), len(dates))
+        arrays = {}
+        for column in ("open", "high", "low", "close", "volume"):
+            values = np.full(shape, np.nan)
+            values[symbol_codes, date_codes] = df[column].to_numpy(dtype=float)
+            arrays[column] = values
+        return cls(symbols=np.asarray(symbols), dates=np.asarray(dates), **arrays)
+
+    def chunks(self, size: int) -> Iterator["PricePanel"]:
+        """size 銘柄ずつに分けたパネル (スイープの結果は 期間数×銘柄数×日付数×8バイト になるため分割して計算する)"""
+        for start in range(0, len(self.symbols), size):
+            part = slice(start, start + size)
+            yield PricePanel(self.symbols[part], self.dates, self.open[part], self.high[part],
+                             self.low[part], self.close[part], self.volume[part])
+
+    def to_frame(self, columns: Dict[str, np.ndarray], dropna: bool = True) -> pd.DataFrame:
+        """
+        (銘柄数, 日付数) の配列を symbol, date と指標列の縦持ちDataFrameに戻す
+
+        Args:
+            columns: 列名 → 配列
+            dropna: 株価の無い (close が NaN の) 行を除く
+        """
+        n_symbols, n_dates = self.close.shape
+        frame = pd.DataFrame({
+            "symbol": np.repeat(self.symbols, n_dates),
+            "date": np.tile(self.dates, n_symbols),
+            **{name: np.asarray(values).reshape(-1) for name, values in columns.items()},
+        })
+        if dropna:
+            frame = frame[~np.isnan(self.close).reshape(-1)]
+        return frame.reset_index(drop=True)
+
+def _as_windows(windows: Windows):
+    """期間の指定を (配列, 単一指定か) に変換"""
+    single = np.isscalar(windows)
+    values = np.atleast_1d(np.asarray(windows, dtype=int))
+    if (values < 1).any():
+        raise ValueError(f"期間は1以上を指定してください: {windows}")
+    return values, single
+
+def _squeeze(result: np.ndarray, single: bool) -> np.ndarray:
+    return result[0] if single else result
+
+def _per_window(values: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """期間の配列を (期間数, 1, ..., 1) にして x の次元にそろえる"""
+    return values.reshape((-1,) + (1,) * x.ndim)
+
+def _rolling_sum(x: np.ndarray, windows: np.ndarray) -> np.ndarray:
+    """期間ごとの移動合計 (P, S, T)。期間内に NaN を含む位置は NaN"""
+    valid = ~np.isnan(x)
+    pad = np.zeros(x.shape[:-1] + (1,))
+    total = np.concatenate([pad, np.cumsum(np.where(valid, x, 0.0), axis=-1)], axis=-1)
+    count = np.concatenate([pad, np.cumsum(valid, axis=-1)], axis=-1)
+    n_dates = x.shape[-1]
+    result = np.full((len(windows),) + x.shape, np.nan)
+    for i, window in enumerate(windows):
+        if window > n_dates:
+            continue
+        sums = total[..., window:] - total[..., :-window]
+        full = (count[..., window:] - count[..., :-window]) == window
+        result[i, ..., window - 1:] = np.where(full, sums, np.nan)
+    return result
+
+def sma(x: np.ndarray, windows: Windows) -> np.ndarray:
+    """単純移動平均 (期間を複数指定すると (期間数, 銘柄数, 日付数))"""
+    values, single = _as_windows(windows)
+    return _squeeze(_rolling_sum(x, values) / _per_window(values, x), single)
+
+def rolling_std(x: np.ndarray, windows: Windows) -> np.ndarray:
+    """移動標準偏差 (母標準偏差、ddof=0)"""
+    values, single = _as_windows(windows)
+    # 桁落ちを避けるため銘柄ごとの平均を引いてから二乗和をとる
+    centered = x - np.nanmean(x, axis=-1, keepdims=True)
+    mean = _rolling_sum(centered, values) / _per_window(values, x)
+    mean_sq = _rolling_sum(centered ** 2, values) / _per_window(values, x)
+    return _squeeze(np.sqrt(np.maximum(mean_sq - mean ** 2, 0.0)), single)
+
+def _rolling_extreme(x: np.ndarray, windows: np.ndarray, reducer) -> np.ndarray:
+    result = np.full((len(windows),) + x.shape, np.nan)
+    for i, window in enumerate(windows):
+        if window <= x.shape[-1]:
+            result[i, ..., window - 1:] = reducer(sliding_window_view(x, window, axis=-1), axis=-1)
+    return result
+
+def rolling_max(x: np.ndarray, windows: Windows) -> np.ndarray:
+    """移動最大値"""
+    values, single = _as_windows(windows)
+    return _squeeze(_rolling_extreme(x, values, np.max), single)
+
+def rolling_min(x: np.ndarray, windows: Windows) -> np.ndarray:
+    """移動最小値"""
+    values, single = _as_windows(windows)
+    return _squeeze(_rolling_extreme(x, values, np.min), single)
+
+def _ewm(x: np.ndarray, alphas: np.ndarray, min_periods: np.ndarray) -> np.ndarray:
+    """
+    指数平滑 (pandas の ewm(alpha, adjust=False, min_periods) 相当) を全平滑係数について1回の走査で計算
+
+    初値は最初の有効値、NaN の日は状態を引き継いで NaN を返す。
+    """
+    n_params = len(alphas)
+    alpha = alphas.reshape((n_params,) + (1,) * (x.ndim - 1))
+    state = np.full((n_params,) + x.shape[:-1], np.nan)
+    result = np.full((n_params,) + x.shape, np.nan)
+    for t in range(x.shape[-1]):
+        current = x[..., t]
+        valid = ~np.isnan(current)
+        updated = np.where(np.isnan(state), current, state + alpha * (current - state))
+        state = np.where(valid, updated, state)
+        result[..., t] = np.where(valid, state, np.nan)
+    seen = np.cumsum(~np.isnan(x), axis=-1)
+    return np.where(seen >= _per_window(min_periods, x), result, np.nan)
+
+def ema(x: np.ndarray, spans: Windows, min_periods: int = 1) -> np.ndarray:
+    """指数移動平均 (alpha = 2 / (span + 1)、pandas の ewm(span, adjust=False) 相当)"""
+    values, single = _as_windows(spans)
+    return _squeeze(_ewm(x, 2.0 / (values + 1.0), np.full(len(values), min_periods)), single)
+
+def wilder(x: np.ndarray, windows: Windows) -> np.ndarray:
+    """ワイルダーの平滑化 (alpha = 1 / 期間、期間分の有効値がそろうまでは NaN)"""
+    values, single = _as_windows(windows)
+    return _squeeze(_ewm(x, 1.0 / values, values), single)
+
+def _diff(x: np.ndarray) -> np.ndarray:
+    delta = np.full(x.shape, np.nan)
+    delta[..., 1:] = x[..., 1:] - x[..., :-1]
+    return delta
+
+def rsi(close: np.ndarray, windows: Windows, method: str = "wilder") -> np.ndarray:
+    """
+    RSI
+
+    Args:
+        method: wilder (ワイルダーの平滑化) / sma (単純平均、technical_indicators.calculate_rsi と同じ)
+    """
+    delta = _diff(close)
+    if method == "sma":
+        # calculate_rsi と同じく、初日 (前日の無い日) の値幅は 0 とする
+        delta = np.where(np.isnan(delta) & ~np.isnan(close), 0.0, delta)
+    gain = np.where(delta > 0, delta, np.where(np.isnan(delta), np.nan, 0.0))
+    loss = np.where(delta < 0, -delta, np.where(np.isnan(delta), np.nan, 0.0))
+    if method == "wilder":
+        avg_gain, avg_loss = wilder(gain, windows), wilder(loss, windows)
+    elif method == "sma":
+        avg_gain, avg_loss = sma(gain, windows), sma(loss, windows)
+    else:
+        raise ValueError(f"method は wilder または sma を指定してください: {method}")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> Dict[str, np.ndarray]:
+    """MACD (macd, signal_line, histogram)"""
+    ema_fast, ema_slow = ema(close, [fast, slow])
+    line = ema_fast - ema_slow
+    signal_line = ema(line, signal)
+    return {"macd": line, "signal_line": signal_line, "histogram": line - signal_line}
+
+def bollinger(close: np.ndarray, window: int = 20, k: float = 2.0) -> Dict[str, np.ndarray]:
+    """ボリンジャーバンド (bb_middle, bb_upper, bb_lower, bb_percent_b, bb_bandwidth)"""
+    middle = sma(close, window)
+    width = k * rolling_std(close, window)
+    upper, lower = middle + width, middle - width
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent_b = (close - lower) / (upper - lower)
+        bandwidth = (upper - lower) / middle
+    return {"bb_middle": middle, "bb_upper": upper, "bb_lower": lower,
+            "bb_percent_b": percent_b, "bb_bandwidth": bandwidth}
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """真の値幅 (初日は高値 - 安値)"""
+    prev_close = np.full(close.shape, np.nan)
+    prev_close[..., 1:] = close[..., :-1]
+    # fmax は NaN を無視するため、前日終値が無い日は高値 - 安値になる
+    return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, windows: Windows) -> np.ndarray:
+    """ATR (真の値幅のワイルダー平滑化)"""
+    return wilder(true_range(high, low, close), windows)
+
+def stochastic(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+               k_window: int = 14, d_window: int = 3) -> Dict[str, np.ndarray]:
+    """ストキャスティクス (stoch_k, stoch_d)"""
+    highest, lowest = rolling_max(high, k_window), rolling_min(low, k_window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = 100.0 * (close - lowest) / (highest - lowest)
+    return {"stoch_k": k, "stoch_d": sma(k, d_window)}
+
+def obv(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """OBV (初日は0、終値が上がった日は出来高を加え、下がった日は引く)"""
+    direction = np.sign(np.nan_to_num(_diff(close)))
+    flow = np.where(np.isnan(close), 0.0, direction * np.nan_to_num(volume))
+    return np.where(np.isnan(close), np.nan, np.cumsum(flow, axis=-1))
+
+def vwma(close: np.ndarray, volume: np.ndarray, windows: Windows) -> np.ndarray:
+    """出来高加重移動平均"""
+    values, single = _as_windows(windows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = _rolling_sum(close * volume, values) / _rolling_sum(volume, values)
+    return _squeeze(result, single)
+
+def crosses(short_ma: np.ndarray, long_ma: np.ndarray) -> Dict[str, np.ndarray]:
+    """ゴールデンクロス・デッドクロス (technical_indicators.calculate_crosses と同じ判定)"""
+    prev_short = np.full(short_ma.shape, np.nan)
+    prev_long = np.full(long_ma.shape, np.nan)
+    prev_short[..., 1:], prev_long[..., 1:] = short_ma[..., :-1], long_ma[..., :-1]
+    return {
+        "golden_cross": (short_ma > long_ma) & (prev_short <= prev_long),
+        "dead_cross": (short_ma < long_ma) & (prev_short >= prev_long),
+    }
+
+def compute_indicators(panel: PricePanel, config: Optional[IndicatorConfig] = None,
+                       include: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+    """
+    全銘柄の指標を計算
+
+    Args:
+        include: 計算する指標グループ (crosses, rsi, macd, bollinger, atr, stochastic, obv, vwma、既定: 全て)
+
+    Returns:
+        dict: 列名 → (銘柄数, 日付数) の配列
+    """
+    config = config or IndicatorConfig.from_env()
+    groups = set(include) if include is not None else {
+        "crosses", "rsi", "macd", "bollinger", "atr", "stochastic", "obv", "vwma"}
+    close = panel.close
+    result = {}
+    if "crosses" in groups:
+        short_ma, long_ma = sma(close, [config.cross_short, config.cross_long])
+        result.update(crosses(short_ma, long_ma))
+    if "rsi" in groups:
+        result["rsi"] = rsi(close, config.rsi_window, method="wilder")
+    if "macd" in groups:
+        result.update(macd(close, config.macd_fast, config.macd_slow, config.macd_signal))
+    if "bollinger" in groups:
+        result.update(bollinger(close, config.bollinger_window, config.bollinger_k))
+    if "atr" in groups:
+        result["atr"] = atr(panel.high, panel.low, close, config.atr_window)
+    if "stochastic" in groups:
+        result.update(stochastic(panel.high, panel.low, close, config.stochastic_k, config.stochastic_d))
+    if "obv" in groups:
+        result["obv"] = obv(close, panel.volume)
+    if "vwma" in groups:
+        result["vwma"] = vwma(close, panel.volume, config.vwma_window)
+    return result
+
+def sweep(panel: PricePanel, indicator: str, windows: Sequence[int]) -> Dict[str, np.ndarray]:
+    """
+    1つの指標を複数の期間でまとめて計算 (パラメータスイープ)
+
+    結果は 期間数×銘柄数×日付数 の配列になるため、全銘柄・長期間では PricePanel.chunks() で分割して呼ぶ。
+
+    Args:
+        indicator: sma / ema / vwma / rsi / atr / bollinger_width
+        windows: 期間のリスト (例: range(5, 201))
+
+    Returns:
+        dict: "<indicator>_<期間>" → (銘柄数, 日付数) の配列
+    """
+    close = panel.close
+    calculators = {
+        "sma": lambda w: sma(close, w),
+        "ema": lambda w: ema(close, w),
+        "vwma": lambda w: vwma(close, panel.volume, w),
+        "rsi": lambda w: rsi(close, w),
+        "atr": lambda w: atr(panel.high, panel.low, close, w),
+        "bollinger_width": lambda w: rolling_std(close, w) / sma(close, w),
+    }
+    if indicator not in calculators:
+        raise ValueError(f"未対応の指標: {indicator} ({' / '.join(calculators)})")
+    windows = list(windows)
+    values = calculators[indicator](windows)
+    return {f"{indicator}_{window}": values[i] for i, window in enumerate(windows)}
+
+def indicator_frame(df: pd.DataFrame, config: Optional[IndicatorConfig] = None,
+                    include: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """縦持ちの株価DataFrameから指標を計算し、symbol, date と指標列の縦持ちDataFrameで返す"""
+    panel = PricePanel.from_frame(df)
+    return panel.to_frame(compute_indicators(panel, config, include))
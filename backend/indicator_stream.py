@@ -0,0 +1,298 @@
+"""
+テクニカル指標の更新のサーバープッシュ配信 (Server-Sent Events)
+
+指標バッチ (technical_indicators.batch_store_indicators) が発行する無効化イベント (invalidation.INDICATORS_UPDATED) と
+アラート (alerts.store_events) の NOTIFY を受信し、接続中のクライアントに「最新の指標が変わった銘柄の行」と「発火したアラート」を配信する。
+
+- 通知は coalesce_seconds の間まとめてから、変わった銘柄の最新行をDBから1回だけ読み、全クライアントに振り分ける
+  (バッチは100銘柄ごとに保存・通知するため、1回ずつ読むとクライアント数 × 通知数のクエリになる)。
+- 前回配信した値と同じ行は送らない (同じ足の再計算では差分なし)。
+- クライアントごとに購読する銘柄・時間軸を指定できる。未指定は全銘柄。
+- 送信待ちのメッセージはクライアントごとに buffer_size 件まで。受信が追いつかず溢れたクライアントは
+  dropped イベントを送って切断する (EventSource は自動で再接続するので、一覧を取得し直してから購読し直す)。
+- LISTEN の接続が切れた間の通知は失われるため、再接続時 (invalidation.RESET) は resync イベントで取得し直しを促す。
+"""
+import os
+import json
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+
+from alerts import ALERTS_CHANNEL
+from bar_aggregates import TIMEFRAMES
+from metrics import REGISTRY
+from invalidation import INDICATORS_UPDATED, RESET, InvalidationEvent, invalidation_bus
+from pg_listener import PgListener
+from utils import get_db_engine
+
+logger = logging.getLogger(__name__)
+
+STREAM_CLIENTS = REGISTRY.gauge(
+    "stream_clients", "指標の更新を購読中のクライアント数")
+STREAM_MESSAGES = REGISTRY.counter(
+    "stream_messages_total", "クライアントに配信したメッセージ数", ["event"])
+STREAM_CLIENTS_DROPPED = REGISTRY.counter(
+    "stream_clients_dropped_total", "送信待ちが buffer_size を超えて切断したクライアント数")
+
+# 配信する指標の列 (/api/stocks と同じ名前)
+STREAM_COLUMNS = ("golden_cross", "dead_cross", "rsi", "macd", "signal_line", "histogram", "macd_score")
+DECIMAL_COLUMNS = ("rsi", "macd", "signal_line", "histogram")
+
+@dataclass
+class StreamConfig:
+    """配信の設定 (環境変数 STREAM_*)"""
+    coalesce_seconds: float = 0.5
+    buffer_size: int = 100
+    heartbeat_seconds: float = 15.0
+    max_symbols: int = 1000
+
+    @classmethod
+    def from_env(cls) -> "StreamConfig":
+        return cls(
+            coalesce_seconds=float(os.getenv("STREAM_COALESCE_MS", "500")) / 1000,
+            buffer_size=int(os.getenv("STREAM_BUFFER_SIZE", "100")),
+            heartbeat_seconds=float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15")),
+            max_symbols=int(os.getenv("STREAM_MAX_SYMBOLS", "1000")),
+        )
+
+class Subscription:
+    """1クライアントの購読 (symbols が None なら全銘柄)"""
+
+    def __init__(self, symbols: Optional[FrozenSet[str]], timeframes: FrozenSet[str], buffer_size: int):
+        self.symbols = symbols
+        self.sorted_symbols = tuple(sorted(symbols)) if symbols else ()
+        self.timeframes = timeframes
+        self.queue: asyncio.Queue = asyncio.Queue(buffer_size)
+        self.dropped = False
+
+def format_event(event: str, data, event_id: Optional[int] = None) -> str:
+    """SSE のメッセージを組み立てる"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+def load_latest_rows(engine, timeframe: str, symbols: Iterable[str]) -> List[Dict]:
+    """銘柄ごとの最新の指標の行"""
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT s.symbol, TO_CHAR(ti.date, 'YYYY-MM-DD') AS technical_date,
+                   {', '.join(f'ti.{column}' for column in STREAM_COLUMNS)}
+            FROM unnest(CAST(:symbols AS TEXT[])) AS s(symbol)
+            CROSS JOIN LATERAL (
+                SELECT * FROM {TIMEFRAMES[timeframe]['indicators']}
+                WHERE symbol = s.symbol
+                ORDER BY date DESC
+                LIMIT 1
+            ) ti
+        """), {"symbols": sorted(symbols)}).mappings().all()
+    # DECIMAL の列は JSON の数値で送る
+    return [{key: float(value) if key in DECIMAL_COLUMNS and value is not None else value
+             for key, value in row.items()} for row in rows]
+
+class IndicatorStream:
+    """
+    NOTIFY を受けて購読中のクライアントに差分を配信する (APIワーカーごとに1つ)
+
+    NOTIFY・無効化イベントのハンドラは PgListener のスレッドから呼ばれるため、イベントループに渡してから処理する。
+    """
+
+    def __init__(self, config: Optional[StreamConfig] = None, engine=None):
+        self.config = config or StreamConfig.from_env()
+        self._engine = engine
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscriptions: Set[Subscription] = set()
+        self._pending: Dict[str, Set[str]] = {}
+        self._pending_alerts: List[Dict] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+        self._sent: Dict[tuple, Dict] = {}
+        self._ids = itertools.count(1)
+        STREAM_CLIENTS.set_function(lambda: len(self._subscriptions))
+
+    def attach(self, listener: PgListener, loop: asyncio.AbstractEventLoop):
+        """
+        PgListener にアラートのチャネルを登録する (listener.start() より前に呼ぶ)
+
+        指標の更新は invalidation_bus から受け取る (モジュールの読み込み時に登録済み)。
+        """
+        self._loop = loop
+        listener.subscribe(ALERTS_CHANNEL, self._on_alerts)
+
+    def subscribe(self, symbols: Optional[Iterable[str]] = None,
+                  timeframes: Optional[Iterable[str]] = None) -> Subscription:
+        """
+        購読を開始する
+
+        Raises:
+            ValueError: 銘柄数が max_symbols を超える、または未対応の時間軸
+        """
+        symbols = frozenset(symbols) if symbols else None
+        if symbols is not None and len(symbols) > self.config.max_symbols:
+            raise ValueError(f"購読できる銘柄は{self.config.max_symbols}件までです: {len(symbols)}件")
+        timeframes = frozenset(timeframes or ("daily",))
+        invalid = timeframes - set(TIMEFRAMES)
+        if invalid:
+            raise ValueError(f"無効な時間軸: {', '.join(sorted(invalid))} (daily / weekly / monthly のいずれか)")
+        subscription = Subscription(symbols, timeframes, self.config.buffer_size)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    async def iterate(self, subscription: Subscription) -> AsyncIterator[str]:
+        """SSE のメッセージを順に返す (StreamingResponse に渡す)。一定時間送るものが無ければコメントを送る"""
+        try:
+            yield "retry: 5000\n\n"
+            yield format_event("ready", {"symbols": subscription.sorted_symbols or None,
+                                         "timeframes": sorted(subscription.timeframes)})
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), self.config.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    yield format_event("dropped", {"buffer_size": self.config.buffer_size})
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+    # --- PgListener のスレッドから呼ばれる ---
+
+    def on_invalidation(self, event: InvalidationEvent):
+        """指標の更新 (銘柄の無いイベント・再接続は取得し直しを促す)"""
+        if event.type == RESET or event.symbols is None:
+            self._call_soon(self._resync)
+        elif event.timeframe in TIMEFRAMES:
+            self._call_soon(self._receive_indicators, event.timeframe, event.symbols)
+
+    def _on_alerts(self, channel: str, payload: str):
+        self._call_soon(self._receive_alerts, json.loads(payload or "{}").get("events", []))
+
+    def _call_soon(self, callback, *args):
+        if self._loop is None or not self._subscriptions:
+            return
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # イベントループの終了後
+            pass
+
+    # --- 以下はイベントループ上で実行 ---
+
+    def _receive_indicators(self, timeframe: str, symbols: FrozenSet[str]):
+        self._pending.setdefault(timeframe, set()).update(symbols)
+        self._schedule_flush()
+
+    def _receive_alerts(self, events: List[Dict]):
+        self._pending_alerts.extend(events)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._subscriptions and self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(
+                self.config.coalesce_seconds, lambda: asyncio.ensure_future(self._flush()))
+
+    def _resync(self):
+        """取りこぼした可能性があるため、差分の基準を捨てて全クライアントに取得し直しを促す"""
+        self._sent.clear()
+        message = format_event("resync", {})
+        for subscription in list(self._subscriptions):
+            self._deliver(subscription, message, "resync")
+
+    async def _flush(self):
+        async with self._flush_lock:
+            self._flush_handle = None
+            pending, alerts = self._pending, self._pending_alerts
+            self._pending, self._pending_alerts = {}, []
+            subscriptions = list(self._subscriptions)
+            if not subscriptions:
+                return
+            try:
+                rows = await self._changed_rows(pending, subscriptions)
+            except Exception as e:
+                logger.exception(f"指標の更新の読み込みでエラー: {str(e)}")
+                return
+            by_symbol = {timeframe: {row["symbol"]: row for row in timeframe_rows}
+                         for timeframe, timeframe_rows in rows.items()}
+            alerts_by_symbol: Dict[str, List[Dict]] = {}
+            for event in alerts:
+                alerts_by_symbol.setdefault(event.get("symbol"), []).append(event)
+            # 同じ銘柄・時間軸の購読 (全銘柄、同じページを表示中のクライアントなど) には同じメッセージを送る
+            messages: Dict[tuple, Optional[str]] = {}
+            for subscription in subscriptions:
+                key = (subscription.symbols, subscription.timeframes)
+                if key not in messages:
+                    messages[key] = self._message(subscription, rows, by_symbol, alerts, alerts_by_symbol)
+                if messages[key] is not None:
+                    self._deliver(subscription, messages[key], "update")
+
+    def _message(self, subscription: Subscription, rows: Dict[str, List[Dict]], by_symbol: Dict[str, Dict],
+                 alerts: List[Dict], alerts_by_symbol: Dict[str, List[Dict]]) -> Optional[str]:
+        """購読する銘柄・時間軸の分だけを取り出したメッセージ (無ければ None)。購読する銘柄の側から引く"""
+        indicators = {}
+        for timeframe in sorted(subscription.timeframes & rows.keys()):
+            if subscription.symbols is None:
+                values = rows[timeframe]
+            else:
+                values = [by_symbol[timeframe][symbol] for symbol in subscription.sorted_symbols
+                          if symbol in by_symbol[timeframe]]
+            if values:
+                indicators[timeframe] = values
+        if subscription.symbols is not None:
+            alerts = [event for symbol in subscription.sorted_symbols for event in alerts_by_symbol.get(symbol, ())]
+        events = [event for event in alerts if event.get("timeframe", "daily") in subscription.timeframes]
+        if not indicators and not events:
+            return None
+        return format_event("update", {"indicators": indicators, "alerts": events}, next(self._ids))
+
+    async def _changed_rows(self, pending: Dict[str, Set[str]],
+                            subscriptions: List[Subscription]) -> Dict[str, List[Dict]]:
+        """通知された銘柄のうち、購読されていて前回配信した値から変わった最新行"""
+        changed = {}
+        for timeframe, symbols in pending.items():
+            subscribers = [s for s in subscriptions if timeframe in s.timeframes]
+            if not subscribers:
+                continue
+            if all(s.symbols is not None for s in subscribers):
+                symbols = symbols & frozenset().union(*(s.symbols for s in subscribers))
+            if not symbols:
+                continue
+            rows = await asyncio.to_thread(load_latest_rows, self._engine or get_db_engine(), timeframe, symbols)
+            changed[timeframe] = []
+            for row in rows:
+                key = (timeframe, row["symbol"])
+                if self._sent.get(key) != row:
+                    self._sent[key] = row
+                    changed[timeframe].append(row)
+        return changed
+
+    def _deliver(self, subscription: Subscription, message: str, event: str):
+        if subscription.dropped:
+            return
+        try:
+            subscription.queue.put_nowait(message)
+            STREAM_MESSAGES.inc(event=event)
+        except asyncio.QueueFull:
+            self._drop(subscription)
+
+    def _drop(self, subscription: Subscription):
+        """受信が追いつかないクライアントの送信待ちを捨て、dropped を送って切断する"""
+        subscription.dropped = True
+        self.unsubscribe(subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+        STREAM_CLIENTS_DROPPED.inc()
+        logger.warning(f"受信が追いつかないクライアントを切断しました (送信待ち {self.config.buffer_size}件)")
+
+indicator_stream = IndicatorStream()
+invalidation_bus.register(indicator_stream.on_invalidation, INDICATORS_UPDATED)
@@ -1,6 +1,11 @@
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 
+class EnsembleBranch(BaseModel):
+    """アンサンブル実行の1ブランチ (エージェントタイプとプロンプトの組)"""
+    agent_type: str = "direct"
+    prompt_id: Optional[int] = None
+
 class RecommendationRequest(BaseModel):
     principal: float
     risk_tolerance: str     # 例: "低", "中", "高"
@@ -9,11 +14,22 @@ class RecommendationRequest(BaseModel):
     search: Optional[str] = None        # 検索条件（追加）
     industries: Optional[List[str]] = None  # 業種コードリスト（オプション）
     scales: Optional[List[str]] = None     # 規模コードリスト（オプション）
-    technical_filters: Optional[dict] = None
+    technical_filters: Optional[dict] = None  # 例: {"rsi": ["<", 30], "golden_cross": true, "momentum_industry_rank": [">=", 80]}
+    timeframe: Optional[str] = "daily"  # テクニカル指標の時間軸 ("daily", "weekly", "monthly")
     agent_type: str = "direct"  # デフォルト値
     prompt_id: Optional[int] = None  # プロンプトテンプレートID
     optimizer_prompt_id: Optional[int] = None  # 最適化プロンプトID
     evaluation_prompt_id: Optional[int] = None  # 評価プロンプトID
+    prompt_encoding: Optional[str] = None  # プロンプトデータ形式 ("table", "compact", "summary")
+    prompt_token_budget: Optional[int] = None  # プロンプトデータのトークン予算
+    ensemble_branches: Optional[List[EnsembleBranch]] = None  # アンサンブル対象ブランチ（agent_type="ensemble"時）
+    ensemble_quorum: Optional[int] = None  # 統合に必要な有効結果数
+    branch_timeout: Optional[float] = None  # ブランチごとのデッドライン(秒)
+    max_wall_time: Optional[float] = None  # 評価-最適化ループの最大実行時間(秒)（mcpagent）
+    max_tokens: Optional[int] = None  # 評価-最適化ループの最大トークン数（mcpagent）
+    max_rounds: Optional[int] = None  # 評価-最適化ループの最大ラウンド数（mcpagent）
+    optimizer_method: Optional[str] = None  # 配分方法 ("mean_variance", "risk_parity", "inverse_volatility")（quant）
+    prefilter_top: Optional[int] = None  # LLMに渡す前に数値最適化で候補銘柄を絞り込む銘柄数
 
 class SelectedRecommendationRequest(RecommendationRequest):
     selected_symbols: List[str]
@@ -46,6 +62,7 @@ class GetStocksParams(BaseModel):
     scale_code: Optional[str] = None
     sort_by: Optional[str] = "symbol"
     sort_order: Optional[str] = "asc"
+    timeframe: Optional[str] = "daily"  # テクニカル指標の時間軸 ("daily", "weekly", "monthly")
 
 class GetStocksResponse(BaseModel):
     """get_stocks エンドポイントのレスポンス型"""
@@ -53,3 +70,34 @@ class GetStocksResponse(BaseModel):
     total: int
     page: int
     limit: int
+
+class ProfilingSettingsRequest(BaseModel):
+    """プロファイリング設定の変更リクエスト (指定した項目のみ更新)"""
+    sample_rate: Optional[float] = None  # ヘッダ無しのリクエストをプロファイルする割合（0で無効）
+    mode: Optional[str] = None  # cprofile / sampling
+    header_enabled: Optional[bool] = None  # X-Profile ヘッダによる指定を受け付けるか
+    interval: Optional[float] = None  # 統計的プロファイルのサンプリング間隔(秒)
+
+class BacktestRequest(BaseModel):
+    """バックテストのリクエスト"""
+    strategy: str = "golden_cross"  # golden_cross / macd_score / rsi
+    symbols: Optional[List[str]] = None  # 対象銘柄（未指定なら全銘柄）
+    start_date: Optional[str] = None  # 開始日 (YYYY-MM-DD、未指定なら終了日の BACKTEST_MAX_YEARS 年前)
+    end_date: Optional[str] = None  # 終了日 (YYYY-MM-DD)
+    timeframe: Optional[str] = "daily"  # 時間軸 ("daily", "weekly", "monthly")
+    cost_bps: float = 10.0  # 片道の取引コスト(bps)
+    execution: str = "next_open"  # 約定価格 ("next_open": 次の足の始値, "close": シグナルの足の終値)
+    params: Optional[Dict[str, Any]] = None  # 戦略・指標のパラメータ（例: {"cross_short": 5, "rsi_lower": 25}）
+    top: int = 20  # 上位・下位銘柄の件数
+
+class AlertRuleRequest(BaseModel):
+    """アラートのルールの作成・更新リクエスト"""
+    name: Optional[str] = None  # 未指定なら条件から生成
+    indicator: str  # rsi / macd_score / golden_cross / dead_cross
+    condition: str  # above / below / crosses_above / crosses_below（数値の指標）、occurs（golden_cross / dead_cross）
+    threshold: Optional[float] = None  # 数値の指標の閾値
+    timeframe: str = "daily"  # 評価する時間軸 ("daily", "weekly", "monthly")
+    symbols: Optional[List[str]] = None  # 対象銘柄（未指定なら全銘柄）
+    industry_code: Optional[str] = None  # 対象の33業種コード
+    scale_code: Optional[str] = None  # 対象の規模コード
+    enabled: bool = True
@@ -0,0 +1,248 @@
+"""
+キャッシュの無効化イベント (ワーカー間)
+
+データを書き込むバッチ・エンドポイントは型付きのイベントを NOTIFY で発行し (書き込みと同じトランザクションで、
+コミット時に配信される)、各APIワーカーは InvalidationBus で受信して、登録されたキャッシュから
+影響のあるキーだけを破棄する。チャネル名はイベントの種類と同じ。
+
+  stocks_updated      銘柄情報の取り込み (batch/stock_symbol_importer.py)       symbols
+  prices_updated      株価の取り込み (stock_prices.store_price_history)          symbols, min_date, max_date
+  indicators_updated  指標の保存 (technical_indicators.batch_store_indicators)   symbols, timeframe
+  prompts_changed     プロンプトテンプレートの作成・更新・削除 (/api/prompts)     id
+
+symbols の無いイベントと、LISTEN の再接続 (切断中の通知を取りこぼした可能性がある) ではキャッシュ全体を破棄する。
+取りこぼしは再接続時の破棄で補うため、キャッシュの TTL は長くしてよい (CACHE_TTL)。
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set
+
+from bar_aggregates import TIMEFRAMES
+from metrics import record_cache_lookup
+from partitions import _as_date
+from pg_listener import NOTIFY_PAYLOAD_LIMIT, PgListener, notify, payload_chunks
+
+logger = logging.getLogger(__name__)
+
+STOCKS_UPDATED = "stocks_updated"
+PRICES_UPDATED = "prices_updated"
+INDICATORS_UPDATED = "indicators_updated"
+PROMPTS_CHANGED = "prompts_changed"
+EVENT_TYPES = (STOCKS_UPDATED, PRICES_UPDATED, INDICATORS_UPDATED, PROMPTS_CHANGED)
+
+# LISTEN の再接続時にハンドラに渡すイベント (全体を破棄させる)
+RESET = "reset"
+
+# 指標テーブル名 → 時間軸
+_TIMEFRAME_BY_TABLE = {config["indicators"]: timeframe for timeframe, config in TIMEFRAMES.items()}
+
+@dataclass(frozen=True)
+class InvalidationEvent:
+    """無効化イベント (symbols が None なら全銘柄)"""
+    type: str
+    symbols: Optional[FrozenSet[str]] = None
+    min_date: Optional[date] = None
+    max_date: Optional[date] = None
+    timeframe: Optional[str] = None
+    id: Optional[int] = None
+
+    def affects(self, symbols: Optional[Iterable[str]]) -> bool:
+        """symbols (None は全銘柄に依存) に関係するか"""
+        if self.symbols is None or symbols is None:
+            return True
+        return not self.symbols.isdisjoint(symbols)
+
+    @classmethod
+    def from_payload(cls, event_type: str, payload: Optional[str]) -> "InvalidationEvent":
+        data = json.loads(payload) if payload else {}
+        symbols = data.get("symbols")
+        return cls(
+            type=event_type,
+            symbols=frozenset(symbols) if symbols is not None else None,
+            min_date=_as_date(data["min_date"]) if data.get("min_date") else None,
+            max_date=_as_date(data["max_date"]) if data.get("max_date") else None,
+            timeframe=data.get("timeframe"),
+            id=data.get("id"),
+        )
+
+def publish(conn, event_type: str, symbols: Optional[Iterable[str]] = None, **fields):
+    """
+    イベントを発行する (コミット時に配信)。銘柄が多い場合は NOTIFY のペイロードに収まるように分割する
+
+    Args:
+        conn: SQLAlchemyのConnection・Session、またはpsycopg2のカーソル
+        symbols: 影響する銘柄 (None は全銘柄)
+
+    Raises:
+        ValueError: 未対応のイベント
+    """
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"未対応の無効化イベント: {event_type}")
+    fields = {key: str(value) if isinstance(value, date) else value
+              for key, value in fields.items() if value is not None}
+    if symbols is None:
+        notify(conn, event_type, fields)
+        return
+    overhead = len(json.dumps(fields, ensure_ascii=False)) + len('"symbols": []')
+    for chunk in payload_chunks(sorted(set(symbols)), NOTIFY_PAYLOAD_LIMIT - overhead):
+        notify(conn, event_type, {**fields, "symbols": chunk})
+
+def publish_stocks_updated(conn, symbols: Optional[Iterable[str]] = None):
+    publish(conn, STOCKS_UPDATED, symbols)
+
+def publish_prices_updated(conn, symbols: Iterable[str], max_date, min_date=None):
+    publish(conn, PRICES_UPDATED, symbols, max_date=_as_date(max_date),
+            min_date=_as_date(min_date) if min_date is not None else None)
+
+def publish_indicators_updated(conn, symbols: Iterable[str], table: str = "technical_indicators"):
+    publish(conn, INDICATORS_UPDATED, symbols, timeframe=_TIMEFRAME_BY_TABLE.get(table, table))
+
+def publish_prompts_changed(conn, prompt_id: Optional[int] = None):
+    publish(conn, PROMPTS_CHANGED, id=prompt_id)
+
+class InvalidationBus:
+    """
+    無効化イベントの受信と、キャッシュ (ハンドラ) への振り分け (APIワーカーごとに1つ)
+
+    ハンドラは PgListener のスレッドから呼ばれる。エンドポイント自身の書き込みは dispatch() で
+    即座に反映する (自ワーカーにも NOTIFY は届くが、コミット直後の読み込みに間に合わせるため)。
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[InvalidationEvent], None]]] = {}
+
+    def register(self, handler: Callable[[InvalidationEvent], None], *event_types: str):
+        """ハンドラを登録する (attach() より前に呼ぶ)。LISTEN の再接続時には RESET のイベントで呼ばれる"""
+        for event_type in event_types:
+            if event_type not in EVENT_TYPES:
+                raise ValueError(f"未対応の無効化イベント: {event_type}")
+            self._handlers.setdefault(event_type, []).append(handler)
+
+    def attach(self, listener: PgListener):
+        """PgListener にイベントのチャネルを登録する (listener.start() より前に呼ぶ)"""
+        for i, event_type in enumerate(self._handlers):
+            listener.subscribe(event_type, self._on_notify, on_reconnect=self.reset if i == 0 else None)
+
+    def dispatch(self, event: InvalidationEvent):
+        for handler in self._handlers.get(event.type, []):
+            try:
+                handler(event)
+            except Exception as e:
+                logger.exception(f"無効化ハンドラでエラー: {event.type}, {str(e)}")
+
+    def reset(self):
+        """登録されたすべてのキャッシュを破棄する"""
+        event = InvalidationEvent(RESET)
+        handlers = {id(h): h for handlers in self._handlers.values() for h in handlers}
+        for handler in handlers.values():
+            try:
+                handler(event)
+            except Exception as e:
+                logger.exception(f"無効化ハンドラでエラー: {RESET}, {str(e)}")
+        logger.info(f"キャッシュをすべて破棄しました ({len(handlers)}件)")
+
+    def _on_notify(self, channel: str, payload: str):
+        self.dispatch(InvalidationEvent.from_payload(channel, payload))
+
+invalidation_bus = InvalidationBus()
+
+@dataclass
+class CacheConfig:
+    """レスポンスキャッシュの設定 (環境変数)"""
+    ttl: float = 86400.0
+    chart_size: int = 200
+
+    @classmethod
+    def from_env(cls) -> "CacheConfig":
+        return cls(
+            ttl=float(os.getenv("CACHE_TTL", "86400")),
+            chart_size=int(os.getenv("CHART_CACHE_SIZE", "200")),
+        )
+
+class TaggedCache:
+    """
+    銘柄のタグ付きのプロセス内キャッシュ (LRU + TTL)
+
+    put() で値が依存する銘柄を指定しておくと、invalidate(event) はイベントの銘柄に関係するキーだけを破棄する。
+    銘柄を指定しない値は全銘柄に依存するものとして、対象のイベントがあれば常に破棄する。
+    """
+
+    def __init__(self, name: str, ttl: float = None, size: int = 1000):
+        self.name = name
+        self.ttl = CacheConfig.from_env().ttl if ttl is None else ttl
+        self.size = size
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._keys_by_symbol: Dict[str, Set[Hashable]] = {}
+        self._untagged: Set[Hashable] = set()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.monotonic() - entry[2] > self.ttl:
+                self._evict(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache_lookup(self.name, hit=entry is not None)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: Hashable, value: Any, symbols: Optional[Iterable[str]] = None):
+        if self.size <= 0:
+            return
+        tags = frozenset(symbols) if symbols is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (value, tags, time.monotonic())
+            if tags is None:
+                self._untagged.add(key)
+            else:
+                for symbol in tags:
+                    self._keys_by_symbol.setdefault(symbol, set()).add(key)
+            while len(self._entries) > self.size:
+                self._evict(next(iter(self._entries)))
+
+    def invalidate(self, event: Optional[InvalidationEvent] = None) -> int:
+        """イベントの銘柄に関係するキーを破棄する (event が None、または銘柄の無いイベントは全体)。破棄した件数を返す"""
+        with self._lock:
+            if event is None or event.symbols is None:
+                count = len(self._entries)
+                self._clear()
+                return count
+            keys = set(self._untagged)
+            for symbol in event.symbols:
+                keys |= self._keys_by_symbol.get(symbol, set())
+            for key in keys:
+                self._evict(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _clear(self):
+        self._entries.clear()
+        self._keys_by_symbol.clear()
+        self._untagged.clear()
+
+    def _evict(self, key: Hashable):
+        _, tags, _ = self._entries.pop(key)
+        if tags is None:
+            self._untagged.discard(key)
+            return
+        for symbol in tags:
+            keys = self._keys_by_symbol.get(symbol)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_symbol[symbol]
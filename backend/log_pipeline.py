@@ -0,0 +1,147 @@
+"""
+キュー経由の非同期ロギング
+
+ロガーにはキューへ積むだけの QueueHandler を付け、ファイル・標準エラーへの書き込みは
+QueueListener のバックグラウンドスレッドで行う。リクエスト処理スレッドはディスクや
+パイプの書き込み待ちでブロックしない。キューが満杯のときは待たずに破棄して件数を数える。
+
+大きなペイロード (プロンプト全文、銘柄データ、LLMの生レスポンス等) は LOG_MAX_MESSAGE_CHARS で
+切り詰め、LOG_FULL_PAYLOAD_SAMPLE_RATE の割合だけ全文を残す。LOG_FORMAT=json で
+1行1レコードのJSON出力 (ログ基盤への取り込み用) に切り替えられる。
+"""
+import os
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from metrics import LOG_RECORDS_DROPPED, LOG_PAYLOADS_TRUNCATED
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(funcName)s:%(lineno)d] - %(message)s'
+
+# LogRecord の標準属性 (これ以外は extra として JSON に出力する)
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+class PayloadLimitFilter(logging.Filter):
+    """
+    長すぎるメッセージを切り詰めるフィルタ
+
+    ロガーを呼び出したスレッドで実行され、メッセージを確定 (args を展開) した上で
+    max_chars を超える部分を省略する。sample_rate の割合のレコードは切り詰めずに残す。
+    """
+
+    def __init__(self, max_chars: int = 2000, sample_rate: float = 0.0):
+        super().__init__()
+        self.max_chars = max_chars
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.max_chars <= 0:
+            return True
+        message = record.getMessage()
+        if len(message) > self.max_chars and random.random() >= self.sample_rate:
+            omitted = len(message) - self.max_chars
+            message = f"{message[:self.max_chars]}...(省略 {omitted}文字)"
+            LOG_PAYLOADS_TRUNCATED.inc()
+        record.msg = message
+        record.args = None
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSON形式 (extra で渡した項目もそのまま出力する)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "func": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """キューが満杯なら待たずに破棄する QueueHandler"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # メッセージと例外のトレースバックは呼び出し元スレッドで文字列化しておく
+        # (args や exc_info をスレッドを跨いで渡さない)
+        prepared = copy.copy(record)
+        prepared.msg = record.getMessage()
+        prepared.args = None
+        if record.exc_info and not record.exc_text:
+            prepared.exc_text = logging.Formatter().formatException(record.exc_info)
+        prepared.exc_info = None
+        return prepared
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def _build_handlers(log_file: str, formatter: logging.Formatter) -> List[logging.Handler]:
+    handlers = []
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+def configure_logging(log_file: str) -> None:
+    """
+    ルートロガーを設定する (LOG_* 環境変数を参照)
+
+    Args:
+        log_file: ログファイルのパス (空文字ならファイルには出力しない)
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "DEBUG").upper())
+    formatter = JsonFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = _build_handlers(log_file, formatter)
+    payload_filter = PayloadLimitFilter(int(os.getenv("LOG_MAX_MESSAGE_CHARS", 2000)),
+                                        float(os.getenv("LOG_FULL_PAYLOAD_SAMPLE_RATE", 0)))
+
+    if not _env_bool("LOG_ASYNC", True):
+        for handler in handlers:
+            handler.addFilter(payload_filter)
+            root.addHandler(handler)
+        return
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(payload_filter)
+    root.addHandler(queue_handler)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """キューに残ったログを書き出してバックグラウンドスレッドを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
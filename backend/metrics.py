@@ -0,0 +1,408 @@
+"""
+Prometheus形式のメトリクス
+
+外部ライブラリに依存しない最小限のカウンタ/ゲージ/ヒストグラムと、
+テキスト形式 (text/plain; version=0.0.4) での出力を提供する。
+APIは /metrics で公開し、バッチは node_exporter の textfile collector 向けに
+METRICS_TEXTFILE_DIR へ <ジョブ名>.prom を書き出す。
+"""
+import os
+import time
+import random
+import logging
+import threading
+import contextlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# レイテンシ用の既定バケット (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ラベルが一致しません (期待値: {self.labelnames}, 指定: {tuple(labels)})")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+class Counter(_Metric):
+    """単調増加するカウンタ"""
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+class Gauge(_Metric):
+    """任意に増減する値。set_function で出力時に値を計算することもできる"""
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_function(self, function: Callable[[], float], **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.debug(f"{self.name}: 値の取得に失敗: {str(e)}")
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in sorted(values.items()) if v is not None]
+
+class Histogram(_Metric):
+    """累積バケット付きのヒストグラム"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [バケット別件数..., 合計, 件数]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """with ブロックの所要時間を記録する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """メトリクスの登録先。同名のメトリクスは既存のものを返す"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} は別の種類のメトリクスとして登録済みです")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式で出力"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str):
+        """textfile collector 向けにファイルへ書き出す (読み込み途中のファイルを見せないよう置き換え)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+# API プロセス全体で共有するレジストリ
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTPリクエスト数", ["method", "route", "status"])
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTPリクエストの処理時間", ["method", "route"])
+
+DB_QUERY_DURATION = REGISTRY.histogram(
+    "db_query_duration_seconds", "SQLの実行時間", ["operation"])
+DB_SLOW_QUERIES = REGISTRY.counter(
+    "db_slow_queries_total", "DB_SLOW_QUERY_MS を超えたSQLの件数", ["operation"])
+DB_POOL_CHECKOUT_WAIT = REGISTRY.histogram(
+    "db_pool_checkout_wait_seconds", "接続プールからの接続取得待ち時間", ["pool"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+DB_POOL_CHECKED_OUT = REGISTRY.gauge(
+    "db_pool_connections_checked_out", "使用中のプール接続数", ["pool"])
+
+CHART_RENDER_DURATION = REGISTRY.histogram(
+    "chart_render_duration_seconds", "チャート画像の描画時間")
+
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "llm_request_duration_seconds", "LLM呼び出しの所要時間", ["recommender", "status"])
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "LLMのトークン数 (usageが無い場合は概算値)", ["recommender", "type"])
+RECOMMENDATION_DURATION = REGISTRY.histogram(
+    "recommendation_duration_seconds", "推奨生成全体の所要時間", ["agent_type", "status"])
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "cache_requests_total", "キャッシュ参照数", ["cache", "result"])
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "cache_hit_ratio", "キャッシュヒット率 (プロセス起動後の累計)", ["cache"])
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "log_records_dropped_total", "ログキューが満杯で破棄したログレコード数")
+LOG_PAYLOADS_TRUNCATED = REGISTRY.counter(
+    "log_payloads_truncated_total", "LOG_MAX_MESSAGE_CHARS を超えて切り詰めたログメッセージ数")
+
+_hit_ratio_caches = set()
+
+def record_cache_lookup(cache: str, hit: bool):
+    """キャッシュ参照を記録し、ヒット率ゲージを登録する"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    if cache not in _hit_ratio_caches:
+        _hit_ratio_caches.add(cache)
+        def ratio():
+            hits = CACHE_REQUESTS.value(cache=cache, result="hit")
+            total = hits + CACHE_REQUESTS.value(cache=cache, result="miss")
+            return hits / total if total else None
+        CACHE_HIT_RATIO.set_function(ratio, cache=cache)
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+def _sql_operation(statement: str) -> str:
+    words = statement.lstrip().split(None, 1)
+    operation = words[0].upper() if words else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+def instrument_engine(engine):
+    """SQLAlchemyエンジンにクエリ時間・スロークエリ・プール使用数の計測を仕掛ける
+
+    DB_SLOW_QUERY_MS (既定500) を超えたSQLは DB_SLOW_QUERY_SAMPLE_RATE (既定1.0) の
+    割合で本文をWARNINGログに出力する。
+    """
+    from sqlalchemy import event
+
+    slow_ms = float(os.getenv("DB_SLOW_QUERY_MS", 500))
+    sample_rate = float(os.getenv("DB_SLOW_QUERY_SAMPLE_RATE", 1.0))
+    pool_name = engine.url.database or "default"
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        operation = _sql_operation(statement)
+        DB_QUERY_DURATION.observe(elapsed, operation=operation)
+        if elapsed * 1000 >= slow_ms:
+            DB_SLOW_QUERIES.inc(operation=operation)
+            if random.random() < sample_rate:
+                logger.warning(f"スロークエリ ({elapsed * 1000:.0f}ms): {' '.join(statement.split())[:500]}")
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    DB_POOL_CHECKED_OUT.set_function(engine.pool.checkedout, pool=pool_name)
+    if hasattr(engine.pool, "pool_name"):
+        engine.pool.pool_name = pool_name
+    return engine
+
+def _instrumented_pool_class():
+    from sqlalchemy.pool import QueuePool
+
+    class InstrumentedQueuePool(QueuePool):
+        """接続取得の待ち時間を計測する QueuePool"""
+        pool_name = "default"
+
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start, pool=self.pool_name)
+
+        def recreate(self):
+            pool = super().recreate()
+            pool.pool_name = self.pool_name
+            return pool
+
+    return InstrumentedQueuePool
+
+_pool_class = None
+
+def instrumented_pool_class():
+    """create_engine の poolclass に渡すクラス"""
+    global _pool_class
+    if _pool_class is None:
+        _pool_class = _instrumented_pool_class()
+    return _pool_class
+
+class BatchMetrics:
+    """バッチジョブのステージ別処理時間・銘柄別スループットを textfile collector 形式で出力する
+
+    Args:
+        job: ジョブ名 (出力ファイル名とjobラベルに使用)
+        path: 出力先ファイル。未指定の場合は METRICS_TEXTFILE_DIR/<job>.prom
+            (環境変数も未設定なら書き出さない)
+    """
+
+    def __init__(self, job: str, path: Optional[str] = None):
+        self.job = job
+        directory = os.getenv("METRICS_TEXTFILE_DIR")
+        self.path = path or (os.path.join(directory, f"{job}.prom") if directory else None)
+        self.registry = MetricsRegistry()
+        self.started_at = time.time()
+        self.stage_duration = self.registry.histogram(
+            "batch_stage_duration_seconds", "ステージごとの処理時間", ["job", "stage"])
+        self.stage_symbols = self.registry.counter(
+            "batch_stage_symbols_total", "ステージで処理した銘柄数", ["job", "stage"])
+        self.stage_throughput = self.registry.gauge(
+            "batch_stage_symbols_per_second", "ステージの銘柄スループット (銘柄数 / ステージ累計時間)",
+            ["job", "stage"])
+        self.symbols = self.registry.counter(
+            "batch_symbols_total", "銘柄ごとの処理結果", ["job", "result"])
+        self.rows = self.registry.counter(
+            "batch_rows_written_total", "書き込んだ行数", ["job", "table"])
+        self.run_duration = self.registry.gauge(
+            "batch_run_duration_seconds", "ジョブ開始からの経過時間", ["job"])
+        self.last_success = self.registry.gauge(
+            "batch_last_success_timestamp_seconds", "最後に正常終了した時刻", ["job"])
+        self.registry.gauge("batch_start_timestamp_seconds", "ジョブ開始時刻", ["job"]).set(
+            self.started_at, job=job)
+        self._stage_totals: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe_stage(self, name: str, seconds: float, symbols: int = 1):
+        """ステージの処理時間と処理銘柄数を記録する"""
+        self.stage_duration.observe(seconds, job=self.job, stage=name)
+        self.stage_symbols.inc(symbols, job=self.job, stage=name)
+        with self._lock:
+            total = self._stage_totals[name] = self._stage_totals.get(name, 0.0) + seconds
+        if total > 0:
+            self.stage_throughput.set(
+                self.stage_symbols.value(job=self.job, stage=name) / total, job=self.job, stage=name)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, symbols: int = 1):
+        """with ブロックをステージとして計測する"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - start, symbols)
+
+    def symbol_result(self, result: str, count: int = 1):
+        """銘柄単位の結果 (ok / skipped / empty / error など) を記録する"""
+        self.symbols.inc(count, job=self.job, result=result)
+
+    def rows_written(self, table: str, count: int):
+        self.rows.inc(count, job=self.job, table=table)
+
+    def write(self, success: Optional[bool] = None):
+        """メトリクスを書き出す (途中経過の出力にも使える)"""
+        if not self.path:
+            return
+        self.run_duration.set(round(time.time() - self.started_at, 3), job=self.job)
+        if success:
+            self.last_success.set(time.time(), job=self.job)
+        try:
+            self.registry.write_textfile(self.path)
+        except OSError as e:
+            logger.warning(f"メトリクスファイルの書き出しに失敗: {self.path}: {str(e)}")
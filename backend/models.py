@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, Text, TIMESTAMP, text
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import Column, Integer, String, DECIMAL, Text, TIMESTAMP, LargeBinary, text
+from sqlalchemy.orm import deferred
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -22,8 +23,13 @@ class RecommendationSession(Base):
     strategy = Column(String(50), nullable=False)
     symbols = Column(ARRAY(String))
     technical_filter = Column(Text)
-    ai_raw_response = Column(Text)
+    # 数十KBになることがあるため、参照時まで読み込まない
+    ai_raw_response = deferred(Column(Text))
     total_return_estimate = Column(String(20))
+    execution_metrics = Column(JSONB)
+    prompt_id = Column(Integer)
+    agent_type = Column(String(20))
+    risk_metrics = Column(JSONB)
 
 class RecommendationResult(Base):
     """推奨結果モデル"""
@@ -37,6 +43,15 @@ class RecommendationResult(Base):
     confidence = Column(DECIMAL(5,4))
     reason = Column(Text)
 
+class RecommendationRawResponse(Base):
+    """AI生レスポンスの圧縮保存モデル (RAW_RESPONSE_STORAGE=compressed)"""
+    __tablename__ = 'recommendation_raw_responses'
+
+    session_id = Column(Integer, primary_key=True)
+    encoding = Column(String(10), nullable=False)
+    raw_size = Column(Integer, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+
 class PromptTemplate(Base):
     """プロンプトテンプレートモデル"""
     __tablename__ = 'prompt_templates'
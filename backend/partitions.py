@@ -0,0 +1,162 @@
+"""
+日付範囲パーティションの管理
+
+stock_prices / technical_indicators は date (日本時間の月単位または年単位) で範囲パーティション化されている
+(db/migrations/003_partition_price_tables.sql)。パーティションの作成は DB 関数 ensure_date_partitions() が行い、
+ここではその呼び出し、最新日の取得、古いパーティションの切り離し・アーカイブ・復元を提供する。
+"""
+import os
+import re
+import gzip
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("stock_prices", "technical_indicators")
+PARTITION_INTERVALS = ("month", "year")
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+def partition_interval() -> str:
+    """新規パーティションの粒度 (PARTITION_INTERVAL: month / year)"""
+    interval = os.getenv("PARTITION_INTERVAL", "month").lower()
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(f"PARTITION_INTERVAL は month または year を指定してください: {interval}")
+    return interval
+
+def _as_date(value) -> date:
+    """日時を日本時間の日付に変換 (タイムゾーン無しの日時は日本時間とみなす)"""
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("Asia/Tokyo")
+    return timestamp.date()
+
+def ensure_partitions(cursor, table: str, start, end) -> int:
+    """
+    start〜end の日付を含むパーティションを作成する (作成済みなら何もしない)
+
+    Args:
+        cursor: psycopg2 のカーソル (コミットは呼び出し元で行う)
+        table: 親テーブル名
+        start, end: 日付・日時 (タイムゾーン無しの日時は日本時間とみなす)
+
+    Returns:
+        int: 新たに作成したパーティション数
+    """
+    cursor.execute("SELECT ensure_date_partitions(%s, %s, %s, %s)",
+                   (table, _as_date(start), _as_date(end), partition_interval()))
+    created = cursor.fetchone()[0]
+    if created:
+        logger.info(f"{table} のパーティションを{created}件作成しました ({_as_date(start)}〜{_as_date(end)})")
+    return created
+
+def list_partitions(conn, table: str) -> List[Dict]:
+    """
+    パーティションの一覧 (範囲の新しい順)
+
+    Args:
+        conn: SQLAlchemy のコネクション
+
+    Returns:
+        list: name, lower, upper (タイムゾーン付き日時), rows (推定行数), bytes
+    """
+    result = conn.execute(text("""
+        SELECT c.relname AS name,
+               pg_get_expr(c.relpartbound, c.oid) AS bound,
+               GREATEST(c.reltuples, 0)::bigint AS rows,
+               pg_total_relation_size(c.oid) AS bytes
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table)
+    """), {"table": table})
+    partitions = []
+    for row in result.mappings():
+        match = _BOUND_PATTERN.search(row["bound"])
+        if not match:
+            continue
+        partitions.append({
+            "name": row["name"],
+            "lower": pd.Timestamp(match.group(1)),
+            "upper": pd.Timestamp(match.group(2)),
+            "rows": row["rows"],
+            "bytes": row["bytes"],
+        })
+    return sorted(partitions, key=lambda p: p["lower"], reverse=True)
+
+def latest_date(conn, table: str) -> Optional[datetime]:
+    """
+    テーブルの最新日時
+
+    全パーティションを走査する MAX(date) の代わりに、新しいパーティションから順に調べて
+    最初に見つかった値を返す。パーティション化されていないテーブルでは MAX(date) を返す。
+    """
+    partitions = list_partitions(conn, table)
+    if not partitions:
+        return conn.execute(text(f"SELECT MAX(date) FROM {table}")).scalar()
+    for partition in partitions:
+        latest = conn.execute(text(f'SELECT MAX(date) FROM "{partition["name"]}"')).scalar()
+        if latest is not None:
+            return latest
+    return None
+
+def archive_partition(raw_conn, table: str, partition: str, archive_dir: str,
+                      keep_table: bool = False) -> str:
+    """
+    パーティションを親テーブルから切り離し、gzip圧縮したCSVに書き出す
+
+    DETACH PARTITION ... CONCURRENTLY を使うため、実行中の参照・更新は止めなくてよい。
+    書き出しに失敗した場合も切り離したテーブルは残る (再実行または ATTACH PARTITION で戻せる)。
+
+    Args:
+        raw_conn: psycopg2 のコネクション (自動コミットに切り替えて使う)
+        keep_table: True なら書き出し後も切り離したテーブルを削除しない
+
+    Returns:
+        str: 書き出したファイルのパス
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{partition}.csv.gz")
+    autocommit = raw_conn.autocommit
+    raw_conn.autocommit = True
+    try:
+        with raw_conn.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {table} DETACH PARTITION "{partition}" CONCURRENTLY')
+            logger.info(f"{partition} を {table} から切り離しました")
+            tmp_path = f"{path}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                cursor.copy_expert(f'COPY "{partition}" TO STDOUT WITH (FORMAT csv, HEADER)', f)
+            os.replace(tmp_path, path)
+            if not keep_table:
+                cursor.execute(f'DROP TABLE "{partition}"')
+    finally:
+        raw_conn.autocommit = autocommit
+    logger.info(f"{partition} をアーカイブしました: {path}")
+    return path
+
+def restore_archive(raw_conn, table: str, path: str) -> int:
+    """
+    archive_partition で書き出したCSVを親テーブルに戻す (必要なパーティションは作成し、重複行は無視)
+
+    Returns:
+        int: 挿入した行数
+    """
+    with raw_conn.cursor() as cursor:
+        cursor.execute(f"CREATE TEMP TABLE restore_rows (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            cursor.copy_expert("COPY restore_rows FROM STDIN WITH (FORMAT csv, HEADER)", f)
+        cursor.execute("SELECT MIN(date), MAX(date) FROM restore_rows")
+        start, end = cursor.fetchone()
+        if start is None:
+            raw_conn.commit()
+            return 0
+        ensure_partitions(cursor, table, start, end)
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM restore_rows ON CONFLICT (symbol, date) DO NOTHING")
+        inserted = cursor.rowcount
+    raw_conn.commit()
+    logger.info(f"{path} から {table} に{inserted}行を復元しました")
+    return inserted
@@ -0,0 +1,135 @@
+import json
+import select
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import text
+from utils import get_db_engine, setup_backend_logger
+
+logger = setup_backend_logger(__name__)
+
+# NOTIFY のペイロードの上限 (8000バイト) に収まるように分割する
+NOTIFY_PAYLOAD_LIMIT = 7000
+
+def notify(conn, channel: str, payload=None):
+    """NOTIFYを発行する (トランザクション内で呼んだ場合はコミット時に配信される)
+
+    Args:
+        conn: SQLAlchemyのConnection・Session、またはpsycopg2のカーソル
+        channel: チャネル名
+        payload: 文字列、またはJSONに変換する値
+    """
+    if payload is not None and not isinstance(payload, str):
+        payload = json.dumps(payload, ensure_ascii=False, default=str)
+    if isinstance(conn, psycopg2.extensions.cursor):
+        conn.execute("SELECT pg_notify(%s, %s)", (channel, payload or ""))
+        return
+    conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                 {"channel": channel, "payload": payload or ""})
+
+def payload_chunks(items: Iterable, limit: int = NOTIFY_PAYLOAD_LIMIT) -> Iterable[List]:
+    """JSONにしたときに limit バイト以内に収まるように items を分割する"""
+    chunk, size = [], 0
+    for item in items:
+        length = len(json.dumps(item, ensure_ascii=False, default=str).encode("utf-8")) + 2
+        if chunk and size + length > limit:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += length
+    if chunk:
+        yield chunk
+
+class PgListener:
+    """PostgreSQLの LISTEN/NOTIFY を受信するバックグラウンドスレッド
+
+    接続プールとは別に専用の接続を1本張り、受信した通知をチャネルごとの
+    コールバック (channel, payload) に渡す。接続が切れた場合は再接続し、
+    切断中の通知を取りこぼした可能性があるため on_reconnect を呼ぶ。
+    """
+
+    def __init__(self, reconnect_interval: float = 5.0, poll_interval: float = 1.0):
+        self.reconnect_interval = reconnect_interval
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, List[Callable[[str, str], None]]] = {}
+        self._reconnect_handlers: List[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+
+    def subscribe(self, channel: str, handler: Callable[[str, str], None],
+                  on_reconnect: Callable[[], None] = None):
+        """チャネルのハンドラを登録 (start() より前に呼ぶ)"""
+        self._handlers.setdefault(channel, []).append(handler)
+        if on_reconnect is not None:
+            self._reconnect_handlers.append(on_reconnect)
+
+    @property
+    def channels(self) -> List[str]:
+        return list(self._handlers)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+        self._thread.start()
+        logger.info(f"LISTENを開始: {self.channels}")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._close()
+
+    def _connect(self):
+        url = get_db_engine().url
+        conn = psycopg2.connect(connect_timeout=10,
+                                **url.translate_connect_args(username="user", database="dbname"))
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            for channel in self._handlers:
+                cur.execute(f'LISTEN "{channel}"')
+        return conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _dispatch(self, channel: str, payload: str):
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(channel, payload)
+            except Exception as e:
+                logger.exception(f"NOTIFYハンドラでエラー: channel={channel}, {str(e)}")
+
+    def _run(self):
+        first = True
+        while not self._stop.is_set():
+            try:
+                self._conn = self._connect()
+                if not first:
+                    logger.info("LISTEN接続を再確立しました")
+                    for handler in self._reconnect_handlers:
+                        handler()
+                first = False
+                while not self._stop.is_set():
+                    if select.select([self._conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    self._conn.poll()
+                    while self._conn.notifies:
+                        notification = self._conn.notifies.pop(0)
+                        self._dispatch(notification.channel, notification.payload)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logger.warning(f"LISTEN接続エラー、{self.reconnect_interval}秒後に再接続: {str(e)}")
+                first = False
+                self._close()
+                self._stop.wait(self.reconnect_interval)
+        self._close()
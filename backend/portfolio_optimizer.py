@@ -0,0 +1,278 @@
+"""
+ポートフォリオの配分最適化
+
+portfolio_risk の共分散ブロック (Ledoit-Wolf 縮小推定) と期待リターンから、選択銘柄の配分を数値最適化で求める。
+LLM を使わないため決定的で、数百銘柄でも1秒未満で返る (aiagent.quant_recommender から使う)。
+
+  mean_variance       期待リターン − リスク回避度/2 × 分散 を最大化 (0 ≤ 比率 ≤ 1銘柄の上限、合計1)
+  risk_parity         各銘柄のリスク寄与が等しくなる配分
+  inverse_volatility  ボラティリティの逆数に比例する配分をシグナル (MACDスコア・RSI) で傾ける
+
+リスク許容度 (risk_tolerance) はリスク回避度・1銘柄の上限・シグナルの強さ・最大銘柄数に対応させ (RISK_PROFILES)、
+元金 (principal) は単元株 (100株) を買えない銘柄を除いて配分し直すのに使う。
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+
+from backtest import PERIODS_PER_YEAR
+from portfolio_risk import CovarianceBlock
+
+METHODS = ("mean_variance", "risk_parity", "inverse_volatility")
+
+# 単元株数
+LOT_SIZE = 100
+
+# 期待リターン (期間の平均リターン) を全銘柄の平均へ縮小する割合
+MEAN_SHRINKAGE = 0.5
+
+# これ未満の比率の銘柄は配分しない
+MIN_WEIGHT = 0.005
+
+# 銘柄を除いて最適化し直す最大回数
+MAX_ROUNDS = 20
+
+@dataclass
+class RiskProfile:
+    """リスク許容度ごとの最適化の設定"""
+    risk_aversion: float    # mean_variance のリスク回避度 (年率の分散に掛ける)
+    max_weight: float       # 1銘柄の上限
+    signal_strength: float  # シグナルで傾ける強さ
+    max_holdings: int       # 最大銘柄数
+
+RISK_PROFILES = {
+    "低": RiskProfile(risk_aversion=8.0, max_weight=0.10, signal_strength=0.25, max_holdings=20),
+    "中": RiskProfile(risk_aversion=4.0, max_weight=0.20, signal_strength=0.5, max_holdings=12),
+    "高": RiskProfile(risk_aversion=1.5, max_weight=0.35, signal_strength=1.0, max_holdings=8),
+}
+
+_RISK_ALIASES = {"low": "低", "medium": "中", "high": "高"}
+
+def risk_profile(risk_tolerance: Optional[str]) -> RiskProfile:
+    """リスク許容度 ("低" / "中" / "高"、low / medium / high も可) の設定 (不明なら "中")"""
+    key = str(risk_tolerance or "").strip()
+    key = _RISK_ALIASES.get(key.lower(), key)
+    return RISK_PROFILES.get(key, RISK_PROFILES["中"])
+
+def _zscore(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if finite.sum() < 2:
+        return np.zeros(len(values))
+    std = values[finite].std()
+    z = (values - values[finite].mean()) / std if std > 0 else np.zeros(len(values))
+    return np.where(finite, z, 0.0)
+
+def signal_scores(macd_score: np.ndarray, rsi: np.ndarray) -> np.ndarray:
+    """
+    テクニカル指標のシグナル (銘柄間で標準化、指標が無い銘柄は0)
+
+    MACDスコアが高いほど、RSI が買われすぎ (50超) から遠いほど高い。
+    """
+    rsi_component = np.clip(50.0 - np.asarray(rsi, dtype=np.float64), -50.0, 50.0)
+    return _zscore(_zscore(macd_score) + 0.5 * _zscore(rsi_component))
+
+def project_capped_simplex(v: np.ndarray, cap: float) -> np.ndarray:
+    """
+    {0 ≤ w ≤ cap, Σw = 1} へのユークリッド射影 w = clip(v − tau, 0, cap)
+
+    Σ clip(v − tau, 0, cap) は tau について区分線形なので、折れ点 (v と v − cap) での値を
+    累積和と二分探索でまとめて求め、1 をまたぐ区間で線形補間して tau を決める (O(n log n))。
+    """
+    n = len(v)
+    cap = max(cap, 1.0 / n)
+    values = np.sort(v)
+    cumsum = np.concatenate(([0.0], np.cumsum(values)))
+
+    def total(taus):
+        upper = np.searchsorted(values, taus + cap, side="right")
+        lower = np.searchsorted(values, taus, side="right")
+        return (n - upper) * cap + (cumsum[upper] - cumsum[lower]) - taus * (upper - lower)
+
+    breakpoints = np.unique(np.concatenate((values - cap, values)))
+    sums = total(breakpoints)
+    k = min(np.searchsorted(-sums, -1.0, side="right") - 1, len(breakpoints) - 2)
+    k = max(k, 0)
+    span = sums[k] - sums[k + 1]
+    tau = breakpoints[k] + ((sums[k] - 1.0) / span * (breakpoints[k + 1] - breakpoints[k]) if span > 0 else 0.0)
+    return np.clip(v - tau, 0.0, cap)
+
+def cap_weights(weights: np.ndarray, cap: float) -> np.ndarray:
+    """上限を超えた比率を上限に揃え、超過分を残りの銘柄へ比率に応じて配り直す"""
+    w = np.asarray(weights, dtype=np.float64) / np.sum(weights)
+    cap = max(cap, 1.0 / len(w))
+    capped = np.zeros(len(w), dtype=bool)
+    while True:
+        over = ~capped & (w > cap + 1e-12)
+        if not over.any():
+            return w
+        capped |= over
+        free = ~capped
+        w[capped] = cap
+        if free.any():
+            w[free] *= (1.0 - cap * capped.sum()) / w[free].sum()
+
+def _largest_eigenvalue(matrix: np.ndarray, iterations: int = 50) -> float:
+    x = np.full(len(matrix), 1.0 / np.sqrt(len(matrix)))
+    value = 0.0
+    for _ in range(iterations):
+        y = matrix @ x
+        value = float(np.linalg.norm(y))
+        if value == 0:
+            break
+        x = y / value
+    return value
+
+def mean_variance(mu: np.ndarray, cov: np.ndarray, risk_aversion: float, max_weight: float,
+                  iterations: int = 1000, tol: float = 1e-10) -> np.ndarray:
+    """
+    μ'w − λ/2 w'Σw の最大化 (0 ≤ w ≤ max_weight, Σw = 1)
+
+    加速付きの射影勾配法 (FISTA)。ステップ幅は λ × Σ の最大固有値の逆数。
+    """
+    n = len(mu)
+    lipschitz = risk_aversion * _largest_eigenvalue(cov) * 1.01
+    step = 1.0 / lipschitz if lipschitz > 0 else 1.0
+    w = project_capped_simplex(np.full(n, 1.0 / n), max_weight)
+    y, t = w.copy(), 1.0
+    for _ in range(iterations):
+        gradient = risk_aversion * (cov @ y) - mu
+        w_next = project_capped_simplex(y - step * gradient, max_weight)
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        y = w_next + (t - 1) / t_next * (w_next - w)
+        converged = np.abs(w_next - w).max() < tol
+        w, t = w_next, t_next
+        if converged:
+            break
+    return w
+
+def risk_parity(cov: np.ndarray, budget: Optional[np.ndarray] = None,
+                iterations: int = 100, tol: float = 1e-12) -> np.ndarray:
+    """
+    リスク寄与 w_i (Σw)_i / w'Σw が budget (既定は均等) に比例する配分
+
+    ½ y'Σy − Σ b_i log(y_i) (y > 0) を Newton 法で最小化し、w = y / Σy とする (Spinu の凸定式化)。
+    """
+    n = len(cov)
+    b = np.full(n, 1.0 / n) if budget is None else np.asarray(budget, dtype=np.float64) / np.sum(budget)
+    y = 1.0 / np.sqrt(np.diag(cov))
+    y *= np.sqrt(1.0 / (y @ cov @ y))
+    for _ in range(iterations):
+        gradient = cov @ y - b / y
+        if np.abs(gradient).max() < tol:
+            break
+        direction = np.linalg.solve(cov + np.diag(b / y ** 2), gradient)
+        # y が正のままになるようにステップを縮める
+        ratio = direction / y
+        step = min(1.0, 0.95 / ratio.max()) if ratio.max() > 0 else 1.0
+        y = y - step * direction
+    return y / y.sum()
+
+def inverse_volatility(cov: np.ndarray, scores: np.ndarray, signal_strength: float,
+                       max_weight: float) -> np.ndarray:
+    """ボラティリティの逆数 × exp(シグナルの強さ × シグナル) に比例する配分 (1銘柄の上限あり)"""
+    raw = np.exp(signal_strength * scores) / np.sqrt(np.diag(cov))
+    return cap_weights(raw, max_weight)
+
+def expected_returns(block: CovarianceBlock, scores: np.ndarray, signal_strength: float,
+                     periods_per_year: int = PERIODS_PER_YEAR["daily"]) -> np.ndarray:
+    """
+    年率の期待リターン
+
+    期間の平均リターンを全銘柄の平均へ MEAN_SHRINKAGE だけ縮小し、シグナル × 銘柄間のばらつき で傾ける。
+    """
+    historical = block.returns.mean(axis=0) * periods_per_year
+    mu = (1 - MEAN_SHRINKAGE) * historical + MEAN_SHRINKAGE * historical.mean()
+    return mu + signal_strength * scores * historical.std()
+
+def solve_weights(method: str, mu: np.ndarray, cov: np.ndarray, scores: np.ndarray,
+                  profile: RiskProfile) -> np.ndarray:
+    """配分方法ごとの比率 (合計1)"""
+    if method == "mean_variance":
+        return mean_variance(mu, cov, profile.risk_aversion, profile.max_weight)
+    if method == "risk_parity":
+        return risk_parity(cov)
+    if method == "inverse_volatility":
+        return inverse_volatility(cov, scores, profile.signal_strength, profile.max_weight)
+    raise ValueError(f"未対応の配分方法: {method} ({' / '.join(METHODS)})")
+
+def optimize_allocation(block: CovarianceBlock, scores: np.ndarray, method: str = "mean_variance",
+                        profile: Optional[RiskProfile] = None, principal: Optional[float] = None,
+                        max_holdings: Optional[int] = None,
+                        periods_per_year: int = PERIODS_PER_YEAR["daily"]) -> Dict:
+    """
+    ブロックの銘柄から配分を求める
+
+    最大銘柄数を超える銘柄と比率が MIN_WEIGHT 未満の銘柄を除いて保有銘柄だけで最適化し直す。
+    principal を指定した場合は、配分額で単元株を買えない銘柄を候補から外して候補全体から最適化し直す
+    (MAX_ROUNDS 回目以降は外さず、その時点の保有銘柄の配分を返す)。
+
+    Args:
+        block: 共分散ブロック
+        scores: ブロックの銘柄順のシグナル (signal_scores)
+        principal: 元金 (None なら単元株を考慮しない)
+        max_holdings: 最大銘柄数 (None ならリスク許容度の既定値)
+
+    Returns:
+        dict: method, symbols, weights, scores, expected_returns, volatilities (年率),
+              shares / amounts (principal 指定時), expected_return, volatility, rounds
+    """
+    if method not in METHODS:
+        raise ValueError(f"未対応の配分方法: {method} ({' / '.join(METHODS)})")
+    profile = profile or RISK_PROFILES["中"]
+    max_holdings = max_holdings or profile.max_holdings
+    mu_all = expected_returns(block, scores, profile.signal_strength, periods_per_year)
+    cov_all = block.covariance * periods_per_year
+    prices = block.last_close if block.last_close is not None else np.full(len(block.symbols), np.nan)
+    active = np.flatnonzero(np.isfinite(mu_all) & (np.isfinite(prices) | (principal is None)))
+    if len(active) == 0:
+        raise ValueError("配分できる銘柄がありません (株価が不足しています)")
+
+    candidates = active
+    if principal is not None:
+        # 1銘柄の上限の額で単元株を買えない銘柄は最初から除く (全銘柄が該当する場合は元金で買える銘柄)
+        lot_cost = prices[active] * LOT_SIZE
+        within_cap = lot_cost <= principal * profile.max_weight
+        candidates = active[within_cap] if within_cap.any() else active[lot_cost <= principal]
+        if len(candidates) == 0:
+            raise ValueError(f"元金 {principal:,.0f} では単元株 ({LOT_SIZE}株) を買える銘柄がありません")
+
+    active, rounds = candidates, 0
+    while True:
+        rounds += 1
+        weights = solve_weights(method, mu_all[active], cov_all[np.ix_(active, active)], scores[active], profile)
+        keep = np.argsort(-weights, kind="stable")[:max_holdings]
+        keep = keep[weights[keep] / weights[keep].sum() >= MIN_WEIGHT]
+        if len(keep) < len(active):
+            # 保有する銘柄だけで最適化し直す (銘柄が減るだけなので必ず終わる)
+            active = np.sort(active[keep])
+            continue
+        if principal is not None and rounds < MAX_ROUNDS:
+            short = weights * principal < prices[active] * LOT_SIZE
+            if short.any() and len(candidates) > short.sum():
+                # 単元株を買えない銘柄を候補から外し、残りの候補全体で最適化し直す
+                candidates = np.setdiff1d(candidates, active[short])
+                active = candidates
+                continue
+        break
+
+    mu, cov = mu_all[active], cov_all[np.ix_(active, active)]
+    sigma = float(np.sqrt(max(weights @ cov @ weights, 0.0)))
+    result = {
+        "method": method,
+        "symbols": [block.symbols[i] for i in active],
+        "weights": weights,
+        "scores": scores[active],
+        "expected_returns": mu,
+        "volatilities": np.sqrt(np.diag(cov)),
+        "expected_return": float(weights @ mu),
+        "volatility": sigma,
+        "rounds": rounds,
+    }
+    if principal is not None:
+        lot_cost = prices[active] * LOT_SIZE
+        lots = np.floor(weights * principal / lot_cost)
+        result["shares"] = (lots * LOT_SIZE).astype(int)
+        result["amounts"] = lots * lot_cost
+    return result
@@ -0,0 +1,340 @@
+"""
+推奨ポートフォリオのリスク分析
+
+推奨銘柄の配分 (allocation) について、stock_prices の日次対数リターンから
+Ledoit-Wolf 縮小推定した共分散行列を求め、ボラティリティ・VaR/CVaR・最大ドローダウン・集中度を計算する。
+
+- 共分散は推奨の候補銘柄 (selected_symbols) 全体 = ユニバースについて求め、推奨銘柄はその部分行列を使う。
+  銘柄数に対して日数が少ない場合も縮小推定により正定値になる。
+- 共分散ブロックは (ユニバース, 期間, 最終日) ごとにプロセス内でキャッシュする (CovarianceCache)。
+  同じ候補銘柄での推奨の繰り返しや、キャッシュ済みのユニバースに含まれる銘柄だけの分析は株価を読み直さない。
+- VaR/CVaR はヒストリカル法 (期間中の日次リターンに現在の配分を当てはめる) と、正規分布を仮定したパラメトリック法の両方を返す。
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from statistics import NormalDist
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from backtest import PERIODS_PER_YEAR, _forward_fill, load_price_panel
+from metrics import record_cache_lookup
+from invalidation import PRICES_UPDATED, InvalidationEvent, invalidation_bus
+from partitions import _as_date
+from recommendation_performance import parse_allocations
+from aiagent.data_access import normalize_symbol
+from utils import get_db_engine
+
+logger = logging.getLogger(__name__)
+
+# 共分散の推定に必要な有効リターンの割合 (これ未満の銘柄は上場直後などとして除外)
+MIN_COVERAGE = 0.5
+
+@dataclass
+class RiskConfig:
+    """リスク分析の設定 (環境変数 PORTFOLIO_RISK_* で上書き可能)"""
+    window: int = 250
+    confidence: float = 0.95
+    cache_size: int = 16
+
+    @classmethod
+    def from_env(cls) -> "RiskConfig":
+        return cls(
+            window=int(os.getenv("PORTFOLIO_RISK_WINDOW", cls.window)),
+            confidence=float(os.getenv("PORTFOLIO_RISK_CONFIDENCE", cls.confidence)),
+            cache_size=int(os.getenv("PORTFOLIO_RISK_CACHE_SIZE", cls.cache_size)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+@dataclass
+class CovarianceBlock:
+    """ユニバースの日次対数リターンと縮小推定した共分散"""
+    symbols: Tuple[str, ...]
+    returns: np.ndarray       # 日付 × 銘柄 (欠損は銘柄の平均リターンで補完)
+    covariance: np.ndarray    # 銘柄 × 銘柄
+    shrinkage: float
+    start_date: date
+    end_date: date
+    excluded: Tuple[str, ...] = ()
+    last_close: Optional[np.ndarray] = None  # 銘柄ごとの最終日の終値
+
+    def __post_init__(self):
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+def ledoit_wolf(returns: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    Ledoit-Wolf (2004) の縮小推定による共分散
+
+    標本共分散を、分散の平均を対角に持つ行列 (mu × 単位行列) に向けて縮小する。
+
+    Args:
+        returns: 日付 × 銘柄 のリターン (欠損なし)
+
+    Returns:
+        (共分散行列, 縮小の強さ 0〜1)
+    """
+    t, n = returns.shape
+    x = returns - returns.mean(axis=0)
+    sample = x.T @ x / t
+    mu = np.trace(sample) / n
+    x2 = x ** 2
+    # 標本共分散の各要素の推定誤差の合計 (beta) と、縮小先との距離 (delta)
+    beta = (np.sum(x2.T @ x2) / t - np.sum(sample ** 2)) / t
+    delta = np.sum(sample ** 2) - 2 * mu * np.trace(sample) + n * mu ** 2
+    shrinkage = 0.0 if delta <= 0 else float(min(max(beta, 0.0), delta) / delta)
+    covariance = (1 - shrinkage) * sample
+    covariance[np.diag_indices(n)] += shrinkage * mu
+    return covariance, shrinkage
+
+class CovarianceCache:
+    """共分散ブロックのプロセス内キャッシュ (LRU)
+
+    キーは (ユニバース, 期間, 最終日)。同じキーが無くても、同じ期間・最終日で
+    要求された銘柄をすべて含むブロックがあればそれを返す (呼び出し側で部分行列を使う)。
+    最終日はキーに含まれるため、新しい株価が入ると自然に使われなくなる。
+    過去の株価の訂正 (prices_updated の期間が最終日以前) では、その銘柄を含むブロックを破棄する。
+    """
+
+    def __init__(self, size: int = None):
+        self.size = RiskConfig.from_env().cache_size if size is None else size
+        self._blocks: "OrderedDict[Tuple, CovarianceBlock]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, symbols: Iterable[str], window: int, end_date: date) -> Optional[CovarianceBlock]:
+        wanted = frozenset(symbols)
+        with self._lock:
+            key = (wanted, window, end_date)
+            block = self._blocks.get(key)
+            if block is None:
+                for (universe, w, end), candidate in reversed(self._blocks.items()):
+                    if w == window and end == end_date and wanted <= universe:
+                        key, block = (universe, w, end), candidate
+                        break
+            if block is not None:
+                self._blocks.move_to_end(key)
+            record_cache_lookup("portfolio_covariance", hit=block is not None)
+            return block
+
+    def put(self, symbols: Iterable[str], window: int, end_date: date, block: CovarianceBlock):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._blocks[(frozenset(symbols), window, end_date)] = block
+            while len(self._blocks) > self.size:
+                self._blocks.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+    def invalidate(self, event: InvalidationEvent):
+        """株価の更新で内容が変わるブロックを破棄する (最終日より後の足の追加は影響しない)"""
+        with self._lock:
+            stale = [key for key in self._blocks
+                     if event.affects(key[0]) and (event.min_date is None or event.min_date <= key[2])]
+            for key in stale:
+                del self._blocks[key]
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+covariance_cache = CovarianceCache()
+invalidation_bus.register(covariance_cache.invalidate, PRICES_UPDATED)
+
+def build_block(closes: np.ndarray, symbols: Sequence[str], dates: Sequence, window: int) -> CovarianceBlock:
+    """
+    終値 (銘柄 × 日付) から直近 window 日の対数リターンと共分散を求める
+
+    休場などの欠損は直前の終値で埋め、有効なリターンが MIN_COVERAGE 未満の銘柄は除外する。
+    """
+    closes = _forward_fill(np.asarray(closes, dtype=np.float64))[:, -(window + 1):]
+    dates = list(dates)[-(window + 1):]
+    if closes.shape[1] < 3:
+        raise ValueError("リスク分析に必要な株価の日数が足りません")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(np.log(closes), axis=1).T
+    valid = np.isfinite(returns)
+    keep = valid.mean(axis=0) >= MIN_COVERAGE
+    if not keep.any():
+        raise ValueError("リスク分析に必要な株価の日数が足りません")
+    returns = returns[:, keep]
+    # 欠損は銘柄の平均リターンで埋める (中心化後は0になり、共分散への寄与が無い)
+    means = np.nanmean(returns, axis=0)
+    returns = np.where(valid[:, keep], returns, means)
+    covariance, shrinkage = ledoit_wolf(returns)
+    kept = np.asarray(symbols)[keep]
+    return CovarianceBlock(
+        symbols=tuple(kept), returns=returns, covariance=covariance, shrinkage=shrinkage,
+        start_date=_as_date(dates[0]), end_date=_as_date(dates[-1]),
+        excluded=tuple(np.asarray(symbols)[~keep]), last_close=closes[keep, -1],
+    )
+
+def load_block(engine, universe: Iterable[str], window: int, end_date: date) -> CovarianceBlock:
+    """ユニバースの直近 window 営業日の株価を読み込んで共分散ブロックを作る"""
+    # 営業日は年245日程度なので、祝日を見込んで暦日で多めに読む
+    start = end_date - timedelta(days=int(window * 1.6) + 14)
+    panel = load_price_panel(engine, sorted(set(universe)), start, end_date)
+    return build_block(panel.close, panel.symbols, panel.dates, window)
+
+def latest_bar(engine, symbols: Iterable[str]) -> date:
+    """銘柄の最新の営業日 (銘柄ごとに (symbol, date) の索引から最新1行だけを読む)"""
+    with engine.connect() as conn:
+        latest = conn.execute(text("""
+            SELECT MAX(p.date) FROM unnest(CAST(:symbols AS TEXT[])) AS s(symbol)
+            CROSS JOIN LATERAL (
+                SELECT date FROM stock_prices WHERE symbol = s.symbol ORDER BY date DESC LIMIT 1
+            ) p
+        """), {"symbols": sorted(symbols)}).scalar()
+    if latest is None:
+        raise ValueError("株価がありません")
+    return _as_date(latest)
+
+def covariance_block(universe: Iterable[str], config: Optional[RiskConfig] = None,
+                     end_date=None, engine=None, cache: Optional[CovarianceCache] = None) -> CovarianceBlock:
+    """
+    ユニバースの共分散ブロックを取得 (キャッシュに無ければ株価を読み込んで計算)
+
+    Args:
+        universe: 銘柄コード
+        end_date: 最終日 (None ならユニバースの最新の営業日)
+    """
+    config = config or RiskConfig.from_env()
+    engine = engine or get_db_engine()
+    cache = covariance_cache if cache is None else cache
+    universe = {normalize_symbol(s) for s in universe if s}
+    end_date = latest_bar(engine, universe) if end_date is None else _as_date(end_date)
+
+    block = cache.get(universe, config.window, end_date)
+    if block is None:
+        block = load_block(engine, universe, config.window, end_date)
+        # 株価が無く除外された銘柄も含めたユニバースで登録し、次回も同じキーで当たるようにする
+        cache.put(universe, config.window, end_date, block)
+        logger.debug(f"共分散を計算しました: {len(block.symbols)}銘柄 × {len(block.returns)}日 "
+                     f"(縮小 {block.shrinkage:.3f})")
+    return block
+
+def _finite(value) -> Optional[float]:
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+def portfolio_risk(block: CovarianceBlock, weights: Dict[str, float],
+                   confidence: float = 0.95, periods_per_year: int = PERIODS_PER_YEAR["daily"]) -> Dict:
+    """
+    配分 (銘柄 → 比率) のリスク指標
+
+    ブロックに無い銘柄は missing_symbols に入れ、残りの銘柄で比率を合計1に正規化する。
+    VaR/CVaR・ボラティリティは日次の損失率 (正の値が損失)。
+
+    Returns:
+        dict: volatility (年率), daily_volatility, var / cvar (ヒストリカル), parametric_var,
+              max_drawdown, concentration (hhi, effective_n, max_weight), avg_correlation,
+              diversification_ratio, positions (銘柄ごとの比率・ボラティリティ・リスク寄与)
+    """
+    symbols = [s for s in weights if s in block.index and weights[s] > 0]
+    missing = [s for s in weights if s not in block.index]
+    if not symbols:
+        raise ValueError("リスクを計算できる銘柄がありません (株価が不足しています)")
+    idx = np.array([block.index[s] for s in symbols])
+    w = np.array([weights[s] for s in symbols], dtype=np.float64)
+    w /= w.sum()
+    cov = block.covariance[np.ix_(idx, idx)]
+    marginal = cov @ w
+    variance = float(w @ marginal)
+    sigma = np.sqrt(max(variance, 0.0))
+    asset_sigma = np.sqrt(np.diag(cov))
+
+    # 期間中の日次リターンに現在の配分を当てはめた損益 (単純リターンで合成)
+    daily = np.expm1(block.returns[:, idx]) @ w
+    alpha = 1 - confidence
+    threshold = np.quantile(daily, alpha)
+    tail = daily[daily <= threshold]
+    equity = np.cumprod(1 + daily)
+    z = NormalDist().inv_cdf(confidence)
+
+    correlation = cov / np.outer(asset_sigma, asset_sigma)
+    off_diagonal = correlation[~np.eye(len(symbols), dtype=bool)]
+    positions = [
+        {
+            "symbol": symbol,
+            "weight": float(weight),
+            "volatility": _finite(vol * np.sqrt(periods_per_year)),
+            "risk_contribution": _finite(weight * m / variance) if variance > 0 else None,
+        }
+        for symbol, weight, vol, m in zip(symbols, w, asset_sigma, marginal)
+    ]
+    hhi = float(np.sum(w ** 2))
+    return {
+        "window": len(block.returns),
+        "start_date": str(block.start_date),
+        "end_date": str(block.end_date),
+        "confidence": confidence,
+        "shrinkage": block.shrinkage,
+        "volatility": _finite(sigma * np.sqrt(periods_per_year)),
+        "daily_volatility": _finite(sigma),
+        "var": _finite(-threshold),
+        "cvar": _finite(-tail.mean()),
+        "parametric_var": _finite(z * sigma - daily.mean()),
+        "max_drawdown": _finite((equity / np.maximum.accumulate(equity) - 1).min()),
+        "concentration": {
+            "hhi": hhi,
+            "effective_n": 1 / hhi,
+            "max_weight": float(w.max()),
+        },
+        "avg_correlation": _finite(off_diagonal.mean()) if len(off_diagonal) else None,
+        "diversification_ratio": _finite(w @ asset_sigma / sigma) if sigma > 0 else None,
+        "positions": positions,
+        "missing_symbols": missing,
+    }
+
+def recommendation_weights(recommendations: List[Dict]) -> Dict[str, float]:
+    """推奨結果の allocation ("30%" など) を銘柄ごとの比率にする (読めない場合は均等配分)"""
+    symbols = [normalize_symbol(rec["symbol"]) for rec in recommendations if rec.get("symbol")]
+    if not symbols:
+        return {}
+    allocations = parse_allocations(pd.Series([rec.get("allocation") for rec in recommendations
+                                               if rec.get("symbol")]))
+    allocations = np.where(np.isfinite(allocations) & (allocations > 0), allocations, 0.0)
+    if allocations.sum() <= 0:
+        allocations = np.ones(len(symbols))
+    weights: Dict[str, float] = {}
+    for symbol, allocation in zip(symbols, allocations):
+        weights[symbol] = weights.get(symbol, 0.0) + float(allocation)
+    return weights
+
+def analyze_recommendation(result: Dict, params: Dict, config: Optional[RiskConfig] = None,
+                           engine=None) -> Optional[Dict]:
+    """
+    推奨結果のリスク指標を計算する
+
+    共分散は候補銘柄 (params の selected_symbols) と推奨銘柄を合わせたユニバースで求める。
+    リスク分析が無効 (PORTFOLIO_RISK_WINDOW=0) または推奨銘柄が無い場合は None。
+    """
+    config = config or RiskConfig.from_env()
+    weights = recommendation_weights(result.get("recommendations") or [])
+    if not config.enabled or not weights:
+        return None
+    engine = engine or get_db_engine()
+    universe = set(weights) | {normalize_symbol(s) for s in params.get("selected_symbols") or [] if s}
+    # 最終日は推奨銘柄だけで求める (候補銘柄全体を調べるより速く、通常は市場の最新日と一致する)
+    block = covariance_block(universe, config, latest_bar(engine, weights), engine)
+    return portfolio_risk(block, weights, config.confidence)
+
+def attach_risk(result: Dict, params: Dict) -> Optional[Dict]:
+    """推奨結果にリスク指標 (risk) を付ける (失敗しても推奨自体は返せるよう警告のみ)"""
+    try:
+        risk = analyze_recommendation(result, params)
+    except Exception as e:
+        logger.warning(f"ポートフォリオのリスク分析に失敗しました: {str(e)}")
+        return None
+    if risk is not None:
+        result["risk"] = risk
+    return risk
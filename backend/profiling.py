@@ -0,0 +1,349 @@
+"""
+オンデマンドのプロファイリング
+
+- APIリクエスト: X-Profile ヘッダ (cprofile / sampling) またはサンプリング率で
+  対象リクエストを選び、cProfile (.prof) または統計的プロファイル (.collapsed) を保存する。
+  設定は環境変数が初期値で、PROFILE_API_ENABLED=true のときは PUT /api/debug/profiling で再起動なしに変更できる
+  (本番では有効にしない)。
+- バッチ: StageProfiler でステージごとの cProfile と tracemalloc の上位アロケーションを保存する。
+
+出力形式:
+  .prof      pstats形式 (snakeviz / flameprof でフレームグラフ化)
+  .collapsed "関数;関数;関数 サンプル数" 形式 (flamegraph.pl / speedscope でそのまま読める)
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+import contextlib
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "sampling")
+PROFILE_HEADER = "x-profile"
+
+# /api/debug/profiling を登録するか (開発・検証環境のみ)
+API_ENABLED = os.getenv("PROFILE_API_ENABLED", "false").lower() == "true"
+
+@dataclass
+class ProfilingConfig:
+    """APIリクエストのプロファイリング設定
+
+    Attributes:
+        sample_rate: ヘッダ無しのリクエストをプロファイルする割合 (0で無効)
+        mode: サンプリング率で選ばれたリクエストのプロファイル方式
+        header_enabled: X-Profile ヘッダによる指定を受け付けるか
+        interval: 統計的プロファイルのサンプリング間隔(秒)
+        output_dir: 出力先ディレクトリ
+        max_files: 出力先に残す最大ファイル数 (古いものから削除)
+    """
+    sample_rate: float = 0.0
+    mode: str = "cprofile"
+    header_enabled: bool = False
+    interval: float = 0.005
+    output_dir: str = "profiles"
+    max_files: int = 200
+
+    @classmethod
+    def from_env(cls) -> "ProfilingConfig":
+        return cls(
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", cls.sample_rate)),
+            mode=os.getenv("PROFILE_MODE", cls.mode).lower(),
+            header_enabled=os.getenv("PROFILE_HEADER_ENABLED", "false").lower() == "true",
+            interval=float(os.getenv("PROFILE_INTERVAL", cls.interval)),
+            output_dir=os.getenv("PROFILE_DIR", cls.output_dir),
+            max_files=int(os.getenv("PROFILE_MAX_FILES", cls.max_files)),
+        )
+
+    def update(self, values: Dict):
+        """指定された項目だけを更新する"""
+        for key, value in values.items():
+            if value is None or not hasattr(self, key):
+                continue
+            if key == "mode" and value not in PROFILE_MODES:
+                raise ValueError(f"無効なプロファイル方式: {value} (有効: {', '.join(PROFILE_MODES)})")
+            setattr(self, key, type(getattr(self, key))(value))
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+config = ProfilingConfig.from_env()
+
+_request_profile_lock = threading.Lock()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+class StackSampler:
+    """一定間隔でスレッドのスタックを採取する統計的プロファイラ
+
+    Args:
+        interval: サンプリング間隔(秒)
+        thread_ids: 対象スレッドID (Noneなら自身以外の全スレッド)
+        label: スレッドIDからスタック先頭に付けるラベルを返す関数 (ステージ名など)
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[Iterable[int]] = None,
+                 label: Optional[Callable[[int], Optional[str]]] = None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.label = label
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = _collapse(frame)
+                prefix = self.label(thread_id) if self.label else None
+                self.samples[f"{prefix};{stack}" if prefix else stack] += 1
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write_collapsed(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+def _prune(directory: str, max_files: int):
+    """古い出力ファイルを削除して max_files 件以内に保つ"""
+    if max_files <= 0:
+        return
+    try:
+        entries = sorted(os.scandir(directory), key=lambda e: e.stat().st_mtime)
+    except FileNotFoundError:
+        return
+    for entry in entries[:max(len(entries) - max_files, 0)]:
+        with contextlib.suppress(OSError):
+            os.remove(entry.path)
+
+def _artifact_path(directory: str, name: str, extension: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name).strip("_")
+    return os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_name}-{uuid.uuid4().hex[:6]}{extension}")
+
+def select_request_mode(headers) -> Optional[str]:
+    """リクエストをプロファイルするか判定し、方式を返す (対象外ならNone)
+
+    無効時は設定値の比較のみで終わるため、通常リクエストへのオーバーヘッドは無視できる。
+    """
+    if config.header_enabled:
+        requested = headers.get(PROFILE_HEADER)
+        if requested:
+            requested = requested.lower()
+            return requested if requested in PROFILE_MODES else config.mode
+    if config.sample_rate > 0 and random.random() < config.sample_rate:
+        return config.mode
+    return None
+
+async def profile_request(mode: str, name: str, call_next, request):
+    """1リクエストをプロファイルしながら処理し、(レスポンス, 出力ファイル) を返す
+
+    イベントループのスレッドを対象にするため、同時に処理中の他リクエストも含まれうる。
+    プロファイル中のリクエストが既にある場合は計測せずに処理する (出力ファイルはNone)。
+    """
+    if not _request_profile_lock.acquire(blocking=False):
+        return await call_next(request), None
+    try:
+        return await _profile_request(mode, name, call_next, request)
+    finally:
+        _request_profile_lock.release()
+
+async def _profile_request(mode: str, name: str, call_next, request):
+    if mode == "sampling":
+        sampler = StackSampler(config.interval, thread_ids=[threading.get_ident()])
+        sampler.start()
+        try:
+            response = await call_next(request)
+        finally:
+            sampler.stop()
+        path = _artifact_path(config.output_dir, name, ".collapsed")
+        sampler.write_collapsed(path)
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = await call_next(request)
+        finally:
+            profiler.disable()
+        path = _artifact_path(config.output_dir, name, ".prof")
+        profiler.dump_stats(path)
+    _prune(config.output_dir, config.max_files)
+    logger.info(f"リクエストのプロファイルを保存しました: {path}")
+    return response, path
+
+class StageProfiler:
+    """バッチのステージごとに cProfile と tracemalloc の結果を保存する
+
+    cProfile はスレッドごとに計測してステージ単位で合算する。tracemalloc は
+    計測コストが大きいため、各ステージ先頭の tracemalloc_samples 回の実行中だけ有効にし、
+    終了時点で残っている確保を記録する。プロセス全体が対象のため、並列実行中は
+    他スレッドの確保も含まれる。
+
+    Args:
+        job: ジョブ名 (出力ファイル名の接頭辞)
+        output_dir: 出力先 (未指定なら PROFILE_DIR)
+        mode: cprofile / sampling
+        enabled: Falseの場合は何もしない (stage() は素通り)
+        tracemalloc_samples: ステージごとに tracemalloc を有効にする回数 (0で無効)
+        top: 出力する上位アロケーション数
+    """
+
+    def __init__(self, job: str, output_dir: Optional[str] = None, mode: str = "cprofile",
+                 enabled: bool = True, tracemalloc_samples: int = 3, top: int = 25):
+        self.job = job
+        self.output_dir = output_dir or config.output_dir
+        self.mode = mode
+        self.enabled = enabled
+        self.tracemalloc_samples = tracemalloc_samples
+        self.top = top
+        # 保存するスタック深さ。深くするほど遅くなる (pandas中心の処理で1フレーム約3倍、5フレーム約12倍)
+        self.tracemalloc_frames = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", 1))
+        self._profiles: Dict[tuple, cProfile.Profile] = {}
+        self._allocations: Dict[str, Dict[str, list]] = {}
+        self._stage_counts: Counter = Counter()
+        self._peaks: Dict[str, int] = {}
+        self._current_stage: Dict[int, str] = {}
+        self._active: Dict[int, tuple] = {}
+        self._tracing = 0
+        self._lock = threading.Lock()
+        self._sampler: Optional[StackSampler] = None
+
+    def start(self):
+        if not self.enabled:
+            return
+        if self.mode == "sampling":
+            self._sampler = StackSampler(
+                config.interval,
+                label=lambda thread_id: f"stage:{self._current_stage.get(thread_id, '-')}")
+            self._sampler.start()
+        logger.info(f"プロファイリングを開始: job={self.job}, mode={self.mode}, 出力先={self.output_dir}")
+
+    def begin(self, name: str):
+        """このスレッドでステージを開始する (実行中のステージがあれば終了してから切り替える)"""
+        if not self.enabled:
+            return
+        thread_id = threading.get_ident()
+        if thread_id in self._active:
+            self.end()
+        with self._lock:
+            self._stage_counts[name] += 1
+            trace = self._stage_counts[name] <= self.tracemalloc_samples
+            if trace:
+                if self._tracing == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start(self.tracemalloc_frames)
+                self._tracing += 1
+
+        profiler = None
+        if self.mode == "cprofile":
+            with self._lock:
+                profiler = self._profiles.setdefault((name, thread_id), cProfile.Profile())
+            try:
+                profiler.enable()
+            except ValueError:
+                # 別のプロファイラが有効な場合 (Python 3.12以降は同時に1つまで) は計測しない
+                profiler = None
+        self._current_stage[thread_id] = name
+        self._active[thread_id] = (name, profiler, trace)
+
+    def end(self):
+        """このスレッドで実行中のステージを終了する"""
+        if not self.enabled:
+            return
+        thread_id = threading.get_ident()
+        active = self._active.pop(thread_id, None)
+        if active is None:
+            return
+        name, profiler, trace = active
+        if profiler is not None:
+            profiler.disable()
+        self._current_stage.pop(thread_id, None)
+        if trace:
+            self._record_allocations(name, tracemalloc.take_snapshot())
+            with self._lock:
+                self._tracing -= 1
+                if self._tracing == 0:
+                    tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """with ブロックをステージとしてプロファイルする"""
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def _record_allocations(self, name: str, snapshot):
+        """ステージ実行中に確保され、終了時点で残っているメモリを確保箇所ごとに集計"""
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        stats = snapshot.statistics("traceback" if self.tracemalloc_frames > 1 else "lineno")
+        _, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            self._peaks[name] = max(self._peaks.get(name, 0), peak)
+            totals = self._allocations.setdefault(name, {})
+            for stat in stats[:self.top * 4]:
+                key = "\n".join(stat.traceback.format(most_recent_first=True))
+                entry = totals.setdefault(key, [0, 0])
+                entry[0] += stat.size
+                entry[1] += stat.count
+
+    def stop(self):
+        """プロファイルを停止してファイルに書き出す"""
+        if not self.enabled:
+            return
+        if self._sampler is not None:
+            self._sampler.stop()
+            path = _artifact_path(self.output_dir, f"{self.job}-stages", ".collapsed")
+            self._sampler.write_collapsed(path)
+            logger.info(f"統計的プロファイルを保存しました: {path}")
+
+        by_stage: Dict[str, list] = {}
+        for (name, _), profiler in self._profiles.items():
+            by_stage.setdefault(name, []).append(profiler)
+        for name, profilers in by_stage.items():
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            path = _artifact_path(self.output_dir, f"{self.job}-{name}", ".prof")
+            stats.dump_stats(path)
+            logger.info(f"ステージ '{name}' のプロファイルを保存しました: {path}")
+
+        for name, totals in self._allocations.items():
+            path = _artifact_path(self.output_dir, f"{self.job}-{name}-tracemalloc", ".txt")
+            ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:self.top]
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"# ステージ: {name} (計測{min(self._stage_counts[name], self.tracemalloc_samples)}回, "
+                        f"ピーク {self._peaks.get(name, 0) / 1024 / 1024:.1f} MiB)\n")
+                for rank, (traceback, (size, count)) in enumerate(ranked, 1):
+                    f.write(f"\n#{rank}: {size / 1024:.1f} KiB, {count} blocks\n{traceback}\n")
+            logger.info(f"ステージ '{name}' のアロケーション上位を保存しました: {path}")
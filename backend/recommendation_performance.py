@@ -0,0 +1,246 @@
+"""
+推奨の実績評価
+
+recommendation_sessions / recommendation_results の推奨銘柄を、推奨後の stock_prices と突き合わせて
+1/5/20/60営業日後の騰落率・配分加重のポートフォリオ騰落率・的中率 (騰落率が正の銘柄の割合) を求める。
+全セッションの推奨銘柄を 銘柄×日付 の終値の配列に対する添字演算でまとめて計算する (セッションごとのループは使わない)。
+
+- 基準価格は推奨後に最初に確定した終値 (大引け 15:30 以降に生成された推奨は翌営業日の終値)。
+- 結果は recommendation_pick_performance (銘柄ごと) と recommendation_session_performance (セッションごと) に保存し、
+  未評価のセッションと、60営業日後まで揃っていないセッションのうち前回の評価より新しい株価があるものだけを処理する。
+- プロンプトテンプレート・エージェントタイプ別の集計は保存済みのセッション単位の値から求める (performance_summary)。
+"""
+import logging
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from sqlalchemy import text
+
+from backtest import _forward_fill, load_price_panel
+from indicator_library import PricePanel
+from partitions import _as_date, latest_date
+
+logger = logging.getLogger(__name__)
+
+# 評価する期間 (営業日)
+HORIZONS = (1, 5, 20, 60)
+
+# 終値が確定する時刻 (日本時間、東証の大引け)
+MARKET_CLOSE = timedelta(hours=15, minutes=30)
+
+# 集計の単位 (performance_summary の group_by) → SQL の式
+SUMMARY_GROUPS = {
+    "prompt": "rs.prompt_id",
+    "agent_type": "COALESCE(rs.agent_type, 'unknown')",
+    "strategy": "rs.strategy",
+    "risk_tolerance": "rs.risk_tolerance",
+    "none": "'all'",
+}
+
+def parse_allocations(allocations: pd.Series) -> np.ndarray:
+    """"30%" / "30" などの配分を数値にする (読めない値は NaN)"""
+    return pd.to_numeric(allocations.astype(str).str.extract(r"(-?\d+(?:\.\d+)?)")[0], errors="coerce").to_numpy()
+
+def evaluate_picks(picks: pd.DataFrame, panel: PricePanel) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    推奨銘柄の実績を計算する
+
+    Args:
+        picks: session_id, result_id, symbol, allocation, generated_at (タイムゾーン付き) の推奨銘柄
+        panel: 推奨日以降の株価 (日付は日本時間の日付)
+
+    Returns:
+        tuple: (銘柄ごとの実績, セッションごとの実績)。未到来の期間の騰落率は NaN
+    """
+    n_dates = len(panel.dates)
+    close = _forward_fill(np.asarray(panel.close, dtype=float))
+    close_times = pd.DatetimeIndex(panel.dates) + MARKET_CLOSE
+    generated = pd.DatetimeIndex(picks["generated_at"]).tz_convert("Asia/Tokyo").tz_localize(None)
+
+    # 推奨後に最初に確定する終値の位置
+    entry = np.searchsorted(close_times.values, generated.values, side="right")
+    symbol_index = pd.Index(panel.symbols).get_indexer(picks["symbol"])
+    has_row = (symbol_index >= 0) & (entry < n_dates)
+    rows, cols = np.where(has_row, symbol_index, 0), np.minimum(entry, n_dates - 1)
+    entry_price = np.where(has_row, close[rows, cols], np.nan)
+    priced = ~np.isnan(entry_price)
+
+    result = pd.DataFrame({
+        "result_id": picks["result_id"].to_numpy(),
+        "session_id": picks["session_id"].to_numpy(),
+        "symbol": picks["symbol"].to_numpy(),
+        "entry_date": np.where(entry < n_dates, panel.dates[cols], np.datetime64("NaT")),
+        "entry_price": entry_price,
+    })
+    for horizon in HORIZONS:
+        target = entry + horizon
+        available = priced & (target < n_dates)
+        result[f"return_{horizon}d"] = np.where(
+            available, close[rows, np.minimum(target, n_dates - 1)] / entry_price - 1, np.nan)
+
+    # 配分をセッション内の株価のある銘柄で合計1に正規化 (配分が読めない場合は等分)
+    codes, sessions = pd.factorize(result["session_id"], sort=True)
+    allocation = np.where(priced, np.nan_to_num(parse_allocations(picks["allocation"]), nan=0.0).clip(min=0), 0.0)
+    allocation_total = np.bincount(codes, weights=allocation, minlength=len(sessions))
+    priced_count = np.bincount(codes, weights=priced, minlength=len(sessions))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight = np.where(allocation_total[codes] > 0, allocation / allocation_total[codes],
+                          1.0 / priced_count[codes])
+    result["weight"] = np.where(priced, weight, np.nan)
+
+    session_entry = np.full(len(sessions), n_dates)
+    np.minimum.at(session_entry, codes, entry)
+    summary = pd.DataFrame({
+        "session_id": sessions.to_numpy(),
+        "entry_date": np.where(session_entry < n_dates, panel.dates[np.minimum(session_entry, n_dates - 1)],
+                               np.datetime64("NaT")),
+        "picks": np.bincount(codes, minlength=len(sessions)),
+        "priced": priced_count.astype(int),
+    })
+    for horizon in HORIZONS:
+        returns = result[f"return_{horizon}d"].to_numpy()
+        available = ~np.isnan(returns)
+        counted = np.bincount(codes, weights=available, minlength=len(sessions))
+        weighted = np.bincount(codes, weights=np.where(available, returns * result["weight"], 0.0),
+                               minlength=len(sessions))
+        summary[f"return_{horizon}d"] = np.where(counted > 0, weighted, np.nan)
+        hits = np.bincount(codes, weights=available & (returns > 0), minlength=len(sessions))
+        summary[f"hits_{horizon}d"] = pd.array(np.where(counted > 0, hits, np.nan), dtype="Int64")
+    summary["last_bar_date"] = panel.dates[-1] if n_dates else np.datetime64("NaT")
+    summary["complete"] = session_entry + max(HORIZONS) < n_dates
+    return result, summary
+
+def _pending_picks(conn, latest, session_ids: Optional[Iterable[int]], full: bool) -> pd.DataFrame:
+    """評価が必要なセッションの推奨銘柄"""
+    conditions, params = [], {"latest": latest}
+    if not full:
+        conditions.append("(sp.session_id IS NULL OR (NOT sp.complete AND "
+                          "(sp.last_bar_date IS NULL OR sp.last_bar_date < :latest)))")
+    if session_ids is not None:
+        conditions.append("rs.session_id = ANY(:session_ids)")
+        params["session_ids"] = list(session_ids)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return pd.read_sql(text(f"""
+        SELECT rs.session_id, rs.generated_at, rr.id AS result_id, rr.symbol, rr.allocation
+        FROM recommendation_sessions rs
+        JOIN recommendation_results rr ON rr.session_id = rs.session_id
+        LEFT JOIN recommendation_session_performance sp ON sp.session_id = rs.session_id
+        {where}
+        ORDER BY rs.session_id, rr.id
+    """), conn, params=params)
+
+def _records(frame: pd.DataFrame, columns: List[str]) -> List[tuple]:
+    values = frame[columns].astype(object).where(frame[columns].notna(), None)
+    return [tuple(row) for row in values.itertuples(index=False)]
+
+def store_performance(cursor, picks: pd.DataFrame, sessions: pd.DataFrame):
+    """評価結果を保存 (既存の行は上書き、コミットは呼び出し元で行う)"""
+    returns = [f"return_{h}d" for h in HORIZONS]
+    hits = [f"hits_{h}d" for h in HORIZONS]
+    pick_columns = ["result_id", "session_id", "symbol", "weight", "entry_date", "entry_price"] + returns
+    execute_values(cursor, f"""
+        INSERT INTO recommendation_pick_performance ({', '.join(pick_columns)})
+        VALUES %s
+        ON CONFLICT (result_id) DO UPDATE SET
+            {', '.join(f'{c} = EXCLUDED.{c}' for c in pick_columns[1:])},
+            evaluated_at = CURRENT_TIMESTAMP
+    """, _records(picks, pick_columns), page_size=1000)
+    session_columns = ["session_id", "entry_date", "picks", "priced"] + returns + hits + ["last_bar_date", "complete"]
+    execute_values(cursor, f"""
+        INSERT INTO recommendation_session_performance ({', '.join(session_columns)})
+        VALUES %s
+        ON CONFLICT (session_id) DO UPDATE SET
+            {', '.join(f'{c} = EXCLUDED.{c}' for c in session_columns[1:])},
+            evaluated_at = CURRENT_TIMESTAMP
+    """, _records(sessions, session_columns), page_size=1000)
+
+def evaluate_sessions(engine, session_ids: Optional[Iterable[int]] = None, full: bool = False) -> Dict:
+    """
+    推奨セッションの実績を評価して保存する
+
+    Args:
+        session_ids: 対象セッション (None なら評価が必要な全セッション)
+        full: True なら評価済みのセッションも評価し直す
+
+    Returns:
+        dict: sessions (評価したセッション数), picks, completed (60営業日後まで揃ったセッション数), latest_bar
+    """
+    with engine.connect() as conn:
+        latest = latest_date(conn, "stock_prices")
+        if latest is None:
+            logger.info("株価が無いため推奨の実績評価を行いません")
+            return {"sessions": 0, "picks": 0, "completed": 0, "latest_bar": None}
+        latest = _as_date(latest)
+        picks = _pending_picks(conn, latest, session_ids, full)
+    if picks.empty:
+        logger.info("評価が必要な推奨セッションはありません")
+        return {"sessions": 0, "picks": 0, "completed": 0, "latest_bar": str(latest)}
+
+    start = _as_date(picks["generated_at"].min())
+    try:
+        panel = load_price_panel(engine, picks["symbol"].unique(), start, latest)
+    except ValueError:
+        logger.info(f"推奨銘柄の {start} 以降の株価が無いため評価しません ({picks['session_id'].nunique()}セッション)")
+        return {"sessions": 0, "picks": 0, "completed": 0, "latest_bar": str(latest)}
+    pick_perf, session_perf = evaluate_picks(picks, panel)
+
+    raw = engine.raw_connection()
+    try:
+        store_performance(raw.cursor(), pick_perf, session_perf)
+        raw.commit()
+    finally:
+        raw.close()
+    summary = {"sessions": len(session_perf), "picks": len(pick_perf),
+               "completed": int(session_perf["complete"].sum()), "latest_bar": str(latest)}
+    logger.info(f"推奨の実績を評価しました: {summary}")
+    return summary
+
+def performance_summary(conn, group_by: str = "prompt", start_date=None, end_date=None) -> List[Dict]:
+    """
+    保存済みの実績を集計する
+
+    Args:
+        group_by: prompt / agent_type / strategy / risk_tolerance / none
+        start_date, end_date: 推奨の生成日で絞り込む
+
+    Returns:
+        list: 集計単位ごとの sessions、期間ごとの平均騰落率 (avg_return_Nd: 配分加重のポートフォリオ騰落率の平均)、
+            的中率 (hit_rate_Nd: 騰落率が正の銘柄の割合)、勝率 (win_rate_Nd: ポートフォリオ騰落率が正のセッションの割合)
+
+    Raises:
+        ValueError: 未対応の集計単位
+    """
+    key = SUMMARY_GROUPS.get(group_by)
+    if key is None:
+        raise ValueError(f"未対応の集計単位: {group_by} ({' / '.join(SUMMARY_GROUPS)})")
+    metrics = []
+    for h in HORIZONS:
+        metrics.append(f"""
+            COUNT(sp.return_{h}d) AS sessions_{h}d,
+            AVG(sp.return_{h}d) AS avg_return_{h}d,
+            SUM(sp.hits_{h}d)::float / NULLIF(SUM(sp.priced) FILTER (WHERE sp.return_{h}d IS NOT NULL), 0)
+                AS hit_rate_{h}d,
+            (AVG((sp.return_{h}d > 0)::int) FILTER (WHERE sp.return_{h}d IS NOT NULL))::float AS win_rate_{h}d""")
+    conditions, params = [], {}
+    if start_date:
+        conditions.append("rs.generated_at >= :start_date")
+        params["start_date"] = start_date
+    if end_date:
+        conditions.append("rs.generated_at <= :end_date")
+        params["end_date"] = end_date
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    label = "MAX(pt.name)" if group_by == "prompt" else key
+    rows = conn.execute(text(f"""
+        SELECT {key} AS key, {label} AS label, COUNT(*) AS sessions, SUM(sp.priced)::int AS picks,
+            {','.join(metrics)}
+        FROM recommendation_session_performance sp
+        JOIN recommendation_sessions rs ON rs.session_id = sp.session_id
+        LEFT JOIN prompt_templates pt ON pt.id = rs.prompt_id
+        {where}
+        GROUP BY 1
+        ORDER BY COUNT(*) DESC
+    """), params).mappings().all()
+    return [dict(row) for row in rows]
@@ -0,0 +1,271 @@
+"""
+値動きの形が似ている銘柄の検索
+
+全銘柄の直近 window 営業日の値動きを、銘柄ごとに平均0・分散1に正規化した単位ベクトル (埋め込み) にして
+夜間バッチ (batch/similarity_index_builder.py) で similarity_indexes に保存する。
+検索はプロセス内に読み込んだ行列と基準銘柄のベクトルの内積 (BLAS の行列ベクトル積) による全件の厳密な検索で、
+4000銘柄でも1ms程度で答える。
+
+- kind=returns: 日次対数リターン。内積はリターンの相関係数になる (同じ日に同じ向きに動く銘柄)
+- kind=trajectory: 期間初日を基準にした対数株価の推移。内積は価格の軌跡の形の相関になる (上昇・下落の形が似た銘柄)
+
+SIMILARITY_DIMENSIONS を指定すると、全銘柄の行列の特異値分解 (PCA) で次元を削減して保存する
+(内積の近似の精度を保ったまま、保存サイズと検索時間を減らす)。
+"""
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from backtest import _forward_fill, load_price_panel
+from partitions import _as_date, latest_date
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("returns", "trajectory")
+
+# 期間内の有効な値の割合がこれ未満の銘柄 (上場直後・長期の売買停止など) は除外する
+MIN_COVERAGE = 0.8
+
+@dataclass
+class SimilarityConfig:
+    """類似銘柄検索の設定 (環境変数 SIMILARITY_* で上書き可能)"""
+    windows: Tuple[int, ...] = (60, 120, 250)
+    dimensions: int = 0
+    refresh_seconds: float = 300.0
+
+    @classmethod
+    def from_env(cls) -> "SimilarityConfig":
+        windows = os.getenv("SIMILARITY_WINDOWS")
+        return cls(
+            windows=tuple(int(w) for w in windows.split(",") if w.strip()) if windows else cls.windows,
+            dimensions=int(os.getenv("SIMILARITY_DIMENSIONS", cls.dimensions)),
+            refresh_seconds=float(os.getenv("SIMILARITY_REFRESH_SECONDS", cls.refresh_seconds)),
+        )
+
+@dataclass
+class SimilarityIndex:
+    """全銘柄の埋め込み (銘柄 × 次元、各行は単位ベクトル)"""
+    kind: str
+    window: int
+    end_date: date
+    symbols: Tuple[str, ...]
+    vectors: np.ndarray
+    explained_variance: float = 1.0
+    built_at: Optional[datetime] = None
+    index: Dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1]
+
+    def query(self, symbol: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        symbol に似ている順に k 銘柄 (symbol 自身を除く) と類似度 (-1〜1) を返す
+
+        Raises:
+            LookupError: symbol がインデックスに無い
+        """
+        position = self.index.get(symbol)
+        if position is None:
+            raise LookupError(f"類似銘柄のインデックスに {symbol} がありません (期間 {self.window}営業日)")
+        scores = self.vectors @ self.vectors[position]
+        scores[position] = -np.inf
+        k = min(k, len(self.symbols) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.symbols[i], float(scores[i])) for i in top]
+
+def embed(closes: np.ndarray, window: int, kind: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    終値 (銘柄 × 日付) の直近 window 営業日を埋め込みにする
+
+    Returns:
+        (vectors: 残した銘柄 × window の単位ベクトル (float32), keep: 銘柄ごとに残したか)
+    """
+    if kind not in KINDS:
+        raise ValueError(f"未対応の類似度: {kind} ({' / '.join(KINDS)})")
+    closes = np.asarray(closes, dtype=np.float64)
+    coverage = np.isfinite(closes[:, -window:]).mean(axis=1)
+    closes = _forward_fill(closes)[:, -(window + 1):]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.log(closes)
+        if kind == "returns":
+            values = np.diff(logs, axis=1)
+        else:
+            values = logs[:, 1:] - logs[:, :1]
+    if values.shape[1] < window:
+        raise ValueError(f"類似度の計算に必要な株価の日数が足りません ({values.shape[1]} < {window})")
+    valid = np.isfinite(values)
+    counts = valid.sum(axis=1)
+    means = np.where(valid, values, 0.0).sum(axis=1) / np.maximum(counts, 1)
+    centered = np.where(valid, values - means[:, None], 0.0)
+    norms = np.sqrt((centered ** 2).sum(axis=1))
+    keep = (coverage >= MIN_COVERAGE) & (norms > 0)
+    # 平均0・ノルム1にすると、内積が相関係数になる (欠損は平均で埋めたのと同じで、相関への寄与が無い)
+    vectors = centered[keep] / norms[keep, None]
+    return vectors.astype(np.float32), keep
+
+def reduce_dimensions(vectors: np.ndarray, dimensions: int) -> Tuple[np.ndarray, float]:
+    """
+    特異値分解で上位 dimensions 次元に射影し、単位ベクトルに戻す
+
+    Returns:
+        (射影したベクトル, 保持した分散の割合)
+    """
+    if dimensions <= 0 or dimensions >= min(vectors.shape):
+        return vectors, 1.0
+    _, singular, vt = np.linalg.svd(vectors.astype(np.float64), full_matrices=False)
+    reduced = vectors.astype(np.float64) @ vt[:dimensions].T
+    norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+    reduced = np.divide(reduced, norms, out=np.zeros_like(reduced), where=norms > 0)
+    explained = float((singular[:dimensions] ** 2).sum() / (singular ** 2).sum())
+    return reduced.astype(np.float32), explained
+
+def build_index(closes: np.ndarray, symbols: Sequence[str], dates: Sequence, window: int,
+                kind: str = "returns", dimensions: int = 0) -> SimilarityIndex:
+    """終値 (銘柄 × 日付) から類似銘柄のインデックスを作る"""
+    vectors, keep = embed(closes, window, kind)
+    vectors, explained = reduce_dimensions(vectors, dimensions)
+    return SimilarityIndex(
+        kind=kind, window=window, end_date=_as_date(list(dates)[-1]),
+        symbols=tuple(np.asarray(symbols)[keep]), vectors=vectors, explained_variance=explained,
+    )
+
+def store_index(cursor, index: SimilarityIndex):
+    """インデックスを保存する (同じ kind・window は置き換え、コミットは呼び出し元で行う)"""
+    cursor.execute("""
+        INSERT INTO similarity_indexes
+            (kind, window_days, end_date, dimensions, explained_variance, symbols, vectors, built_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (kind, window_days) DO UPDATE SET
+            end_date = EXCLUDED.end_date, dimensions = EXCLUDED.dimensions,
+            explained_variance = EXCLUDED.explained_variance, symbols = EXCLUDED.symbols,
+            vectors = EXCLUDED.vectors, built_at = EXCLUDED.built_at
+    """, (index.kind, index.window, index.end_date, index.dimensions, index.explained_variance,
+          list(index.symbols), np.ascontiguousarray(index.vectors, dtype="<f4").tobytes()))
+
+def load_index(conn, kind: str, window: int) -> Optional[SimilarityIndex]:
+    """保存済みのインデックスを読み込む (無ければ None)"""
+    row = conn.execute(text("""
+        SELECT end_date, dimensions, explained_variance, symbols, vectors, built_at
+        FROM similarity_indexes WHERE kind = :kind AND window_days = :window
+    """), {"kind": kind, "window": window}).mappings().first()
+    if row is None:
+        return None
+    vectors = np.frombuffer(bytes(row["vectors"]), dtype="<f4").reshape(len(row["symbols"]), row["dimensions"])
+    return SimilarityIndex(
+        kind=kind, window=window, end_date=row["end_date"], symbols=tuple(row["symbols"]),
+        vectors=vectors, explained_variance=row["explained_variance"], built_at=row["built_at"],
+    )
+
+def build_indexes(engine, config: Optional[SimilarityConfig] = None,
+                  kinds: Sequence[str] = KINDS) -> List[SimilarityIndex]:
+    """全銘柄の株価を1回読み込み、設定の期間・種類ごとのインデックスを作って保存する"""
+    config = config or SimilarityConfig.from_env()
+    with engine.connect() as conn:
+        end = latest_date(conn, "stock_prices")
+    if end is None:
+        raise ValueError("株価がありません")
+    end = _as_date(end)
+    # 営業日は年245日程度なので、祝日を見込んで暦日で多めに読む
+    panel = load_price_panel(engine, None, end - timedelta(days=int(max(config.windows) * 1.6) + 14), end)
+    indexes = []
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for window in config.windows:
+            for kind in kinds:
+                start = time.perf_counter()
+                index = build_index(panel.close, panel.symbols, panel.dates, window, kind, config.dimensions)
+                store_index(cursor, index)
+                indexes.append(index)
+                logger.info(f"類似銘柄のインデックスを作成しました: {kind} {window}営業日 "
+                            f"{len(index.symbols)}銘柄 × {index.dimensions}次元 "
+                            f"(分散の保持率 {index.explained_variance:.3f}, {time.perf_counter() - start:.2f}秒)")
+        raw.commit()
+    finally:
+        raw.close()
+    return indexes
+
+class SimilarityIndexCache:
+    """
+    プロセス内のインデックス (kind, window ごと)
+
+    refresh_seconds ごとに built_at だけを確認し、夜間バッチで作り直されていれば読み込み直す。
+    """
+
+    def __init__(self, refresh_seconds: float = 300.0):
+        self.refresh_seconds = refresh_seconds
+        self._entries: Dict[Tuple[str, int], Tuple[SimilarityIndex, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, engine, kind: str, window: int) -> Optional[SimilarityIndex]:
+        key = (kind, window)
+        with self._lock:
+            entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry[1] < self.refresh_seconds:
+            return entry[0]
+        with engine.connect() as conn:
+            if entry is not None:
+                built_at = conn.execute(text(
+                    "SELECT built_at FROM similarity_indexes WHERE kind = :kind AND window_days = :window"
+                ), {"kind": kind, "window": window}).scalar()
+                if built_at == entry[0].built_at:
+                    with self._lock:
+                        self._entries[key] = (entry[0], now)
+                    return entry[0]
+            index = load_index(conn, kind, window)
+        with self._lock:
+            if index is None:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = (index, now)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+similarity_cache = SimilarityIndexCache(SimilarityConfig.from_env().refresh_seconds)
+
+def similar_stocks(engine, symbol: str, window: Optional[int] = None, kind: str = "returns", k: int = 10,
+                   cache: Optional[SimilarityIndexCache] = None) -> Dict:
+    """
+    symbol と値動きが似ている k 銘柄
+
+    Raises:
+        ValueError: 未対応の kind・window・k
+        LookupError: インデックスが未作成、または symbol がインデックスに無い
+    """
+    config = SimilarityConfig.from_env()
+    window = window or config.windows[0]
+    if kind not in KINDS:
+        raise ValueError(f"未対応の類似度: {kind} ({' / '.join(KINDS)})")
+    if window not in config.windows:
+        raise ValueError(f"未対応の期間: {window} ({' / '.join(str(w) for w in config.windows)})")
+    if k <= 0:
+        raise ValueError(f"無効な銘柄数: {k}")
+    index = (cache or similarity_cache).get(engine, kind, window)
+    if index is None:
+        raise LookupError(f"類似銘柄のインデックスがありません ({kind}, {window}営業日)")
+    return {
+        "symbol": symbol,
+        "kind": kind,
+        "window": window,
+        "end_date": index.end_date.isoformat(),
+        "dimensions": index.dimensions,
+        "similar": [{"symbol": s, "similarity": round(score, 4)} for s, score in index.query(symbol, k)],
+    }
@@ -0,0 +1,73 @@
+from psycopg2.extras import execute_values
+from partitions import ensure_partitions
+from bar_aggregates import refresh_aggregates
+from invalidation import publish_prices_updated
+
+def build_price_rows(ticker, hist):
+    """
+    yfinanceの株価履歴をstock_pricesへの挿入行に変換
+
+    Args:
+        ticker (str): 銘柄シンボル
+        hist (pd.DataFrame): Open/High/Low/Close/Volume列を持つ株価履歴 (日付インデックス)
+
+    Returns:
+        tuple: (挿入行のリスト, 最終日時 (タイムゾーン無し))
+    """
+    data = []
+    current_fetch_date = None
+    for index, row in hist.iterrows():
+        current_fetch_date = index.to_pydatetime().replace(tzinfo=None)
+        data.append((
+            ticker,
+            current_fetch_date,
+            float(row['Open']),
+            float(row['High']),
+            float(row['Low']),
+            float(row['Close']),
+            int(row['Volume'])
+        ))
+    return data, current_fetch_date
+
+def store_price_history(cursor, ticker, hist):
+    """
+    株価履歴をstock_pricesへバルクインサートし、取り込んだ期間の週足・月足と銘柄の最終取得日時を更新
+    (コミットは呼び出し元で行う。コミット時に無効化イベント prices_updated が配信される)
+
+    Args:
+        cursor: psycopg2のカーソル
+        ticker (str): 銘柄シンボル
+        hist (pd.DataFrame): yfinanceの株価履歴
+
+    Returns:
+        int: 挿入を試みた行数
+    """
+    data, current_fetch_date = build_price_rows(ticker, hist)
+    if not data:
+        return 0
+
+    # 挿入先のパーティションを用意 (作成済みなら何もしない)
+    dates = [row[1] for row in data]
+    ensure_partitions(cursor, "stock_prices", min(dates), max(dates))
+
+    # バルクインサート実行
+    execute_values(cursor,
+        """INSERT INTO stock_prices
+           (symbol, date, open, high, low, close, volume)
+           VALUES %s
+           ON CONFLICT (symbol, date) DO NOTHING""",
+        data
+    )
+
+    # 取り込んだ日付を含む週・月だけを集計し直す
+    refresh_aggregates(cursor, [ticker], min(dates), max(dates))
+
+    # 最終取得日時を更新
+    cursor.execute("""
+        UPDATE stocks
+        SET last_fetched = %s
+        WHERE symbol = %s
+    """, (current_fetch_date, ticker))
+
+    publish_prices_updated(cursor, [ticker], max(dates), min(dates))
+    return len(data)
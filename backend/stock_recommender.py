@@ -1,25 +1,59 @@
+import time
+import asyncio
 import logging
 from typing import Dict
 from aiagent.factory import RecommenderFactory
+from metrics import RECOMMENDATION_DURATION
 from aiagent.data_access import save_recommendation
+from portfolio_risk import attach_risk
+from aiagent.quant_recommender import prefilter_symbols
+from aiagent.recommendation_spool import (
+    get_save_mode,
+    spool_recommendation,
+    flush_spooled_recommendation
+)
 
 logger = logging.getLogger(__name__)
 
-async def recommend_stocks(params: Dict) -> Dict:
+async def _prefilter(params: Dict) -> Dict:
+    """候補銘柄を数値最適化で prefilter_top 銘柄に絞り込んだパラメータを返す (失敗時は絞り込まない)"""
+    before = len(params.get('selected_symbols') or [])
+    try:
+        symbols = await asyncio.to_thread(prefilter_symbols, params, int(params['prefilter_top']))
+    except Exception as e:
+        logger.warning(f"候補銘柄の絞り込みに失敗しました (絞り込まずに推奨します): {str(e)}")
+        return params
+    logger.info(f"候補銘柄を絞り込みました: {before} → {len(symbols)}銘柄")
+    return {**params, 'selected_symbols': symbols, 'symbols': symbols}
+
+async def recommend_stocks(params: Dict, background_tasks=None) -> Dict:
     """銘柄推奨を生成 (ファクトリ経由で実装を選択)
     
     Args:
-        params: 推奨パラメータ (agent_typeとprompt_idを含む可能性あり)
+        params: 推奨パラメータ (agent_typeとprompt_idを含む可能性あり。
+            prefilter_top を指定すると、LLMに渡す前に候補銘柄を数値最適化で絞り込む)
+        background_tasks: FastAPIのBackgroundTasks。保存モードがasyncの場合、
+            保存内容をスプールに書き出した上でレスポンス送信後にDB保存する
         
     Returns:
         推奨結果を含む辞書
     """
     agent_type = params.get('agent_type', 'direct')
+    if params.get('prefilter_top') and agent_type != 'quant':
+        params = await _prefilter(params)
     
     recommender = RecommenderFactory.create(agent_type)
     logger.info(f"Created recommender: {recommender.__class__.__name__}")
 
-    result = await recommender.execute(params)
+    start = time.perf_counter()
+    try:
+        result = await recommender.execute(params)
+    except Exception:
+        RECOMMENDATION_DURATION.observe(time.perf_counter() - start, agent_type=agent_type, status="exception")
+        raise
+    status = "error" if not isinstance(result, dict) or \
+        result.get("parsed_result", result).get("status") == "error" else "ok"
+    RECOMMENDATION_DURATION.observe(time.perf_counter() - start, agent_type=agent_type, status=status)
     
     # 型チェックを追加
     if not isinstance(result, dict):
@@ -29,6 +63,7 @@ async def recommend_stocks(params: Dict) -> Dict:
     # 新しいレスポンス形式に対応（生データを含む場合）
     parsed_result = result
     raw_response = None
+    execution_metrics = result.get("execution_metrics")
     
     if "parsed_result" in result and "raw_response" in result:
         # 新しい形式: parsed_resultとraw_responseを含む
@@ -37,12 +72,24 @@ async def recommend_stocks(params: Dict) -> Dict:
         logger.info("新しいレスポンス形式を検出: 生データを含みます")
     
     # 推奨結果をDBに保存
-    logger.info("Saving recommendation to database...")
-    if parsed_result.get('status') != 'error':
-        save_recommendation(parsed_result, params, raw_response)
-    else:
-        save_recommendation({}, params, raw_response)
+    saved_result = parsed_result if parsed_result.get('status') != 'error' else {}
+    if parsed_result.get('status') == 'error':
         logger.error(f"Recommendation failed with error status: {parsed_result.get('message', '不明なエラー')}")
+    else:
+        # 推奨配分のリスク指標をレスポンスに付け、セッションと一緒に保存する
+        await asyncio.to_thread(attach_risk, parsed_result, params)
+    
+    if background_tasks is not None and get_save_mode() == "async":
+        # スプールに書き出してからレスポンス送信後に保存（DB停止時は再送キューに残る）
+        spool_path = spool_recommendation(saved_result, params, raw_response, execution_metrics)
+        background_tasks.add_task(flush_spooled_recommendation, spool_path)
+        logger.info(f"Recommendation queued for asynchronous save: {spool_path}")
+    else:
+        logger.info("Saving recommendation to database...")
+        if not save_recommendation(saved_result, params, raw_response, execution_metrics):
+            # DBが一時的に利用できない場合に備えて再送キューへ
+            spool_path = spool_recommendation(saved_result, params, raw_response, execution_metrics)
+            logger.warning(f"Recommendation queued for retry: {spool_path}")
     
     logger.info("Recommendation process completed")
     return parsed_result
@@ -1,15 +1,18 @@
-import os
 import pandas as pd
 from sqlalchemy import text
+from indicator_library import IndicatorConfig
+from invalidation import publish_indicators_updated
+
+# 多銘柄・複数パラメータの一括計算は indicator_library (銘柄×日付の配列でベクトル化) を使う
 
 # 移動平均計算関数
 def calculate_moving_average(data, window=30):
     return data.rolling(window=window).mean()
 
 # ゴールデンクロス/デッドクロス計算関数
-def calculate_crosses(df):
-    short_window = int(os.getenv('GOLDEN_DEAD_SHORT_WINDOW', 25))
-    long_window = int(os.getenv('GOLDEN_DEAD_LONG_WINDOW', 75))
+def calculate_crosses(df, config=None):
+    config = config or IndicatorConfig.from_env()
+    short_window, long_window = config.cross_short, config.cross_long
     df = df.copy()
     df['short_ma'] = df['close'].rolling(window=short_window).mean()
     df['long_ma'] = df['close'].rolling(window=long_window).mean()
@@ -18,8 +21,8 @@ def calculate_crosses(df):
     return golden_cross, dead_cross
 
 # RSI計算関数
-def calculate_rsi(df):
-    window = int(os.getenv('RSI_WINDOW', 14))
+def calculate_rsi(df, config=None):
+    window = (config or IndicatorConfig.from_env()).rsi_window
     delta = df['close'].diff()
     gain = delta.where(delta > 0, 0)
     loss = -delta.where(delta < 0, 0)
@@ -30,10 +33,9 @@ def calculate_rsi(df):
     return rsi
 
 # MACD計算関数
-def calculate_macd(df):
-    fast = int(os.getenv('MACD_FAST', 12))
-    slow = int(os.getenv('MACD_SLOW', 26))
-    signal = int(os.getenv('MACD_SIGNAL', 9))
+def calculate_macd(df, config=None):
+    config = config or IndicatorConfig.from_env()
+    fast, slow, signal = config.macd_fast, config.macd_slow, config.macd_signal
     ema_fast = df['close'].ewm(span=fast, adjust=False).mean()
     ema_slow = df['close'].ewm(span=slow, adjust=False).mean()
     macd = ema_fast - ema_slow
@@ -74,15 +76,16 @@ def calculate_macd_score(golden_cross, histogram, histogram_prev=None):
     return score
 
 # 指標計算とDB保存
-def calculate_indicators(df):
-    """DataFrameに対してテクニカル指標を一括計算"""
+def calculate_indicators(df, config=None):
+    """DataFrameに対してテクニカル指標を一括計算 (config 省略時は環境変数の設定)"""
+    config = config or IndicatorConfig.from_env()
     df = df.copy()
     # クロス指標計算
-    df['golden_cross'], df['dead_cross'] = calculate_crosses(df)
+    df['golden_cross'], df['dead_cross'] = calculate_crosses(df, config)
     # RSI計算
-    df['rsi'] = calculate_rsi(df)
+    df['rsi'] = calculate_rsi(df, config)
     # MACD計算（ヒストグラムを含む）
-    df['macd'], df['signal_line'], df['histogram'] = calculate_macd(df)
+    df['macd'], df['signal_line'], df['histogram'] = calculate_macd(df, config)
     
     # MACDスコア計算（前日値を使用）
     df['macd_score'] = 0
@@ -108,12 +111,16 @@ def calculate_indicators(df):
     
     return df[['symbol', 'date', 'golden_cross', 'dead_cross', 'rsi', 'macd', 'signal_line', 'histogram', 'macd_score']]
 
-def batch_store_indicators(df, engine):
-    """DataFrameの内容をバッチでUPSERT"""
+def batch_store_indicators(df, engine, table="technical_indicators"):
+    """
+    DataFrameの内容をバッチでUPSERT (週足・月足は technical_indicators_weekly / _monthly)
+
+    保存した銘柄の無効化イベント (indicators_updated) を発行する (コミット時に配信される)
+    """
     try:
         with engine.begin() as conn:
-            conn.execute(text("""
-                INSERT INTO technical_indicators 
+            conn.execute(text(f"""
+                INSERT INTO {table}
                 (symbol, date, golden_cross, dead_cross, rsi, macd, signal_line, histogram, macd_score)
                 VALUES 
                 (:symbol, :date, :golden_cross, :dead_cross, :rsi, :macd, :signal_line, :histogram, :macd_score)
@@ -126,6 +133,7 @@ def batch_store_indicators(df, engine):
                     histogram = EXCLUDED.histogram,
                     macd_score = EXCLUDED.macd_score
             """), df.to_dict('records'))
+            publish_indicators_updated(conn, df['symbol'].unique().tolist(), table)
         return True
     except Exception as e:
         print(f"バッチ保存エラー: {str(e)}")
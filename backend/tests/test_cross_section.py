@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cross_section import percentile_ranks, rank_filter
+
+def test_missing_value_next_to_single_peer_is_null():
+    frame = pd.DataFrame({
+        "date": pd.to_datetime(["2024-01-02", "2024-01-02", "2024-01-03", "2024-01-03"]),
+        "industry_code_33": ["0050", "0050", "0050", "0050"],
+        "symbol": ["a", "b", "a", "b"],
+        "momentum": [np.nan, 0.1, 0.2, 0.1],
+    })
+
+    ranks = percentile_ranks(frame, ["date"], ["momentum"])
+    industry_ranks = percentile_ranks(frame, ["date", "industry_code_33"], ["momentum"])
+
+    for result in (ranks, industry_ranks):
+        assert result["momentum"].isna().tolist() == [True, False, False, False]
+        assert result["momentum"].tolist()[1:] == [50, 100, 0]
+
+def test_rank_filter_builds_condition():
+    assert rank_filter("rsi_rank", ">=", "80") == "tr.rsi_rank >= 80"
+
+@pytest.mark.parametrize("column, op, value", [
+    ("unknown_rank", ">=", 80),
+    ("rsi_rank", "!=", 80),
+    ("rsi_rank", ">=", "x"),
+    ("rsi_rank", ">=", None),
+    ("rsi_rank", ">=", "nan"),
+    ("rsi_rank", "<", float("inf")),
+])
+def test_rank_filter_rejects_invalid_conditions(column, op, value):
+    with pytest.raises(ValueError):
+        rank_filter(column, op, value)
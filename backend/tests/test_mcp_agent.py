@@ -0,0 +1,116 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from aiagent import mcp_agent
+from aiagent.budgeted_optimizer import BudgetedEvaluatorOptimizer, OptimizationBudget
+from aiagent.mcp_agent import MCPAgentRecommender
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class StubAgent:
+    def __init__(self, name=None, instruction=None, server_names=None):
+        self.name = name
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class StubLLM:
+    """optimizer は "回答1", "回答2", ... を返し、evaluator は ratings を順に返す (呼び出しごとに step 秒進む)"""
+
+    def __init__(self, agent, ratings, clock=None, step=0.0):
+        self.agent = agent
+        self.ratings = list(ratings)
+        self.clock = clock
+        self.step = step
+        self.calls = 0
+
+    def _tick(self):
+        if self.clock is not None:
+            self.clock.now += self.step
+
+    async def generate_str(self, message, request_params=None):
+        self._tick()
+        self.calls += 1
+        return f"回答{self.calls}"
+
+    async def generate_structured(self, message, response_model, request_params=None):
+        self._tick()
+        rating = self.ratings.pop(0)
+        return SimpleNamespace(rating=rating, feedback="改善してください", needs_improvement=True, focus_areas=[])
+
+def make_optimizer(ratings, budget, clock=None, step=0.0):
+    return BudgetedEvaluatorOptimizer(
+        optimizer=StubAgent("optimizer"),
+        evaluator=StubAgent("evaluator"),
+        llm_factory=lambda agent: StubLLM(agent, ratings, clock, step),
+        evaluation_model=None,
+        budget=budget,
+        **({"clock": clock} if clock is not None else {}),
+    )
+
+def test_plateau_stops_with_best_response():
+    optimizer = make_optimizer([1, 0, 1, 3], OptimizationBudget(max_rounds=5, plateau_rounds=2))
+
+    result = asyncio.run(optimizer.generate_str("依頼"))
+
+    assert result == "回答1"
+    assert optimizer.stop_reason == "plateau"
+    assert [r["rating"] for r in optimizer.rounds] == [1, 0, 1]
+
+def test_wall_time_exhaustion_returns_best_so_far():
+    clock = FakeClock()
+    # 1回の呼び出しで10秒進む: 2回目の評価の前に25秒の予算を使い切る
+    optimizer = make_optimizer([1, 3], OptimizationBudget(max_wall_time=25, max_rounds=5), clock, step=10)
+
+    result = asyncio.run(optimizer.generate_str("依頼"))
+
+    assert result == "回答1"
+    assert optimizer.stop_reason == "wall_time"
+    assert optimizer.metrics()["rounds"][0]["rating"] == 1
+
+class TimeoutEvaluatorOptimizer:
+    """標準モード (EvaluatorOptimizerLLM) の代わり: metrics() を持たない"""
+
+    def __init__(self, **kwargs):
+        pass
+
+    async def generate_str(self, message, request_params=None):
+        raise TimeoutError("タイムアウト")
+
+@pytest.fixture
+def recommender(monkeypatch):
+    monkeypatch.setattr(mcp_agent, "get_prompt_template", lambda prompt_id: {
+        "system_role": "{risk_tolerance}", "user_template": "{principal}", "output_format": "JSON"})
+    monkeypatch.setattr(mcp_agent, "fetch_prompt_data", lambda symbols, params, include_indicators=False: {
+        "company_infos": [], "technical_indicators": [], "stats": {}})
+    monkeypatch.delenv("MCP_OPTIMIZER_MODE", raising=False)
+    return MCPAgentRecommender(agent_cls=StubAgent, llm_factory=lambda agent: StubLLM(agent, []))
+
+PARAMS = {"optimizer_prompt_id": 1, "evaluation_prompt_id": 2, "selected_symbols": ["7203.T"],
+          "principal": 1_000_000, "risk_tolerance": "中"}
+
+def test_standard_mode_timeout_returns_error_without_metrics(recommender, monkeypatch):
+    monkeypatch.setattr(mcp_agent, "EvaluatorOptimizerLLM", TimeoutEvaluatorOptimizer)
+
+    result = asyncio.run(recommender.execute(dict(PARAMS)))
+
+    assert result["parsed_result"] == {"status": "error", "message": "タイムアウト"}
+    assert result["raw_response"] is None
+    assert result["execution_metrics"] is None
+
+def test_budgeted_mode_timeout_returns_metrics(recommender):
+    result = asyncio.run(recommender.execute({**PARAMS, "max_wall_time": 0}))
+
+    assert result["parsed_result"]["status"] == "error"
+    assert result["execution_metrics"]["mode"] == "budgeted"
+    assert result["execution_metrics"]["stop_reason"] == "wall_time"
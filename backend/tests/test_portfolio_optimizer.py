@@ -0,0 +1,22 @@
+import numpy as np
+
+from benchmarks.synthetic_market import generate_ohlcv
+from indicator_library import PricePanel
+from portfolio_optimizer import MAX_ROUNDS, MIN_WEIGHT, RISK_PROFILES, optimize_allocation
+from portfolio_risk import build_block
+
+def test_weights_match_holdings_when_rounds_exhausted():
+    # 単元株を買えない銘柄を少しずつ外すため、MAX_ROUNDS 回では収まらないケース
+    panel = PricePanel.from_frame(generate_ohlcv(400, 280 / 245, seed=1))
+    block = build_block(panel.close, list(panel.symbols), panel.dates, 250)
+    scores = np.random.default_rng(1).standard_normal(400)
+    profile = RISK_PROFILES["低"]
+
+    allocation = optimize_allocation(block, scores, "mean_variance", profile, principal=1_000_000)
+
+    assert allocation["rounds"] >= MAX_ROUNDS
+    assert len(allocation["weights"]) == len(allocation["symbols"]) == len(allocation["shares"])
+    assert 0 < len(allocation["symbols"]) <= profile.max_holdings
+    assert np.isclose(allocation["weights"].sum(), 1.0)
+    assert (allocation["weights"] >= MIN_WEIGHT - 1e-12).all()
+    assert np.isfinite(allocation["volatility"])
@@ -0,0 +1,18 @@
+import os
+
+from aiagent import recommendation_spool
+from aiagent.recommendation_spool import list_spooled_recommendations, replay_spooled_recommendations
+
+def test_corrupt_spool_file_is_moved_aside(tmp_path, monkeypatch):
+    monkeypatch.setenv("RECOMMENDATION_SPOOL_DIR", str(tmp_path))
+    saved = []
+    monkeypatch.setattr(recommendation_spool, "persist_recommendation",
+                        lambda result, params, raw, metrics: saved.append(result) or len(saved))
+    (tmp_path / "00000000000000000001-aaaaaaaa.json").write_text('{"result": ', encoding="utf-8")
+    recommendation_spool.spool_recommendation({"recommendations": []}, {"principal": 1})
+
+    assert replay_spooled_recommendations() == 1
+
+    assert saved == [{"recommendations": []}]
+    assert sorted(os.listdir(tmp_path)) == ["00000000000000000001-aaaaaaaa.failed"]
+    assert list_spooled_recommendations() == []
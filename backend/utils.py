@@ -1,9 +1,11 @@
 import os
 import logging
+import threading
 import pandas as pd
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
-from matplotlib.font_manager import FontProperties
+from metrics import instrument_engine, instrumented_pool_class
+from log_pipeline import configure_logging
 
 _env_loaded = False
 
@@ -20,26 +22,24 @@ def initialize_environment():
 def setup_backend_logger(name=__name__):
     """
     バックエンド全体のロガー設定（1回だけ実行）
-    ファイル名、関数名、行番号を含む詳細なログフォーマット
+    ファイル名、関数名、行番号を含む詳細なログフォーマット (LOG_FORMAT=json でJSON形式)
     
     Args:
         name (str): ロガー名 (デフォルトはモジュール名 __name__)
     """
     if not logging.getLogger().hasHandlers():
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(funcName)s:%(lineno)d] - %(message)s',
-            handlers=[
-                logging.FileHandler(f"logs/stock-analyzer-{__name__}.log"),
-                logging.StreamHandler()
-            ]
-        )
+        # ハンドラのI/Oはバックグラウンドスレッドで行う (設定は log_pipeline と .env.example の LOG_* を参照)
+        configure_logging(os.getenv('LOG_FILE', f"logs/stock-analyzer-{__name__}.log"))
     return logging.getLogger(name)
 
+_engines = {}
+_engines_lock = threading.Lock()
+
 def get_db_engine():
     """
     標準のPostgreSQLデータベースエンジンを作成（一元化された接続方法）
     接続プールとタイムアウト設定を追加
+    同一接続先のエンジンはプロセス内で再利用し、呼び出しごとに接続プールを作り直さない
     
     Returns:
         sqlalchemy.engine.Engine: データベースエンジンオブジェクト
@@ -56,8 +56,17 @@ def get_db_engine():
     if not all([user, password, db_name]):
         raise EnvironmentError("データベース接続に必要な環境変数が設定されていません")
     
-    return create_engine(
-        f"postgresql://{user}:{password}@{host}:{port}/{db_name}",
+    url = f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
+    with _engines_lock:
+        if url not in _engines:
+            _engines[url] = _create_engine(url)
+        return _engines[url]
+
+def _create_engine(url):
+    """接続プール・タイムアウト設定付きのエンジンを生成 (クエリ時間・プール待ち時間を計測)"""
+    engine = create_engine(
+        url,
+        poolclass=instrumented_pool_class(),
         pool_size=10,
         max_overflow=20,
         pool_timeout=30,
@@ -70,6 +79,7 @@ def get_db_engine():
             'keepalives_count': 5
         }
     )
+    return instrument_engine(engine)
 
 def process_in_symbol_groups(df, group_size=100):
     """
@@ -103,10 +113,19 @@ def get_ma_settings():
     logger.debug(f"移動平均設定を読み込み: {settings}")
     return settings
 
+_missing_fonts = set()
+
 def get_font_config():
-    """日本語フォント設定を返す"""
-    font_prop = FontProperties(fname=r'C:\Windows\Fonts\msgothic.ttc', size=9)
-    title_font = FontProperties(fname=r'C:\Windows\Fonts\msgothic.ttc', size=12)
+    """日本語フォント設定を返す (CHART_FONT_PATH のフォントが無い環境では既定フォントを使う)"""
+    from matplotlib.font_manager import FontProperties
+    font_path = os.getenv('CHART_FONT_PATH', r'C:\Windows\Fonts\msgothic.ttc')
+    if not os.path.exists(font_path):
+        if font_path not in _missing_fonts:
+            _missing_fonts.add(font_path)
+            logging.getLogger(__name__).warning(f"チャート用フォントが見つからないため既定フォントを使用します: {font_path}")
+        return FontProperties(size=9), FontProperties(size=12)
+    font_prop = FontProperties(fname=font_path, size=9)
+    title_font = FontProperties(fname=font_path, size=12)
     return font_prop, title_font
 
 def get_company_names(engine):
@@ -0,0 +1,331 @@
+"""
+指標パラメータのウォークフォワード最適化
+
+移動平均・RSI・MACDの期間などのグリッドの各組み合わせ (セル) でバックテスト (backtest.run_backtest) を行い、
+期間をずらしながら 学習期間で最良のセルを選ぶ → 直後の検証期間で成績を測る を繰り返す。
+最後に直近の学習期間で最良のセルを、.env にそのまま書ける環境変数 (IndicatorConfig.to_env) として出力する。
+
+- セルはプロセスプールで並列に計算する。株価の配列は .npy に書き出してワーカーがメモリマップで読むため、
+  タスクごとに株価を pickle して送ることはない。
+- 各セルの結果 (日ごとのポートフォリオのリターン) はキャッシュディレクトリのメモリマップ (returns.npy) に
+  ワーカーが直接書き込み、完了したセルを done.txt に追記する。中断しても再実行すると未完了のセルだけを計算する。
+- シグナルは過去の株価だけで決まるため、バックテストは全期間で1回行い、学習・検証期間はリターンを切り出して評価する
+  (分割の長さや評価指標を変えてもキャッシュをそのまま使える)。
+"""
+import os
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, fields
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backtest import PERIODS_PER_YEAR, BacktestConfig, performance_stats, run_backtest
+from indicator_library import IndicatorConfig, PricePanel
+from utils import setup_backend_logger
+
+logger = setup_backend_logger(__name__)
+
+OBJECTIVES = ("sharpe", "total_return", "cagr")
+
+# 戦略ごとの既定のグリッド
+DEFAULT_GRIDS = {
+    "golden_cross": {
+        "cross_short": [5, 10, 15, 20, 25],
+        "cross_long": [50, 75, 100, 150, 200],
+    },
+    "macd_score": {
+        "cross_short": [5, 12, 25],
+        "cross_long": [26, 75],
+        "macd_fast": [8, 12],
+        "macd_slow": [21, 26, 35],
+        "macd_signal": [5, 9],
+    },
+    "rsi": {
+        "rsi_window": [7, 9, 14, 21],
+        "rsi_lower": [20, 25, 30],
+        "rsi_upper": [70, 75, 80],
+    },
+}
+
+_PANEL_FIELDS = ("open", "high", "low", "close", "volume")
+
+def default_cache_dir() -> str:
+    return os.getenv("WALK_FORWARD_CACHE_DIR", os.path.join("cache", "walk_forward"))
+
+def parse_grid(specs: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    key=値1,値2,... または key=開始:終了:刻み (終了を含む) をグリッドにする
+
+    Raises:
+        ValueError: 形式が不正
+    """
+    grid = {}
+    for spec in specs:
+        key, sep, values = spec.partition("=")
+        if not sep or not values:
+            raise ValueError(f"グリッドは key=値1,値2 または key=開始:終了:刻み の形式で指定してください: {spec}")
+        if ":" in values:
+            start, stop, step = (float(v) for v in values.split(":"))
+            items = np.arange(start, stop + step / 2, step)
+            grid[key.strip()] = [str(int(v)) if float(v).is_integer() else str(v) for v in items]
+        else:
+            grid[key.strip()] = [v.strip() for v in values.split(",") if v.strip()]
+    return grid
+
+def grid_cells(base: BacktestConfig, grid: Dict[str, Sequence]) -> List[Dict]:
+    """
+    グリッドの全組み合わせ (短期 < 長期 などを満たさない組み合わせは除く)
+
+    Raises:
+        ValueError: 未知のパラメータ
+    """
+    keys = list(grid)
+    cells = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        config = base.with_overrides(dict(zip(keys, values)))
+        params = config.indicators
+        if (params.cross_short < params.cross_long and params.macd_fast < params.macd_slow
+                and config.rsi_lower < config.rsi_upper):
+            cells.append({key: getattr(params, key) if hasattr(params, key) else getattr(config, key)
+                          for key in keys})
+    return cells
+
+def walk_forward_splits(n_dates: int, train_bars: int, test_bars: int, step: Optional[int] = None,
+                        start: int = 0) -> List[Tuple[slice, slice]]:
+    """
+    学習・検証期間の組 (足の添字の範囲) を作る
+
+    Args:
+        start: 最初の学習期間の開始位置 (指標の助走期間を除くため)
+        step: 次の組までのずらし幅 (既定: test_bars、検証期間が重ならない)
+    """
+    step = step or test_bars
+    splits = []
+    train_start = start
+    while train_start + train_bars < n_dates:
+        train_end = train_start + train_bars
+        splits.append((slice(train_start, train_end), slice(train_end, min(train_end + test_bars, n_dates))))
+        train_start += step
+    return splits
+
+def warmup_bars(base: BacktestConfig, cells: List[Dict]) -> int:
+    """全セルの指標が出揃うまでの足の数"""
+    longest = 0
+    for cell in cells:
+        params = base.with_overrides(cell).indicators
+        longest = max(longest, params.cross_long, params.macd_slow + params.macd_signal, params.rsi_window)
+    return longest + 1
+
+def share_panel(panel: PricePanel, directory: str):
+    """株価の配列を .npy に書き出す (ワーカーは open_shared_panel でメモリマップとして読む)"""
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "symbols.npy"), np.asarray(panel.symbols, dtype=str))
+    np.save(os.path.join(directory, "dates.npy"), np.asarray(panel.dates, dtype="datetime64[ns]"))
+    for name in _PANEL_FIELDS:
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(getattr(panel, name)))
+
+def open_shared_panel(directory: str) -> PricePanel:
+    """share_panel で書き出した配列を読み取り専用のメモリマップで開く"""
+    arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in _PANEL_FIELDS}
+    return PricePanel(symbols=np.load(os.path.join(directory, "symbols.npy")),
+                      dates=np.load(os.path.join(directory, "dates.npy")), **arrays)
+
+def _cache_key(panel: PricePanel, base: BacktestConfig, cells: List[Dict]) -> str:
+    """株価・基本設定・グリッドが同じなら同じキー (分割・評価指標は含めない)"""
+    digest = hashlib.sha1()
+    digest.update(np.asarray(panel.symbols, dtype=str).tobytes())
+    digest.update(np.asarray(panel.dates, dtype="datetime64[ns]").tobytes())
+    digest.update(np.nan_to_num(panel.open).tobytes())
+    digest.update(np.nan_to_num(panel.close).tobytes())
+    digest.update(json.dumps({"base": asdict(base), "cells": cells}, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+def _completed(directory: str) -> set:
+    path = os.path.join(directory, "done.txt")
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {int(line) for line in f if line.strip()}
+
+# ワーカープロセスごとの共有配列
+_worker_state = {}
+
+def _init_worker(directory: str):
+    _worker_state["panel"] = open_shared_panel(os.path.join(directory, "panel"))
+    _worker_state["returns"] = np.load(os.path.join(directory, "returns.npy"), mmap_mode="r+")
+
+def _run_cell(index: int, config: BacktestConfig) -> int:
+    """1セルのバックテストを行い、ポートフォリオのリターンを共有の結果配列に書き込む"""
+    result = run_backtest(_worker_state["panel"], config)
+    returns = _worker_state["returns"]
+    returns[index] = result.portfolio_returns
+    returns.flush()
+    return index
+
+def compute_cells(panel: PricePanel, base: BacktestConfig, cells: List[Dict],
+                  workers: Optional[int] = None, cache_dir: Optional[str] = None,
+                  resume: bool = True) -> np.ndarray:
+    """
+    全セルのポートフォリオのリターン (セル数, 日付数) を計算する (キャッシュ済みのセルは計算しない)
+
+    Args:
+        workers: プロセス数 (既定: WALK_FORWARD_WORKERS または CPU数、1ならプロセスを使わない)
+        resume: False ならキャッシュを使わずに計算し直す
+    """
+    directory = os.path.join(cache_dir or default_cache_dir(), _cache_key(panel, base, cells))
+    returns_path = os.path.join(directory, "returns.npy")
+    done_path = os.path.join(directory, "done.txt")
+    if not resume or not os.path.exists(returns_path):
+        share_panel(panel, os.path.join(directory, "panel"))
+        with open(os.path.join(directory, "cells.json"), "w", encoding="utf-8") as f:
+            json.dump({"base": asdict(base), "cells": cells}, f, ensure_ascii=False, indent=2)
+        np.lib.format.open_memmap(returns_path, mode="w+", dtype=np.float64,
+                                  shape=(len(cells), len(panel.dates))).flush()
+        open(done_path, "w").close()
+
+    done = _completed(directory)
+    pending = [i for i in range(len(cells)) if i not in done]
+    logger.info(f"ウォークフォワード: {len(cells)}セル中 {len(done)}セルはキャッシュ済み ({directory})")
+    workers = workers or int(os.getenv("WALK_FORWARD_WORKERS") or os.cpu_count() or 1)
+
+    finished = len(done)
+    with open(done_path, "a", encoding="utf-8") as done_file:
+        def mark(index):
+            nonlocal finished
+            done_file.write(f"{index}\n")
+            done_file.flush()
+            finished += 1
+            if finished % max(1, len(cells) // 10) == 0 or finished == len(cells):
+                logger.info(f"ウォークフォワード: {finished}/{len(cells)}セル完了")
+
+        if workers <= 1 or len(pending) <= 1:
+            _init_worker(directory)
+            for index in pending:
+                mark(_run_cell(index, base.with_overrides(cells[index])))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(directory,)) as pool:
+                futures = [pool.submit(_run_cell, index, base.with_overrides(cells[index])) for index in pending]
+                try:
+                    for future in as_completed(futures):
+                        mark(future.result())
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    logger.warning("ウォークフォワードを中断しました (再実行すると未完了のセルから再開します)")
+                    raise
+    return np.load(returns_path, mmap_mode="r")
+
+def score_cells(returns: np.ndarray, objective: str, periods_per_year: int) -> np.ndarray:
+    """各セル (行) のリターン系列の評価値 (performance_stats と同じ定義、評価できないセルは -inf)"""
+    if objective == "sharpe":
+        volatility = returns.std(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = returns.mean(axis=1) * np.sqrt(periods_per_year) / volatility
+        return np.where(volatility > 0, scores, -np.inf)
+    total = np.expm1(np.log1p(returns).sum(axis=1))
+    if objective == "total_return":
+        return total
+    years = returns.shape[1] / periods_per_year
+    return np.where(total > -1, np.power(np.maximum(1 + total, 0), 1 / years) - 1, -np.inf)
+
+def evaluate(returns: np.ndarray, cells: List[Dict], dates: np.ndarray, splits: List[Tuple[slice, slice]],
+             objective: str = "sharpe", periods_per_year: int = PERIODS_PER_YEAR["daily"]) -> Dict:
+    """
+    各分割の学習期間で最良のセルを選び、検証期間の成績を集計する
+
+    Returns:
+        dict: splits (分割ごとの選択と成績), out_of_sample (検証期間をつないだ成績), selection_counts
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"未対応の評価指標: {objective} ({' / '.join(OBJECTIVES)})")
+
+    def day(index):
+        return str(np.datetime_as_string(dates[index], unit="D"))
+
+    rows, out_of_sample, counts = [], [], np.zeros(len(cells), dtype=int)
+    for train, test in splits:
+        scores = score_cells(np.asarray(returns[:, train]), objective, periods_per_year)
+        best = int(np.argmax(scores))
+        counts[best] += 1
+        test_returns = np.asarray(returns[best, test])
+        out_of_sample.append(test_returns)
+        rows.append({
+            "train_period": [day(train.start), day(train.stop - 1)],
+            "test_period": [day(test.start), day(test.stop - 1)],
+            "params": cells[best],
+            "train_score": float(scores[best]) if np.isfinite(scores[best]) else None,
+            "test": performance_stats(test_returns, periods_per_year),
+        })
+    combined = np.concatenate(out_of_sample) if out_of_sample else np.array([])
+    return {
+        "splits": rows,
+        "out_of_sample": performance_stats(combined, periods_per_year) if len(combined) else None,
+        "selection_counts": [{"params": cells[i], "count": int(counts[i])} for i in np.argsort(-counts) if counts[i]],
+    }
+
+def recommend(returns: np.ndarray, cells: List[Dict], base: BacktestConfig, train_bars: int,
+              objective: str = "sharpe", periods_per_year: int = PERIODS_PER_YEAR["daily"]) -> Dict:
+    """
+    直近 train_bars 本で最良のセルを推奨値とする
+
+    Returns:
+        dict: params, score, env (IndicatorConfig の項目の環境変数), strategy_params (戦略の閾値など .env に無い項目)
+    """
+    scores = score_cells(np.asarray(returns[:, -train_bars:]), objective, periods_per_year)
+    best = int(np.argmax(scores))
+    config = base.with_overrides(cells[best])
+    indicator_fields = {f.name for f in fields(IndicatorConfig)}
+    return {
+        "params": cells[best],
+        "score": float(scores[best]) if np.isfinite(scores[best]) else None,
+        "env": config.indicators.to_env([key for key in cells[best] if key in indicator_fields]),
+        "strategy_params": {key: value for key, value in cells[best].items() if key not in indicator_fields},
+    }
+
+def optimize(panel: PricePanel, base: BacktestConfig, grid: Dict[str, Sequence], train_bars: int,
+             test_bars: int, step: Optional[int] = None, objective: str = "sharpe",
+             workers: Optional[int] = None, cache_dir: Optional[str] = None, resume: bool = True) -> Dict:
+    """
+    ウォークフォワード最適化
+
+    Args:
+        panel: 株価 (load_price_panel)
+        base: グリッド以外の設定 (戦略・コスト・約定方法・時間軸)
+        grid: パラメータ名 → 候補値 (BacktestConfig.with_overrides で指定できる項目)
+        train_bars / test_bars / step: 学習・検証期間とずらし幅 (足の数)
+
+    Returns:
+        dict: 設定、分割ごとの選択と検証期間の成績、推奨値 (recommended.env は .env にそのまま書ける)
+
+    Raises:
+        ValueError: パラメータの不正、またはデータが学習期間より短い
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"未対応の評価指標: {objective} ({' / '.join(OBJECTIVES)})")
+    cells = grid_cells(base, grid)
+    if not cells:
+        raise ValueError("有効なパラメータの組み合わせがありません")
+    start = warmup_bars(base, cells)
+    splits = walk_forward_splits(len(panel.dates), train_bars, test_bars, step, start)
+    if not splits:
+        raise ValueError(f"データが短すぎます: {len(panel.dates)}本 (助走 {start}本 + 学習 {train_bars}本より多く必要)")
+
+    returns = compute_cells(panel, base, cells, workers, cache_dir, resume)
+    periods = PERIODS_PER_YEAR[base.timeframe]
+    report = {
+        "strategy": base.strategy,
+        "objective": objective,
+        "timeframe": base.timeframe,
+        "symbols": int(len(panel.symbols)),
+        "cells": len(cells),
+        "train_bars": train_bars,
+        "test_bars": test_bars,
+        "step": step or test_bars,
+    }
+    report.update(evaluate(returns, cells, panel.dates, splits, objective, periods))
+    report["recommended"] = recommend(returns, cells, base, train_bars, objective, periods)
+    return report
@@ -21,9 +21,49 @@ CREATE TABLE IF NOT EXISTS stocks (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- 株価情報テーブルの作成
+-- 日付範囲パーティションの作成関数 (日本時間の月/年単位、パーティションごとに date の BRIN インデックスを作成)
+CREATE OR REPLACE FUNCTION ensure_date_partitions(parent TEXT, from_date DATE, to_date DATE,
+                                                  step TEXT DEFAULT 'month')
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    bound DATE;
+    next_bound DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    IF step NOT IN ('month', 'year') THEN
+        RAISE EXCEPTION 'step は month または year を指定してください: %', step;
+    END IF;
+    bound := date_trunc(step, from_date)::date;
+    WHILE bound <= to_date LOOP
+        next_bound := (bound + ('1 ' || step)::interval)::date;
+        partition_name := parent || '_p' || to_char(bound, CASE step WHEN 'year' THEN 'YYYY' ELSE 'YYYY_MM' END);
+        IF to_regclass(partition_name) IS NULL THEN
+            BEGIN
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent,
+                               bound::timestamp AT TIME ZONE 'Asia/Tokyo',
+                               next_bound::timestamp AT TIME ZONE 'Asia/Tokyo');
+                EXECUTE format('CREATE INDEX %I ON %I USING brin (date)', partition_name || '_date_brin', partition_name);
+                created := created + 1;
+            EXCEPTION
+                -- 別の粒度のパーティションが範囲を含んでいる / 同時実行で先に作成された
+                WHEN invalid_object_definition OR duplicate_table THEN NULL;
+            END;
+        END IF;
+        bound := next_bound;
+    END LOOP;
+    RETURN created;
+END
+$$;
+
+COMMENT ON FUNCTION ensure_date_partitions(TEXT, DATE, DATE, TEXT) IS
+    'from_date〜to_date を含む日付範囲パーティション (日本時間の月/年単位) を作成し、作成数を返す';
+
+-- 株価情報テーブルの作成 (date で範囲パーティション化、パーティションは ensure_date_partitions() で作成)
 CREATE TABLE IF NOT EXISTS stock_prices (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     symbol TEXT NOT NULL,
     date TIMESTAMP WITH TIME ZONE NOT NULL,
     open REAL,
@@ -32,11 +72,16 @@ CREATE TABLE IF NOT EXISTS stock_prices (
     close REAL,
     volume INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE (symbol, date),
     CONSTRAINT fk_stock_prices_stocks FOREIGN KEY (symbol) REFERENCES stocks(symbol) ON DELETE CASCADE
-);
+) PARTITION BY RANGE (date);
+CREATE UNIQUE INDEX IF NOT EXISTS stock_prices_symbol_date_key ON stock_prices (symbol, date DESC);
+-- 株価の取り込み (既定は過去3年) とバッチ以外の投入経路でも失敗しないよう、過去10年から3か月先までを作成しておく
+-- (それ以降は batch/partition_manager.py ensure で先の月を作成する)
+SELECT ensure_date_partitions('stock_prices',
+    (date_trunc('year', CURRENT_DATE) - INTERVAL '10 years')::date,
+    (CURRENT_DATE + INTERVAL '3 months')::date);
 
--- テクニカル指標テーブルの作成
+-- テクニカル指標テーブルの作成 (date で範囲パーティション化)
 CREATE TABLE IF NOT EXISTS technical_indicators (
     symbol TEXT NOT NULL,
     date TIMESTAMP WITH TIME ZONE NOT NULL,
@@ -48,9 +93,227 @@ CREATE TABLE IF NOT EXISTS technical_indicators (
     histogram DECIMAL(20,4),
     macd_score INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    PRIMARY KEY (symbol, date),
     FOREIGN KEY (symbol) REFERENCES stocks(symbol)
+) PARTITION BY RANGE (date);
+CREATE UNIQUE INDEX IF NOT EXISTS technical_indicators_symbol_date_key ON technical_indicators (symbol, date DESC);
+SELECT ensure_date_partitions('technical_indicators',
+    (date_trunc('year', CURRENT_DATE) - INTERVAL '10 years')::date,
+    (CURRENT_DATE + INTERVAL '3 months')::date);
+
+-- 週足・月足 (stock_prices の集計、date は日本時間の週・月の開始日。refresh_bar_aggregates() で更新)
+CREATE TABLE IF NOT EXISTS stock_prices_weekly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume BIGINT,
+    trading_days SMALLINT NOT NULL,
+    last_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS stock_prices_monthly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume BIGINT,
+    trading_days SMALLINT NOT NULL,
+    last_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS technical_indicators_weekly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol),
+    date DATE NOT NULL,
+    golden_cross BOOLEAN,
+    dead_cross BOOLEAN,
+    rsi DECIMAL(20,4),
+    macd DECIMAL(20,4),
+    signal_line DECIMAL(20,4),
+    histogram DECIMAL(20,4),
+    macd_score INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS technical_indicators_monthly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol),
+    date DATE NOT NULL,
+    golden_cross BOOLEAN,
+    dead_cross BOOLEAN,
+    rsi DECIMAL(20,4),
+    macd DECIMAL(20,4),
+    signal_line DECIMAL(20,4),
+    histogram DECIMAL(20,4),
+    macd_score INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (symbol, date)
+);
+
+COMMENT ON TABLE stock_prices_weekly IS '週足 (stock_prices の集計、date は週の開始日)';
+COMMENT ON TABLE stock_prices_monthly IS '月足 (stock_prices の集計、date は月初日)';
+COMMENT ON COLUMN stock_prices_weekly.last_date IS '期間内の最終営業日';
+COMMENT ON COLUMN stock_prices_monthly.last_date IS '期間内の最終営業日';
+COMMENT ON TABLE technical_indicators_weekly IS '週足のテクニカル指標';
+COMMENT ON TABLE technical_indicators_monthly IS '月足のテクニカル指標';
+
+-- 日次の横断的な順位と業種・規模別の平均 (cross_section.py で計算)
+CREATE TABLE IF NOT EXISTS technical_rankings (
+    date DATE NOT NULL,
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    momentum REAL,
+    rsi_rank SMALLINT,
+    momentum_rank SMALLINT,
+    histogram_rank SMALLINT,
+    rsi_industry_rank SMALLINT,
+    momentum_industry_rank SMALLINT,
+    histogram_industry_rank SMALLINT,
+    rsi_scale_rank SMALLINT,
+    momentum_scale_rank SMALLINT,
+    histogram_scale_rank SMALLINT,
+    PRIMARY KEY (date, symbol)
+);
+COMMENT ON TABLE technical_rankings IS '日足の指標の日次パーセンタイル順位（市場全体・業種内・規模内、0〜100）';
+COMMENT ON COLUMN technical_rankings.date IS '営業日（日本時間）';
+COMMENT ON COLUMN technical_rankings.momentum IS '20営業日の騰落率';
+COMMENT ON COLUMN technical_rankings.rsi_industry_rank IS '33業種（industry_code_33）内の順位';
+COMMENT ON COLUMN technical_rankings.rsi_scale_rank IS '規模区分（scale_code）内の順位';
+
+-- 業種・規模・市場全体の日次平均
+CREATE TABLE IF NOT EXISTS sector_indicator_averages (
+    group_type VARCHAR(10) NOT NULL,
+    group_code TEXT NOT NULL,
+    date DATE NOT NULL,
+    members INTEGER NOT NULL,
+    rsi REAL,
+    momentum REAL,
+    histogram REAL,
+    PRIMARY KEY (group_type, group_code, date)
+);
+CREATE INDEX IF NOT EXISTS idx_sector_indicator_averages_date ON sector_indicator_averages (date);
+COMMENT ON TABLE sector_indicator_averages IS '業種・規模・市場全体の指標の日次平均';
+COMMENT ON COLUMN sector_indicator_averages.group_type IS 'market / industry（industry_code_33） / scale（scale_code）';
+COMMENT ON COLUMN sector_indicator_averages.group_code IS '業種コード・規模コード（market は all）';
+COMMENT ON COLUMN sector_indicator_averages.members IS '集計した銘柄数';
+
+-- 類似銘柄検索の埋め込み (similarity.py)
+CREATE TABLE IF NOT EXISTS similarity_indexes (
+    kind VARCHAR(20) NOT NULL,
+    window_days SMALLINT NOT NULL,
+    end_date DATE NOT NULL,
+    dimensions SMALLINT NOT NULL,
+    explained_variance REAL,
+    symbols TEXT[] NOT NULL,
+    vectors BYTEA NOT NULL,
+    built_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (kind, window_days)
+);
+COMMENT ON TABLE similarity_indexes IS '類似銘柄検索の埋め込み（値動きを正規化した単位ベクトル、内積が相関係数）';
+COMMENT ON COLUMN similarity_indexes.kind IS 'returns（日次リターン） / trajectory（対数株価の推移）';
+COMMENT ON COLUMN similarity_indexes.window_days IS '埋め込みの期間（営業日）';
+COMMENT ON COLUMN similarity_indexes.end_date IS '期間の最終営業日（日本時間）';
+COMMENT ON COLUMN similarity_indexes.explained_variance IS '次元削減（PCA）で保持した分散の割合（削減しない場合は1）';
+COMMENT ON COLUMN similarity_indexes.vectors IS '銘柄 × 次元の float32（リトルエンディアン）行列、行の順序は symbols と同じ';
+
+-- テクニカル指標のアラート (alerts.py)
+CREATE TABLE IF NOT EXISTS alert_rules (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    indicator VARCHAR(20) NOT NULL,
+    condition VARCHAR(20) NOT NULL,
+    threshold REAL,
+    timeframe VARCHAR(10) NOT NULL DEFAULT 'daily',
+    symbols TEXT[],
+    industry_code TEXT,
+    scale_code TEXT,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
 );
+COMMENT ON TABLE alert_rules IS 'テクニカル指標のアラートのルール';
+COMMENT ON COLUMN alert_rules.indicator IS 'rsi / macd_score / golden_cross / dead_cross';
+COMMENT ON COLUMN alert_rules.condition IS 'above / below / crosses_above / crosses_below（数値の指標）、occurs（golden_cross / dead_cross）';
+COMMENT ON COLUMN alert_rules.symbols IS '対象銘柄（NULLは全銘柄）';
+COMMENT ON COLUMN alert_rules.industry_code IS '対象の33業種コード（NULLは全業種）';
+COMMENT ON COLUMN alert_rules.scale_code IS '対象の規模コード（NULLは全規模）';
+
+-- 発火したアラート (同じルール・銘柄・足は1回だけ)
+CREATE TABLE IF NOT EXISTS alert_events (
+    id BIGSERIAL PRIMARY KEY,
+    rule_id INTEGER NOT NULL REFERENCES alert_rules(id) ON DELETE CASCADE,
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    value REAL,
+    previous REAL,
+    fired_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    UNIQUE (rule_id, symbol, date, timeframe)
+);
+CREATE INDEX IF NOT EXISTS idx_alert_events_symbol ON alert_events (symbol, id);
+COMMENT ON TABLE alert_events IS '発火したアラート（指標バッチが書き込んだ足で評価）';
+COMMENT ON COLUMN alert_events.date IS '足の日付（日足は日本時間の営業日、週足・月足は期間の開始日）';
+COMMENT ON COLUMN alert_events.value IS '発火した足の指標の値';
+COMMENT ON COLUMN alert_events.previous IS '前の足の指標の値';
+
+CREATE OR REPLACE FUNCTION refresh_bar_aggregates(unit TEXT, symbols TEXT[] DEFAULT NULL,
+                                                  from_date DATE DEFAULT NULL, to_date DATE DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    target TEXT;
+    lower_bound TIMESTAMP WITH TIME ZONE := '-infinity';
+    upper_bound TIMESTAMP WITH TIME ZONE := 'infinity';
+    affected INTEGER;
+BEGIN
+    target := CASE unit WHEN 'week' THEN 'stock_prices_weekly' WHEN 'month' THEN 'stock_prices_monthly' END;
+    IF target IS NULL THEN
+        RAISE EXCEPTION 'unit は week または month を指定してください: %', unit;
+    END IF;
+    -- 指定日を含む期間の全体を集計し直す
+    IF from_date IS NOT NULL THEN
+        lower_bound := date_trunc(unit, from_date::timestamp) AT TIME ZONE 'Asia/Tokyo';
+    END IF;
+    IF to_date IS NOT NULL THEN
+        upper_bound := (date_trunc(unit, to_date::timestamp) + ('1 ' || unit)::interval) AT TIME ZONE 'Asia/Tokyo';
+    END IF;
+    EXECUTE format($sql$
+        INSERT INTO %I (symbol, date, open, high, low, close, volume, trading_days, last_date)
+        SELECT symbol,
+               date_trunc(%L, date AT TIME ZONE 'Asia/Tokyo')::date,
+               (array_agg(open ORDER BY date))[1],
+               MAX(high),
+               MIN(low),
+               (array_agg(close ORDER BY date DESC))[1],
+               SUM(volume),
+               COUNT(*),
+               MAX(date)
+        FROM stock_prices
+        WHERE date >= $1 AND date < $2 AND ($3 IS NULL OR symbol = ANY($3))
+        GROUP BY 1, 2
+        ON CONFLICT (symbol, date) DO UPDATE SET
+            open = EXCLUDED.open,
+            high = EXCLUDED.high,
+            low = EXCLUDED.low,
+            close = EXCLUDED.close,
+            volume = EXCLUDED.volume,
+            trading_days = EXCLUDED.trading_days,
+            last_date = EXCLUDED.last_date,
+            updated_at = CURRENT_TIMESTAMP
+    $sql$, target, unit) USING lower_bound, upper_bound, symbols;
+    GET DIAGNOSTICS affected = ROW_COUNT;
+    RETURN affected;
+END
+$$;
+
+COMMENT ON FUNCTION refresh_bar_aggregates(TEXT, TEXT[], DATE, DATE) IS
+    '週足 (week) / 月足 (month) を stock_prices から集計し直す (symbols・期間を省略すると全体)';
 
 -- 推奨セッションテーブルの作成
 CREATE TABLE IF NOT EXISTS recommendation_sessions (
@@ -63,11 +326,30 @@ CREATE TABLE IF NOT EXISTS recommendation_sessions (
     technical_filter TEXT,
     prompt_id INTEGER REFERENCES prompt_templates(id),
     ai_raw_response TEXT,
-    total_return_estimate VARCHAR(20)
+    total_return_estimate VARCHAR(20),
+    execution_metrics JSONB,
+    agent_type VARCHAR(20),
+    risk_metrics JSONB
 );
 -- 変更内容の確認クエリ
 COMMENT ON COLUMN recommendation_sessions.ai_raw_response IS 'AIからの生のレスポンスデータ（JSON形式など）';
 COMMENT ON COLUMN recommendation_sessions.total_return_estimate IS '期待リターン推定値';
+COMMENT ON COLUMN recommendation_sessions.execution_metrics IS '実行計測値（アンサンブルのブランチ別レイテンシなど）';
+COMMENT ON COLUMN recommendation_sessions.agent_type IS '推奨を生成したエージェントタイプ（direct / mcpagent / ensemble など）';
+COMMENT ON COLUMN recommendation_sessions.risk_metrics IS '推奨配分のリスク指標（ボラティリティ・VaR/CVaR・最大ドローダウン・集中度など）';
+
+-- AI生レスポンスの圧縮保存テーブルの作成
+CREATE TABLE IF NOT EXISTS recommendation_raw_responses (
+    session_id INTEGER PRIMARY KEY REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    encoding VARCHAR(10) NOT NULL,
+    raw_size INTEGER NOT NULL,
+    body BYTEA NOT NULL
+);
+-- 圧縮済みのため、TOASTでの再圧縮を行わない
+ALTER TABLE recommendation_raw_responses ALTER COLUMN body SET STORAGE EXTERNAL;
+COMMENT ON TABLE recommendation_raw_responses IS 'AIからの生のレスポンス（圧縮保存、RAW_RESPONSE_STORAGE=compressed）';
+COMMENT ON COLUMN recommendation_raw_responses.encoding IS '圧縮方式（zstd / zlib）';
+COMMENT ON COLUMN recommendation_raw_responses.raw_size IS '展開後のバイト数（UTF-8）';
 
 -- 推奨結果テーブルの作成
 CREATE TABLE IF NOT EXISTS recommendation_results (
@@ -80,6 +362,50 @@ CREATE TABLE IF NOT EXISTS recommendation_results (
     reason TEXT
 );
 
+-- 推奨の実績評価 (db/migrations/005_add_recommendation_performance.sql)
+CREATE TABLE IF NOT EXISTS recommendation_pick_performance (
+    result_id INTEGER PRIMARY KEY REFERENCES recommendation_results(id) ON DELETE CASCADE,
+    session_id INTEGER NOT NULL REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    symbol TEXT NOT NULL,
+    weight REAL,
+    entry_date DATE,
+    entry_price REAL,
+    return_1d REAL,
+    return_5d REAL,
+    return_20d REAL,
+    return_60d REAL,
+    evaluated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recommendation_pick_performance_session
+    ON recommendation_pick_performance (session_id);
+
+CREATE TABLE IF NOT EXISTS recommendation_session_performance (
+    session_id INTEGER PRIMARY KEY REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    entry_date DATE,
+    picks SMALLINT NOT NULL,
+    priced SMALLINT NOT NULL,
+    return_1d REAL,
+    return_5d REAL,
+    return_20d REAL,
+    return_60d REAL,
+    hits_1d SMALLINT,
+    hits_5d SMALLINT,
+    hits_20d SMALLINT,
+    hits_60d SMALLINT,
+    last_bar_date DATE,
+    complete BOOLEAN NOT NULL DEFAULT FALSE,
+    evaluated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recommendation_session_performance_incomplete
+    ON recommendation_session_performance (session_id) WHERE NOT complete;
+COMMENT ON TABLE recommendation_pick_performance IS '推奨銘柄ごとの実績（1/5/20/60営業日後の騰落率、未到来の期間はNULL）';
+COMMENT ON COLUMN recommendation_pick_performance.weight IS 'セッション内の配分比率（allocation を株価のある銘柄で合計1に正規化）';
+COMMENT ON COLUMN recommendation_pick_performance.entry_date IS '推奨後に最初に終値が確定した営業日（日本時間）';
+COMMENT ON TABLE recommendation_session_performance IS '推奨セッションごとの実績（配分加重の騰落率・騰落率が正の銘柄数）';
+COMMENT ON COLUMN recommendation_session_performance.priced IS '株価があり評価できた銘柄数（的中率の分母）';
+COMMENT ON COLUMN recommendation_session_performance.last_bar_date IS '評価に使った最新の営業日（これより新しい株価が入るまで再評価しない）';
+COMMENT ON COLUMN recommendation_session_performance.complete IS '全期間（60営業日後まで）の評価が済んだか';
+
 -- プロンプトテンプレートテーブルの作成
 CREATE TABLE IF NOT EXISTS prompt_templates (
     id SERIAL PRIMARY KEY,
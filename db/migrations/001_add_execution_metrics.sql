@@ -0,0 +1,3 @@
+-- 既存データベース向けマイグレーション: 推奨セッションに実行計測値カラムを追加
+ALTER TABLE recommendation_sessions ADD COLUMN IF NOT EXISTS execution_metrics JSONB;
+COMMENT ON COLUMN recommendation_sessions.execution_metrics IS '実行計測値（アンサンブルのブランチ別レイテンシなど）';
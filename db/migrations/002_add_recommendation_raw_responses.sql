@@ -0,0 +1,12 @@
+-- 既存データベース向けマイグレーション: AI生レスポンスの圧縮保存テーブルを追加
+CREATE TABLE IF NOT EXISTS recommendation_raw_responses (
+    session_id INTEGER PRIMARY KEY REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    encoding VARCHAR(10) NOT NULL,
+    raw_size INTEGER NOT NULL,
+    body BYTEA NOT NULL
+);
+-- 圧縮済みのため、TOASTでの再圧縮を行わない
+ALTER TABLE recommendation_raw_responses ALTER COLUMN body SET STORAGE EXTERNAL;
+COMMENT ON TABLE recommendation_raw_responses IS 'AIからの生のレスポンス（圧縮保存、RAW_RESPONSE_STORAGE=compressed）';
+COMMENT ON COLUMN recommendation_raw_responses.encoding IS '圧縮方式（zstd / zlib）';
+COMMENT ON COLUMN recommendation_raw_responses.raw_size IS '展開後のバイト数（UTF-8）';
@@ -0,0 +1,106 @@
+-- 既存データベース向けマイグレーション: stock_prices / technical_indicators を日付で範囲パーティション化
+--   * パーティションは ensure_date_partitions() で必要な期間分を作成する (月単位 / 年単位)
+--   * 境界は日本時間 (Asia/Tokyo) の月初・年初
+--   * 各パーティションには date の BRIN インデックス、親には (symbol, date DESC) の一意インデックスを作成
+--   * 古いパーティションは backend/batch/partition_manager.py archive で切り離してアーカイブできる
+-- 全行をコピーするため、実行中は両テーブルへの書き込みを止めること
+
+CREATE OR REPLACE FUNCTION ensure_date_partitions(parent TEXT, from_date DATE, to_date DATE,
+                                                  step TEXT DEFAULT 'month')
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    bound DATE;
+    next_bound DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    IF step NOT IN ('month', 'year') THEN
+        RAISE EXCEPTION 'step は month または year を指定してください: %', step;
+    END IF;
+    bound := date_trunc(step, from_date)::date;
+    WHILE bound <= to_date LOOP
+        next_bound := (bound + ('1 ' || step)::interval)::date;
+        partition_name := parent || '_p' || to_char(bound, CASE step WHEN 'year' THEN 'YYYY' ELSE 'YYYY_MM' END);
+        IF to_regclass(partition_name) IS NULL THEN
+            BEGIN
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent,
+                               bound::timestamp AT TIME ZONE 'Asia/Tokyo',
+                               next_bound::timestamp AT TIME ZONE 'Asia/Tokyo');
+                EXECUTE format('CREATE INDEX %I ON %I USING brin (date)', partition_name || '_date_brin', partition_name);
+                created := created + 1;
+            EXCEPTION
+                -- 別の粒度のパーティションが範囲を含んでいる / 同時実行で先に作成された
+                WHEN invalid_object_definition OR duplicate_table THEN NULL;
+            END;
+        END IF;
+        bound := next_bound;
+    END LOOP;
+    RETURN created;
+END
+$$;
+
+COMMENT ON FUNCTION ensure_date_partitions(TEXT, DATE, DATE, TEXT) IS
+    'from_date〜to_date を含む日付範囲パーティション (日本時間の月/年単位) を作成し、作成数を返す';
+
+BEGIN;
+
+-- 株価
+ALTER TABLE stock_prices RENAME TO stock_prices_unpartitioned;
+ALTER INDEX IF EXISTS stock_prices_pkey RENAME TO stock_prices_unpartitioned_pkey;
+ALTER INDEX IF EXISTS stock_prices_symbol_date_key RENAME TO stock_prices_unpartitioned_symbol_date_key;
+
+CREATE TABLE stock_prices (
+    id INTEGER NOT NULL DEFAULT nextval('stock_prices_id_seq'),
+    symbol TEXT NOT NULL,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_stock_prices_stocks FOREIGN KEY (symbol) REFERENCES stocks(symbol) ON DELETE CASCADE
+) PARTITION BY RANGE (date);
+CREATE UNIQUE INDEX stock_prices_symbol_date_key ON stock_prices (symbol, date DESC);
+ALTER SEQUENCE stock_prices_id_seq OWNED BY stock_prices.id;
+
+SELECT ensure_date_partitions('stock_prices',
+    COALESCE((SELECT (MIN(date) AT TIME ZONE 'Asia/Tokyo')::date FROM stock_prices_unpartitioned), CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 months')::date);
+INSERT INTO stock_prices SELECT * FROM stock_prices_unpartitioned;
+DROP TABLE stock_prices_unpartitioned;
+
+-- テクニカル指標
+ALTER TABLE technical_indicators RENAME TO technical_indicators_unpartitioned;
+ALTER INDEX IF EXISTS technical_indicators_pkey RENAME TO technical_indicators_unpartitioned_pkey;
+
+CREATE TABLE technical_indicators (
+    symbol TEXT NOT NULL,
+    date TIMESTAMP WITH TIME ZONE NOT NULL,
+    golden_cross BOOLEAN,
+    dead_cross BOOLEAN,
+    rsi DECIMAL(20,4),
+    macd DECIMAL(20,4),
+    signal_line DECIMAL(20,4),
+    histogram DECIMAL(20,4),
+    macd_score INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (symbol) REFERENCES stocks(symbol)
+) PARTITION BY RANGE (date);
+CREATE UNIQUE INDEX technical_indicators_symbol_date_key ON technical_indicators (symbol, date DESC);
+
+SELECT ensure_date_partitions('technical_indicators',
+    COALESCE((SELECT (MIN(date) AT TIME ZONE 'Asia/Tokyo')::date FROM technical_indicators_unpartitioned), CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 months')::date);
+INSERT INTO technical_indicators SELECT * FROM technical_indicators_unpartitioned;
+DROP TABLE technical_indicators_unpartitioned;
+
+COMMIT;
+
+ANALYZE stock_prices;
+ANALYZE technical_indicators;
+
+COMMENT ON TABLE stock_prices IS '株価 (日本時間の月単位で範囲パーティション化)';
+COMMENT ON TABLE technical_indicators IS 'テクニカル指標 (日本時間の月単位で範囲パーティション化)';
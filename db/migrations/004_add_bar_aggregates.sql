@@ -0,0 +1,127 @@
+-- 既存データベース向けマイグレーション: 週足・月足の集計テーブルと時間軸別のテクニカル指標テーブルを追加
+--   * 週足・月足は stock_prices から refresh_bar_aggregates() で集計する
+--     (株価取り込み時は取り込んだ銘柄・期間のみ、ここでは全期間を初回集計)
+--   * date は期間の開始日 (週は月曜、月は1日、日本時間)
+--   * 週足・月足の指標は backend/batch/technical_indicator_calculator.py --timeframe weekly / monthly で計算する
+
+CREATE TABLE IF NOT EXISTS stock_prices_weekly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume BIGINT,
+    trading_days SMALLINT NOT NULL,
+    last_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS stock_prices_monthly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume BIGINT,
+    trading_days SMALLINT NOT NULL,
+    last_date TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS technical_indicators_weekly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol),
+    date DATE NOT NULL,
+    golden_cross BOOLEAN,
+    dead_cross BOOLEAN,
+    rsi DECIMAL(20,4),
+    macd DECIMAL(20,4),
+    signal_line DECIMAL(20,4),
+    histogram DECIMAL(20,4),
+    macd_score INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (symbol, date)
+);
+
+CREATE TABLE IF NOT EXISTS technical_indicators_monthly (
+    symbol TEXT NOT NULL REFERENCES stocks(symbol),
+    date DATE NOT NULL,
+    golden_cross BOOLEAN,
+    dead_cross BOOLEAN,
+    rsi DECIMAL(20,4),
+    macd DECIMAL(20,4),
+    signal_line DECIMAL(20,4),
+    histogram DECIMAL(20,4),
+    macd_score INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (symbol, date)
+);
+
+COMMENT ON TABLE stock_prices_weekly IS '週足 (stock_prices の集計、date は週の開始日)';
+COMMENT ON TABLE stock_prices_monthly IS '月足 (stock_prices の集計、date は月初日)';
+COMMENT ON COLUMN stock_prices_weekly.last_date IS '期間内の最終営業日';
+COMMENT ON COLUMN stock_prices_monthly.last_date IS '期間内の最終営業日';
+COMMENT ON TABLE technical_indicators_weekly IS '週足のテクニカル指標';
+COMMENT ON TABLE technical_indicators_monthly IS '月足のテクニカル指標';
+
+CREATE OR REPLACE FUNCTION refresh_bar_aggregates(unit TEXT, symbols TEXT[] DEFAULT NULL,
+                                                  from_date DATE DEFAULT NULL, to_date DATE DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    target TEXT;
+    lower_bound TIMESTAMP WITH TIME ZONE := '-infinity';
+    upper_bound TIMESTAMP WITH TIME ZONE := 'infinity';
+    affected INTEGER;
+BEGIN
+    target := CASE unit WHEN 'week' THEN 'stock_prices_weekly' WHEN 'month' THEN 'stock_prices_monthly' END;
+    IF target IS NULL THEN
+        RAISE EXCEPTION 'unit は week または month を指定してください: %', unit;
+    END IF;
+    -- 指定日を含む期間の全体を集計し直す
+    IF from_date IS NOT NULL THEN
+        lower_bound := date_trunc(unit, from_date::timestamp) AT TIME ZONE 'Asia/Tokyo';
+    END IF;
+    IF to_date IS NOT NULL THEN
+        upper_bound := (date_trunc(unit, to_date::timestamp) + ('1 ' || unit)::interval) AT TIME ZONE 'Asia/Tokyo';
+    END IF;
+    EXECUTE format($sql$
+        INSERT INTO %I (symbol, date, open, high, low, close, volume, trading_days, last_date)
+        SELECT symbol,
+               date_trunc(%L, date AT TIME ZONE 'Asia/Tokyo')::date,
+               (array_agg(open ORDER BY date))[1],
+               MAX(high),
+               MIN(low),
+               (array_agg(close ORDER BY date DESC))[1],
+               SUM(volume),
+               COUNT(*),
+               MAX(date)
+        FROM stock_prices
+        WHERE date >= $1 AND date < $2 AND ($3 IS NULL OR symbol = ANY($3))
+        GROUP BY 1, 2
+        ON CONFLICT (symbol, date) DO UPDATE SET
+            open = EXCLUDED.open,
+            high = EXCLUDED.high,
+            low = EXCLUDED.low,
+            close = EXCLUDED.close,
+            volume = EXCLUDED.volume,
+            trading_days = EXCLUDED.trading_days,
+            last_date = EXCLUDED.last_date,
+            updated_at = CURRENT_TIMESTAMP
+    $sql$, target, unit) USING lower_bound, upper_bound, symbols;
+    GET DIAGNOSTICS affected = ROW_COUNT;
+    RETURN affected;
+END
+$$;
+
+COMMENT ON FUNCTION refresh_bar_aggregates(TEXT, TEXT[], DATE, DATE) IS
+    '週足 (week) / 月足 (month) を stock_prices から集計し直す (symbols・期間を省略すると全体)';
+
+-- 初回集計
+SELECT refresh_bar_aggregates('week');
+SELECT refresh_bar_aggregates('month');
+ANALYZE stock_prices_weekly;
+ANALYZE stock_prices_monthly;
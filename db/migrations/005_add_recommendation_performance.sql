@@ -0,0 +1,50 @@
+-- 既存データベース向けマイグレーション: 推奨の実績評価 (batch/recommendation_evaluator.py) のテーブルを追加
+
+-- 推奨を生成したエージェントタイプ (プロンプトテンプレート・エージェント別の集計用)
+ALTER TABLE recommendation_sessions ADD COLUMN IF NOT EXISTS agent_type VARCHAR(20);
+COMMENT ON COLUMN recommendation_sessions.agent_type IS '推奨を生成したエージェントタイプ（direct / mcpagent / ensemble など）';
+
+-- 推奨銘柄ごとの実績 (推奨後に最初に確定した終値からの騰落率)
+CREATE TABLE IF NOT EXISTS recommendation_pick_performance (
+    result_id INTEGER PRIMARY KEY REFERENCES recommendation_results(id) ON DELETE CASCADE,
+    session_id INTEGER NOT NULL REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    symbol TEXT NOT NULL,
+    weight REAL,
+    entry_date DATE,
+    entry_price REAL,
+    return_1d REAL,
+    return_5d REAL,
+    return_20d REAL,
+    return_60d REAL,
+    evaluated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recommendation_pick_performance_session
+    ON recommendation_pick_performance (session_id);
+COMMENT ON TABLE recommendation_pick_performance IS '推奨銘柄ごとの実績（1/5/20/60営業日後の騰落率、未到来の期間はNULL）';
+COMMENT ON COLUMN recommendation_pick_performance.weight IS 'セッション内の配分比率（allocation を株価のある銘柄で合計1に正規化）';
+COMMENT ON COLUMN recommendation_pick_performance.entry_date IS '推奨後に最初に終値が確定した営業日（日本時間）';
+
+-- セッションごとの実績 (配分比率で加重した騰落率と、騰落率が正の銘柄数)
+CREATE TABLE IF NOT EXISTS recommendation_session_performance (
+    session_id INTEGER PRIMARY KEY REFERENCES recommendation_sessions(session_id) ON DELETE CASCADE,
+    entry_date DATE,
+    picks SMALLINT NOT NULL,
+    priced SMALLINT NOT NULL,
+    return_1d REAL,
+    return_5d REAL,
+    return_20d REAL,
+    return_60d REAL,
+    hits_1d SMALLINT,
+    hits_5d SMALLINT,
+    hits_20d SMALLINT,
+    hits_60d SMALLINT,
+    last_bar_date DATE,
+    complete BOOLEAN NOT NULL DEFAULT FALSE,
+    evaluated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recommendation_session_performance_incomplete
+    ON recommendation_session_performance (session_id) WHERE NOT complete;
+COMMENT ON TABLE recommendation_session_performance IS '推奨セッションごとの実績（配分加重の騰落率・騰落率が正の銘柄数）';
+COMMENT ON COLUMN recommendation_session_performance.priced IS '株価があり評価できた銘柄数（的中率の分母）';
+COMMENT ON COLUMN recommendation_session_performance.last_bar_date IS '評価に使った最新の営業日（これより新しい株価が入るまで再評価しない）';
+COMMENT ON COLUMN recommendation_session_performance.complete IS '全期間（60営業日後まで）の評価が済んだか';
@@ -0,0 +1,3 @@
+-- 既存データベース向けマイグレーション: 推奨ポートフォリオのリスク指標 (portfolio_risk.py) の保存列を追加
+ALTER TABLE recommendation_sessions ADD COLUMN IF NOT EXISTS risk_metrics JSONB;
+COMMENT ON COLUMN recommendation_sessions.risk_metrics IS '推奨配分のリスク指標（ボラティリティ・VaR/CVaR・最大ドローダウン・集中度など）';
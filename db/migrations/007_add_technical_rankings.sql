@@ -0,0 +1,40 @@
+-- 既存データベース向けマイグレーション: 日次の横断的な順位と業種・規模別の平均 (cross_section.py) のテーブルを追加
+
+-- 銘柄ごとの日次パーセンタイル順位 (0〜100、大きいほど上位)
+CREATE TABLE IF NOT EXISTS technical_rankings (
+    date DATE NOT NULL,
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    momentum REAL,
+    rsi_rank SMALLINT,
+    momentum_rank SMALLINT,
+    histogram_rank SMALLINT,
+    rsi_industry_rank SMALLINT,
+    momentum_industry_rank SMALLINT,
+    histogram_industry_rank SMALLINT,
+    rsi_scale_rank SMALLINT,
+    momentum_scale_rank SMALLINT,
+    histogram_scale_rank SMALLINT,
+    PRIMARY KEY (date, symbol)
+);
+COMMENT ON TABLE technical_rankings IS '日足の指標の日次パーセンタイル順位（市場全体・業種内・規模内、0〜100）';
+COMMENT ON COLUMN technical_rankings.date IS '営業日（日本時間）';
+COMMENT ON COLUMN technical_rankings.momentum IS '20営業日の騰落率';
+COMMENT ON COLUMN technical_rankings.rsi_industry_rank IS '33業種（industry_code_33）内の順位';
+COMMENT ON COLUMN technical_rankings.rsi_scale_rank IS '規模区分（scale_code）内の順位';
+
+-- 業種・規模・市場全体の日次平均
+CREATE TABLE IF NOT EXISTS sector_indicator_averages (
+    group_type VARCHAR(10) NOT NULL,
+    group_code TEXT NOT NULL,
+    date DATE NOT NULL,
+    members INTEGER NOT NULL,
+    rsi REAL,
+    momentum REAL,
+    histogram REAL,
+    PRIMARY KEY (group_type, group_code, date)
+);
+CREATE INDEX IF NOT EXISTS idx_sector_indicator_averages_date ON sector_indicator_averages (date);
+COMMENT ON TABLE sector_indicator_averages IS '業種・規模・市場全体の指標の日次平均';
+COMMENT ON COLUMN sector_indicator_averages.group_type IS 'market / industry（industry_code_33） / scale（scale_code）';
+COMMENT ON COLUMN sector_indicator_averages.group_code IS '業種コード・規模コード（market は all）';
+COMMENT ON COLUMN sector_indicator_averages.members IS '集計した銘柄数';
@@ -0,0 +1,20 @@
+-- 既存データベース向けマイグレーション: 類似銘柄検索 (similarity.py) のインデックスの保存テーブルを追加
+
+-- 全銘柄の埋め込み (銘柄 × 次元の float32 行列、夜間バッチ batch/similarity_index_builder.py で作成)
+CREATE TABLE IF NOT EXISTS similarity_indexes (
+    kind VARCHAR(20) NOT NULL,
+    window_days SMALLINT NOT NULL,
+    end_date DATE NOT NULL,
+    dimensions SMALLINT NOT NULL,
+    explained_variance REAL,
+    symbols TEXT[] NOT NULL,
+    vectors BYTEA NOT NULL,
+    built_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    PRIMARY KEY (kind, window_days)
+);
+COMMENT ON TABLE similarity_indexes IS '類似銘柄検索の埋め込み（値動きを正規化した単位ベクトル、内積が相関係数）';
+COMMENT ON COLUMN similarity_indexes.kind IS 'returns（日次リターン） / trajectory（対数株価の推移）';
+COMMENT ON COLUMN similarity_indexes.window_days IS '埋め込みの期間（営業日）';
+COMMENT ON COLUMN similarity_indexes.end_date IS '期間の最終営業日（日本時間）';
+COMMENT ON COLUMN similarity_indexes.explained_variance IS '次元削減（PCA）で保持した分散の割合（削減しない場合は1）';
+COMMENT ON COLUMN similarity_indexes.vectors IS '銘柄 × 次元の float32（リトルエンディアン）行列、行の順序は symbols と同じ';
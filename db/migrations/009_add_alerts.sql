@@ -0,0 +1,41 @@
+-- 既存データベース向けマイグレーション: テクニカル指標のアラート (alerts.py) のテーブルを追加
+
+-- アラートのルール (指標バッチの後に、書き込んだ足で評価する)
+CREATE TABLE IF NOT EXISTS alert_rules (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    indicator VARCHAR(20) NOT NULL,
+    condition VARCHAR(20) NOT NULL,
+    threshold REAL,
+    timeframe VARCHAR(10) NOT NULL DEFAULT 'daily',
+    symbols TEXT[],
+    industry_code TEXT,
+    scale_code TEXT,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+COMMENT ON TABLE alert_rules IS 'テクニカル指標のアラートのルール';
+COMMENT ON COLUMN alert_rules.indicator IS 'rsi / macd_score / golden_cross / dead_cross';
+COMMENT ON COLUMN alert_rules.condition IS 'above / below / crosses_above / crosses_below（数値の指標）、occurs（golden_cross / dead_cross）';
+COMMENT ON COLUMN alert_rules.symbols IS '対象銘柄（NULLは全銘柄）';
+COMMENT ON COLUMN alert_rules.industry_code IS '対象の33業種コード（NULLは全業種）';
+COMMENT ON COLUMN alert_rules.scale_code IS '対象の規模コード（NULLは全規模）';
+
+-- 発火したアラート (同じルール・銘柄・足は1回だけ)
+CREATE TABLE IF NOT EXISTS alert_events (
+    id BIGSERIAL PRIMARY KEY,
+    rule_id INTEGER NOT NULL REFERENCES alert_rules(id) ON DELETE CASCADE,
+    symbol TEXT NOT NULL REFERENCES stocks(symbol) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    timeframe VARCHAR(10) NOT NULL,
+    value REAL,
+    previous REAL,
+    fired_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    UNIQUE (rule_id, symbol, date, timeframe)
+);
+CREATE INDEX IF NOT EXISTS idx_alert_events_symbol ON alert_events (symbol, id);
+COMMENT ON TABLE alert_events IS '発火したアラート（指標バッチが書き込んだ足で評価）';
+COMMENT ON COLUMN alert_events.date IS '足の日付（日足は日本時間の営業日、週足・月足は期間の開始日）';
+COMMENT ON COLUMN alert_events.value IS '発火した足の指標の値';
+COMMENT ON COLUMN alert_events.previous IS '前の足の指標の値';
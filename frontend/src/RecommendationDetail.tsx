@@ -38,7 +38,8 @@ interface Session {
   risk_tolerance: string;
   strategy: string;
   technical_filter?: string;
-  ai_raw_response?: string;
+  raw_response_size?: number;
+  has_raw_response?: boolean;
   total_return_estimate?: string;
 }
 
@@ -52,6 +53,8 @@ const RecommendationDetail: React.FC = () => {
   const [chartImage, setChartImage] = useState<string | null>(null);
   const [isModalOpen, setIsModalOpen] = useState<boolean>(false);
   const [loadingChart, setLoadingChart] = useState<boolean>(false);
+  const [rawResponse, setRawResponse] = useState<string | null>(null);
+  const [loadingRaw, setLoadingRaw] = useState<boolean>(false);
 
   useEffect(() => {
     const fetchRecommendationDetail = async () => {
@@ -101,6 +104,22 @@ const RecommendationDetail: React.FC = () => {
     }
   };
 
+  // AI生レスポンスは大きいため、表示ボタンが押されたときに取得する
+  const handleShowRawResponse = async () => {
+    try {
+      setLoadingRaw(true);
+      const response = await fetch(`/api/recommendations/${session_id}/raw`);
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      setRawResponse(await response.text());
+    } catch (err) {
+      console.error('AI生レスポンスの取得に失敗しました:', err);
+    } finally {
+      setLoadingRaw(false);
+    }
+  };
+
   const closeModal = () => {
     setIsModalOpen(false);
     setChartImage(null);
@@ -172,25 +191,36 @@ const RecommendationDetail: React.FC = () => {
         </Box>
       </Paper>
 
-      {session.ai_raw_response && (
+      {session.has_raw_response && (
         <Paper sx={{ p: 3, mb: 3 }}>
           <Typography variant="h6" gutterBottom>
             AI生レスポンス
           </Typography>
-          <Box
-            sx={{
-              p: 2,
-              backgroundColor: 'grey.100',
-              borderRadius: 1,
-              maxHeight: '300px',
-              overflow: 'auto',
-              fontFamily: 'monospace',
-              fontSize: '0.875rem',
-              whiteSpace: 'pre-wrap'
-            }}
-          >
-            {session.ai_raw_response}
-          </Box>
+          {rawResponse === null ? (
+            <Button
+              variant="outlined"
+              onClick={handleShowRawResponse}
+              disabled={loadingRaw}
+              startIcon={loadingRaw ? <CircularProgress size={16} /> : undefined}
+            >
+              表示する ({Math.ceil((session.raw_response_size || 0) / 1024)}KB)
+            </Button>
+          ) : (
+            <Box
+              sx={{
+                p: 2,
+                backgroundColor: 'grey.100',
+                borderRadius: 1,
+                maxHeight: '300px',
+                overflow: 'auto',
+                fontFamily: 'monospace',
+                fontSize: '0.875rem',
+                whiteSpace: 'pre-wrap'
+              }}
+            >
+              {rawResponse}
+            </Box>
+          )}
         </Paper>
       )}
 
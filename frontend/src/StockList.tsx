@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
-import { stockService, chartService } from './utils/apiService';
+import { stockService, chartService, streamService } from './utils/apiService';
 import {
   Table,
   TableBody,
@@ -146,6 +146,30 @@ const StockList: React.FC = () => {
     fetchStocks(currentPage, itemsPerPage, searchTerm, industryCode, scaleCode, sortBy, sortOrder);
   }, [currentPage, itemsPerPage, searchTerm, industryCode, scaleCode, sortBy, sortOrder]);
   
+  // 再同期は購読後に変わったページ・検索・ソート条件で読み直す (購読は銘柄が変わったときだけ張り直す)
+  const resyncRef = useRef<() => void>(() => {});
+  resyncRef.current = () => {
+    fetchStocks(currentPage, itemsPerPage, searchTerm, industryCode, scaleCode, sortBy, sortOrder);
+  };
+
+  // 表示中の銘柄の指標の更新を購読し、変わった行だけを差し替える
+  const visibleSymbols = stocks.map((stock) => stock.symbol).join(',');
+  useEffect(() => {
+    if (!visibleSymbols) return;
+    return streamService.subscribeIndicators(visibleSymbols.split(','), {
+      onUpdate: (data) => {
+        const rows = new Map<string, Partial<Stock>>(
+          (data.indicators.daily || []).map((row: any): [string, Partial<Stock>] => [row.symbol, row])
+        );
+        if (rows.size === 0) return;
+        setStocks((current) => current.map((stock) => (
+          rows.has(stock.symbol) ? { ...stock, ...rows.get(stock.symbol) } : stock
+        )));
+      },
+      onResync: () => resyncRef.current()
+    });
+  }, [visibleSymbols]);
+
   // ソートハンドラ（No.列はソート対象外）
   const handleSort = (columnId: string) => {
     if (columnId === 'index') return; // No.列はソートしない
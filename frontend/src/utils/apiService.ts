@@ -36,10 +36,30 @@ export const stockService = {
   }
 };
 
+// 指標の更新のサーバープッシュ配信 (Server-Sent Events)
+export interface IndicatorStreamHandlers {
+  onUpdate: (data: { indicators: { [timeframe: string]: any[] }; alerts: any[] }) => void;
+  // 取りこぼしの可能性がある (LISTEN の再接続・受信が追いつかず切断された) ので一覧を取得し直す
+  onResync?: () => void;
+}
+
+export const streamService = {
+  // symbols の最新の指標が変わったときに onUpdate を呼ぶ。戻り値の関数で購読を終了する
+  subscribeIndicators: (symbols: string[], handlers: IndicatorStreamHandlers) => {
+    const params = new URLSearchParams({ symbols: symbols.join(',') });
+    const source = new EventSource(`${API_BASE_URL}/api/stream/indicators?${params}`);
+    source.addEventListener('update', (event) => handlers.onUpdate(JSON.parse((event as MessageEvent).data)));
+    source.addEventListener('resync', () => handlers.onResync?.());
+    // dropped の後は EventSource が自動で再接続する
+    source.addEventListener('dropped', () => handlers.onResync?.());
+    return () => source.close();
+  }
+};
+
 // チャート関連API
 export const chartService = {
-  getChart: async (symbol: string) => {
-    const response = await axios.get(`${API_BASE_URL}/api/chart/${symbol}`);
+  getChart: async (symbol: string, timeframe: 'daily' | 'weekly' | 'monthly' = 'daily') => {
+    const response = await axios.get(`${API_BASE_URL}/api/chart/${symbol}`, { params: { timeframe } });
     return response.data;
   }
 };